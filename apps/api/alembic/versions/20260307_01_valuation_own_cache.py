@@ -0,0 +1,58 @@
+"""valuation_own_cache: create table / sketch column / cars.valuation_aggregated_at
+
+Revision ID: 20260307_01
+Revises: 20260306_08
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_01"
+down_revision = "20260306_08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # create_all 経由で既に作られている環境もあるため IF NOT EXISTS で揃える
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS valuation_own_cache (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            store_id UUID NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+            make VARCHAR NOT NULL,
+            model VARCHAR NOT NULL,
+            grade VARCHAR NOT NULL,
+            year_center INTEGER NOT NULL,
+            mileage_bucket VARCHAR NOT NULL,
+            own_count INTEGER NOT NULL DEFAULT 0,
+            own_median_price INTEGER,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+    op.execute("ALTER TABLE valuation_own_cache ADD COLUMN IF NOT EXISTS sketch JSONB")
+    op.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_valuation_own_cache_bucket
+        ON valuation_own_cache (store_id, make, model, grade, year_center, mileage_bucket)
+        """
+    )
+
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS valuation_aggregated_at TIMESTAMPTZ")
+    # 未集計の販売済み車両だけを拾う部分インデックス
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_cars_valuation_pending
+        ON cars (store_id)
+        WHERE valuation_aggregated_at IS NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_cars_valuation_pending")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS valuation_aggregated_at")
+    op.execute("DROP INDEX IF EXISTS uq_valuation_own_cache_bucket")
+    op.execute("ALTER TABLE valuation_own_cache DROP COLUMN IF EXISTS sketch")
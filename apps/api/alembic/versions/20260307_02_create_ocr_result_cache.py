@@ -0,0 +1,44 @@
+"""create ocr_result_cache table
+
+Revision ID: 20260307_02
+Revises: 20260307_01
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "20260307_02"
+down_revision = "20260307_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ocr_result_cache",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("content_sha256", sa.String(64), nullable=False),
+        sa.Column("provider", sa.String(16), nullable=False),
+        sa.Column("lang", sa.String(32), nullable=False),
+        sa.Column("preprocess", sa.Boolean, nullable=False),
+        sa.Column("dpi", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("max_pages", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("raw_text", sa.Text, nullable=False),
+        sa.Column("parsed", JSONB, nullable=True),
+        sa.Column("size_bytes", sa.Integer, nullable=True),
+        sa.Column("hit_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.UniqueConstraint(
+            "content_sha256", "provider", "lang", "preprocess", "dpi", "max_pages", name="uq_ocr_result_cache_key"
+        ),
+    )
+    op.create_index("ix_ocr_result_cache_last_used_at", "ocr_result_cache", ["last_used_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ocr_result_cache_last_used_at", table_name="ocr_result_cache")
+    op.drop_table("ocr_result_cache")
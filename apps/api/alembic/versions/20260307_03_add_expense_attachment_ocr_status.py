@@ -0,0 +1,29 @@
+"""expense_attachments: add ocr_status / ocr_updated_at
+
+Revision ID: 20260307_03
+Revises: 20260307_02
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_03"
+down_revision = "20260307_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE expense_attachments "
+        "ADD COLUMN IF NOT EXISTS ocr_status VARCHAR(16) NOT NULL DEFAULT 'none'"
+    )
+    op.execute("ALTER TABLE expense_attachments ADD COLUMN IF NOT EXISTS ocr_updated_at TIMESTAMPTZ")
+    # 既存の OCR 済みデータは done 扱い
+    op.execute("UPDATE expense_attachments SET ocr_status = 'done' WHERE ocr_text IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE expense_attachments DROP COLUMN IF EXISTS ocr_updated_at")
+    op.execute("ALTER TABLE expense_attachments DROP COLUMN IF EXISTS ocr_status")
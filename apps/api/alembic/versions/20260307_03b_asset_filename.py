@@ -0,0 +1,24 @@
+"""assets: add filename
+
+Revision ID: 20260307_03b
+Revises: 20260307_03
+Create Date: 2026-03-07
+
+内容アドレスで保存した file_path には拡張子がないので、ダウンロード名用に元のファイル名を持つ。
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_03b"
+down_revision = "20260307_03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE assets ADD COLUMN IF NOT EXISTS filename VARCHAR(255)")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE assets DROP COLUMN IF EXISTS filename")
@@ -0,0 +1,23 @@
+"""cars: add export_image_ref
+
+Revision ID: 20260307_04
+Revises: 20260307_03b
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_04"
+down_revision = "20260307_03b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # アップロードした公開用画像のストレージ参照（export_image_url は配信 URL）
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS export_image_ref VARCHAR(512)")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS export_image_ref")
@@ -0,0 +1,38 @@
+"""cars / customers: lookup indexes for CSV import upsert
+
+Revision ID: 20260307_05
+Revises: 20260307_04
+Create Date: 2026-03-07
+
+家族で同じ電話番号・同じ車体番号の再買取があるので一意にはせず、検索用の通常インデックスにする。
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_05"
+down_revision = "20260307_04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_cars_store_vin
+        ON cars (store_id, vin)
+        WHERE vin IS NOT NULL AND vin <> ''
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_customers_store_tel
+        ON customers (store_id, tel)
+        WHERE tel IS NOT NULL AND tel <> ''
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_customers_store_tel")
+    op.execute("DROP INDEX IF EXISTS ix_cars_store_vin")
@@ -0,0 +1,49 @@
+"""create import_jobs table
+
+Revision ID: 20260307_06
+Revises: 20260307_05
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "20260307_06"
+down_revision = "20260307_05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("store_id", UUID(as_uuid=True), sa.ForeignKey("stores.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("kind", sa.String(16), nullable=False),
+        sa.Column("mode", sa.String(16), nullable=False, server_default="insert"),
+        sa.Column("dry_run", sa.Boolean, nullable=False, server_default=sa.text("false")),
+        sa.Column("file_ref", sa.String(512), nullable=False),
+        sa.Column("filename", sa.String(255), nullable=True),
+        sa.Column("bytes_total", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("bytes_read", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("next_row", sa.Integer, nullable=False, server_default="2"),
+        sa.Column("stats", JSONB, nullable=True),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("claim_token", UUID(as_uuid=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_import_jobs_store_created", "import_jobs", ["store_id", "created_at"])
+    op.create_index("ix_import_jobs_status", "import_jobs", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_jobs_status", table_name="import_jobs")
+    op.drop_index("ix_import_jobs_store_created", table_name="import_jobs")
+    op.drop_table("import_jobs")
@@ -0,0 +1,36 @@
+"""instruction_orders: composite index for calendar range queries
+
+Revision ID: 20260307_07
+Revises: 20260307_06
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_07"
+down_revision = "20260307_06"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # カレンダーの期間重なり検索（store_id = ? AND due_at >= ? AND received_at < ?）用。
+    # (store_id, due_at) は先頭が同じなのでこのインデックスで代替できる
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_instruction_orders_store_due_received
+            ON instruction_orders (store_id, due_at, received_at)
+        """
+    )
+    op.execute("DROP INDEX IF EXISTS ix_instruction_orders_store_due")
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_instruction_orders_store_due
+            ON instruction_orders (store_id, due_at)
+        """
+    )
+    op.execute("DROP INDEX IF EXISTS ix_instruction_orders_store_due_received")
@@ -0,0 +1,74 @@
+"""loaner_reservations: daterange period column, GiST index and no-overlap exclusion constraint
+
+Revision ID: 20260307_08
+Revises: 20260307_07
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_08"
+down_revision = "20260307_07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 予約期間（start_date〜end_date の両端を含む）を daterange で持つ。INSERT / UPDATE 側の変更は不要
+    op.execute(
+        """
+        ALTER TABLE loaner_reservations
+            ADD COLUMN IF NOT EXISTS period daterange
+            GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED
+        """
+    )
+
+    # uuid を GiST で「=」比較するには btree_gist が必要。権限が無い環境では入れずに進める
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS btree_gist;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'btree_gist not available: %', SQLERRM;
+        END $$;
+        """
+    )
+
+    # 同じ代車の期間重複を DB で禁止する（同時に予約しても二重予約にならない）。
+    # 制約の GiST インデックスが空き状況検索（loaner_car_id = ? AND period && ?）にも使われる。
+    # btree_gist が無い / 既に重複データがある場合は period だけの GiST インデックスにとどめる
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ex_loaner_reservations_no_overlap') THEN
+                RETURN;
+            END IF;
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gist')
+               AND NOT EXISTS (
+                   SELECT 1
+                   FROM loaner_reservations a
+                   JOIN loaner_reservations b
+                     ON a.loaner_car_id = b.loaner_car_id
+                    AND a.id < b.id
+                    AND a.period && b.period
+               ) THEN
+                ALTER TABLE loaner_reservations
+                    ADD CONSTRAINT ex_loaner_reservations_no_overlap
+                    EXCLUDE USING gist (loaner_car_id WITH =, period WITH &&);
+            ELSE
+                RAISE NOTICE 'ex_loaner_reservations_no_overlap skipped: btree_gist missing or overlapping reservations exist';
+                CREATE INDEX IF NOT EXISTS ix_loaner_reservations_period
+                    ON loaner_reservations USING gist (period);
+            END IF;
+        END $$;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE loaner_reservations DROP CONSTRAINT IF EXISTS ex_loaner_reservations_no_overlap")
+    op.execute("DROP INDEX IF EXISTS ix_loaner_reservations_period")
+    op.execute("ALTER TABLE loaner_reservations DROP COLUMN IF EXISTS period")
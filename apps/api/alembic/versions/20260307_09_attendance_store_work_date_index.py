@@ -0,0 +1,29 @@
+"""attendance: (store_id, work_date) index for listing and timesheet aggregation
+
+Revision ID: 20260307_09
+Revises: 20260307_08
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_09"
+down_revision = "20260307_08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # uq_attendance_user_date は (store_id, user_id, work_date) なので、
+    # スタッフを絞らない期間検索には使えない
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_attendance_store_work_date
+            ON attendance (store_id, work_date)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_attendance_store_work_date")
@@ -0,0 +1,34 @@
+"""referrals: (partner_id, status) / (referrer_store_id, status) indexes for grouped counts
+
+Revision ID: 20260307_10
+Revises: 20260307_09
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_10"
+down_revision = "20260307_09"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_referrals_partner_status
+            ON referrals (partner_id, status)
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_referrals_referrer_status
+            ON referrals (referrer_store_id, status)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_referrals_referrer_status")
+    op.execute("DROP INDEX IF EXISTS ix_referrals_partner_status")
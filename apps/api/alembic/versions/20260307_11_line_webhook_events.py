@@ -0,0 +1,52 @@
+"""create line_webhook_events table (inbound LINE webhook queue)
+
+Revision ID: 20260307_11
+Revises: 20260307_10
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "20260307_11"
+down_revision = "20260307_10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "line_webhook_events",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("store_id", UUID(as_uuid=True), sa.ForeignKey("stores.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("webhook_event_id", sa.String(64), nullable=True, unique=True),
+        sa.Column("event_type", sa.String(32), nullable=True),
+        sa.Column("payload", JSONB, nullable=False),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("locked_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("claim_token", UUID(as_uuid=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_line_webhook_events_pending
+        ON line_webhook_events (created_at)
+        WHERE status IN ('queued', 'processing')
+        """
+    )
+    op.create_index(
+        "ix_line_webhook_events_status_processed",
+        "line_webhook_events",
+        ["status", "processed_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_line_webhook_events_status_processed", table_name="line_webhook_events")
+    op.execute("DROP INDEX IF EXISTS ix_line_webhook_events_pending")
+    op.drop_table("line_webhook_events")
@@ -0,0 +1,70 @@
+"""line_campaigns table, line_messages.campaign_id, cars.customer_id
+
+Revision ID: 20260307_12
+Revises: 20260307_11
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "20260307_12"
+down_revision = "20260307_11"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "line_campaigns",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("store_id", UUID(as_uuid=True), sa.ForeignKey("stores.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("name", sa.String(255), nullable=True),
+        sa.Column("message", sa.Text, nullable=False),
+        sa.Column("segment", JSONB, nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("total", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("sent", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("failed", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("claim_token", UUID(as_uuid=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_line_campaigns_store_created", "line_campaigns", ["store_id", "created_at"])
+    op.create_index("ix_line_campaigns_status", "line_campaigns", ["status"])
+
+    op.execute(
+        """
+        ALTER TABLE line_messages
+        ADD COLUMN IF NOT EXISTS campaign_id UUID
+        REFERENCES line_campaigns(id) ON DELETE SET NULL
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_line_messages_campaign_id ON line_messages (campaign_id)")
+
+    # 車検満了日は 7b2de5ddae9b で追加済みだが、環境差分に備えて冪等に
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS inspection_expiry DATE")
+    op.execute(
+        """
+        ALTER TABLE cars
+        ADD COLUMN IF NOT EXISTS customer_id UUID
+        REFERENCES customers(id) ON DELETE SET NULL
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_cars_customer_id ON cars (customer_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_cars_customer_id")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS customer_id")
+    op.execute("DROP INDEX IF EXISTS ix_line_messages_campaign_id")
+    op.execute("ALTER TABLE line_messages DROP COLUMN IF EXISTS campaign_id")
+    op.drop_index("ix_line_campaigns_status", table_name="line_campaigns")
+    op.drop_index("ix_line_campaigns_store_created", table_name="line_campaigns")
+    op.drop_table("line_campaigns")
@@ -0,0 +1,22 @@
+"""sns_posts.results (per-platform post results)
+
+Revision ID: 20260307_13
+Revises: 20260307_12
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_13"
+down_revision = "20260307_12"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE sns_posts ADD COLUMN IF NOT EXISTS results JSON")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE sns_posts DROP COLUMN IF EXISTS results")
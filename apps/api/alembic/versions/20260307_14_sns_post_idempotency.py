@@ -0,0 +1,35 @@
+"""sns_posts.idempotency_key / claimed_at for the scheduled repost runner
+
+Revision ID: 20260307_14
+Revises: 20260307_13
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260307_14"
+down_revision = "20260307_13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE sns_posts ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255)")
+    op.execute("ALTER TABLE sns_posts ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ")
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_sns_posts_idempotency_key "
+        "ON sns_posts (idempotency_key)"
+    )
+    # 最終投稿日の集計（get_repost_due_cars）用
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_sns_posts_store_car_posted "
+        "ON sns_posts (store_id, car_id, posted_at) WHERE status = 'posted'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_sns_posts_store_car_posted")
+    op.execute("DROP INDEX IF EXISTS uq_sns_posts_idempotency_key")
+    op.execute("ALTER TABLE sns_posts DROP COLUMN IF EXISTS claimed_at")
+    op.execute("ALTER TABLE sns_posts DROP COLUMN IF EXISTS idempotency_key")
@@ -0,0 +1,54 @@
+"""create stripe_events table (Stripe webhook inbox)
+
+Revision ID: 20260307_15
+Revises: 20260307_14
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "20260307_15"
+down_revision = "20260307_14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stripe_events",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("stripe_event_id", sa.String(255), nullable=False, unique=True),
+        sa.Column("event_type", sa.String(64), nullable=False),
+        sa.Column("stripe_customer_id", sa.String(255), nullable=True),
+        sa.Column("stripe_created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("payload", JSONB, nullable=False),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("locked_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("claim_token", UUID(as_uuid=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_stripe_events_pending
+        ON stripe_events (stripe_customer_id, stripe_created_at)
+        WHERE status IN ('queued', 'processing')
+        """
+    )
+    op.create_index(
+        "ix_stripe_events_status_processed",
+        "stripe_events",
+        ["status", "processed_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stripe_events_status_processed", table_name="stripe_events")
+    op.execute("DROP INDEX IF EXISTS ix_stripe_events_pending")
+    op.drop_table("stripe_events")
@@ -0,0 +1,53 @@
+"""cars inspection_expiry index, shaken_reminders table
+
+Revision ID: 20260307_16
+Revises: 20260307_15
+Create Date: 2026-03-07
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "20260307_16"
+down_revision = "20260307_15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_cars_store_inspection_expiry
+        ON cars (store_id, inspection_expiry)
+        WHERE inspection_expiry IS NOT NULL
+        """
+    )
+
+    op.create_table(
+        "shaken_reminders",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("store_id", UUID(as_uuid=True), sa.ForeignKey("stores.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("car_id", UUID(as_uuid=True), sa.ForeignKey("cars.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("customer_id", UUID(as_uuid=True), sa.ForeignKey("customers.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("inspection_expiry", sa.Date, nullable=False),
+        sa.Column("window_days", sa.Integer, nullable=False),
+        sa.Column("status", sa.String(16), nullable=False, server_default="pending"),
+        sa.Column("recipients", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("NOW()"), nullable=False),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("car_id", "inspection_expiry", "window_days", name="uq_shaken_reminders_car_window"),
+    )
+    op.create_index(
+        "ix_shaken_reminders_store_created",
+        "shaken_reminders",
+        ["store_id", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_shaken_reminders_store_created", table_name="shaken_reminders")
+    op.drop_table("shaken_reminders")
+    op.execute("DROP INDEX IF EXISTS ix_cars_store_inspection_expiry")
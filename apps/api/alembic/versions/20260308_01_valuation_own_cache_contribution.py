@@ -0,0 +1,41 @@
+"""cars: record the valuation_own_cache bucket and price each sold car was aggregated into
+
+Revision ID: 20260308_01
+Revises: 20260307_16
+Create Date: 2026-03-08
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260308_01"
+down_revision = "20260307_16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE cars ADD COLUMN IF NOT EXISTS valuation_bucket_id UUID
+            REFERENCES valuation_own_cache(id) ON DELETE SET NULL
+        """
+    )
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS valuation_aggregated_price INTEGER")
+    # バケットごとの取り込み直し用
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_cars_valuation_bucket
+        ON cars (valuation_bucket_id)
+        WHERE valuation_bucket_id IS NOT NULL
+        """
+    )
+    # 既存の集計はどのバケットに入れたか分からないので、作り直す（次回の定期実行で差分集計される）
+    op.execute("UPDATE cars SET valuation_aggregated_at = NULL WHERE valuation_aggregated_at IS NOT NULL")
+    op.execute("DELETE FROM valuation_own_cache")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_cars_valuation_bucket")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS valuation_aggregated_price")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS valuation_bucket_id")
@@ -0,0 +1,25 @@
+"""import_jobs: file_deleted_at / file_ref index for uploaded CSV retention
+
+Revision ID: 20260308_02
+Revises: 20260308_01
+Create Date: 2026-03-08
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260308_02"
+down_revision = "20260308_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE import_jobs ADD COLUMN IF NOT EXISTS file_deleted_at TIMESTAMPTZ")
+    # 同じファイルを参照する他のジョブの確認用
+    op.execute("CREATE INDEX IF NOT EXISTS ix_import_jobs_file_ref ON import_jobs (file_ref)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_import_jobs_file_ref")
+    op.execute("ALTER TABLE import_jobs DROP COLUMN IF EXISTS file_deleted_at")
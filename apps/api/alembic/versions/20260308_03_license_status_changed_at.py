@@ -0,0 +1,24 @@
+"""licenses: status_changed_at for churn stats
+
+Revision ID: 20260308_03
+Revises: 20260308_02
+Create Date: 2026-03-08
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260308_03"
+down_revision = "20260308_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE licenses ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMPTZ")
+    # 既存行は変更日が分からないので updated_at で埋める
+    op.execute("UPDATE licenses SET status_changed_at = updated_at WHERE status_changed_at IS NULL")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE licenses DROP COLUMN IF EXISTS status_changed_at")
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import uuid
+
+from fastapi import HTTPException
+
+# 店舗の設定変更・集計のやり直しなどができるロール
+ADMIN_ROLES = ("admin", "manager", "superadmin")
+
+
+def require_store(current_user) -> uuid.UUID:
+    """所属店舗の id を返す（店舗に所属していなければ 403）"""
+    if not current_user.store_id:
+        raise HTTPException(status_code=403, detail="店舗に所属していません")
+    return current_user.store_id
+
+
+def require_admin(current_user) -> None:
+    """店舗の管理者でなければ 403"""
+    if current_user.role not in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="管理者権限が必要です")
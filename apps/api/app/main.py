@@ -24,6 +24,7 @@ from app.routes.auth import router as auth_router
 from app.routes.users import router as users_router
 from app.routes.cars import router as cars_router
 from app.routes.shaken import router as shaken_router
+from app.routes.ocr import router as ocr_router
 from app.routes.valuation import router as valuation_router
 from app.routes.billing import router as billing_router
 from app.routes.stores import router as stores_router
@@ -52,7 +53,24 @@ from app.routes.integrations import router as integrations_router
 from app.routes.push_notification import router as push_notification_router
 from app.routes.line_webhook import router as line_webhook_router
 from app.routes.line import router as line_router
+from app.routes.line_campaigns import router as line_campaigns_router
 from app.routes.tax_calc import router as tax_calc_router
+from app.services import (
+    expense_ocr,
+    import_jobs,
+    line_campaigns,
+    line_client,
+    line_inbox,
+    ocr_cache,
+    ocr_jobs,
+    push_queue,
+    shaken_reminders,
+    sns_reposts,
+    sns_service,
+    stripe_events,
+    thumbnails,
+    valuation_own_cache,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -138,6 +156,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 一覧 API の総件数（ページング用）
+    expose_headers=["X-Total-Count"],
 )
 
 # ============================================================
@@ -159,6 +179,55 @@ def ensure_updated_at_column():
 ensure_updated_at_column()
 
 
+# ============================================================
+# Background workers
+# ============================================================
+
+@app.on_event("startup")
+def start_workers():
+    # 販売済み車両を自社販売実績（査定の相場）に定期的に取り込む
+    valuation_own_cache.start()
+    # 再起動で取り残された領収書の OCR を積み直す
+    expense_ocr.start()
+    # OCR 結果キャッシュの件数上限を超えた分を定期的に削除する
+    ocr_cache.start()
+    # 再起動前に止まった CSV インポートを続きから再開する
+    import_jobs.start()
+    # 受信済みで未処理の LINE Webhook イベントを処理する
+    line_inbox.start()
+    # 止まった LINE キャンペーン配信を未送信の宛先から再開する
+    line_campaigns.start()
+    # 再投稿期限の来た車両を定期的に SNS へ再投稿する
+    sns_reposts.start()
+    # 受信済みで未処理の Stripe イベントを処理する
+    stripe_events.start()
+    # 毎日、車検満了が近い車両のお知らせを送る
+    shaken_reminders.start()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    valuation_own_cache.shutdown()
+    ocr_jobs.shutdown()
+    ocr_cache.shutdown()
+    expense_ocr.shutdown()
+    thumbnails.shutdown()
+    import_jobs.shutdown()
+    line_inbox.shutdown()
+    line_campaigns.shutdown()
+    sns_reposts.shutdown()
+    stripe_events.shutdown()
+    shaken_reminders.shutdown()
+    line_client.shutdown()
+    push_queue.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    # SNS 投稿の共有クライアントはアプリのイベントループ上にある
+    await sns_service.aclose_clients()
+
+
 # ============================================================
 # Routes
 # ============================================================
@@ -204,6 +273,7 @@ app.include_router(auth_router, prefix=API_PREFIX)
 app.include_router(users_router, prefix=API_PREFIX)
 app.include_router(cars_router, prefix=API_PREFIX)
 app.include_router(shaken_router, prefix=API_PREFIX)
+app.include_router(ocr_router, prefix=API_PREFIX)
 app.include_router(valuation_router, prefix=API_PREFIX)
 app.include_router(billing_router, prefix=API_PREFIX)
 app.include_router(stores_router, prefix=API_PREFIX)
@@ -232,4 +302,5 @@ app.include_router(integrations_router, prefix=API_PREFIX)
 app.include_router(push_notification_router, prefix=API_PREFIX)
 app.include_router(line_webhook_router, prefix=API_PREFIX)
 app.include_router(line_router, prefix=API_PREFIX)
+app.include_router(line_campaigns_router, prefix=API_PREFIX)
 app.include_router(tax_calc_router, prefix=API_PREFIX)
@@ -35,6 +35,8 @@ class AssetORM(Base):
 
     content_type = Column(String(128), nullable=True)
     file_path = Column(String(1024), nullable=False)
+    # アップロード時のファイル名（file_path は内容アドレスで拡張子を持たないため、ダウンロード名に使う）
+    filename = Column(String(255), nullable=True)
 
     created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow, index=True)
 
@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import date, datetime, timezone
 
-from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, String, Text, UniqueConstraint
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Index, String, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
@@ -13,6 +13,8 @@ class AttendanceORM(Base):
     __tablename__ = "attendance"
     __table_args__ = (
         UniqueConstraint("store_id", "user_id", "work_date", name="uq_attendance_user_date"),
+        # 店舗全体の期間検索（一覧・期間集計）用
+        Index("ix_attendance_store_work_date", "store_id", "work_date"),
     )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
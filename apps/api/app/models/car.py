@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Boolean, Text
+from sqlalchemy import Column, String, Integer, Date, DateTime, ForeignKey, Float, Boolean, Text, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
@@ -6,9 +6,35 @@ from datetime import datetime, timezone
 
 from app.models.base import Base
 
+# 売約・納車済みの車両ステータス（再投稿の対象外・自社販売実績の集計対象）
+SOLD_STATUSES = ("売約", "売約済み", "SOLD", "sold_out", "納車済")
+
 
 class Car(Base):
     __tablename__ = "cars"
+    __table_args__ = (
+        # CSV インポートの重複チェック・上書き先の検索用。空の VIN は対象外
+        # （同じ車両の再買取があるので一意にはしない）
+        Index(
+            "ix_cars_store_vin",
+            "store_id",
+            "vin",
+            postgresql_where=text("vin IS NOT NULL AND vin <> ''"),
+        ),
+        # 自社販売実績のバケットごとの取り込み直し（app/services/valuation_own_cache.py）
+        Index(
+            "ix_cars_valuation_bucket",
+            "valuation_bucket_id",
+            postgresql_where=text("valuation_bucket_id IS NOT NULL"),
+        ),
+        # 店舗ごとの車検満了日の範囲検索（app/services/shaken_reminders.py）
+        Index(
+            "ix_cars_store_inspection_expiry",
+            "store_id",
+            "inspection_expiry",
+            postgresql_where=text("inspection_expiry IS NOT NULL"),
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -29,6 +55,14 @@ class Car(Base):
     stock_no = Column(String, nullable=False, index=True)
     status = Column(String, nullable=False, server_default="在庫")
 
+    # 所有者の顧客（任意）。LINE キャンペーンのセグメント（車検が近い顧客など）に使う
+    customer_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("customers.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+
     make = Column(String, nullable=False)
     maker = Column(String, nullable=True)
     model = Column(String, nullable=False)
@@ -37,6 +71,8 @@ class Car(Base):
     mileage = Column(Integer, nullable=True)
 
     vin = Column(String, nullable=True)
+    # 車検満了日（7b2de5ddae9b で追加済みのカラム）
+    inspection_expiry = Column(Date, nullable=True)
     model_code = Column(String, nullable=True)
     color = Column(String, nullable=True)
 
@@ -45,6 +81,15 @@ class Car(Base):
     expected_profit = Column(Integer, nullable=True)
     expected_profit_rate = Column(Float, nullable=True)
     valuation_at = Column(DateTime(timezone=True), nullable=True)
+    # 自社販売実績（valuation_own_cache）へ集計済みになった日時
+    valuation_aggregated_at = Column(DateTime(timezone=True), nullable=True)
+    # 集計に入れたバケットと売価（変更があったときに、そのバケットだけを作り直すため）
+    valuation_bucket_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("valuation_own_cache.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    valuation_aggregated_price = Column(Integer, nullable=True)
 
     # =========================================================
     # 海外公開（export）
@@ -53,6 +98,8 @@ class Car(Base):
     export_price = Column(Integer, nullable=True)
     export_status = Column(String, nullable=True)
     export_image_url = Column(String, nullable=True)
+    # アップロードした画像のストレージ参照（外部 URL を直接指定した場合は NULL）
+    export_image_ref = Column(String(512), nullable=True)
     export_description = Column(Text, nullable=True)
 
     # --- 書類印刷用（委任状/譲渡証明） ---
@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, ForeignKey, Index, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String, text
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
@@ -44,4 +44,12 @@ class CustomerORM(Base):
 
     __table_args__ = (
         Index("ix_customers_store_name", "store_id", "name"),
+        # CSV インポートの重複チェック・上書き先の検索用。空の電話番号は対象外
+        # （家族で同じ電話番号を使うことがあるので一意にはしない）
+        Index(
+            "ix_customers_store_tel",
+            "store_id",
+            "tel",
+            postgresql_where=text("tel IS NOT NULL AND tel <> ''"),
+        ),
     )
\ No newline at end of file
@@ -36,6 +36,9 @@ class ExpenseAttachmentORM(Base):
 
     ocr_text = Column(Text, nullable=True)
     ocr_lang = Column(String(32), nullable=True)
+    # none / pending / running / done / failed（OCR はアップロード後にバックグラウンドで実行）
+    ocr_status = Column(String(16), nullable=False, default="none", server_default="none")
+    ocr_updated_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow, index=True)
 
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ImportJobORM(Base):
+    """CSV インポートのジョブ（app/services/import_jobs.py）
+
+    - アップロードしたファイルはストレージに置き、file_ref で参照する。
+      顧客の氏名・電話番号を含むので、終了から保持期間を過ぎたら削除して file_deleted_at を立てる
+    - チャンクを登録するたびに同じトランザクションで next_row / stats を更新するので、
+      ワーカーが落ちても最後に commit したチャンクの次から再開できる
+    """
+
+    __tablename__ = "import_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    # cars / customers
+    kind = Column(String(16), nullable=False)
+    # insert / upsert
+    mode = Column(String(16), nullable=False, default="insert")
+    dry_run = Column(Boolean, nullable=False, default=False)
+
+    file_ref = Column(String(512), nullable=False)
+    # file_ref のファイルを削除した日時（以降は再実行できない）
+    file_deleted_at = Column(DateTime(timezone=True), nullable=True)
+    filename = Column(String(255), nullable=True)
+    bytes_total = Column(Integer, nullable=False, default=0)
+    bytes_read = Column(Integer, nullable=False, default=0)
+
+    # queued / running / done / failed
+    status = Column(String(16), nullable=False, default="queued")
+    # 次に処理する CSV 行番号（ヘッダが 1 行目）
+    next_row = Column(Integer, nullable=False, default=2)
+    # ImportStats.to_dict()
+    stats = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+
+    # 取得したワーカーごとに変わる値。進捗の保存はこの値が一致するときだけ行い、
+    # 止まったと判定されて他のワーカーに取られたら、元のワーカーは登録をやめる
+    claim_token = Column(UUID(as_uuid=True), nullable=True)
+    # 実行中のワーカーが定期的に更新する（止まったジョブの検出用）
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow, onupdate=_utcnow)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_import_jobs_store_created", "store_id", "created_at"),
+        Index("ix_import_jobs_status", "status"),
+        Index("ix_import_jobs_file_ref", "file_ref"),
+    )
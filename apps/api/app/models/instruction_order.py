@@ -48,6 +48,7 @@ class InstructionOrderORM(Base):
     updated_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow, onupdate=_utcnow)
 
     __table_args__ = (
-        Index("ix_instruction_orders_store_due", "store_id", "due_at"),
+        # カレンダーの期間重なり検索用（due_at >= from で絞り、received_at < to はインデックス上で判定）
+        Index("ix_instruction_orders_store_due_received", "store_id", "due_at", "received_at"),
         Index("ix_instruction_orders_store_received", "store_id", "received_at"),
     )
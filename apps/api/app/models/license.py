@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, String, Text, event
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
@@ -30,6 +30,8 @@ class LicenseORM(Base):
 
     # trial / active / expired / suspended
     status = Column(String(32), nullable=False, server_default="trial")
+    # status を最後に変えた時刻（解約数の集計用。updated_at は他の列の更新でも進む）
+    status_changed_at = Column(DateTime(timezone=True), nullable=True)
 
     trial_ends_at = Column(DateTime(timezone=True), nullable=True)
     current_period_start = Column(DateTime(timezone=True), nullable=True)
@@ -67,3 +69,9 @@ class LicenseORM(Base):
         server_default="NOW()",
         onupdate=_utcnow,
     )
+
+
+@event.listens_for(LicenseORM.status, "set", active_history=True)
+def _on_status_set(target: LicenseORM, value, oldvalue, _initiator) -> None:
+    if value != oldvalue:
+        target.status_changed_at = _utcnow()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class LineCampaignORM(Base):
+    """LINE キャンペーン配信（app/services/line_campaigns.py）
+
+    - segment の条件で友だちを絞り込み、ワーカーが multicast でまとめて送る
+    - 送信できた宛先は line_messages（campaign_id 付き）に残すので、
+      ワーカーが止まっても未送信の宛先だけを続きから送れる
+    """
+
+    __tablename__ = "line_campaigns"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+
+    name = Column(String(255), nullable=True)
+    message = Column(Text, nullable=False)
+    # CampaignSegment.model_dump()
+    segment = Column(JSONB, nullable=False, default=dict)
+
+    # queued / running / done / failed / cancelled
+    status = Column(String(16), nullable=False, default="queued")
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    # 取得したワーカーごとに変わる値。他のワーカーに取り直されたら元のワーカーは送信をやめる
+    claim_token = Column(UUID(as_uuid=True), nullable=True)
+    # 実行中のワーカーが定期的に更新する（止まった配信の検出用）
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_line_campaigns_store_created", "store_id", "created_at"),
+        Index("ix_line_campaigns_status", "status"),
+    )
@@ -23,5 +23,8 @@ class LineMessageORM(Base):
 
     line_message_id = Column(String(128), nullable=True)  # LINE 側のメッセージID（inboundのみ）
 
+    # キャンペーン配信の送信ログ（app/services/line_campaigns.py）
+    campaign_id = Column(UUID(as_uuid=True), ForeignKey("line_campaigns.id", ondelete="SET NULL"), nullable=True, index=True)
+
     sent_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class LineWebhookEventORM(Base):
+    """LINE Webhook の受信イベント（app/services/line_inbox.py）
+
+    - Webhook は署名検証後にイベントをそのまま保存して 200 を返すだけ
+    - ワーカーがまとめて取り出して処理する
+    - webhook_event_id は LINE の webhookEventId。再送（isRedelivery）は一意制約で弾く
+    """
+
+    __tablename__ = "line_webhook_events"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+
+    webhook_event_id = Column(String(64), nullable=True, unique=True)
+    event_type = Column(String(32), nullable=True)
+    # LINE から受け取ったイベント JSON（1 件分）
+    payload = Column(JSONB, nullable=False)
+
+    # queued / processing / done / failed
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    # processing にした時刻（止まったワーカーの検出用）
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    # 取り出したバッチごとに発行する。done にするのは token が一致するワーカーだけ
+    claim_token = Column(UUID(as_uuid=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_line_webhook_events_pending",
+            "created_at",
+            postgresql_where=text("status IN ('queued', 'processing')"),
+        ),
+        Index("ix_line_webhook_events_status_processed", "status", "processed_at"),
+    )
@@ -3,8 +3,8 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Index, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, Computed, Date, DateTime, ForeignKey, Index, String, Text
+from sqlalchemy.dialects.postgresql import DATERANGE, UUID
 from sqlalchemy.orm import relationship
 
 from app.models.base import Base
@@ -66,6 +66,11 @@ class LoanerReservationORM(Base):
     end_date = Column(Date, nullable=False)
     note = Column(Text, nullable=True)
 
+    # [start_date, end_date]（両端を含む）。DB の生成列なので書き込み不要。
+    # 同じ代車で period が重なる行は排他制約 ex_loaner_reservations_no_overlap で禁止
+    # （btree_gist が必要なのでマイグレーション 20260307_08 でのみ作成）
+    period = Column(DATERANGE, Computed("daterange(start_date, end_date, '[]')", persisted=True))
+
     created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
     updated_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow, onupdate=_utcnow)
 
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OcrResultCacheORM(Base):
+    """OCR 結果キャッシュ（ファイル内容の SHA-256 + provider / lang / preprocess / dpi / max_pages 単位）
+
+    - 同じ車検証・領収書の再アップロード時に OCR（Google Vision の課金含む）を省略する
+    - 件数・size_bytes 合計の上限を超えた分は、ワーカーが定期的に last_used_at の古い順に削除する（app/services/ocr_cache.py）
+    """
+
+    __tablename__ = "ocr_result_cache"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+
+    content_sha256 = Column(String(64), nullable=False)
+    provider = Column(String(16), nullable=False)
+    lang = Column(String(32), nullable=False)
+    preprocess = Column(Boolean, nullable=False)
+    # PDF のラスタライズ解像度・ページ数（0 = ラスタライズしない / 全ページ）
+    dpi = Column(Integer, nullable=False, default=0)
+    max_pages = Column(Integer, nullable=False, default=0)
+
+    raw_text = Column(Text, nullable=False)
+    parsed = Column(JSONB, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "content_sha256", "provider", "lang", "preprocess", "dpi", "max_pages",
+            name="uq_ocr_result_cache_key",
+        ),
+        Index("ix_ocr_result_cache_last_used_at", "last_used_at"),
+    )
@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, ForeignKey, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
@@ -50,3 +50,9 @@ class ReferralORM(Base):
     created_at = Column(
         DateTime(timezone=True), nullable=False, default=_utcnow, server_default="NOW()"
     )
+
+    __table_args__ = (
+        # パートナー別・紹介元店舗別の件数集計用
+        Index("ix_referrals_partner_status", "partner_id", "status"),
+        Index("ix_referrals_referrer_status", "referrer_store_id", "status"),
+    )
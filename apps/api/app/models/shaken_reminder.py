@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ShakenReminderORM(Base):
+    """車検満了のお知らせの送信記録（app/services/shaken_reminders.py）
+
+    - (car_id, inspection_expiry, window_days) で一意。同じ満了日・同じ通知タイミング
+      （満了 window_days 日前）のお知らせは 1 回しか作らない
+    - 送信前に pending で作り、送信後に sent / failed / no_line にする
+    """
+
+    __tablename__ = "shaken_reminders"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    car_id = Column(UUID(as_uuid=True), ForeignKey("cars.id", ondelete="CASCADE"), nullable=False)
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id", ondelete="SET NULL"), nullable=True)
+
+    inspection_expiry = Column(Date, nullable=False)
+    # 満了の何日前の通知か（SHAKEN_REMINDER_DAYS のいずれか）
+    window_days = Column(Integer, nullable=False)
+
+    # pending / sent / failed / no_line（LINE 紐付けの友だちがいない）
+    status = Column(String(16), nullable=False, default="pending")
+    # LINE で送れた友だちの数
+    recipients = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("car_id", "inspection_expiry", "window_days", name="uq_shaken_reminders_car_window"),
+        Index("ix_shaken_reminders_store_created", "store_id", "created_at"),
+    )
@@ -71,13 +71,19 @@ class SnsPostORM(Base):
     trigger = Column(String(50), nullable=False)
     # twitter / instagram / line / all
     platform = Column(String(50), nullable=False, default="all")
-    # pending / posted / failed / skipped
+    # pending / posting / posted / failed / skipped
     status = Column(String(20), nullable=False, default="pending")
+    # 自動再投稿の冪等キー（repost:{car_id}:{予定日}）。同じキーの投稿は 1 件しか作らない
+    idempotency_key = Column(String(255), nullable=True, unique=True)
+    # 自動再投稿ワーカーが投稿を始めた時刻（posting のまま止まった投稿の検出用）
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
 
     caption = Column(Text, nullable=False)
     image_urls = Column(JSON, nullable=True)
     posted_at = Column(DateTime(timezone=True), nullable=True)
     error_message = Column(Text, nullable=True)
+    # プラットフォーム別の結果 {platform: {"status": posted/failed/skipped, "error": ..., "at": ISO8601}}
+    results = Column(JSON, nullable=True)
     repost_count = Column(Integer, nullable=False, default=0)
 
     created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class StripeEventORM(Base):
+    """Stripe Webhook の受信イベント（app/services/stripe_events.py）
+
+    - Webhook は署名検証後にイベントを保存して 200 を返すだけ
+    - stripe_event_id（evt_...）の一意制約で、Stripe の再送を二重に処理しない
+    - ワーカーが顧客ごとに発生順（stripe_created_at）で処理する
+    """
+
+    __tablename__ = "stripe_events"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+
+    stripe_event_id = Column(String(255), nullable=False, unique=True)
+    event_type = Column(String(64), nullable=False)
+    # 処理順を揃える単位（Stripe の customer id）。取れないイベントは NULL
+    stripe_customer_id = Column(String(255), nullable=True)
+    # Stripe 側のイベント発生時刻（event.created）
+    stripe_created_at = Column(DateTime(timezone=True), nullable=False)
+    # Stripe から受け取ったイベント JSON
+    payload = Column(JSONB, nullable=False)
+
+    # queued / processing / done / failed
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    # 失敗後、次に処理してよい時刻（バックオフ）
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+
+    # processing にした時刻（止まったワーカーの検出用）
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    # 取り出すたびに発行する。done / 再試行にするのは token が一致するワーカーだけ
+    claim_token = Column(UUID(as_uuid=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_stripe_events_pending",
+            "stripe_customer_id",
+            "stripe_created_at",
+            postgresql_where=text("status IN ('queued', 'processing')"),
+        ),
+        Index("ix_stripe_events_status_processed", "status", "processed_at"),
+    )
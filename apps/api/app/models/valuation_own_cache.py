@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import uuid
-from sqlalchemy import String, Integer, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import String, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -11,6 +11,12 @@ from app.db.base import Base
 
 class ValuationOwnCache(Base):
     __tablename__ = "valuation_own_cache"
+    __table_args__ = (
+        UniqueConstraint(
+            "store_id", "make", "model", "grade", "year_center", "mileage_bucket",
+            name="uq_valuation_own_cache_bucket",
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     store_id: Mapped[uuid.UUID] = mapped_column(
@@ -25,5 +31,7 @@ class ValuationOwnCache(Base):
 
     own_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
     own_median_price: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # P² 推定器の状態（中央値を全件ソートせずに逐次更新するため）
+    sketch = mapped_column(JSONB, nullable=True)
 
     updated_at = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
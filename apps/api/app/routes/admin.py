@@ -18,6 +18,7 @@ from app.models.invite import StoreInviteORM
 from app.models.license import LicenseORM
 from app.models.store import StoreORM
 from app.models.user import User
+from app.services import admin_stats
 from app.schemas.license import LicenseCreate, LicenseCreateOut, LicenseOut, LicenseUpdate
 from app.core.security import get_password_hash
 
@@ -215,6 +216,20 @@ def extend_license(
 
 # ─── Dashboard Stats ──────────────────────────────────────────
 
+class PlanStats(BaseModel):
+    plan: str
+    total: int
+    active: int
+    trial: int
+    suspended: int
+    expired: int
+    expiring_soon: int
+    churned_30d: int
+    churn_rate_30d: float
+    mrr: int                # 有効ライセンスの月額換算（税抜・割引前）
+    referral_discount: int  # 有効ライセンスの紹介割引（月額）
+
+
 class DashboardStats(BaseModel):
     total_stores: int
     total_users: int
@@ -222,31 +237,21 @@ class DashboardStats(BaseModel):
     licenses_trial: int
     licenses_suspended: int
     licenses_expiring_soon: int  # 30日以内に期限切れ
+    mrr: int
+    referral_discount: int
+    churned_30d: int             # 直近30日に expired / suspended になった数
+    churn_rate_30d: float        # churned_30d / (有効数 + churned_30d)
+    plans: List[PlanStats]
+    generated_at: datetime
 
 
 @router.get("/dashboard", response_model=DashboardStats)
-def get_dashboard_stats(db: Session = Depends(get_db)) -> DashboardStats:
-    from sqlalchemy import func as sa_func
-    now = datetime.now(timezone.utc)
-    soon = now + timedelta(days=30)
-
-    licenses = db.execute(select(LicenseORM)).scalars().all()
-    total_stores = db.execute(select(sa_func.count()).select_from(StoreORM)).scalar_one()
-    total_users = db.execute(select(sa_func.count()).select_from(User)).scalar_one()
-
-    return DashboardStats(
-        total_stores=int(total_stores),
-        total_users=int(total_users),
-        licenses_active=sum(1 for lic in licenses if lic.status == "active"),
-        licenses_trial=sum(1 for lic in licenses if lic.status == "trial"),
-        licenses_suspended=sum(1 for lic in licenses if lic.status == "suspended"),
-        licenses_expiring_soon=sum(
-            1 for lic in licenses
-            if lic.status in ("active", "trial")
-            and lic.current_period_end is not None
-            and now <= lic.current_period_end <= soon
-        ),
-    )
+def get_dashboard_stats(
+    refresh: bool = False,
+    db: Session = Depends(get_db),
+) -> DashboardStats:
+    """集計はキャッシュされる（ライセンス等の変更時、または refresh=true で作り直す）"""
+    return DashboardStats.model_validate(admin_stats.get_summary(db, refresh=refresh))
 
 
 # ─── Invites (全店舗) ─────────────────────────────────────────
@@ -4,6 +4,7 @@ GET  /attendance              一覧（管理者=全スタッフ、スタッフ=
 POST /attendance/clock-in     出勤打刻
 POST /attendance/clock-out    退勤打刻
 GET  /attendance/today        今日の打刻状況（ログインユーザー）
+GET  /attendance/timesheet    期間（既定は当月）のスタッフ別集計
 PUT  /attendance/{id}         管理者による修正
 DELETE /attendance/{id}       管理者による削除
 """
@@ -12,11 +13,11 @@ from __future__ import annotations
 
 import uuid
 from datetime import date, datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import and_, func, select
+from sqlalchemy import and_, extract, func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
@@ -30,6 +31,8 @@ from app.schemas.attendance import (
     AttendanceUpdate,
     ClockInRequest,
     ClockOutRequest,
+    TimesheetOut,
+    TimesheetUserOut,
 )
 
 router = APIRouter(tags=["attendance"])
@@ -55,16 +58,25 @@ def _is_admin(user: User) -> bool:
     return getattr(user, "role", "staff") in ADMIN_ROLES
 
 
-def _enrich(row: AttendanceORM, db: Session) -> AttendanceOut:
-    """ユーザー名を付加して AttendanceOut を返す"""
+def _enrich(row: AttendanceORM, u: Optional[User]) -> AttendanceOut:
+    """ユーザー名を付加して AttendanceOut を返す（u は呼び出し側で取得済みのもの）"""
     out = AttendanceOut.model_validate(row)
-    u = db.get(User, row.user_id)
     if u:
         out.user_name = u.name or u.email
         out.user_email = u.email
     return out
 
 
+def _month_range(month: str) -> tuple[date, date]:
+    """YYYY-MM → その月の初日と末日"""
+    try:
+        start = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month は YYYY-MM 形式で指定してください")
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
 # ─── 一覧 ────────────────────────────────────────────────────
 
 @router.get("/attendance", response_model=AttendanceListOut)
@@ -95,20 +107,96 @@ def list_attendance(
         select(func.count()).select_from(AttendanceORM).where(and_(*cond))
     ).scalar_one()
 
+    # ユーザーは JOIN で同時に取得する（同じユーザーはセッション内で 1 オブジェクトに共有される）
     rows = db.execute(
-        select(AttendanceORM)
+        select(AttendanceORM, User)
+        .outerjoin(User, User.id == AttendanceORM.user_id)
         .where(and_(*cond))
         .order_by(AttendanceORM.work_date.desc(), AttendanceORM.clock_in.desc())
         .limit(limit)
         .offset(offset)
-    ).scalars().all()
+    ).all()
 
     return AttendanceListOut(
-        items=[_enrich(r, db) for r in rows],
+        items=[_enrich(r, u) for r, u in rows],
         total=int(total),
     )
 
 
+# ─── 期間集計（給与計算用） ────────────────────────────────────
+
+@router.get("/attendance/timesheet", response_model=TimesheetOut)
+def get_timesheet(
+    month: Optional[str] = Query(None, description="YYYY-MM（start_date / end_date 指定時は不要）"),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    user_id: Optional[UUID] = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+) -> TimesheetOut:
+    """スタッフ別の日数・勤務時間を SQL で集計する（管理者=全スタッフ、スタッフ=自分のみ）"""
+    sid = _get_store_id(user)
+
+    if start_date or end_date:
+        if not (start_date and end_date):
+            raise HTTPException(status_code=400, detail="start_date と end_date は両方指定してください")
+    else:
+        start_date, end_date = _month_range(month or _today_jst().strftime("%Y-%m"))
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Invalid range")
+
+    cond = [
+        AttendanceORM.store_id == sid,
+        AttendanceORM.work_date >= start_date,
+        AttendanceORM.work_date <= end_date,
+    ]
+    if not _is_admin(user):
+        cond.append(AttendanceORM.user_id == user.id)
+    elif user_id:
+        cond.append(AttendanceORM.user_id == user_id)
+
+    completed = and_(AttendanceORM.clock_in.isnot(None), AttendanceORM.clock_out.isnot(None))
+    seconds = func.greatest(extract("epoch", AttendanceORM.clock_out - AttendanceORM.clock_in), 0)
+
+    stmt = (
+        select(
+            AttendanceORM.user_id,
+            User.name,
+            User.email,
+            func.count().label("days"),
+            func.count().filter(completed).label("completed_days"),
+            func.count().filter(
+                and_(AttendanceORM.clock_in.isnot(None), AttendanceORM.clock_out.is_(None))
+            ).label("incomplete_days"),
+            func.coalesce(func.sum(seconds).filter(completed), 0).label("total_seconds"),
+        )
+        .outerjoin(User, User.id == AttendanceORM.user_id)
+        .where(and_(*cond))
+        .group_by(AttendanceORM.user_id, User.name, User.email)
+    )
+
+    items = [
+        TimesheetUserOut(
+            user_id=r.user_id,
+            user_name=r.name or r.email,
+            user_email=r.email,
+            days=int(r.days),
+            completed_days=int(r.completed_days),
+            incomplete_days=int(r.incomplete_days),
+            total_minutes=int(r.total_seconds) // 60,
+        )
+        for r in db.execute(stmt).all()
+    ]
+    items.sort(key=lambda x: x.user_name or "")
+
+    return TimesheetOut(
+        start_date=start_date,
+        end_date=end_date,
+        items=items,
+        total_minutes=sum(x.total_minutes for x in items),
+    )
+
+
 # ─── 今日の打刻状況 ──────────────────────────────────────────
 
 @router.get("/attendance/today", response_model=Optional[AttendanceOut])
@@ -129,7 +217,7 @@ def get_today(
     ).scalar_one_or_none()
     if not row:
         return None
-    return _enrich(row, db)
+    return _enrich(row, user)
 
 
 # ─── 出勤打刻 ────────────────────────────────────────────────
@@ -169,7 +257,7 @@ def clock_in(
         db.add(existing)
         db.commit()
         db.refresh(existing)
-        return _enrich(existing, db)
+        return _enrich(existing, user)
 
     row = AttendanceORM(
         id=uuid.uuid4(),
@@ -189,7 +277,7 @@ def clock_in(
         db.rollback()
         raise HTTPException(status_code=400, detail="すでに出勤打刻済みです")
     db.refresh(row)
-    return _enrich(row, db)
+    return _enrich(row, user)
 
 
 # ─── 退勤打刻 ────────────────────────────────────────────────
@@ -229,7 +317,7 @@ def clock_out(
     db.add(row)
     db.commit()
     db.refresh(row)
-    return _enrich(row, db)
+    return _enrich(row, user)
 
 
 # ─── 管理者修正 ──────────────────────────────────────────────
@@ -255,7 +343,7 @@ def update_attendance(
     db.add(row)
     db.commit()
     db.refresh(row)
-    return _enrich(row, db)
+    return _enrich(row, db.get(User, row.user_id))
 
 
 @router.delete("/attendance/{attendance_id}")
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from datetime import date
-from uuid import UUID
-
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import and_, cast, select
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy.types import Date as SA_Date
 
 from app.db.session import get_db
 from app.deps.auth import get_current_user
@@ -18,13 +21,54 @@ from app.schemas.calendar import CalendarDayOut, CalendarEventOut, InstructionOr
 router = APIRouter(tags=["calendar"])
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+# カレンダーは画面から頻繁にポーリングされるので、短時間はブラウザのキャッシュで返す
+CALENDAR_CACHE_MAX_AGE = _env_int("CALENDAR_CACHE_MAX_AGE", 15)
+
+
+def _overlap_conds(store_id, date_from: date, date_to: date) -> list:
+    """[date_from, date_to] の日付範囲に帯がかかる指示書の条件。
+
+    列を date に cast するとインデックスが使えないので、境界側を半開区間の日時にする。
+    date のまま bind すると DB 側でセッションのタイムゾーンの 0:00 に変換されるので、
+    従来の cast(... AS date) と同じ日付の区切りになる（DATE / TIMESTAMP / TIMESTAMPTZ どれでも可）。
+    """
+    return [
+        InstructionOrderORM.store_id == store_id,
+        InstructionOrderORM.due_at >= date_from,
+        InstructionOrderORM.received_at < date_to + timedelta(days=1),
+    ]
+
+
+def _cached_json(request: Request, payload: Any) -> Response:
+    """本文のハッシュを ETag にして返す。If-None-Match が一致すれば 304。"""
+    body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={CALENDAR_CACHE_MAX_AGE}",
+    }
+
+    inm = request.headers.get("if-none-match")
+    if inm and any(t.strip().removeprefix("W/") == etag.removeprefix("W/") for t in inm.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/calendar/events", response_model=list[CalendarEventOut])
 def list_calendar_events(
+    request: Request,
     date_from: date = Query(..., alias="from"),
     date_to: date = Query(..., alias="to"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
-) -> list[CalendarEventOut]:
+):
     """カレンダー表示用イベント
 
     - 指示書（instruction_orders）の received_at〜due_at を帯で表示
@@ -34,21 +78,10 @@ def list_calendar_events(
     if date_to < date_from:
         raise HTTPException(status_code=400, detail="Invalid range")
 
-    # ★ DB側の型ズレ（DATE / TIMESTAMP / TIMESTAMPTZ）に強くするため、
-    #   比較を "date" ベースに寄せる
-    received_date = cast(InstructionOrderORM.received_at, SA_Date)
-    due_date = cast(InstructionOrderORM.due_at, SA_Date)
-
     stmt = (
         select(InstructionOrderORM, Car)
         .outerjoin(Car, Car.id == InstructionOrderORM.car_id)
-        .where(
-            InstructionOrderORM.store_id == user.store_id,
-            and_(
-                received_date <= date_to,
-                due_date >= date_from,
-            ),
-        )
+        .where(*_overlap_conds(user.store_id, date_from, date_to))
         .order_by(InstructionOrderORM.due_at.asc())
     )
 
@@ -76,31 +109,25 @@ def list_calendar_events(
             )
         )
 
-    return events
+    return _cached_json(request, events)
 
 
 @router.get("/calendar/day", response_model=CalendarDayOut)
 def get_calendar_day(
+    request: Request,
     target: date = Query(..., alias="date"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
-) -> CalendarDayOut:
+):
     """指定日の表示データ
 
     - その日に「帯がかかる」指示書（received_at <= date <= due_at）を返す
     """
 
-    received_date = cast(InstructionOrderORM.received_at, SA_Date)
-    due_date = cast(InstructionOrderORM.due_at, SA_Date)
-
     stmt = (
         select(InstructionOrderORM, Car)
         .outerjoin(Car, Car.id == InstructionOrderORM.car_id)
-        .where(
-            InstructionOrderORM.store_id == user.store_id,
-            received_date <= target,
-            due_date >= target,
-        )
+        .where(*_overlap_conds(user.store_id, target, target))
         .order_by(InstructionOrderORM.due_at.asc())
     )
 
@@ -130,4 +157,4 @@ def get_calendar_day(
             )
         )
 
-    return CalendarDayOut(date=target, items=items)
+    return _cached_json(request, CalendarDayOut(date=target, items=items))
@@ -17,6 +17,7 @@ from app.db.session import get_db
 from app.dependencies.auth import get_current_user  # ✅ “唯一の正”を使う
 from app.models.car import Car
 from app.models.car_valuation import CarValuation
+from app.models.customer import CustomerORM
 from app.models.user import User
 from app.schemas.car import CarCreate, CarRead, CarUpdate
 from app.services.valuation_service import calculate_valuation
@@ -118,6 +119,15 @@ def _norm_str(value: Any) -> Any:
     return value
 
 
+def _check_customer(db: Session, customer_id: Optional[UUID], current_user: User) -> None:
+    """他店舗の顧客は紐付けさせない。"""
+    if customer_id is None:
+        return
+    customer = db.get(CustomerORM, customer_id)
+    if customer is None or customer.store_id != current_user.store_id:
+        raise HTTPException(status_code=400, detail="customer_id が不正です")
+
+
 def _create_car_with_payload(db: Session, current_user: User, payload: Dict[str, Any]) -> Car:
     """
     CarCreate の payload を受け取り、DBモデルに合わせて整形して作成する。
@@ -149,6 +159,8 @@ def _create_car_with_payload(db: Session, current_user: User, payload: Dict[str,
     allowed_keys = {c.key for c in mapper.columns}
     payload = {k: v for k, v in payload.items() if k in allowed_keys}
 
+    _check_customer(db, payload.get("customer_id"), current_user)
+
     # 最低限チェック
     required = ["stock_no", "make", "model", "year"]
     missing = [k for k in required if payload.get(k) in (None, "")]
@@ -275,6 +287,8 @@ def update_car(
     # ✅ テナント関連の更新は拒否（万一 schema に混入しても守る）
     blocked_fields = {"id", "user_id", "store_id", "created_at", "updated_at"}
     updates = data.model_dump(exclude_unset=True)
+    if "customer_id" in updates:
+        _check_customer(db, updates["customer_id"], current_user)
 
     for key, value in updates.items():
         if key in blocked_fields:
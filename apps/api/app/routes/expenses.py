@@ -3,18 +3,12 @@ from __future__ import annotations
 import csv
 import io
 import os
-from pathlib import Path
 from datetime import date, datetime, timezone
 from decimal import Decimal
 from typing import List, Optional
 from uuid import UUID, uuid4
 
-import pytesseract
-from PIL import Image
-
-
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File, Request
-from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import and_, func, or_, select
 from sqlalchemy.orm import Session
@@ -26,6 +20,9 @@ from app.models.expense_attachment import ExpenseAttachmentORM
 from app.models.master_category import ExpenseCategoryORM
 from app.models.store_setting import StoreSettingORM
 from app.models.user import User
+from app.services import expense_ocr, storage, thumbnails
+from app.services.expense_ocr import BulkReocrRunningError
+from app.services.storage import FileTooLargeError
 
 router = APIRouter(tags=["expenses"])
 
@@ -48,6 +45,20 @@ def _to_date(value: str) -> date:
 
 def _resolve_store_id(user: User, store_id: Optional[UUID]) -> UUID:
     """store_id の決定
+    - 原則: user.store_id があればそれを固定（他店を見れない）
+    - 例外: user.store_id が無い運用（管理者）ならクエリ/ボディの store_id を必須
+    """
+    actor_store_id = getattr(user, "store_id", None)
+    if isinstance(actor_store_id, UUID):
+        if store_id and store_id != actor_store_id:
+            raise HTTPException(status_code=404, detail="Not found")
+        return actor_store_id
+
+    # actor に store_id が無い → 指定必須
+    if not store_id:
+        raise HTTPException(status_code=400, detail="store_id required")
+    return store_id
+
 
 def _normalize_name(name: str) -> str:
     return " ".join((name or "").strip().split())
@@ -98,27 +109,6 @@ def _safe_filename(name: str) -> str:
     return base
 
 
-def _uploads_root() -> Path:
-    # api/ 配下に uploads を作る
-    here = Path(__file__).resolve()
-    # app/routes/expenses.py -> app -> api root
-    api_root = here.parents[2]
-    return api_root / "uploads"
-    - 原則: user.store_id があればそれを固定（他店を見れない）
-    - 例外: user.store_id が無い運用（管理者）ならクエリ/ボディの store_id を必須
-    """
-    actor_store_id = getattr(user, "store_id", None)
-    if isinstance(actor_store_id, UUID):
-        if store_id and store_id != actor_store_id:
-            raise HTTPException(status_code=404, detail="Not found")
-        return actor_store_id
-
-    # actor に store_id が無い → 指定必須
-    if not store_id:
-        raise HTTPException(status_code=400, detail="store_id required")
-    return store_id
-
-
 # ============================================================
 # schemas
 # ============================================================
@@ -420,6 +410,7 @@ class ExpenseAttachmentOut(BaseModel):
     content_type: str
     created_at: datetime
     has_ocr: bool = False
+    ocr_status: str = "none"
 
     class Config:
         from_attributes = True
@@ -454,6 +445,7 @@ def list_expense_attachments(
                 content_type=r.content_type,
                 created_at=r.created_at,
                 has_ocr=bool(r.ocr_text),
+                ocr_status=r.ocr_status or "none",
             )
         )
     return out
@@ -479,50 +471,37 @@ async def upload_expense_attachment(
     if not file:
         raise HTTPException(status_code=400, detail="file required")
 
-    contents = await file.read()
-    if len(contents) > 20 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="File too large (max 20MB)")
-
     fname = _safe_filename(file.filename or "receipt")
     content_type = file.content_type or "application/octet-stream"
 
-    # 保存先
-    base_dir = _uploads_root() / "expenses" / str(sid) / str(expense_id)
-    base_dir.mkdir(parents=True, exist_ok=True)
-
-    # ファイル名衝突回避
-    save_name = f"{uuid4()}_{fname}"
-    save_path = base_dir / save_name
-    save_path.write_bytes(contents)
-
-    # OCR（画像のみ：png/jpg/jpeg/webp）
-    ocr_text = None
-    used_lang = None
-    if do_ocr and content_type.lower().startswith("image/"):
-        try:
-            img = Image.open(save_path)
-            # そこそこ効く設定：向き補正は別途だが、まずはベース
-            ocr_text = pytesseract.image_to_string(img, lang=ocr_lang) or None
-            used_lang = ocr_lang
-        except Exception:
-            # OCR失敗しても添付自体は成功扱い
-            ocr_text = None
-            used_lang = None
+    # チャンク単位でハッシュを取りながら保存（同一ファイルは実体を共有）
+    try:
+        stored = await storage.save_upload(file, max_bytes=20 * 1024 * 1024, content_type=content_type)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large (max 20MB)")
+
+    # OCR（画像のみ：png/jpg/jpeg/webp）はレスポンス後にバックグラウンドで実行する
+    queue_ocr = do_ocr and expense_ocr.is_ocr_target(content_type)
 
     row = ExpenseAttachmentORM(
         store_id=sid,
         expense_id=expense_id,
         filename=fname,
         content_type=content_type,
-        storage_path=str(save_path),
-        size_bytes=str(len(contents)),
-        ocr_text=ocr_text,
-        ocr_lang=used_lang,
+        storage_path=stored.ref,
+        size_bytes=str(stored.size),
+        ocr_text=None,
+        ocr_lang=ocr_lang if queue_ocr else None,
+        ocr_status=expense_ocr.OCR_PENDING if queue_ocr else expense_ocr.OCR_NONE,
     )
     db.add(row)
     db.commit()
     db.refresh(row)
 
+    if queue_ocr:
+        expense_ocr.enqueue(row.id, lang=ocr_lang, notify_user_id=user.id)
+    thumbnails.enqueue(stored.ref, content_type)
+
     return ExpenseAttachmentOut(
         id=row.id,
         expense_id=row.expense_id,
@@ -530,13 +509,40 @@ async def upload_expense_attachment(
         content_type=row.content_type,
         created_at=row.created_at,
         has_ocr=bool(row.ocr_text),
+        ocr_status=row.ocr_status,
     )
 
 
-@router.get("/expenses/attachments/{attachment_id}/download")
+@router.post("/expenses/attachments/re-ocr", status_code=202)
+def reocr_expense_attachments(
+    store_id: Optional[UUID] = Query(None),
+    only_missing: bool = Query(True, description="未OCR・失敗分のみ（False で全画像を再OCR）"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """メンテナンス用：店舗の画像添付を一括で再OCRする（毎分の処理件数を制限して逐次実行）"""
+    if getattr(user, "role", None) not in ("admin", "manager", "superadmin"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    sid = _resolve_store_id(user, store_id)
+
+    try:
+        queued = expense_ocr.start_bulk_reocr(sid, only_missing=only_missing)
+    except BulkReocrRunningError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {
+        "queued": queued,
+        "per_minute": expense_ocr.EXPENSE_REOCR_PER_MINUTE,
+    }
+
+
+@router.api_route("/expenses/attachments/{attachment_id}/download", methods=["GET", "HEAD"])
 def download_expense_attachment(
+    request: Request,
     attachment_id: UUID,
     store_id: Optional[UUID] = Query(None),
+    w: Optional[int] = Query(None, ge=1, le=4096, description="サムネイル幅（画像のみ。固定幅に丸める）"),
+    fmt: str = Query("auto", pattern="^(auto|webp|avif)$"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -545,12 +551,25 @@ def download_expense_attachment(
     if not row or row.store_id != sid:
         raise HTTPException(status_code=404, detail="Not found")
 
-    path = Path(row.storage_path)
-    if not path.exists():
+    if not storage.exists(row.storage_path):
         raise HTTPException(status_code=404, detail="File not found on server")
 
-    return FileResponse(
-        path=str(path),
+    ref, media_type = thumbnails.variant(
+        row.storage_path,
+        content_type=row.content_type,
+        width=w,
+        fmt=fmt,
+        accept=request.headers.get("accept"),
+    )
+    if ref != row.storage_path:
+        # サムネイルは一覧表示用なのでインライン表示
+        resp = storage.file_response(request, ref, media_type=media_type, inline=True)
+        resp.headers["Vary"] = "Accept"
+        return resp
+
+    return storage.file_response(
+        request,
+        row.storage_path,
         media_type=row.content_type or "application/octet-stream",
         filename=row.filename,
     )
@@ -3,16 +3,26 @@ from __future__ import annotations
 from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.dependencies.auth import get_current_user
 from app.models.car import Car
+from app.models.user import User
+from app.routes.cars import _get_car_owned
+from app.services import storage, thumbnails
+from app.services.storage import FileTooLargeError
 
 router = APIRouter(tags=["export"])
 
+EXPORT_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+
+# 一覧カードに使うサムネイル幅
+EXPORT_LIST_THUMB_WIDTH = 320
+
 
 class ExportVehicleOut(BaseModel):
     id: UUID
@@ -25,12 +35,27 @@ class ExportVehicleOut(BaseModel):
     export_price: Optional[int] = None
     export_status: Optional[str] = None
     export_image_url: Optional[str] = None
+    # 一覧用の縮小画像（アップロード画像のみ。外部 URL の場合は export_image_url と同じ）
+    export_image_thumb_url: Optional[str] = None
     export_description: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+def _image_url(car_id: UUID) -> str:
+    return f"/api/v1/export/vehicles/{car_id}/image"
+
+
+def _to_out(car: Car) -> ExportVehicleOut:
+    out = ExportVehicleOut.model_validate(car)
+    if car.export_image_ref:
+        out.export_image_thumb_url = f"{_image_url(car.id)}?w={EXPORT_LIST_THUMB_WIDTH}"
+    else:
+        out.export_image_thumb_url = car.export_image_url
+    return out
+
+
 @router.get("/export/vehicles", response_model=list[ExportVehicleOut])
 def list_export_vehicles(db: Session = Depends(get_db)) -> list[ExportVehicleOut]:
     """公開対象（export_enabled=true）の車両一覧（認証不要）"""
@@ -41,7 +66,7 @@ def list_export_vehicles(db: Session = Depends(get_db)) -> list[ExportVehicleOut
         .order_by(Car.updated_at.desc())
         .limit(500)
     )
-    return db.execute(stmt).scalars().all()
+    return [_to_out(car) for car in db.execute(stmt).scalars().all()]
 
 
 @router.get("/export/vehicles/{car_id}", response_model=ExportVehicleOut)
@@ -49,4 +74,65 @@ def get_export_vehicle(car_id: UUID, db: Session = Depends(get_db)) -> ExportVeh
     car = db.get(Car, car_id)
     if not car or not getattr(car, "export_enabled", False):
         raise HTTPException(status_code=404, detail="Vehicle not found")
-    return car
+    return _to_out(car)
+
+
+@router.post("/export/vehicles/{car_id}/image", response_model=ExportVehicleOut)
+async def upload_export_image(
+    car_id: UUID,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> ExportVehicleOut:
+    """公開用画像をアップロードし、export_image_url を配信 URL に差し替える。"""
+    car = _get_car_owned(db, car_id, current_user)
+
+    content_type = (file.content_type or "").lower()
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="image required")
+
+    try:
+        stored = await storage.save_upload(file, max_bytes=EXPORT_IMAGE_MAX_BYTES, content_type=content_type)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+
+    car.export_image_ref = stored.ref
+    car.export_image_url = _image_url(car.id)
+    db.commit()
+    db.refresh(car)
+    thumbnails.enqueue(stored.ref, content_type)
+    return _to_out(car)
+
+
+@router.get("/export/vehicles/{car_id}/image")
+def get_export_image(
+    request: Request,
+    car_id: UUID,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="サムネイル幅（固定幅に丸める）"),
+    fmt: str = Query("auto", pattern="^(auto|webp|avif)$"),
+    db: Session = Depends(get_db),
+):
+    """公開用画像（認証不要）。w を付けると WebP / AVIF の縮小画像を返す。"""
+    car = db.get(Car, car_id)
+    if not car or not getattr(car, "export_enabled", False) or not car.export_image_ref:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not storage.exists(car.export_image_ref):
+        raise HTTPException(status_code=404, detail="File not found on server")
+
+    content_type = thumbnails.sniff_content_type(storage.read_head(car.export_image_ref))
+    ref, media_type = thumbnails.variant(
+        car.export_image_ref,
+        content_type=content_type,
+        width=w,
+        fmt=fmt,
+        accept=request.headers.get("accept"),
+    )
+    resp = storage.file_response(
+        request,
+        ref,
+        media_type=media_type,
+        inline=True,
+        cache_control="public, max-age=300",
+    )
+    resp.headers["Vary"] = "Accept"
+    return resp
@@ -6,34 +6,48 @@ CSV インポート API
 - POST /import/cars               → 実インポート
 - POST /import/customers?dry_run=true
 - POST /import/customers
+- mode=upsert を付けると登録済みの車体番号 / 電話番号は上書き（既定 insert はスキップ）
+- 同期の API は IMPORT_SYNC_MAX_BYTES（既定 5MB）まで
+
+大きいファイルはジョブとして投入する（HTTP リクエスト内で処理しない）
+- POST /import/jobs?kind=cars|customers  → 202 + job_id
+- GET  /import/jobs/{job_id}             → 進捗・結果
+- GET  /import/jobs/{job_id}/events      → Server-Sent Events で進捗を配信
+- POST /import/jobs/{job_id}/retry       → 失敗したジョブを続きから再実行
 """
 from __future__ import annotations
 
-import csv
-import io
-import re
-from datetime import datetime, timezone
+import asyncio
+import json
+import os
 from typing import Any, Dict, List, Optional
-from uuid import UUID, uuid4
+from uuid import UUID
 
 from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
-from app.models.car import Car
-from app.models.customer import CustomerORM
+from app.db.session import SessionLocal, get_db
+from app.models.import_job import ImportJobORM
+from app.services import csv_import, import_jobs, storage
+from app.services.storage import FileTooLargeError
 
 router = APIRouter(prefix="/import", tags=["import"])
 
+# ジョブ（/import/jobs）は旧 DMS からの移行ファイル（数十万行）も受け付ける
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES") or 100 * 1024 * 1024)
+# 同期（/import/cars・/import/customers）はリクエスト内で処理するので小さいファイルだけ。
+# 大きいファイルはジョブで投入する
+IMPORT_SYNC_MAX_BYTES = int(os.getenv("IMPORT_SYNC_MAX_BYTES") or 5 * 1024 * 1024)
 
-# ── Utils ─────────────────────────────────────────────────────────────────────
+# SSE: 進捗の確認間隔とキープアライブ間隔（プロキシのアイドル切断対策）
+SSE_POLL_SEC = 1.0
+SSE_KEEPALIVE_SEC = 15
 
-def _utcnow() -> datetime:
-    return datetime.now(timezone.utc)
 
+# ── Utils ─────────────────────────────────────────────────────────────────────
 
 def _get_store_id(request: Request) -> Optional[UUID]:
     user = getattr(request.state, "user", None)
@@ -61,35 +75,6 @@ def _get_user_id(request: Request) -> Optional[UUID]:
     return None
 
 
-def _decode(content: bytes) -> str:
-    """UTF-8 BOM → UTF-8 → Shift-JIS → cp932 の順で試みる"""
-    for enc in ("utf-8-sig", "utf-8", "shift_jis", "cp932"):
-        try:
-            return content.decode(enc)
-        except (UnicodeDecodeError, LookupError):
-            continue
-    return content.decode("utf-8", errors="replace")
-
-
-def _parse(text: str) -> List[Dict[str, str]]:
-    reader = csv.DictReader(io.StringIO(text))
-    return [dict(r) for r in reader]
-
-
-def _s(v: Any) -> str:
-    return str(v or "").strip()
-
-
-def _int_or_none(v: Any) -> Optional[int]:
-    s = re.sub(r"[^\d\-]", "", _s(v))
-    if not s:
-        return None
-    try:
-        return int(s)
-    except ValueError:
-        return None
-
-
 # ── Templates ─────────────────────────────────────────────────────────────────
 
 CAR_HEADERS = [
@@ -149,64 +134,60 @@ class ImportResult(BaseModel):
     valid: int
     errors: int
     imported: int        # 0 の場合は dry_run
+    updated: int = 0     # imported のうち既存データを上書きした件数（mode=upsert）
+    # 先頭数行 + エラー行（上限あり）。全行は返さない
     rows: List[ImportRowResult]
-
-
-# ── Car validation & import ───────────────────────────────────────────────────
-
-def _validate_car(
-    idx: int,
-    row: Dict[str, str],
-    seen_vins: set,
-    db_vins: set,
-) -> ImportRowResult:
-    d = {
-        "管理番号":        _s(row.get("管理番号")),
-        "メーカー":        _s(row.get("メーカー")),
-        "車種":            _s(row.get("車種")),
-        "グレード":        _s(row.get("グレード")),
-        "年式":            _s(row.get("年式")),
-        "走行距離":        _s(row.get("走行距離(km)")),
-        "VIN":             _s(row.get("車体番号(VIN)")),
-        "型式":            _s(row.get("型式")),
-        "カラー":          _s(row.get("カラー")),
-        "買取価格":        _s(row.get("買取価格")),
-        "販売価格":        _s(row.get("販売価格")),
-        "現所有者名":      _s(row.get("現所有者名")),
-        "現所有者フリガナ": _s(row.get("現所有者フリガナ")),
-        "現所有者郵便番号": _s(row.get("現所有者郵便番号")),
-        "現所有者住所1":   _s(row.get("現所有者住所1")),
-        "現所有者住所2":   _s(row.get("現所有者住所2")),
-        "現所有者電話番号": _s(row.get("現所有者電話番号")),
-    }
-
-    errs: List[str] = []
-    if not d["管理番号"]:
-        errs.append("管理番号は必須です")
-    if not d["メーカー"]:
-        errs.append("メーカーは必須です")
-    if not d["車種"]:
-        errs.append("車種は必須です")
-
-    vin = d["VIN"]
-    if vin:
-        if vin in seen_vins:
-            errs.append(f"車体番号 {vin} がCSV内で重複")
-        elif vin in db_vins:
-            errs.append(f"車体番号 {vin} はすでに登録済み")
-        else:
-            seen_vins.add(vin)
-
-    if errs:
-        return ImportRowResult(row=idx, status="error", reason=" / ".join(errs), data=d)
-    return ImportRowResult(row=idx, status="ok", data=d)
+    truncated: bool = False
+    error_summary: Dict[str, int] = {}
+
+
+# ── Import ────────────────────────────────────────────────────────────────────
+
+def _check_size(file: UploadFile) -> None:
+    f = file.file
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    if size > IMPORT_SYNC_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"{IMPORT_SYNC_MAX_BYTES // (1024 * 1024)}MBを超えるファイルは"
+                "ジョブ（POST /import/jobs）で投入してください"
+            ),
+        )
+
+
+def _run(
+    db: Session,
+    spec: csv_import.ImportSpec,
+    file: UploadFile,
+    *,
+    store_id: UUID,
+    user_id: Optional[UUID],
+    dry_run: bool,
+    mode: str,
+) -> ImportResult:
+    _check_size(file)
+    # UploadFile の実体はディスクに退避された一時ファイルなので、そのまま逐次読みする
+    stats = csv_import.run_import(
+        db,
+        spec,
+        file.file,
+        store_id=store_id,
+        user_id=user_id,
+        dry_run=dry_run,
+        mode=mode,
+    )
+    return ImportResult(**stats.to_dict())
 
 
 @router.post("/cars", response_model=ImportResult)
-async def import_cars(
+def import_cars(
     request: Request,
     file: UploadFile = File(...),
     dry_run: bool = Query(default=False),
+    mode: str = Query(default=csv_import.MODE_INSERT, pattern="^(insert|upsert)$"),
     db: Session = Depends(get_db),
 ) -> ImportResult:
     store_id = _get_store_id(request)
@@ -214,176 +195,144 @@ async def import_cars(
     if not store_id or not user_id:
         raise HTTPException(status_code=401, detail="認証が必要です")
 
-    content = await file.read()
-    if len(content) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="ファイルは5MB以下にしてください")
-
-    rows = _parse(_decode(content))
-    if not rows:
-        return ImportResult(total=0, valid=0, errors=0, imported=0, rows=[])
-
-    # DB 上の既存 VIN を取得
-    db_vins: set = {
-        v for v in db.execute(
-            select(Car.vin).where(Car.store_id == store_id, Car.vin.isnot(None))
-        ).scalars().all()
-        if v
-    }
-
-    seen_vins: set = set()
-    results: List[ImportRowResult] = []
-    for idx, row in enumerate(rows, start=2):
-        results.append(_validate_car(idx, row, seen_vins, db_vins))
-
-    valid = [r for r in results if r.status == "ok"]
-    imported = 0
-
-    if not dry_run and valid:
-        now = _utcnow()
-        for r in valid:
-            d = r.data
-            db.add(Car(
-                id=uuid4(),
-                store_id=store_id,
-                user_id=user_id,
-                stock_no=d["管理番号"],
-                status="在庫",
-                make=d["メーカー"],
-                maker=d["メーカー"],
-                model=d["車種"],
-                grade=d["グレード"] or None,
-                year=_int_or_none(d["年式"]),
-                mileage=_int_or_none(d["走行距離"]),
-                vin=d["VIN"] or None,
-                model_code=d["型式"] or None,
-                color=d["カラー"] or None,
-                expected_buy_price=_int_or_none(d["買取価格"]),
-                expected_sell_price=_int_or_none(d["販売価格"]),
-                owner_name=d["現所有者名"] or None,
-                owner_name_kana=d["現所有者フリガナ"] or None,
-                owner_postal_code=d["現所有者郵便番号"] or None,
-                owner_address1=d["現所有者住所1"] or None,
-                owner_address2=d["現所有者住所2"] or None,
-                owner_tel=d["現所有者電話番号"] or None,
-                created_at=now,
-                updated_at=now,
-            ))
-        db.commit()
-        imported = len(valid)
-
-    return ImportResult(
-        total=len(rows),
-        valid=len(valid),
-        errors=len(results) - len(valid),
-        imported=imported,
-        rows=results,
-    )
-
-
-# ── Customer validation & import ──────────────────────────────────────────────
-
-def _validate_customer(
-    idx: int,
-    row: Dict[str, str],
-    seen_tels: set,
-    db_tels: set,
-) -> ImportRowResult:
-    d = {
-        "顧客名":   _s(row.get("顧客名")),
-        "フリガナ": _s(row.get("フリガナ")),
-        "敬称":     _s(row.get("敬称")),
-        "郵便番号": _s(row.get("郵便番号")),
-        "住所1":    _s(row.get("住所1")),
-        "住所2":    _s(row.get("住所2")),
-        "電話番号": _s(row.get("電話番号")),
-        "メール":   _s(row.get("メールアドレス")),
-        "担当者名": _s(row.get("担当者名")),
-        "支払条件": _s(row.get("支払条件")),
-    }
-
-    errs: List[str] = []
-    if not d["顧客名"]:
-        errs.append("顧客名は必須です")
-
-    tel = d["電話番号"]
-    if tel:
-        if tel in seen_tels:
-            errs.append(f"電話番号 {tel} がCSV内で重複")
-        elif tel in db_tels:
-            errs.append(f"電話番号 {tel} はすでに登録済み")
-        else:
-            seen_tels.add(tel)
-
-    if errs:
-        return ImportRowResult(row=idx, status="error", reason=" / ".join(errs), data=d)
-    return ImportRowResult(row=idx, status="ok", data=d)
+    return _run(db, csv_import.CAR_SPEC, file, store_id=store_id, user_id=user_id, dry_run=dry_run, mode=mode)
 
 
 @router.post("/customers", response_model=ImportResult)
-async def import_customers(
+def import_customers(
     request: Request,
     file: UploadFile = File(...),
     dry_run: bool = Query(default=False),
+    mode: str = Query(default=csv_import.MODE_INSERT, pattern="^(insert|upsert)$"),
     db: Session = Depends(get_db),
 ) -> ImportResult:
     store_id = _get_store_id(request)
     if not store_id:
         raise HTTPException(status_code=401, detail="認証が必要です")
 
-    content = await file.read()
-    if len(content) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="ファイルは5MB以下にしてください")
-
-    rows = _parse(_decode(content))
-    if not rows:
-        return ImportResult(total=0, valid=0, errors=0, imported=0, rows=[])
-
-    # DB 上の既存電話番号（store 内）
-    db_tels: set = {
-        v for v in db.execute(
-            select(CustomerORM.tel).where(
-                CustomerORM.store_id == store_id,
-                CustomerORM.tel.isnot(None),
-            )
-        ).scalars().all()
-        if v
-    }
-
-    seen_tels: set = set()
-    results: List[ImportRowResult] = []
-    for idx, row in enumerate(rows, start=2):
-        results.append(_validate_customer(idx, row, seen_tels, db_tels))
-
-    valid = [r for r in results if r.status == "ok"]
-    imported = 0
-
-    if not dry_run and valid:
-        now = _utcnow()
-        for r in valid:
-            d = r.data
-            db.add(CustomerORM(
-                id=uuid4(),
-                store_id=store_id,
-                name=d["顧客名"],
-                name_kana=d["フリガナ"] or None,
-                honorific=d["敬称"] or "御中",
-                postal_code=d["郵便番号"] or None,
-                address1=d["住所1"] or None,
-                address2=d["住所2"] or None,
-                tel=d["電話番号"] or None,
-                email=d["メール"] or None,
-                contact_person=d["担当者名"] or None,
-                payment_terms=d["支払条件"] or None,
-                created_at=now,
-                updated_at=now,
-            ))
-        db.commit()
-        imported = len(valid)
-
-    return ImportResult(
-        total=len(rows),
-        valid=len(valid),
-        errors=len(results) - len(valid),
-        imported=imported,
-        rows=results,
+    return _run(db, csv_import.CUSTOMER_SPEC, file, store_id=store_id, user_id=None, dry_run=dry_run, mode=mode)
+
+
+# ── Jobs ──────────────────────────────────────────────────────────────────────
+
+def _get_job_or_404(db: Session, job_id: UUID, request: Request):
+    store_id = _get_store_id(request)
+    if not store_id:
+        raise HTTPException(status_code=401, detail="認証が必要です")
+    job = import_jobs.get_job(db, job_id, store_id=store_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs", status_code=202)
+async def submit_import_job(
+    request: Request,
+    kind: str = Query(..., pattern="^(cars|customers)$"),
+    file: UploadFile = File(...),
+    dry_run: bool = Query(default=False),
+    mode: str = Query(default=csv_import.MODE_INSERT, pattern="^(insert|upsert)$"),
+    db: Session = Depends(get_db),
+) -> Dict[str, Any]:
+    """CSV をストレージに保存してジョブを投入し、job_id を即時返す。"""
+    store_id = _get_store_id(request)
+    user_id = _get_user_id(request)
+    if not store_id or (kind == "cars" and not user_id):
+        raise HTTPException(status_code=401, detail="認証が必要です")
+
+    try:
+        stored = await storage.save_upload(file, max_bytes=IMPORT_MAX_BYTES, content_type="text/csv")
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=413,
+            detail=f"ファイルは{IMPORT_MAX_BYTES // (1024 * 1024)}MB以下にしてください",
+        )
+
+    try:
+        job = await run_in_threadpool(
+            import_jobs.create_job,
+            db,
+            kind=kind,
+            store_id=store_id,
+            user_id=user_id,
+            stored=stored,
+            filename=file.filename,
+            mode=mode,
+            dry_run=dry_run,
+        )
+    except import_jobs.FileExpiredError:
+        # 同じ内容の古いファイルの削除と重なった
+        raise HTTPException(status_code=409, detail="もう一度アップロードしてください")
+    return {"job_id": str(job.id), "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+def get_import_job(job_id: UUID, request: Request, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """ポーリング用。status が done になれば result に ImportResult と同じ形の結果が入る。"""
+    return import_jobs.to_dict(_get_job_or_404(db, job_id, request))
+
+
+@router.post("/jobs/{job_id}/retry", status_code=202)
+def retry_import_job(job_id: UUID, request: Request, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    job = _get_job_or_404(db, job_id, request)
+    if job.status != import_jobs.FAILED:
+        raise HTTPException(status_code=409, detail="失敗したジョブのみ再実行できます")
+    try:
+        job = import_jobs.retry_job(db, job)
+    except import_jobs.FileExpiredError:
+        raise HTTPException(status_code=410, detail="ファイルの保存期間を過ぎたため再実行できません。もう一度アップロードしてください")
+    return {"job_id": str(job.id), "status": job.status}
+
+
+def _check_job(job_id: UUID, request: Request) -> None:
+    with SessionLocal() as db:
+        _get_job_or_404(db, job_id, request)
+
+
+def _load_job_dict(job_id: UUID) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        job = db.get(ImportJobORM, job_id)
+        return import_jobs.to_dict(job) if job is not None else None
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_import_job(job_id: UUID, request: Request) -> StreamingResponse:
+    """
+    Server-Sent Events で進捗を返す。
+
+    event: progress … 進捗が変わるたび（rows_parsed / rows_valid / rows_inserted など）
+    event: result   … 完了時（done / failed）。送信後にストリームを閉じる
+
+    進捗は DB から読むので、ジョブを実行しているプロセスと別のプロセスに繋がっても届く。
+    """
+    # 同期の DB アクセスはイベントループを止めないようスレッドで行う
+    await run_in_threadpool(_check_job, job_id, request)
+
+    async def _events():
+        last: Optional[str] = None
+        idle = 0.0
+        while True:
+            if await request.is_disconnected():
+                return
+            data = await run_in_threadpool(_load_job_dict, job_id)
+            if data is None:
+                return
+            payload = json.dumps(data, ensure_ascii=False)
+            if data["status"] in import_jobs.FINISHED_STATUSES:
+                yield f"event: result\ndata: {payload}\n\n"
+                return
+            if payload != last:
+                last = payload
+                idle = 0.0
+                yield f"event: progress\ndata: {payload}\n\n"
+            elif idle >= SSE_KEEPALIVE_SEC:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(SSE_POLL_SEC)
+            idle += SSE_POLL_SEC
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
@@ -111,6 +111,20 @@ class BroadcastRequest(BaseModel):
     message: str
 
 
+class MulticastRequest(BaseModel):
+    line_customer_ids: List[uuid.UUID]
+    message: str
+
+
+class MulticastResult(BaseModel):
+    status: str
+    requested: int
+    sent: int
+    failed: int
+    # 失敗した宛先（line_customer_id → エラー）
+    errors: Dict[str, str] = {}
+
+
 class NotifyWorkOrderRequest(BaseModel):
     line_customer_id: uuid.UUID
     car_name: str
@@ -349,6 +363,54 @@ def broadcast(
     return {"status": "ok"}
 
 
+@router.post("/messages/multicast", response_model=MulticastResult)
+def multicast(
+    body: MulticastRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> MulticastResult:
+    """指定した友だちに同じメッセージを送信（500 人ずつ Multicast でまとめて送る）"""
+    store_id = _require_store(current_user)
+    _require_admin(current_user)
+    setting = _get_setting(db, store_id)
+    if not setting or not setting.channel_access_token:
+        raise HTTPException(status_code=400, detail="LINE 設定が未完了です")
+
+    # ブロックされている友だちには送らない
+    rows = db.execute(
+        select(LineCustomerORM.id, LineCustomerORM.line_user_id).where(
+            LineCustomerORM.store_id == store_id,
+            LineCustomerORM.id.in_(set(body.line_customer_ids)),
+            LineCustomerORM.follow_status == "following",
+        )
+    ).all()
+    by_user = {r.line_user_id: r.id for r in rows}
+
+    sent, failed = line_service.multicast_message(list(by_user), body.message, setting.channel_access_token)
+
+    now = _utcnow()
+    db.add_all([
+        LineMessageORM(
+            store_id=store_id,
+            line_customer_id=by_user[u],
+            direction="outbound",
+            message_type="text",
+            content=body.message,
+            sent_at=now,
+        )
+        for u in sent
+    ])
+    db.commit()
+
+    return MulticastResult(
+        status="ok" if not failed else ("partial" if sent else "error"),
+        requested=len(by_user),
+        sent=len(sent),
+        failed=len(failed),
+        errors={str(by_user[u]): err for u, err in failed.items()},
+    )
+
+
 # ============================================================
 # 通知テンプレート
 # ============================================================
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.dependencies.request_user import attach_current_user, get_current_user
+from app.dependencies.store import require_admin, require_store
+from app.models.line_campaign import LineCampaignORM
+from app.routes.line import _get_setting
+from app.services import line_campaigns
+
+router = APIRouter(
+    prefix="/line/campaigns",
+    tags=["line"],
+    dependencies=[Depends(attach_current_user)],
+)
+
+
+# ============================================================
+# Pydantic スキーマ
+# ============================================================
+
+class CampaignSegment(BaseModel):
+    """宛先の条件（すべて AND。未指定の条件は絞り込まない）"""
+    linked: bool = False
+    shaken_due_from: Optional[date] = None
+    shaken_due_to: Optional[date] = None
+    last_visit_from: Optional[date] = None
+    last_visit_to: Optional[date] = None
+
+    @model_validator(mode="after")
+    def _check_ranges(self) -> "CampaignSegment":
+        if self.shaken_due_from and self.shaken_due_to and self.shaken_due_from > self.shaken_due_to:
+            raise ValueError("shaken_due_from は shaken_due_to 以前にしてください")
+        if self.last_visit_from and self.last_visit_to and self.last_visit_from > self.last_visit_to:
+            raise ValueError("last_visit_from は last_visit_to 以前にしてください")
+        return self
+
+
+class CampaignCreate(BaseModel):
+    name: Optional[str] = Field(default=None, max_length=255)
+    message: str = Field(min_length=1, max_length=5000)
+    segment: CampaignSegment = CampaignSegment()
+
+
+class CampaignPreviewOut(BaseModel):
+    recipients: int
+
+
+class CampaignOut(BaseModel):
+    id: uuid.UUID
+    name: Optional[str] = None
+    message: str
+    segment: dict
+    status: str
+    total: int
+    sent: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+# ============================================================
+# エンドポイント
+# ============================================================
+
+@router.post("/preview", response_model=CampaignPreviewOut)
+def preview_campaign(
+    body: CampaignSegment,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> CampaignPreviewOut:
+    """セグメントに該当する友だちの人数"""
+    store_id = require_store(current_user)
+    return CampaignPreviewOut(
+        recipients=line_campaigns.count_recipients(db, store_id, body.model_dump(mode="json"))
+    )
+
+
+@router.post("", response_model=CampaignOut, status_code=202)
+def create_campaign(
+    body: CampaignCreate,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> CampaignOut:
+    """キャンペーンを登録して配信を開始する（配信はバックグラウンド）"""
+    store_id = require_store(current_user)
+    require_admin(current_user)
+    setting = _get_setting(db, store_id)
+    if not setting or not setting.channel_access_token:
+        raise HTTPException(status_code=400, detail="LINE 設定が未完了です")
+
+    campaign = line_campaigns.create_campaign(
+        db,
+        store_id=store_id,
+        user_id=current_user.id,
+        name=body.name,
+        message=body.message,
+        segment=body.segment.model_dump(mode="json"),
+    )
+    return CampaignOut.model_validate(campaign)
+
+
+@router.get("", response_model=List[CampaignOut])
+def list_campaigns(
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> List[CampaignOut]:
+    store_id = require_store(current_user)
+    rows = db.execute(
+        select(LineCampaignORM)
+        .where(LineCampaignORM.store_id == store_id)
+        .order_by(LineCampaignORM.created_at.desc())
+        .limit(limit)
+        .offset(offset)
+    ).scalars().all()
+    return [CampaignOut.model_validate(r) for r in rows]
+
+
+@router.get("/{campaign_id}", response_model=CampaignOut)
+def get_campaign(
+    campaign_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> CampaignOut:
+    """配信の進捗（total / sent / failed）"""
+    store_id = require_store(current_user)
+    campaign = line_campaigns.get_campaign(db, campaign_id, store_id=store_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Not found")
+    return CampaignOut.model_validate(campaign)
+
+
+@router.post("/{campaign_id}/cancel", response_model=CampaignOut)
+def cancel_campaign(
+    campaign_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> CampaignOut:
+    store_id = require_store(current_user)
+    require_admin(current_user)
+    campaign = line_campaigns.get_campaign(db, campaign_id, store_id=store_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        campaign = line_campaigns.cancel_campaign(db, campaign)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="配信が完了しているためキャンセルできません")
+    return CampaignOut.model_validate(campaign)
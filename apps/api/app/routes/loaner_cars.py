@@ -1,27 +1,36 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import and_, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
 from app.models.loaner_car import LoanerCarORM, LoanerReservationORM
-from app.routes.push_notification import send_push_to_store
 from app.schemas.loaner_car import (
+    LoanerAvailabilityOut,
     LoanerCarCreate,
     LoanerCarOut,
     LoanerCarUpdate,
+    LoanerFreeSlot,
     LoanerReservationCreate,
     LoanerReservationOut,
     LoanerReservationUpdate,
 )
+from app.services import push_queue
 
 router = APIRouter(tags=["loaner_cars"])
 
+# 空き状況検索で一度に指定できる最大日数
+AVAILABILITY_MAX_DAYS = 366
+
+# 排他制約 ex_loaner_reservations_no_overlap 違反
+_EXCLUSION_VIOLATION = "23P01"
+
 
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
@@ -40,6 +49,23 @@ def _get_store_id(request: Request) -> UUID:
     raise HTTPException(status_code=400, detail="store_id required")
 
 
+def _period(start_date, end_date):
+    """[start_date, end_date]（両端を含む）の daterange。"""
+    return func.daterange(start_date, end_date, "[]")
+
+
+def _overlap_error(start_date, end_date, customer_name: Optional[str] = None) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=(
+            f"代車の予約期間が重複しています。"
+            f"（既存: {start_date} 〜 {end_date}"
+            + (f"、顧客: {customer_name}" if customer_name else "")
+            + "）"
+        ),
+    )
+
+
 def _check_overlap(
     db: Session,
     loaner_car_id: UUID,
@@ -49,14 +75,13 @@ def _check_overlap(
 ) -> None:
     """同一代車で期間が重なる予約がある場合は 400 を返す。
 
-    重複判定: 既存の [s, e] と新規の [start, end] が重なる条件
-        既存.start_date <= 新規.end_date AND 既存.end_date >= 新規.start_date
+    既存予約を示したメッセージを返すための事前チェック。
+    同時に登録された場合の二重予約は DB の排他制約で防ぐ（_commit_reservation）。
     """
     stmt = select(LoanerReservationORM).where(
         and_(
             LoanerReservationORM.loaner_car_id == loaner_car_id,
-            LoanerReservationORM.start_date <= end_date,
-            LoanerReservationORM.end_date >= start_date,
+            LoanerReservationORM.period.op("&&")(_period(start_date, end_date)),
         )
     )
     if exclude_id:
@@ -64,15 +89,40 @@ def _check_overlap(
 
     conflict = db.execute(stmt).scalars().first()
     if conflict:
-        raise HTTPException(
-            status_code=400,
-            detail=(
-                f"代車の予約期間が重複しています。"
-                f"（既存: {conflict.start_date} 〜 {conflict.end_date}"
-                + (f"、顧客: {conflict.customer_name}" if conflict.customer_name else "")
-                + "）"
-            ),
-        )
+        raise _overlap_error(conflict.start_date, conflict.end_date, conflict.customer_name)
+
+
+def _commit_reservation(db: Session) -> None:
+    """予約を commit する。事前チェック後に他の予約が先に登録されて重なった場合も 400 にする。"""
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) == _EXCLUSION_VIOLATION:
+            raise HTTPException(
+                status_code=400,
+                detail="代車の予約期間が重複しています。（同じ期間の予約が先に登録されました）",
+            ) from e
+        raise
+
+
+def _free_slots(
+    reservations: List[LoanerReservationORM],
+    date_from: date,
+    date_to: date,
+) -> List[LoanerFreeSlot]:
+    """[date_from, date_to] のうち予約で埋まっていない区間（reservations は start_date 順）。"""
+    slots: List[LoanerFreeSlot] = []
+    cursor = date_from
+    for r in reservations:
+        if r.start_date > cursor:
+            slots.append(LoanerFreeSlot(start_date=cursor, end_date=min(r.start_date - timedelta(days=1), date_to)))
+        cursor = max(cursor, r.end_date + timedelta(days=1))
+        if cursor > date_to:
+            break
+    if cursor <= date_to:
+        slots.append(LoanerFreeSlot(start_date=cursor, end_date=date_to))
+    return slots
 
 
 # ============================================================
@@ -161,6 +211,65 @@ def delete_loaner_car(
     return {"deleted": True}
 
 
+# ============================================================
+# 空き状況
+# ============================================================
+
+@router.get("/loaner-cars/availability", response_model=List[LoanerAvailabilityOut])
+def get_availability(
+    request: Request,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    only_free: bool = Query(False, description="期間すべてが空いている代車だけ返す"),
+    db: Session = Depends(get_db),
+) -> List[LoanerAvailabilityOut]:
+    """指定期間の全代車の空き状況（有効な代車のみ）
+
+    代車と期間に重なる予約を 1 クエリで取得し、代車ごとの空き区間を返す。
+    """
+    store_id = _get_store_id(request)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Invalid range")
+    if (date_to - date_from).days + 1 > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"期間は {AVAILABILITY_MAX_DAYS} 日以内で指定してください")
+
+    stmt = (
+        select(LoanerCarORM, LoanerReservationORM)
+        .outerjoin(
+            LoanerReservationORM,
+            and_(
+                LoanerReservationORM.loaner_car_id == LoanerCarORM.id,
+                LoanerReservationORM.period.op("&&")(_period(date_from, date_to)),
+            ),
+        )
+        .where(LoanerCarORM.store_id == store_id, LoanerCarORM.is_active.is_(True))
+        .order_by(LoanerCarORM.name.asc(), LoanerCarORM.id, LoanerReservationORM.start_date.asc())
+    )
+
+    grouped: dict[UUID, tuple[LoanerCarORM, List[LoanerReservationORM]]] = {}
+    for car, res in db.execute(stmt).all():
+        _, items = grouped.setdefault(car.id, (car, []))
+        if res is not None:
+            items.append(res)
+
+    out: List[LoanerAvailabilityOut] = []
+    for car, items in grouped.values():
+        if only_free and items:
+            continue
+        out.append(
+            LoanerAvailabilityOut(
+                loaner_car_id=car.id,
+                name=car.name,
+                plate_no=car.plate_no,
+                color=car.color,
+                available=not items,
+                free_slots=_free_slots(items, date_from, date_to),
+                reservations=[LoanerReservationOut.model_validate(r) for r in items],
+            )
+        )
+    return out
+
+
 # ============================================================
 # 代車予約 CRUD
 # ============================================================
@@ -227,7 +336,7 @@ def create_reservation(
         updated_at=now,
     )
     db.add(reservation)
-    db.commit()
+    _commit_reservation(db)
     db.refresh(reservation)
 
     # プッシュ通知: 返却期限が今日の場合に通知
@@ -235,7 +344,7 @@ def create_reservation(
     today = date_cls.today()
     if reservation.end_date == today:
         try:
-            send_push_to_store(db, str(store_id), {
+            push_queue.enqueue_store(store_id, {
                 "title": "代車の返却期限",
                 "body": f"{reservation.customer_name} 様の代車（{car.name}）は本日返却予定です。",
                 "url": "/loaner",
@@ -275,7 +384,7 @@ def update_reservation(
         res.note = body.note
 
     res.updated_at = _utcnow()
-    db.commit()
+    _commit_reservation(db)
     db.refresh(res)
     return res
 
@@ -3,8 +3,7 @@ from __future__ import annotations
 import uuid
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import or_, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
@@ -17,32 +16,29 @@ from app.schemas.maintenance_preset import (
     MaintenancePresetUpdate,
     VEHICLE_CATEGORIES,
 )
+from app.services import work_catalog
 
 router = APIRouter(prefix="/maintenance-presets", tags=["maintenance-presets"])
 
 
 @router.get("", response_model=list[MaintenancePresetOut])
 def list_presets(
+    request: Request,
+    response: Response,
     vehicle_category: Optional[str] = Query(default=None),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ) -> list[MaintenancePresetOut]:
-    """店舗固有プリセット + システムデフォルト（store_id=NULL）を返す"""
-    stmt = (
-        select(MaintenancePresetORM)
-        .where(
-            or_(
-                MaintenancePresetORM.store_id == user.store_id,
-                MaintenancePresetORM.store_id.is_(None),
-            )
-        )
-        .order_by(MaintenancePresetORM.sort_order, MaintenancePresetORM.name)
+    """店舗固有プリセット + システムデフォルト（store_id=NULL）を返す（店舗ごとのカタログから）"""
+    catalog = work_catalog.get_preset_catalog(db, user.store_id)
+    not_modified = work_catalog.conditional(
+        request, response, work_catalog.variant_etag(catalog.etag, vehicle_category or "")
     )
+    if not_modified is not None:
+        return not_modified
     if vehicle_category:
-        stmt = stmt.where(MaintenancePresetORM.vehicle_category == vehicle_category)
-
-    rows = db.execute(stmt).scalars().all()
-    return [MaintenancePresetOut.model_validate(r) for r in rows]
+        return catalog.by_vehicle_category.get(vehicle_category, [])
+    return catalog.items
 
 
 @router.get("/categories", response_model=list[str])
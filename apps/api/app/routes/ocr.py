@@ -1,11 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
-import tempfile
 import os
 import logging
 from typing import Dict, Any
 
-from app.services.shaken_ocr import extract_text_from_pdf_or_ocr, parse_shaken_text
+from app.dependencies.auth import get_current_user
+from app.services import ocr_jobs
+from app.services.ocr_jobs import OcrQueueFullError
 
 router = APIRouter(prefix="/ocr", tags=["ocr"])
 
@@ -17,16 +18,19 @@ ALLOWED_CONTENT_TYPES = {
     "image/jpg",
     "image/png",
     "image/webp",
-    "image/tiff",
 }
 
-ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".webp", ".tiff", ".tif"}
+# shaken_ocr が読める形式だけ（TIFF は非対応）
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".webp"}
 
 
 @router.post("/shaken")
-async def ocr_shaken(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def ocr_shaken(
+    file: UploadFile = File(...),
+    current_user=Depends(get_current_user),
+) -> Dict[str, Any]:
     """
-    車検証OCR API
+    車検証OCR API（同期版）。画面からはジョブ（POST /shaken/jobs → GET /shaken/jobs/{id}）を使う
 
     入力: PDF / PNG / JPG / WEBP
 
@@ -70,15 +74,21 @@ async def ocr_shaken(file: UploadFile = File(...)) -> Dict[str, Any]:
             detail="ファイルサイズが大きすぎます（最大20MB）",
         )
 
-    tmp_path: str | None = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
+        # OCR / PDF 抽出はジョブキュー（プロセスプール）で実行し、イベントループを塞がない
+        job = ocr_jobs.submit_shaken_job(
+            filename=file.filename,
+            content=contents,
+            store_id=current_user.store_id,
+        )
+        await job.done.wait()
 
-        # OCR / PDF 抽出
-        text = extract_text_from_pdf_or_ocr(tmp_path)
+        if job.status == ocr_jobs.TIMEOUT:
+            raise HTTPException(status_code=504, detail="OCR処理がタイムアウトしました。")
+        if job.status != ocr_jobs.DONE or not job.result:
+            raise RuntimeError(job.error or "OCR failed")
 
+        text = job.result.get("raw_text") or ""
         if not text or len(text.strip()) < 10:
             raise HTTPException(
                 status_code=422,
@@ -86,7 +96,7 @@ async def ocr_shaken(file: UploadFile = File(...)) -> Dict[str, Any]:
             )
 
         # フィールド抽出
-        fields = parse_shaken_text(text)
+        fields = {k: v for k, v in job.result.items() if k != "raw_text"}
 
         return JSONResponse(
             {
@@ -96,6 +106,13 @@ async def ocr_shaken(file: UploadFile = File(...)) -> Dict[str, Any]:
             }
         )
 
+    except OcrQueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="OCR処理が混み合っています。しばらくしてから再度お試しください。",
+            headers={"Retry-After": "10"},
+        )
+
     except HTTPException:
         raise
 
@@ -106,10 +123,3 @@ async def ocr_shaken(file: UploadFile = File(...)) -> Dict[str, Any]:
             status_code=500,
             detail="OCR処理に失敗しました。再度お試しください。",
         )
-
-    finally:
-        if tmp_path:
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
@@ -4,7 +4,7 @@ import uuid
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
@@ -15,7 +15,8 @@ from app.models.partner import PartnerORM, generate_partner_code
 from app.models.referral import ReferralORM
 from app.models.store import StoreORM
 from app.schemas.partner import PartnerCreate, PartnerOut, PartnerStats, PartnerUpdate
-from app.schemas.referral import REFERRAL_DISCOUNT_PER_ACTIVE, RANK_THRESHOLDS
+from app.schemas.referral import REFERRAL_DISCOUNT_PER_ACTIVE
+from app.services import referrals
 
 router = APIRouter(
     prefix="/admin/partners",
@@ -26,13 +27,14 @@ router = APIRouter(
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 
-def _active_referral_count(db: Session, partner_id: uuid.UUID) -> int:
-    return db.execute(
-        select(func.count()).select_from(ReferralORM).where(
-            ReferralORM.partner_id == partner_id,
-            ReferralORM.status == "active",
-        )
-    ).scalar_one()
+def _select_with_counts():
+    """パートナー・店舗・active 紹介数を 1 クエリで取る SELECT"""
+    counts = referrals.partner_counts_subquery()
+    return (
+        select(PartnerORM, StoreORM, func.coalesce(counts.c.active_count, 0))
+        .join(StoreORM, StoreORM.id == PartnerORM.store_id)
+        .outerjoin(counts, counts.c.partner_id == PartnerORM.id)
+    )
 
 
 def _to_out(partner: PartnerORM, store: StoreORM, referral_count: int = 0) -> PartnerOut:
@@ -54,35 +56,27 @@ def _to_out(partner: PartnerORM, store: StoreORM, referral_count: int = 0) -> Pa
     )
 
 
-def _auto_update_rank(partner: PartnerORM, active_count: int) -> bool:
-    """active referral 数に基づいてランクを自動更新。変更あれば True を返す。"""
-    new_rank = "silver"
-    if active_count >= RANK_THRESHOLDS["platinum"]:
-        new_rank = "platinum"
-    elif active_count >= RANK_THRESHOLDS["gold"]:
-        new_rank = "gold"
-
-    if partner.rank != new_rank:
-        partner.rank = new_rank
-        partner.rank_updated_at = datetime.now(timezone.utc)
-        return True
-    return False
-
-
 # ─── Endpoints ───────────────────────────────────────────────────────────────
 
 @router.get("", response_model=List[PartnerOut])
-def list_partners(db: Session = Depends(get_db)) -> List[PartnerOut]:
+def list_partners(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+) -> List[PartnerOut]:
+    """総件数は X-Total-Count ヘッダーで返す（画面側のページングに使う）"""
+    total = db.scalar(
+        select(func.count()).select_from(PartnerORM).join(StoreORM, StoreORM.id == PartnerORM.store_id)
+    )
+    response.headers["X-Total-Count"] = str(total or 0)
     rows = db.execute(
-        select(PartnerORM, StoreORM)
-        .join(StoreORM, StoreORM.id == PartnerORM.store_id)
-        .order_by(PartnerORM.created_at.desc())
+        _select_with_counts()
+        .order_by(PartnerORM.created_at.desc(), PartnerORM.id)
+        .limit(limit)
+        .offset(offset)
     ).all()
-    result = []
-    for partner, store in rows:
-        count = _active_referral_count(db, partner.id)
-        result.append(_to_out(partner, store, count))
-    return result
+    return [_to_out(partner, store, int(count)) for partner, store, count in rows]
 
 
 @router.post("", response_model=PartnerOut, status_code=status.HTTP_201_CREATED)
@@ -126,29 +120,25 @@ def create_partner(body: PartnerCreate, db: Session = Depends(get_db)) -> Partne
 def get_partner_by_code(code: str, db: Session = Depends(get_db)) -> PartnerOut:
     """コードからパートナーを検索（登録時バリデーション用）。"""
     row = db.execute(
-        select(PartnerORM, StoreORM)
-        .join(StoreORM, StoreORM.id == PartnerORM.store_id)
+        _select_with_counts()
         .where(PartnerORM.code == code.upper(), PartnerORM.is_active == True)
     ).first()
     if not row:
         raise HTTPException(status_code=404, detail="パートナーコードが見つかりません")
-    partner, store = row
-    count = _active_referral_count(db, partner.id)
-    return _to_out(partner, store, count)
+    partner, store, count = row
+    return _to_out(partner, store, int(count))
 
 
 @router.get("/{partner_id}", response_model=PartnerOut)
 def get_partner(partner_id: str, db: Session = Depends(get_db)) -> PartnerOut:
     row = db.execute(
-        select(PartnerORM, StoreORM)
-        .join(StoreORM, StoreORM.id == PartnerORM.store_id)
+        _select_with_counts()
         .where(PartnerORM.id == uuid.UUID(partner_id))
     ).first()
     if not row:
         raise HTTPException(status_code=404, detail="Partner not found")
-    partner, store = row
-    count = _active_referral_count(db, partner.id)
-    return _to_out(partner, store, count)
+    partner, store, count = row
+    return _to_out(partner, store, int(count))
 
 
 @router.put("/{partner_id}", response_model=PartnerOut)
@@ -177,7 +167,7 @@ def update_partner(
     db.commit()
     db.refresh(partner)
     store = db.get(StoreORM, partner.store_id)
-    count = _active_referral_count(db, partner.id)
+    count = referrals.active_count_for_partner(db, partner.id)
     return _to_out(partner, store, count)  # type: ignore[arg-type]
 
 
@@ -192,13 +182,29 @@ def delete_partner(partner_id: str, db: Session = Depends(get_db)) -> None:
 
 
 @router.get("/{partner_id}/stores", response_model=List[dict])
-def list_partner_stores(partner_id: str, db: Session = Depends(get_db)) -> List[dict]:
-    """パートナー経由で紹介された店舗一覧。"""
+def list_partner_stores(
+    partner_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+) -> List[dict]:
+    """パートナー経由で紹介された店舗一覧。総件数は X-Total-Count ヘッダー。"""
+    pid = uuid.UUID(partner_id)
+    total = db.scalar(
+        select(func.count())
+        .select_from(ReferralORM)
+        .join(StoreORM, StoreORM.id == ReferralORM.referred_store_id)
+        .where(ReferralORM.partner_id == pid)
+    )
+    response.headers["X-Total-Count"] = str(total or 0)
     rows = db.execute(
         select(ReferralORM, StoreORM)
         .join(StoreORM, StoreORM.id == ReferralORM.referred_store_id)
-        .where(ReferralORM.partner_id == uuid.UUID(partner_id))
-        .order_by(ReferralORM.created_at.desc())
+        .where(ReferralORM.partner_id == pid)
+        .order_by(ReferralORM.created_at.desc(), ReferralORM.id)
+        .limit(limit)
+        .offset(offset)
     ).all()
     return [
         {
@@ -220,17 +226,17 @@ def get_partner_stats(partner_id: str, db: Session = Depends(get_db)) -> Partner
     if not partner:
         raise HTTPException(status_code=404, detail="Partner not found")
 
-    referrals = db.execute(
-        select(ReferralORM).where(ReferralORM.partner_id == pid)
-    ).scalars().all()
-
-    active = sum(1 for r in referrals if r.status == "active")
-    pending = sum(1 for r in referrals if r.status == "pending")
+    counts = db.execute(
+        select(
+            func.count().filter(ReferralORM.status == referrals.ACTIVE),
+            func.count().filter(ReferralORM.status == referrals.PENDING),
+        ).where(ReferralORM.partner_id == pid)
+    ).one()
+    active, pending = int(counts[0]), int(counts[1])
     total_discount = active * REFERRAL_DISCOUNT_PER_ACTIVE * 12  # 年間概算
 
     # ランク自動更新チェック
-    if _auto_update_rank(partner, active):
-        partner.updated_at = datetime.now(timezone.utc)
+    if referrals.apply_rank(partner, active):
         db.commit()
 
     return PartnerStats(
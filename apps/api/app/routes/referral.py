@@ -3,22 +3,21 @@ from __future__ import annotations
 import secrets
 import string
 import uuid
-from datetime import datetime, timezone
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 
 from app.db.session import get_db
 from app.dependencies.request_user import attach_current_user, get_current_user
 from app.dependencies.permissions import require_roles
 from app.models.license import LicenseORM
-from app.models.partner import PartnerORM
 from app.models.referral import ReferralORM
 from app.models.store import StoreORM
 from app.schemas.license_invoice import PLAN_PRICES
 from app.schemas.referral import MyDiscountOut, REFERRAL_DISCOUNT_PER_ACTIVE, ReferralOut
+from app.services import referrals
 
 router = APIRouter(
     prefix="/referrals",
@@ -69,47 +68,52 @@ def _to_out(ref: ReferralORM, referrer_name: str, referred_name: str) -> Referra
     )
 
 
+def _select_with_names():
+    """紹介と紹介元・紹介先の店舗名を 1 クエリで取る SELECT"""
+    referrer = aliased(StoreORM, name="referrer")
+    referred = aliased(StoreORM, name="referred")
+    return (
+        select(ReferralORM, referrer.name, referred.name)
+        .outerjoin(referrer, referrer.id == ReferralORM.referrer_store_id)
+        .outerjoin(referred, referred.id == ReferralORM.referred_store_id)
+    )
+
+
+def _rows_to_out(rows) -> List[ReferralOut]:
+    return [_to_out(ref, referrer_name or "", referred_name or "") for ref, referrer_name, referred_name in rows]
+
+
 # ─── Endpoints ───────────────────────────────────────────────────────────────
 
 @router.get("", response_model=List[ReferralOut])
 def list_referrals(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ) -> List[ReferralOut]:
-    """admin: 全件 / store: 自分関連（referrer or referred）。"""
-    Referrer = StoreORM.__table__.alias("referrer")
-    Referred = StoreORM.__table__.alias("referred")
-
-    if current_user.role in ("superadmin", "admin", "manager"):
-        rows = db.execute(
-            select(ReferralORM, StoreORM.name.label("referrer_name"))
-            .join(StoreORM, StoreORM.id == ReferralORM.referrer_store_id)
-            .order_by(ReferralORM.created_at.desc())
-        ).all()
-
-        result = []
-        for ref, referrer_name in rows:
-            referred_store = db.get(StoreORM, ref.referred_store_id)
-            result.append(_to_out(ref, referrer_name, referred_store.name if referred_store else ""))
-        return result
-
-    # staff/store ユーザーは自分の店舗に関連するもののみ
-    if not current_user.store_id:
-        return []
-
-    rows = db.execute(
-        select(ReferralORM).where(
+    """admin: 全件 / store: 自分関連（referrer or referred）。総件数は X-Total-Count ヘッダー。"""
+    stmt = _select_with_names()
+    count_stmt = select(func.count()).select_from(ReferralORM)
+
+    if current_user.role not in ("superadmin", "admin", "manager"):
+        # staff/store ユーザーは自分の店舗に関連するもののみ
+        if not current_user.store_id:
+            response.headers["X-Total-Count"] = "0"
+            return []
+        own = (
             (ReferralORM.referrer_store_id == current_user.store_id) |
             (ReferralORM.referred_store_id == current_user.store_id)
-        ).order_by(ReferralORM.created_at.desc())
-    ).scalars().all()
+        )
+        stmt = stmt.where(own)
+        count_stmt = count_stmt.where(own)
 
-    result = []
-    for ref in rows:
-        referrer = db.get(StoreORM, ref.referrer_store_id)
-        referred = db.get(StoreORM, ref.referred_store_id)
-        result.append(_to_out(ref, referrer.name if referrer else "", referred.name if referred else ""))
-    return result
+    response.headers["X-Total-Count"] = str(db.scalar(count_stmt) or 0)
+    rows = db.execute(
+        stmt.order_by(ReferralORM.created_at.desc(), ReferralORM.id).limit(limit).offset(offset)
+    ).all()
+    return _rows_to_out(rows)
 
 
 @router.post(
@@ -125,20 +129,11 @@ def activate_referral(referral_id: str, db: Session = Depends(get_db)) -> Referr
     if ref.status == "active":
         raise HTTPException(status_code=400, detail="既にアクティブです")
 
-    ref.status = "active"
-    ref.activated_at = datetime.now(timezone.utc)
+    # 紹介元店舗のライセンス割引・パートナーランクも同じトランザクションで更新
+    referrals.activate(db, ref)
     db.commit()
 
-    # 紹介元店舗のライセンス割引を再計算
-    _recalc_referral_discount(db, ref.referrer_store_id)
-
-    # パートナーランク自動更新
-    if ref.partner_id:
-        _update_partner_rank(db, ref.partner_id)
-
-    referrer = db.get(StoreORM, ref.referrer_store_id)
-    referred = db.get(StoreORM, ref.referred_store_id)
-    return _to_out(ref, referrer.name if referrer else "", referred.name if referred else "")
+    return _rows_to_out(db.execute(_select_with_names().where(ReferralORM.id == ref.id)).all())[0]
 
 
 @router.get("/my-code")
@@ -158,25 +153,31 @@ def get_my_code(
 
 @router.get("/my-referrals", response_model=List[ReferralOut])
 def my_referrals(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ) -> List[ReferralOut]:
-    """自分が紹介した店舗一覧。"""
+    """自分が紹介した店舗一覧。総件数は X-Total-Count ヘッダー。"""
     if not current_user.store_id:
+        response.headers["X-Total-Count"] = "0"
         return []
 
+    total = db.scalar(
+        select(func.count())
+        .select_from(ReferralORM)
+        .where(ReferralORM.referrer_store_id == current_user.store_id)
+    )
+    response.headers["X-Total-Count"] = str(total or 0)
     rows = db.execute(
-        select(ReferralORM)
+        _select_with_names()
         .where(ReferralORM.referrer_store_id == current_user.store_id)
-        .order_by(ReferralORM.created_at.desc())
-    ).scalars().all()
-
-    result = []
-    referrer = db.get(StoreORM, current_user.store_id)
-    for ref in rows:
-        referred = db.get(StoreORM, ref.referred_store_id)
-        result.append(_to_out(ref, referrer.name if referrer else "", referred.name if referred else ""))
-    return result
+        .order_by(ReferralORM.created_at.desc(), ReferralORM.id)
+        .limit(limit)
+        .offset(offset)
+    ).all()
+    return _rows_to_out(rows)
 
 
 @router.get("/my-discount", response_model=MyDiscountOut)
@@ -214,34 +215,3 @@ def my_discount(
         monthly_price_after=price_after,
         free_slots_needed=slots_needed,
     )
-
-
-# ─── Internal helpers ─────────────────────────────────────────────────────────
-
-def _recalc_referral_discount(db: Session, store_id: uuid.UUID) -> None:
-    """紹介元店舗のライセンス割引額を再計算して保存。"""
-    active_count = db.execute(
-        select(func.count()).select_from(ReferralORM).where(
-            ReferralORM.referrer_store_id == store_id,
-            ReferralORM.status == "active",
-        )
-    ).scalar_one()
-
-    lic = db.execute(
-        select(LicenseORM).where(LicenseORM.store_id == store_id)
-    ).scalar_one_or_none()
-    if lic:
-        lic.referral_discount = active_count * REFERRAL_DISCOUNT_PER_ACTIVE
-        db.commit()
-
-
-def _update_partner_rank(db: Session, partner_id: uuid.UUID) -> None:
-    """パートナーのランクをactive referral数に基づいて自動更新。"""
-    from app.routes.partner import _auto_update_rank, _active_referral_count
-    partner = db.get(PartnerORM, partner_id)
-    if not partner:
-        return
-    active = _active_referral_count(db, partner_id)
-    if _auto_update_rank(partner, active):
-        partner.updated_at = datetime.now(timezone.utc)
-        db.commit()
@@ -1,18 +1,55 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+import asyncio
+import json
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.dependencies.store import require_admin, require_store
+from app.models.shaken_reminder import ShakenReminderORM
 from app.routes.cars import get_current_user, get_db
-from app.services.shaken_ocr import (
-    OcrConfig,
-    ShakenOcrError,
-    ocr_text_from_file_bytes,
-    parse_shaken_text_to_json,
-)
+from app.services import ocr_jobs, shaken_reminders
+from app.services.ocr_jobs import OcrQueueFullError
 
 router = APIRouter(prefix="/shaken", tags=["shaken"])
 
+MAX_BYTES = 10 * 1024 * 1024
+
+# SSE のキープアライブ間隔（プロキシのアイドル切断対策）
+SSE_KEEPALIVE_SEC = 15
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    content = await file.read()
+    if len(content) > MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+    return content
+
+
+def _submit(file: UploadFile, content: bytes, current_user) -> ocr_jobs.OcrJob:
+    try:
+        return ocr_jobs.submit_shaken_job(
+            filename=file.filename or "upload",
+            content=content,
+            store_id=current_user.store_id,
+        )
+    except OcrQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+
+def _get_job_or_404(job_id: str, current_user) -> ocr_jobs.OcrJob:
+    job = ocr_jobs.get_job(job_id, store_id=current_user.store_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 
 @router.post("/parse", status_code=status.HTTP_200_OK)
 async def parse_shaken(
@@ -20,23 +57,166 @@ async def parse_shaken(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    MAX_BYTES = 10 * 1024 * 1024
-    content = await file.read()
+    """
+    同期版（互換用）。OCR はジョブキューのプロセスプールで実行し、完了を待って返す。
+    イベントループはブロックしない。
+    """
+    content = await _read_upload(file)
+    job = _submit(file, content, current_user)
+    await job.done.wait()
 
-    if len(content) > MAX_BYTES:
-        raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+    if job.status == ocr_jobs.DONE:
+        return {"shaken": job.result}
+    if job.status == ocr_jobs.TIMEOUT:
+        raise HTTPException(status_code=504, detail=job.error)
+    if job.error and job.error != ocr_jobs.INTERNAL_ERROR:
+        raise HTTPException(status_code=400, detail=job.error)
+    raise HTTPException(status_code=500, detail="Failed to parse shaken")
 
-    try:
-        text = ocr_text_from_file_bytes(
-            filename=file.filename or "upload",
-            content=content,
-            cfg=OcrConfig(lang="jpn", preprocess=True),
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_shaken_job(
+    file: UploadFile = File(...),
+    current_user=Depends(get_current_user),
+):
+    """車検証 OCR ジョブを投入し、job_id を即時返す。"""
+    content = await _read_upload(file)
+    job = _submit(file, content, current_user)
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+def get_shaken_job(
+    job_id: str,
+    current_user=Depends(get_current_user),
+):
+    """ポーリング用。status が done になれば result に解析結果（/parse の shaken と同じ内容）が入る。"""
+    job = _get_job_or_404(job_id, current_user)
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_shaken_job(
+    job_id: str,
+    current_user=Depends(get_current_user),
+):
+    """
+    Server-Sent Events で進捗を返す。
+
+    event: status  … 接続直後の状態
+    event: result  … 完了時（done / failed / timeout）。送信後にストリームを閉じる
+    """
+    job = _get_job_or_404(job_id, current_user)
+
+    async def _events():
+        yield f"event: status\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+        while not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=SSE_KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+        yield f"event: result\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============================================================
+# Pydantic スキーマ
+# ============================================================
+
+class ShakenDueCar(BaseModel):
+    id: uuid.UUID
+    stock_no: str
+    make: str
+    model: str
+    grade: Optional[str] = None
+    customer_id: Optional[uuid.UUID] = None
+    inspection_expiry: date
+    days_left: int
+
+
+class ShakenReminderOut(BaseModel):
+    id: uuid.UUID
+    car_id: uuid.UUID
+    customer_id: Optional[uuid.UUID] = None
+    inspection_expiry: date
+    window_days: int
+    status: str
+    recipients: int
+    error: Optional[str] = None
+    created_at: datetime
+    sent_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class ShakenReminderRunOut(BaseModel):
+    reminders: int
+    line_sent: int
+    line_failed: int
+    no_line: int
+
+
+# ============================================================
+# エンドポイント
+# ============================================================
+
+@router.get("/due", response_model=List[ShakenDueCar])
+def list_due_cars(
+    within_days: int = Query(60, ge=0, le=366),
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> List[ShakenDueCar]:
+    """今日から within_days 日以内に車検満了を迎える車両"""
+    store_id = require_store(current_user)
+    today = shaken_reminders.today_jst()
+    cars = db.execute(
+        shaken_reminders.due_cars_query(store_id, today, today + timedelta(days=within_days))
+        .limit(limit)
+        .offset(offset)
+    ).scalars().all()
+    return [
+        ShakenDueCar(
+            id=c.id,
+            stock_no=c.stock_no,
+            make=c.make,
+            model=c.model,
+            grade=c.grade,
+            customer_id=c.customer_id,
+            inspection_expiry=c.inspection_expiry,
+            days_left=(c.inspection_expiry - today).days,
         )
-        shaken = parse_shaken_text_to_json(text)
-        return {"shaken": shaken}
+        for c in cars
+    ]
+
+
+@router.get("/reminders", response_model=List[ShakenReminderOut])
+def list_reminders(
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+) -> List[ShakenReminderOut]:
+    store_id = require_store(current_user)
+    rows = db.execute(
+        select(ShakenReminderORM)
+        .where(ShakenReminderORM.store_id == store_id)
+        .order_by(ShakenReminderORM.created_at.desc())
+        .limit(limit)
+        .offset(offset)
+    ).scalars().all()
+    return [ShakenReminderOut.model_validate(r) for r in rows]
 
-    except ShakenOcrError as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to parse shaken")
\ No newline at end of file
+@router.post("/reminders/run", response_model=ShakenReminderRunOut)
+def run_reminders(current_user=Depends(get_current_user)) -> ShakenReminderRunOut:
+    """今日が通知タイミングで未送信のお知らせを送る（送信済みは送らない）"""
+    store_id = require_store(current_user)
+    require_admin(current_user)
+    return ShakenReminderRunOut(**shaken_reminders.run_store(store_id))
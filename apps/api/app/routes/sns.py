@@ -8,6 +8,8 @@ POST /sns/posts/{id}/retry      失敗投稿のリトライ
 GET  /sns/preview               投稿プレビュー生成
 GET  /sns/repost-schedule       定期再投稿候補一覧
 POST /sns/trigger               車両イベントからの自動トリガー
+
+再投稿期限の来た車両は app.services.sns_reposts が定期的に自動で再投稿する。
 """
 
 from __future__ import annotations
@@ -37,8 +39,10 @@ from app.schemas.sns import (
 )
 from app.services.sns_service import (
     execute_sns_post,
+    failed_platforms,
     generate_caption,
     get_repost_due_cars,
+    result_status,
 )
 from app.models.user import User
 
@@ -81,6 +85,19 @@ def _get_template(setting: SnsSettingORM, trigger: str) -> str:
     return setting.new_arrival_template
 
 
+def _apply_results(db: Session, post: SnsPostORM, results: dict) -> None:
+    """プラットフォーム別の結果を既存の results にマージし、status / error_message を更新する"""
+    merged = dict(post.results or {})
+    merged.update(results)
+    post.results = merged
+    post.status, post.error_message = result_status(merged)
+    if post.status == "posted" and not post.posted_at:
+        post.posted_at = datetime.now(timezone.utc)
+    db.add(post)
+    db.commit()
+    db.refresh(post)
+
+
 # ─── Settings エンドポイント ─────────────────────────────────
 
 @router.get("/sns/settings", response_model=SnsSettingOut)
@@ -177,14 +194,9 @@ async def create_sns_post(
     db.commit()
     db.refresh(post)
 
-    # 非同期で実際に投稿
-    ok, err = await execute_sns_post(caption, body.image_urls, body.platform, setting)
-    post.status = "posted" if ok else "failed"
-    post.posted_at = datetime.now(timezone.utc) if ok else None
-    post.error_message = err
-    db.add(post)
-    db.commit()
-    db.refresh(post)
+    # 有効なプラットフォームへ並列に投稿
+    _, _, results = await execute_sns_post(caption, body.image_urls, body.platform, setting)
+    _apply_results(db, post, results)
     return post
 
 
@@ -198,17 +210,17 @@ async def retry_sns_post(
     post = db.get(SnsPostORM, post_id)
     if not post or post.store_id != sid:
         raise HTTPException(status_code=404, detail="not found")
-    if post.status not in ("failed", "skipped"):
+    # 一部のプラットフォームだけ失敗した投稿（status=posted）もリトライできる
+    retry_only = failed_platforms(post.results)
+    if post.status not in ("failed", "skipped") and not retry_only:
         raise HTTPException(status_code=400, detail="failed/skipped の投稿のみリトライ可能です")
 
     setting = _get_or_create_setting(db, sid)
-    ok, err = await execute_sns_post(post.caption, post.image_urls, post.platform, setting)
-    post.status = "posted" if ok else "failed"
-    post.posted_at = datetime.now(timezone.utc) if ok else None
-    post.error_message = err
-    db.add(post)
-    db.commit()
-    db.refresh(post)
+    # 成功済みのプラットフォームへは再投稿しない（results がない旧データは全体を再投稿）
+    _, _, results = await execute_sns_post(
+        post.caption, post.image_urls, post.platform, setting, only=retry_only or None
+    )
+    _apply_results(db, post, results)
     return post
 
 
@@ -323,11 +335,6 @@ async def trigger_sns_post(
         db.refresh(post)
         return post
 
-    ok, err = await execute_sns_post(caption or "", body.image_urls, body.platform, setting)
-    post.status = "posted" if ok else "failed"
-    post.posted_at = datetime.now(timezone.utc) if ok else None
-    post.error_message = err
-    db.add(post)
-    db.commit()
-    db.refresh(post)
+    _, _, results = await execute_sns_post(caption or "", body.image_urls, body.platform, setting)
+    _apply_results(db, post, results)
     return post
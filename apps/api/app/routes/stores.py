@@ -1,14 +1,12 @@
 from __future__ import annotations
 
+import mimetypes
 import os
 from datetime import datetime, timezone
 from typing import List, Optional
 from uuid import UUID, uuid4
 
-from pathlib import Path
-
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -16,20 +14,28 @@ from app.db.session import get_db
 from app.models.asset import AssetORM
 from app.models.store import StoreORM
 from app.schemas.store import StoreCreateIn, StoreOut, StoreUpdateIn
+from app.services import storage, thumbnails
+from app.services.storage import FileTooLargeError
 
 router = APIRouter(tags=["stores"])
 
 
-def _uploads_root() -> Path:
-    # api/ 配下に uploads を作る（既存の expenses 添付と同じ方針）
-    api_root = Path(__file__).resolve().parents[3]
-    return api_root / "uploads"
-
-
 def _logo_url(store_id: UUID) -> str:
     return f"/api/v1/stores/{store_id}/logo"
 
 
+def _logo_filename(logo: AssetORM) -> str:
+    """ダウンロード時のファイル名（アップロード時の拡張子を保つ）。"""
+    if logo.filename:
+        return logo.filename
+    if not storage.is_cas_ref(logo.file_path):
+        # 旧形式は <uuid>.<拡張子> で保存している
+        return os.path.basename(logo.file_path) or "logo"
+    # ファイル名を持たない行は Content-Type から拡張子を決める
+    ext = mimetypes.guess_extension(logo.content_type or "") or ""
+    return f"logo{ext}"
+
+
 def _attach_logo_url(db: Session, row: StoreORM) -> StoreOut:
     # StoreOut を返す直前にロゴの有無を確認して URL を埋める
     logo = (
@@ -161,6 +167,9 @@ def update_store(
     return _attach_logo_url(db, row)
 
 
+LOGO_MAX_BYTES = 5 * 1024 * 1024
+
+
 @router.post("/stores/{store_id}/logo", response_model=StoreOut)
 async def upload_store_logo(
     request: Request,
@@ -179,48 +188,41 @@ async def upload_store_logo(
     if not file:
         raise HTTPException(status_code=400, detail="file required")
 
-    content = await file.read()
-    if len(content) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="File too large (max 5MB)")
-
     content_type = (file.content_type or "").lower()
     if not (content_type.startswith("image/")):
         raise HTTPException(status_code=400, detail="logo must be an image")
 
-    base_dir = _uploads_root() / "assets" / str(store_id) / "logo"
-    base_dir.mkdir(parents=True, exist_ok=True)
-
-    ext = os.path.splitext(file.filename or "logo.png")[1].lower() or ".png"
-    save_path = base_dir / f"{uuid4()}{ext}"
-    save_path.write_bytes(content)
+    try:
+        stored = await storage.save_upload(file, max_bytes=LOGO_MAX_BYTES, content_type=content_type)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large (max 5MB)")
 
-    # 既存ロゴを消して最新のみ残す（DBとファイルの整合は最小限）
+    # 既存ロゴを消して最新のみ残す（内容アドレスの実体は共有されうるので旧形式のみ削除）
     old = db.execute(select(AssetORM).where(AssetORM.store_id == store_id, AssetORM.kind == "logo")).scalars().all()
     for o in old:
-        try:
-            p = Path(o.file_path)
-            if p.exists():
-                p.unlink()
-        except Exception:
-            pass
+        storage.release(o.file_path)
         db.delete(o)
 
     asset = AssetORM(
         store_id=store_id,
         kind="logo",
         content_type=content_type,
-        file_path=str(save_path),
+        file_path=stored.ref,
+        filename=os.path.basename((file.filename or "").replace("\\", "/"))[:255] or None,
     )
     db.add(asset)
     db.commit()
+    thumbnails.enqueue(stored.ref, content_type)
 
     return _attach_logo_url(db, row)
 
 
-@router.get("/stores/{store_id}/logo")
+@router.api_route("/stores/{store_id}/logo", methods=["GET", "HEAD"])
 def download_store_logo(
     request: Request,
     store_id: UUID,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="サムネイル幅（固定幅に丸める）"),
+    fmt: str = Query("auto", pattern="^(auto|webp|avif)$"),
     db: Session = Depends(get_db),
 ):
     row = db.get(StoreORM, store_id)
@@ -244,12 +246,24 @@ def download_store_logo(
     if not logo:
         raise HTTPException(status_code=404, detail="Not found")
 
-    path = Path(logo.file_path)
-    if not path.exists():
+    if not storage.exists(logo.file_path):
         raise HTTPException(status_code=404, detail="File not found on server")
 
-    return FileResponse(
-        path=str(path),
+    ref, media_type = thumbnails.variant(
+        logo.file_path,
+        content_type=logo.content_type,
+        width=w,
+        fmt=fmt,
+        accept=request.headers.get("accept"),
+    )
+    if ref != logo.file_path:
+        resp = storage.file_response(request, ref, media_type=media_type, inline=True)
+        resp.headers["Vary"] = "Accept"
+        return resp
+
+    return storage.file_response(
+        request,
+        logo.file_path,
         media_type=logo.content_type or "application/octet-stream",
-        filename=os.path.basename(logo.file_path) or "logo",
+        filename=_logo_filename(logo),
     )
\ No newline at end of file
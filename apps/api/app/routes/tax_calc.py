@@ -1,7 +1,8 @@
 """自賠責・重量税計算 API"""
 from __future__ import annotations
 
-from typing import List
+from datetime import date
+from typing import List, Optional
 
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
@@ -10,6 +11,8 @@ from app.services.tax_calculator import (
     VEHICLE_TYPE_LABELS,
     ECO_TYPE_LABELS,
     calculate,
+    calculate_many,
+    fee_table_years,
 )
 
 router = APIRouter(prefix="/tax", tags=["tax"])
@@ -17,7 +20,7 @@ router = APIRouter(prefix="/tax", tags=["tax"])
 
 # ─── Schemas ─────────────────────────────────────────────────────────────────
 
-class TaxCalcRequest(BaseModel):
+class TaxCalcVehicle(BaseModel):
     vehicle_type: str = Field(..., description="passenger/kei/kei_business/bike_small/moped")
     weight_kg: float = Field(..., ge=0, description="車両重量(kg)")
     first_reg_year: int = Field(..., ge=1950, le=2100)
@@ -27,15 +30,35 @@ class TaxCalcRequest(BaseModel):
     inspection_years: int = Field(2, ge=1, le=2, description="車検期間(1 or 2年)")
 
 
+class TaxCalcRequest(TaxCalcVehicle):
+    as_of: Optional[date] = Field(None, description="経過年数の基準日（既定は今日）")
+    fiscal_year: Optional[int] = Field(None, ge=2000, le=2100, description="料金表の年度（既定は基準日の年度）")
+
+
 class TaxCalcResponse(BaseModel):
     jibaiseki: int
     jyuryozei: int
     total: int
     vehicle_age: int
     age_category: str
+    fiscal_year: int
     notes: List[str]
 
 
+class TaxBatchRequest(BaseModel):
+    vehicles: List[TaxCalcVehicle] = Field(..., min_length=1, max_length=1000)
+    as_of: Optional[date] = Field(None, description="経過年数の基準日（既定は今日）")
+    fiscal_year: Optional[int] = Field(None, ge=2000, le=2100, description="料金表の年度（既定は基準日の年度）")
+
+
+class TaxBatchResponse(BaseModel):
+    fiscal_year: int
+    results: List[TaxCalcResponse]
+    total_jibaiseki: int
+    total_jyuryozei: int
+    total: int
+
+
 class VehicleTypeItem(BaseModel):
     value: str
     label: str
@@ -53,10 +76,35 @@ def calculate_tax(body: TaxCalcRequest) -> TaxCalcResponse:
         eco_type=body.eco_type,
         jibaiseki_months=body.jibaiseki_months,
         inspection_years=body.inspection_years,
+        as_of=body.as_of,
+        fiscal_year=body.fiscal_year,
     )
     return TaxCalcResponse(**result)
 
 
+@router.post("/calculate/batch", response_model=TaxBatchResponse)
+def calculate_tax_batch(body: TaxBatchRequest) -> TaxBatchResponse:
+    """複数台をまとめて計算する（結果は vehicles と同じ順）"""
+    fiscal_year, results = calculate_many(
+        [v.model_dump() for v in body.vehicles],
+        as_of=body.as_of,
+        fiscal_year=body.fiscal_year,
+    )
+    return TaxBatchResponse(
+        fiscal_year=fiscal_year,
+        results=[TaxCalcResponse(**r) for r in results],
+        total_jibaiseki=sum(r["jibaiseki"] for r in results),
+        total_jyuryozei=sum(r["jyuryozei"] for r in results),
+        total=sum(r["total"] for r in results),
+    )
+
+
+@router.get("/fee-tables", response_model=List[int])
+def get_fee_tables() -> List[int]:
+    """登録済みの料金表の年度"""
+    return fee_table_years()
+
+
 @router.get("/vehicle-types", response_model=List[VehicleTypeItem])
 def get_vehicle_types() -> List[VehicleTypeItem]:
     return [
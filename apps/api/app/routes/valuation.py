@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.dependencies.store import require_admin, require_store
 from app.deps.auth import get_current_user
 from app.schemas.valuation import (
     ValuationRequest,
@@ -16,6 +17,7 @@ from app.services.valuation_service import (
     get_or_create_settings,
     update_settings,
 )
+from app.services.valuation_own_cache import refresh_own_cache
 
 router = APIRouter(prefix="/valuation", tags=["valuation"])
 
@@ -86,3 +88,16 @@ def calculate(
         year=body.year,
         mileage=body.mileage,
     )
+
+
+@router.post("/own-cache/refresh")
+def refresh_own_cache_endpoint(
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """自店舗の未集計の販売済み車両を valuation_own_cache に取り込む（差分のみ）。管理者のみ。"""
+    # store_id=None は全店舗の集計になるので、店舗に所属していないユーザーは 403
+    store_id = require_store(current_user)
+    require_admin(current_user)
+    aggregated = refresh_own_cache(db, store_id=store_id)
+    return {"aggregated": aggregated}
@@ -3,8 +3,8 @@ from __future__ import annotations
 import uuid
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import or_, select
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session, selectinload
 
 from app.db.session import get_db
@@ -15,6 +15,7 @@ from app.schemas.work_master import (
     WorkMasterCreate, WorkMasterOut, WorkMasterUpdate,
     WorkMasterForVehicle, VEHICLE_CATEGORIES,
 )
+from app.services import work_catalog
 
 router = APIRouter(prefix="/work-masters", tags=["work-masters"])
 
@@ -23,46 +24,37 @@ def _is_readonly(wm: WorkMasterORM, user: User) -> bool:
     return wm.store_id is None
 
 
-def _load_list(db: Session, user: User) -> list[WorkMasterORM]:
-    stmt = (
-        select(WorkMasterORM)
-        .where(or_(WorkMasterORM.store_id == user.store_id, WorkMasterORM.store_id.is_(None)))
-        .options(selectinload(WorkMasterORM.rates))
-        .order_by(WorkMasterORM.sort_order, WorkMasterORM.work_name)
-    )
-    return list(db.execute(stmt).scalars().all())
-
-
 # NOTE: /by-vehicle-category/{category} MUST be defined before /{id}
 @router.get("/by-vehicle-category/{vehicle_category}", response_model=list[WorkMasterForVehicle])
 def list_by_vehicle_category(
     vehicle_category: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ) -> list[WorkMasterForVehicle]:
-    """指定車種の作業時間・工賃付きでフラットに返す"""
-    wms = _load_list(db, user)
-    result = []
-    for wm in wms:
-        if not wm.is_active:
-            continue
-        rate = next((r for r in wm.rates if r.vehicle_category == vehicle_category), None)
-        if rate is None:
-            continue
-        result.append(WorkMasterForVehicle(
-            id=wm.id, work_name=wm.work_name, work_category=wm.work_category,
-            store_id=wm.store_id, is_active=wm.is_active, sort_order=wm.sort_order,
-            duration_minutes=rate.duration_minutes, price=rate.price,
-        ))
-    return result
+    """指定車種の作業時間・工賃付きでフラットに返す（店舗ごとのカタログの索引から）"""
+    catalog = work_catalog.get_work_catalog(db, user.store_id)
+    not_modified = work_catalog.conditional(
+        request, response, work_catalog.variant_etag(catalog.etag, vehicle_category)
+    )
+    if not_modified is not None:
+        return not_modified
+    return catalog.by_vehicle_category.get(vehicle_category, [])
 
 
 @router.get("", response_model=list[WorkMasterOut])
 def list_work_masters(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ) -> list[WorkMasterOut]:
-    return [WorkMasterOut.model_validate(wm) for wm in _load_list(db, user)]
+    catalog = work_catalog.get_work_catalog(db, user.store_id)
+    not_modified = work_catalog.conditional(request, response, catalog.etag)
+    if not_modified is not None:
+        return not_modified
+    return catalog.items
 
 @router.get("/{work_master_id}", response_model=WorkMasterOut)
 def get_work_master(
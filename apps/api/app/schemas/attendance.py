@@ -40,6 +40,25 @@ class AttendanceListOut(BaseModel):
     total: int
 
 
+class TimesheetUserOut(BaseModel):
+    """スタッフ別の期間集計"""
+    user_id: UUID
+    user_name: Optional[str] = None
+    user_email: Optional[str] = None
+
+    days: int                 # 打刻のある日数
+    completed_days: int       # 出勤・退勤がそろっている日数
+    incomplete_days: int      # 退勤打刻が無い日数
+    total_minutes: int        # 出勤〜退勤の合計（分）
+
+
+class TimesheetOut(BaseModel):
+    start_date: date
+    end_date: date
+    items: List[TimesheetUserOut]
+    total_minutes: int
+
+
 class ClockInRequest(BaseModel):
     lat: Optional[float] = None
     lng: Optional[float] = None
@@ -44,6 +44,9 @@ class CarBase(BaseModel):
     inspection_expiry: date | None = None
     insurance_expiry: date | None = None
 
+    # 所有者の顧客（任意）
+    customer_id: UUID | None = None
+
 # --- 書類印刷用（委任状/譲渡証明） ---
 owner_name: str | None = None
 owner_name_kana: str | None = None
@@ -90,6 +93,9 @@ class CarUpdate(BaseModel):
     inspection_expiry: date | None = None
     insurance_expiry: date | None = None
 
+    # 所有者の顧客（任意）
+    customer_id: UUID | None = None
+
 # --- 書類印刷用（委任状/譲渡証明） ---
 owner_name: str | None = None
 owner_name_kana: str | None = None
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field, model_validator
@@ -81,3 +81,23 @@ class LoanerReservationOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ─── 空き状況 ────────────────────────────────────────────────────
+
+class LoanerFreeSlot(BaseModel):
+    start_date: date
+    end_date: date
+
+
+class LoanerAvailabilityOut(BaseModel):
+    loaner_car_id: UUID
+    name: str
+    plate_no: Optional[str]
+    color: Optional[str]
+    # 指定期間すべてが空いているか
+    available: bool
+    # 指定期間内の空き（連続した日付の区間）
+    free_slots: List[LoanerFreeSlot]
+    # 指定期間に重なる予約
+    reservations: List[LoanerReservationOut]
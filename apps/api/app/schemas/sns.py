@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -89,6 +89,7 @@ class SnsPostOut(BaseModel):
     image_urls: Optional[List[str]] = None
     posted_at: Optional[datetime] = None
     error_message: Optional[str] = None
+    results: Optional[Dict[str, Dict[str, Any]]] = None
     repost_count: int
 
     created_at: datetime
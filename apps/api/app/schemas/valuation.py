@@ -19,6 +19,9 @@ class ValuationResponse(BaseModel):
     recommended_price: int
     expected_profit: int
     expected_profit_rate: float
+    # market: 外部相場のみ / blend: 自社実績とブレンド / own: 自社実績のみ
+    source: str = "market"
+    own_count: int = 0
 
 
 class ValuationSettingsRead(BaseModel):
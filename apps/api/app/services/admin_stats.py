@@ -0,0 +1,223 @@
+# app/services/admin_stats.py
+"""
+管理ダッシュボードの集計。
+
+- ライセンスはプラン別に 1 クエリ（COUNT(*) FILTER (...)）で集計し、Python には行を持ってこない
+- MRR（月次経常収益）はプラン料金表（PLAN_PRICES）を VALUES で JOIN して SQL で合計する
+  年額契約は 12 で割った月額換算。紹介割引（referral_discount）は別項目で返す
+- 解約数は「直近 CHURN_WINDOW_DAYS 日に expired / suspended になったライセンス」
+  （status_changed_at で判定。updated_at は他の列の更新でも進むので使わない）
+- 結果はプロセス内に ADMIN_STATS_TTL_SEC 秒キャッシュし、ライセンス・店舗・ユーザーの
+  追加 / 更新 / 削除があれば次回の取得時に作り直す。ORM の flush に加えて
+  Session.execute(update(LicenseORM) ...) のような一括更新も対象で、flush / 実行時と commit 時の
+  両方で捨てる（commit 前に他のリクエストが集計した古い結果を残さない）
+
+環境変数:
+  ADMIN_STATS_TTL_SEC   キャッシュの有効秒数（既定 60。他プロセスでの変更はこの秒数で反映）
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Integer, String, and_, case, column, event, func, select, values
+from sqlalchemy.orm import ORMExecuteState, Session, object_session
+
+from app.models.license import LicenseORM
+from app.models.store import StoreORM
+from app.models.user import User
+from app.schemas.license_invoice import PLAN_PRICES
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+ADMIN_STATS_TTL_SEC = _env_int("ADMIN_STATS_TTL_SEC", 60)
+
+# 期限切れ間近とみなす日数
+EXPIRING_SOON_DAYS = 30
+# 解約率を計算する期間
+CHURN_WINDOW_DAYS = 30
+
+CHURNED_STATUSES = ("expired", "suspended")
+
+_cache: Optional[Dict[str, Any]] = None
+_cached_at = 0.0
+# invalidate のたびに進める（集計中に変更があった結果はキャッシュしない）
+_generation = 0
+_cache_lock = threading.Lock()
+
+# 集計対象のモデル
+_TRACKED = (LicenseORM, StoreORM, User)
+# Session.info に「集計対象の変更あり」を記録するキー
+_PENDING_KEY = "admin_stats_pending"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def invalidate(*_args: Any) -> None:
+    """次回の get_summary で集計し直す。"""
+    global _cache, _generation
+    _generation += 1
+    _cache = None
+
+
+def _mark(session: Optional[Session]) -> None:
+    invalidate()
+    if session is not None:
+        session.info[_PENDING_KEY] = True
+
+
+def _on_flush_change(_mapper, _connection, target) -> None:
+    _mark(object_session(target))
+
+
+for _model in _TRACKED:
+    for _ev in ("after_insert", "after_delete"):
+        event.listen(_model, _ev, _on_flush_change)
+# ライセンスはプラン・ステータス・期限・紹介割引の変更でも集計が変わる
+event.listen(LicenseORM, "after_update", _on_flush_change)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_change(state: ORMExecuteState) -> None:
+    # mapper イベントが呼ばれない一括 INSERT / UPDATE / DELETE（紹介割引の一括更新など）
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    if any(m.class_ in _TRACKED for m in state.all_mappers):
+        _mark(state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    if session.info.pop(_PENDING_KEY, False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _plan_prices():
+    """プラン料金表（月額 / 年額の月額換算）の VALUES 句（WITH plan_prices(...) AS (VALUES ...)）"""
+    rows = [(plan, p["monthly"], round(p["yearly"] / 12)) for plan, p in PLAN_PRICES.items()]
+    return values(
+        column("plan", String),
+        column("monthly", Integer),
+        column("yearly_monthly", Integer),
+        name="plan_prices",
+    ).data(rows).cte("plan_prices")
+
+
+def compute_summary(db: Session) -> Dict[str, Any]:
+    now = _utcnow()
+    soon = now + timedelta(days=EXPIRING_SOON_DAYS)
+    churn_since = now - timedelta(days=CHURN_WINDOW_DAYS)
+
+    prices = _plan_prices()
+    status = LicenseORM.status
+    active = status == "active"
+    churned = and_(status.in_(CHURNED_STATUSES), LicenseORM.status_changed_at >= churn_since)
+    monthly_price = case(
+        (LicenseORM.billing_cycle == "yearly", prices.c.yearly_monthly),
+        else_=prices.c.monthly,
+    )
+
+    rows = db.execute(
+        select(
+            LicenseORM.plan,
+            func.count().label("total"),
+            func.count().filter(active).label("active"),
+            func.count().filter(status == "trial").label("trial"),
+            func.count().filter(status == "suspended").label("suspended"),
+            func.count().filter(status == "expired").label("expired"),
+            func.count().filter(
+                and_(
+                    status.in_(("active", "trial")),
+                    LicenseORM.current_period_end >= now,
+                    LicenseORM.current_period_end <= soon,
+                )
+            ).label("expiring_soon"),
+            func.count().filter(churned).label("churned"),
+            func.coalesce(func.sum(monthly_price).filter(active), 0).label("mrr"),
+            func.coalesce(func.sum(LicenseORM.referral_discount).filter(active), 0).label("discount"),
+        )
+        .outerjoin(prices, prices.c.plan == LicenseORM.plan)
+        .group_by(LicenseORM.plan)
+        .order_by(LicenseORM.plan)
+    ).all()
+
+    counts = db.execute(
+        select(
+            select(func.count()).select_from(StoreORM).scalar_subquery(),
+            select(func.count()).select_from(User).scalar_subquery(),
+        )
+    ).one()
+
+    plans = []
+    for r in rows:
+        # 期間開始時点の有効数 ≒ 現在の有効数 + 期間中の解約数
+        base = int(r.active) + int(r.churned)
+        plans.append(
+            {
+                "plan": r.plan,
+                "total": int(r.total),
+                "active": int(r.active),
+                "trial": int(r.trial),
+                "suspended": int(r.suspended),
+                "expired": int(r.expired),
+                "expiring_soon": int(r.expiring_soon),
+                "churned_30d": int(r.churned),
+                "churn_rate_30d": round(int(r.churned) / base, 4) if base else 0.0,
+                "mrr": int(r.mrr),
+                "referral_discount": int(r.discount),
+            }
+        )
+
+    def _sum(key: str) -> int:
+        return sum(p[key] for p in plans)
+
+    base = _sum("active") + _sum("churned_30d")
+    return {
+        "total_stores": int(counts[0]),
+        "total_users": int(counts[1]),
+        "licenses_active": _sum("active"),
+        "licenses_trial": _sum("trial"),
+        "licenses_suspended": _sum("suspended"),
+        "licenses_expiring_soon": _sum("expiring_soon"),
+        "mrr": _sum("mrr"),
+        "referral_discount": _sum("referral_discount"),
+        "churned_30d": _sum("churned_30d"),
+        "churn_rate_30d": round(_sum("churned_30d") / base, 4) if base else 0.0,
+        "plans": plans,
+        "generated_at": now,
+    }
+
+
+def get_summary(db: Session, *, refresh: bool = False) -> Dict[str, Any]:
+    """キャッシュ済みの集計を返す（期限切れ・変更ありなら集計し直す）。"""
+    global _cache, _cached_at
+    cached = _cache
+    if not refresh and cached is not None and time.monotonic() - _cached_at < ADMIN_STATS_TTL_SEC:
+        return cached
+
+    with _cache_lock:
+        cached = _cache
+        if not refresh and cached is not None and time.monotonic() - _cached_at < ADMIN_STATS_TTL_SEC:
+            return cached
+        generation = _generation
+        summary = compute_summary(db)
+        if generation == _generation:
+            _cache = summary
+            _cached_at = time.monotonic()
+        return summary
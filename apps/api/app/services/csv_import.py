@@ -0,0 +1,535 @@
+# app/services/csv_import.py
+"""
+CSV インポート（車両・顧客）の読み込み → 検証 → 登録。
+
+- 文字コードは最初に非 ASCII バイトを含む SNIFF_BYTES で判定し、以降は TextIOWrapper で逐次デコードする
+  （全体をメモリに載せない）。デコードできないバイトは置換せず、その行をエラーにする
+- 行はジェネレータで読み、IMPORT_CHUNK_ROWS 行ごとに検証 → executemany で INSERT → commit
+- 登録済みかどうかはチャンク内のキー（VIN / 電話番号）だけを unnest で DB と突き合わせる
+- mode="upsert" なら登録済みのキーはその行を主キーで上書きする（同じファイルを再実行しても重複しない）。
+  キーは一意制約にしていない（家族で同じ電話番号、同じ車体番号の再買取がある）ので、
+  同じキーの登録済み行が複数あるときは上書き先を決められず、その行をエラーにする。
+  CSV の空欄は上書きしない（登録済みの値を NULL で消さない）
+- 一意制約が無い代わりに、チャンクの「突き合わせ → 登録 → commit」は店舗・種類ごとのアドバイザリロックで
+  直列化する（同じファイルを並行して取り込んでも、どちらも未登録と判定して二重登録しない）
+- 結果は件数・先頭数行・エラー行（上限あり）・エラー理由ごとの件数だけを返す
+
+環境変数:
+  IMPORT_CHUNK_ROWS      1 トランザクションで登録する行数（既定 1000）
+  IMPORT_MAX_ERROR_ROWS  結果に含めるエラー行の上限（既定 200）
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import String, func, insert, literal, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from app.models.car import Car
+from app.models.customer import CustomerORM
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+IMPORT_CHUNK_ROWS = _env_int("IMPORT_CHUNK_ROWS", 1000)
+IMPORT_MAX_ERROR_ROWS = _env_int("IMPORT_MAX_ERROR_ROWS", 200)
+
+# 結果に含める先頭行数（プレビュー表示用）
+PREVIEW_ROWS = 10
+
+# 文字コード判定に使うバイト数
+SNIFF_BYTES = 64 * 1024
+
+# UTF-8（BOM 有無とも）→ cp932 の順で試す。
+# Shift-JIS は cp932 の部分集合なので試さない（判定範囲の後に ① や ㈱ などの
+# NEC / IBM 拡張文字が出てくるファイルを Shift-JIS と誤判定してしまう）
+ENCODINGS = ("utf-8-sig", "cp932")
+
+# デコードできなかったバイト（surrogateescape で U+DC80〜U+DCFF になる）
+_UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+# 登録モード
+MODE_INSERT = "insert"   # 登録済みのキーはエラーとしてスキップ
+MODE_UPSERT = "upsert"   # 登録済みのキーは上書き
+MODES = (MODE_INSERT, MODE_UPSERT)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ── 読み込み ──────────────────────────────────────────────────────────────────
+
+def sniff_encoding(sample: bytes) -> str:
+    """
+    sample で文字コードを決める（末尾で切れたマルチバイト文字は無視される）。
+    どの候補でも読めないバイトがあれば、いちばん先まで読めたものにする。
+    """
+    best, best_pos = ENCODINGS[0], -1
+    for enc in ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            return enc
+        except UnicodeDecodeError as e:
+            if e.start > best_pos:
+                best, best_pos = enc, e.start
+    return best
+
+
+def _read_sample(binary: BinaryIO) -> bytes:
+    """
+    最初に非 ASCII バイトを含むブロックを返す（ASCII だけなら最後のブロック）。
+    先頭が英数字だけの CSV でも、日本語が出てくる位置で判定できるようにする。
+    """
+    block = b""
+    while True:
+        nxt = binary.read(SNIFF_BYTES)
+        if not nxt:
+            return block
+        block = nxt
+        if not block.isascii():
+            return block
+
+
+def open_text(binary: BinaryIO) -> io.TextIOWrapper:
+    """
+    バイナリのファイルオブジェクトを逐次デコードするテキストストリームにする。
+
+    判定後にデコードできないバイトが出てきても U+FFFD には置換しない。
+    surrogateescape で残し、該当行は row_decode_error でエラーにする（壊れた文字を登録しない）。
+    """
+    sample = _read_sample(binary)
+    binary.seek(0)
+    return io.TextIOWrapper(binary, encoding=sniff_encoding(sample), errors="surrogateescape", newline="")
+
+
+def row_decode_error(d: Dict[str, str]) -> Optional[str]:
+    """デコードできないバイトを含む列名を返す（無ければ None）。"""
+    for key, value in d.items():
+        if value and _UNDECODABLE.search(value):
+            return key
+    return None
+
+
+def _printable(d: Dict[str, str]) -> Dict[str, str]:
+    """結果表示用。デコードできないバイトを U+FFFD にする（JSON にそのまま入れられないため）。"""
+    return {k: _UNDECODABLE.sub("\ufffd", v) if v else v for k, v in d.items()}
+
+
+def iter_rows(text: Iterable[str]) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(行番号, 行) を 1 行ずつ返す。行番号はヘッダを 1 行目とした CSV 上の位置。"""
+    reader = csv.DictReader(text)
+    for idx, row in enumerate(reader, start=2):
+        yield idx, row
+
+
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    buf: List[Any] = []
+    for r in rows:
+        buf.append(r)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+# ── 結果 ──────────────────────────────────────────────────────────────────────
+
+@dataclass
+class RowResult:
+    row: int
+    status: str          # "ok" | "error"
+    reason: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ImportStats:
+    total: int = 0
+    valid: int = 0
+    errors: int = 0
+    imported: int = 0
+    # imported のうち既存行を上書きした件数（upsert モード）
+    updated: int = 0
+    rows: List[RowResult] = field(default_factory=list)
+    # rows に含めなかった行がある
+    truncated: bool = False
+    # エラー理由（値を含まない種類）ごとの件数
+    error_summary: Dict[str, int] = field(default_factory=dict)
+    # rows に入れたエラー行の数
+    error_rows: int = 0
+
+    def add(self, result: RowResult, error_kinds: List[str]) -> None:
+        self.total += 1
+        is_error = result.status == "error"
+        if is_error:
+            self.errors += 1
+            for kind in error_kinds:
+                self.error_summary[kind] = self.error_summary.get(kind, 0) + 1
+        else:
+            self.valid += 1
+
+        if self.total <= PREVIEW_ROWS or (is_error and self.error_rows < IMPORT_MAX_ERROR_ROWS):
+            self.rows.append(result)
+            self.error_rows += int(is_error)
+        else:
+            self.truncated = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d.pop("error_rows")
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Optional[Dict[str, Any]]) -> "ImportStats":
+        """to_dict() の逆（ジョブの途中経過から再開する用）。"""
+        if not d:
+            return cls()
+        rows = [RowResult(**r) for r in d.get("rows") or []]
+        return cls(
+            total=int(d.get("total") or 0),
+            valid=int(d.get("valid") or 0),
+            errors=int(d.get("errors") or 0),
+            imported=int(d.get("imported") or 0),
+            updated=int(d.get("updated") or 0),
+            rows=rows,
+            truncated=bool(d.get("truncated")),
+            error_summary=dict(d.get("error_summary") or {}),
+            error_rows=sum(1 for r in rows if r.status == "error"),
+        )
+
+
+# ── 種類ごとの定義 ────────────────────────────────────────────────────────────
+
+def _s(v: Any) -> str:
+    return str(v or "").strip()
+
+
+def _int_or_none(v: Any) -> Optional[int]:
+    s = re.sub(r"[^\d\-]", "", _s(v))
+    if not s:
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+
+# (種類, 表示メッセージ)
+RowError = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class ImportSpec:
+    name: str
+    model: Any
+    normalize: Callable[[Dict[str, str]], Dict[str, str]]
+    required: Tuple[Tuple[str, str], ...]         # (d のキー, 表示名)
+    key_field: str                                # 重複チェックに使う d のキー
+    key_label: str
+    key_column: str                               # 重複チェック・上書き先の検索に使う列
+    to_values: Callable[[Dict[str, str], UUID, Optional[UUID], datetime], Dict[str, Any]]
+    # 上書き時に更新しない列
+    keep_on_update: Tuple[str, ...] = ("id", "store_id", "created_at")
+    # 新規登録で空欄のときに入れる値（上書きでは空欄として扱い、登録済みの値を残す）
+    insert_defaults: Tuple[Tuple[str, Any], ...] = ()
+
+
+def _normalize_car(row: Dict[str, str]) -> Dict[str, str]:
+    return {
+        "管理番号":        _s(row.get("管理番号")),
+        "メーカー":        _s(row.get("メーカー")),
+        "車種":            _s(row.get("車種")),
+        "グレード":        _s(row.get("グレード")),
+        "年式":            _s(row.get("年式")),
+        "走行距離":        _s(row.get("走行距離(km)")),
+        "VIN":             _s(row.get("車体番号(VIN)")),
+        "型式":            _s(row.get("型式")),
+        "カラー":          _s(row.get("カラー")),
+        "買取価格":        _s(row.get("買取価格")),
+        "販売価格":        _s(row.get("販売価格")),
+        "現所有者名":      _s(row.get("現所有者名")),
+        "現所有者フリガナ": _s(row.get("現所有者フリガナ")),
+        "現所有者郵便番号": _s(row.get("現所有者郵便番号")),
+        "現所有者住所1":   _s(row.get("現所有者住所1")),
+        "現所有者住所2":   _s(row.get("現所有者住所2")),
+        "現所有者電話番号": _s(row.get("現所有者電話番号")),
+    }
+
+
+def _car_values(d: Dict[str, str], store_id: UUID, user_id: Optional[UUID], now: datetime) -> Dict[str, Any]:
+    return {
+        "id": uuid4(),
+        "store_id": store_id,
+        "user_id": user_id,
+        "stock_no": d["管理番号"],
+        "status": "在庫",
+        "make": d["メーカー"],
+        "maker": d["メーカー"],
+        "model": d["車種"],
+        "grade": d["グレード"] or None,
+        "year": _int_or_none(d["年式"]),
+        "mileage": _int_or_none(d["走行距離"]),
+        "vin": d["VIN"] or None,
+        "model_code": d["型式"] or None,
+        "color": d["カラー"] or None,
+        "expected_buy_price": _int_or_none(d["買取価格"]),
+        "expected_sell_price": _int_or_none(d["販売価格"]),
+        "owner_name": d["現所有者名"] or None,
+        "owner_name_kana": d["現所有者フリガナ"] or None,
+        "owner_postal_code": d["現所有者郵便番号"] or None,
+        "owner_address1": d["現所有者住所1"] or None,
+        "owner_address2": d["現所有者住所2"] or None,
+        "owner_tel": d["現所有者電話番号"] or None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def _normalize_customer(row: Dict[str, str]) -> Dict[str, str]:
+    return {
+        "顧客名":   _s(row.get("顧客名")),
+        "フリガナ": _s(row.get("フリガナ")),
+        "敬称":     _s(row.get("敬称")),
+        "郵便番号": _s(row.get("郵便番号")),
+        "住所1":    _s(row.get("住所1")),
+        "住所2":    _s(row.get("住所2")),
+        "電話番号": _s(row.get("電話番号")),
+        "メール":   _s(row.get("メールアドレス")),
+        "担当者名": _s(row.get("担当者名")),
+        "支払条件": _s(row.get("支払条件")),
+    }
+
+
+def _customer_values(d: Dict[str, str], store_id: UUID, user_id: Optional[UUID], now: datetime) -> Dict[str, Any]:
+    return {
+        "id": uuid4(),
+        "store_id": store_id,
+        "name": d["顧客名"],
+        "name_kana": d["フリガナ"] or None,
+        "honorific": d["敬称"] or None,
+        "postal_code": d["郵便番号"] or None,
+        "address1": d["住所1"] or None,
+        "address2": d["住所2"] or None,
+        "tel": d["電話番号"] or None,
+        "email": d["メール"] or None,
+        "contact_person": d["担当者名"] or None,
+        "payment_terms": d["支払条件"] or None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+CAR_SPEC = ImportSpec(
+    name="cars",
+    model=Car,
+    normalize=_normalize_car,
+    required=(("管理番号", "管理番号"), ("メーカー", "メーカー"), ("車種", "車種")),
+    key_field="VIN",
+    key_label="車体番号",
+    key_column="vin",
+    to_values=_car_values,
+    # 販売状況や登録者は在庫管理側の値を残す
+    keep_on_update=("id", "store_id", "user_id", "status", "created_at"),
+)
+
+CUSTOMER_SPEC = ImportSpec(
+    name="customers",
+    model=CustomerORM,
+    normalize=_normalize_customer,
+    required=(("顧客名", "顧客名"),),
+    key_field="電話番号",
+    key_label="電話番号",
+    key_column="tel",
+    to_values=_customer_values,
+    insert_defaults=(("honorific", "御中"),),
+)
+
+
+# ── 重複チェック（集合演算） ──────────────────────────────────────────────────
+
+def existing_keys(db: Session, spec: ImportSpec, store_id: UUID, keys: Iterable[str]) -> Dict[str, List[UUID]]:
+    """
+    keys のうち DB に登録済みのものを キー → 登録済み行の id（古い順）で返す。
+
+    店舗の全件を読むのではなく、渡したキーだけを unnest で展開して (store_id, key) のインデックスで突き合わせる。
+    """
+    keys = list({k for k in keys if k})
+    if not keys:
+        return {}
+
+    col = getattr(spec.model, spec.key_column)
+    incoming = func.unnest(literal(keys, ARRAY(String))).table_valued("key").render_derived(name="incoming")
+    stmt = (
+        select(col, spec.model.id)
+        .join(incoming, col == incoming.c.key)
+        .where(spec.model.store_id == store_id)
+        .order_by(spec.model.created_at, spec.model.id)
+    )
+    found: Dict[str, List[UUID]] = {}
+    for key, row_id in db.execute(stmt).all():
+        found.setdefault(key, []).append(row_id)
+    return found
+
+
+def _lock_store(db: Session, spec: ImportSpec, store_id: UUID) -> None:
+    """
+    同じ店舗・種類の取り込みをチャンク単位で直列化する（commit で外れる）。
+    キーに一意制約が無いので、突き合わせから commit までを他の取り込みと重ねない。
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"csv_import:{spec.name}:{store_id}"})
+
+
+def _with_insert_defaults(spec: ImportSpec, row: Dict[str, Any]) -> Dict[str, Any]:
+    for column, default in spec.insert_defaults:
+        if row.get(column) is None:
+            row[column] = default
+    return row
+
+
+def _update_existing(db: Session, spec: ImportSpec, values: List[Dict[str, Any]]) -> None:
+    """
+    values の id（登録済み行）を主キーで一括更新する。
+    keep_on_update の列と、CSV が空欄（None）の列は登録済みの値を残す。
+    """
+    keep = set(spec.keep_on_update) - {"id"}
+    db.execute(
+        update(spec.model),
+        [{k: v for k, v in row.items() if k == "id" or (k not in keep and v is not None)} for row in values],
+    )
+
+
+# ── 検証・登録 ────────────────────────────────────────────────────────────────
+
+def _validate(
+    spec: ImportSpec,
+    idx: int,
+    d: Dict[str, str],
+    seen_keys: Set[str],
+    db_keys: Dict[str, List[UUID]],
+    mode: str,
+    encoding: str,
+) -> Tuple[RowResult, List[str]]:
+    errs: List[RowError] = []
+    bad_column = row_decode_error(d)
+    if bad_column is not None:
+        # 置換した値を登録しないよう、行ごとエラーにする
+        errs.append(("文字コード不正", f"{bad_column}に {encoding} として読めない文字があります"))
+        d = _printable(d)
+
+    for key, label in spec.required:
+        if not d[key]:
+            errs.append((f"{label}未入力", f"{label}は必須です"))
+
+    k = d[spec.key_field]
+    if k:
+        if k in seen_keys:
+            errs.append((f"{spec.key_label}重複（CSV内）", f"{spec.key_label} {k} がCSV内で重複"))
+        elif k in db_keys and mode != MODE_UPSERT:
+            errs.append((f"{spec.key_label}登録済み", f"{spec.key_label} {k} はすでに登録済み"))
+        elif len(db_keys.get(k, ())) > 1:
+            errs.append((
+                f"{spec.key_label}登録済み（複数）",
+                f"{spec.key_label} {k} の登録済みデータが複数あるため上書き先を決められません",
+            ))
+        else:
+            seen_keys.add(k)
+
+    if errs:
+        reason = " / ".join(msg for _, msg in errs)
+        return RowResult(row=idx, status="error", reason=reason, data=d), [kind for kind, _ in errs]
+    return RowResult(row=idx, status="ok", data=d), []
+
+
+def run_import(
+    db: Session,
+    spec: ImportSpec,
+    binary: BinaryIO,
+    *,
+    store_id: UUID,
+    user_id: Optional[UUID] = None,
+    dry_run: bool = False,
+    mode: str = MODE_INSERT,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    stats: Optional[ImportStats] = None,
+    start_row: int = 2,
+    on_chunk: Optional[Callable[[ImportStats, int, int], None]] = None,
+) -> ImportStats:
+    """
+    CSV を chunk_rows 行ずつ検証・登録する。
+
+    チャンクごとに commit するので、途中で失敗しても それまでのチャンクは登録済みになる。
+    mode="upsert" は登録済みのキーが 1 件だけならその行を上書きし（空欄の列は残す）、無ければ登録する。
+
+    再開用:
+      stats      前回までの集計
+      start_row  この行番号より前は読み飛ばす（CSV 内重複の判定用にキーだけ拾う）
+      on_chunk   (stats, 次の行番号, 読み込んだバイト数) をチャンクの commit 直前に呼ぶ。
+                 同じトランザクションで進捗を保存すれば、登録と進捗が必ず一致する
+    """
+    stats = stats or ImportStats()
+    seen_keys: Set[str] = set()
+
+    text_io = open_text(binary)
+    encoding = text_io.encoding
+    try:
+        for chunk in chunked(iter_rows(text_io), chunk_rows):
+            normalized = [(idx, spec.normalize(row)) for idx, row in chunk]
+            if normalized[0][0] < start_row:
+                # 登録済みの範囲は読み飛ばす
+                seen_keys.update(d[spec.key_field] for idx, d in normalized if idx < start_row and d[spec.key_field])
+                normalized = [(idx, d) for idx, d in normalized if idx >= start_row]
+                if not normalized:
+                    continue
+
+            if not dry_run:
+                _lock_store(db, spec, store_id)
+            db_keys = existing_keys(db, spec, store_id, (d[spec.key_field] for _, d in normalized))
+
+            values: List[Dict[str, Any]] = []
+            updates: List[Dict[str, Any]] = []
+            now = _utcnow()
+            for idx, d in normalized:
+                result, kinds = _validate(spec, idx, d, seen_keys, db_keys, mode, encoding)
+                stats.add(result, kinds)
+                if result.status == "ok" and not dry_run:
+                    row = spec.to_values(d, store_id, user_id, now)
+                    existing = db_keys.get(d[spec.key_field])
+                    if existing:
+                        # 検証済みなので上書きモードかつ 1 件だけ
+                        row["id"] = existing[0]
+                        updates.append(row)
+                    else:
+                        values.append(_with_insert_defaults(spec, row))
+
+            if values:
+                db.execute(insert(spec.model), values)
+            if updates:
+                _update_existing(db, spec, updates)
+            stats.imported += len(values) + len(updates)
+            stats.updated += len(updates)
+            if on_chunk is not None:
+                on_chunk(stats, normalized[-1][0] + 1, binary.tell())
+            if not dry_run or on_chunk is not None:
+                # 何も登録しなかったチャンクも commit してロックを外す
+                db.commit()
+    finally:
+        # 呼び出し側のファイルを閉じないよう切り離す
+        text_io.detach()
+
+    return stats
@@ -0,0 +1,336 @@
+# app/services/expense_ocr.py
+"""
+経費添付（領収書画像）の OCR をリクエスト外で実行する。
+
+- アップロード時は ocr_status=pending で保存して即レスポンスし、OCR はスレッドプールで実行
+- 完了したら ocr_text / ocr_lang / ocr_status を書き込み、アップロードしたユーザーへ Web Push で通知
+- 一括再 OCR（メンテナンス用）は専用スレッドで 1 件ずつ、毎分の処理件数を制限して実行
+- OCR は pending → running の条件付き UPDATE で取った添付だけ実行する（同じ添付を二重に OCR しない）
+- 起動時（start）に、再起動で取り残された pending / running の添付を積み直す
+
+環境変数:
+  EXPENSE_OCR_WORKERS         アップロード時 OCR の並列数（既定 2）
+  EXPENSE_REOCR_PER_MINUTE    一括再 OCR の毎分処理件数の上限（既定 30）
+  EXPENSE_OCR_STALE_SEC       pending / running のままこの秒数経った添付を起動時に積み直す（既定 600）
+"""
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from uuid import UUID
+
+from PIL import Image
+from sqlalchemy import or_, update
+
+from app.db.session import SessionLocal
+from app.models.expense_attachment import ExpenseAttachmentORM
+from app.services import ocr_cache, storage
+
+# Optional dep (local OCR)
+try:
+    import pytesseract
+except Exception:  # pragma: no cover
+    pytesseract = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+EXPENSE_OCR_WORKERS = _env_int("EXPENSE_OCR_WORKERS", 2)
+EXPENSE_REOCR_PER_MINUTE = _env_int("EXPENSE_REOCR_PER_MINUTE", 30)
+EXPENSE_OCR_STALE_SEC = _env_int("EXPENSE_OCR_STALE_SEC", 600)
+
+DEFAULT_LANG = "jpn+eng"
+
+# ocr_status
+OCR_NONE = "none"
+OCR_PENDING = "pending"
+OCR_RUNNING = "running"
+OCR_DONE = "done"
+OCR_FAILED = "failed"
+
+
+class BulkReocrRunningError(RuntimeError):
+    """同じ店舗の一括再 OCR が実行中。"""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_bulk_running: set[UUID] = set()
+_bulk_lock = threading.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # pytesseract は tesseract を子プロセスで起動するのでスレッドで十分並列になる
+                _executor = ThreadPoolExecutor(
+                    max_workers=EXPENSE_OCR_WORKERS,
+                    thread_name_prefix="expense-ocr",
+                )
+    return _executor
+
+
+def is_ocr_target(content_type: Optional[str]) -> bool:
+    return (content_type or "").lower().startswith("image/")
+
+
+def _ocr_image_bytes(content: bytes, lang: str) -> str:
+    if pytesseract is None:
+        raise RuntimeError("pytesseract not installed")
+
+    key = ocr_cache.make_key(content, provider="local", lang=lang, preprocess=False)
+    with SessionLocal() as db:
+        cached = ocr_cache.safe_get(db, key)
+        if cached is not None:
+            # last_used_at / hit_count の更新を残す
+            db.commit()
+    if cached is not None:
+        return cached.raw_text
+
+    with Image.open(io.BytesIO(content)) as img:
+        # そこそこ効く設定：向き補正は別途だが、まずはベース
+        text = pytesseract.image_to_string(img, lang=lang) or ""
+
+    with SessionLocal() as db:
+        ocr_cache.safe_put(db, key, raw_text=text, size_bytes=len(content))
+    return text
+
+
+def _claim(db, attachment_id: UUID) -> bool:
+    """pending の添付を running にする。取れなければ他のワーカーが処理中か処理済み。"""
+    claimed = db.execute(
+        update(ExpenseAttachmentORM)
+        .where(ExpenseAttachmentORM.id == attachment_id, ExpenseAttachmentORM.ocr_status == OCR_PENDING)
+        .values(ocr_status=OCR_RUNNING, ocr_updated_at=_utcnow())
+        .returning(ExpenseAttachmentORM.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.commit()
+    return claimed is not None
+
+
+def process_attachment(
+    attachment_id: UUID,
+    *,
+    lang: Optional[str] = None,
+    notify_user_id: Optional[UUID] = None,
+) -> Optional[str]:
+    """
+    1 件 OCR して結果を書き込む。戻り値は最終的な ocr_status。
+    pending でない（他のワーカーが取った・削除された）添付は何もせず None を返す。
+    """
+    with SessionLocal() as db:
+        if not _claim(db, attachment_id):
+            logger.debug("Expense OCR skipped (not pending): attachment_id=%s", attachment_id)
+            return None
+        row = db.get(ExpenseAttachmentORM, attachment_id)
+        if row is None:
+            return None
+
+        use_lang = lang or row.ocr_lang or DEFAULT_LANG
+
+        try:
+            text = _ocr_image_bytes(storage.read_bytes(row.storage_path), use_lang)
+        except Exception:
+            # OCR失敗しても添付自体は残す
+            logger.warning("Expense OCR failed: attachment_id=%s", attachment_id, exc_info=True)
+            row.ocr_status = OCR_FAILED
+            row.ocr_updated_at = _utcnow()
+            db.commit()
+            return OCR_FAILED
+
+        row.ocr_text = text or None
+        row.ocr_lang = use_lang
+        row.ocr_status = OCR_DONE
+        row.ocr_updated_at = _utcnow()
+        db.commit()
+
+        if notify_user_id and row.ocr_text:
+            _notify_ready(notify_user_id, row)
+        return OCR_DONE
+
+
+def _notify_ready(user_id: UUID, row: ExpenseAttachmentORM) -> None:
+    from app.services import push_queue
+
+    try:
+        push_queue.enqueue_user(
+            user_id,
+            {
+                "title": "領収書の読み取りが完了しました",
+                "body": row.filename,
+                "url": f"/sales/expenses?expense_id={row.expense_id}",
+                "tag": f"expense-ocr-{row.id}",
+            },
+        )
+    except Exception:
+        logger.warning("Expense OCR notification failed.", exc_info=True)
+
+
+def enqueue(attachment_id: UUID, *, lang: str, notify_user_id: Optional[UUID] = None) -> None:
+    """アップロード直後の OCR をバックグラウンドに積む。"""
+    _get_executor().submit(
+        _safe_process,
+        attachment_id,
+        lang,
+        notify_user_id,
+    )
+
+
+def _safe_process(attachment_id: UUID, lang: Optional[str], notify_user_id: Optional[UUID]) -> None:
+    try:
+        process_attachment(attachment_id, lang=lang, notify_user_id=notify_user_id)
+    except Exception:
+        logger.exception("Expense OCR worker crashed: attachment_id=%s", attachment_id)
+
+
+def requeue_stale() -> int:
+    """
+    pending / running のまま EXPENSE_OCR_STALE_SEC 経った添付（処理中に再起動した）を積み直す。
+    ocr_updated_at を更新してから積むので、複数プロセスが同時に起動しても 1 回だけ積む。
+    """
+    now = _utcnow()
+    with SessionLocal() as db:
+        ids = db.execute(
+            update(ExpenseAttachmentORM)
+            .where(
+                ExpenseAttachmentORM.ocr_status.in_((OCR_PENDING, OCR_RUNNING)),
+                or_(
+                    ExpenseAttachmentORM.ocr_updated_at.is_(None),
+                    ExpenseAttachmentORM.ocr_updated_at < now - timedelta(seconds=EXPENSE_OCR_STALE_SEC),
+                ),
+            )
+            .values(ocr_status=OCR_PENDING, ocr_updated_at=now)
+            .returning(ExpenseAttachmentORM.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.commit()
+
+    for attachment_id in ids:
+        _get_executor().submit(_safe_process, attachment_id, None, None)
+    if ids:
+        logger.info("Expense OCR: requeued %d stale attachments", len(ids))
+    return len(ids)
+
+
+# ============================================================
+# 一括再 OCR（メンテナンス）
+# ============================================================
+def _mark_pending(store_id: UUID, *, only_missing: bool) -> List[UUID]:
+    # running（OCR 中）は pending に戻さない。戻すと処理中の添付をもう一度取れてしまう
+    conds = [
+        ExpenseAttachmentORM.store_id == store_id,
+        ExpenseAttachmentORM.content_type.ilike("image/%"),
+        ExpenseAttachmentORM.ocr_status != OCR_RUNNING,
+    ]
+    if only_missing:
+        conds.append(
+            or_(
+                ExpenseAttachmentORM.ocr_text.is_(None),
+                ExpenseAttachmentORM.ocr_status.in_((OCR_PENDING, OCR_FAILED)),
+            )
+        )
+    with SessionLocal() as db:
+        ids = db.execute(
+            update(ExpenseAttachmentORM)
+            .where(*conds)
+            .values(ocr_status=OCR_PENDING, ocr_updated_at=_utcnow())
+            .returning(ExpenseAttachmentORM.id)
+        ).scalars().all()
+        db.commit()
+    return list(ids)
+
+
+def _run_bulk(store_id: UUID, ids: List[UUID], per_minute: int) -> None:
+    interval = 60.0 / max(1, per_minute)
+    done = failed = 0
+    try:
+        for attachment_id in ids:
+            started = time.monotonic()
+            status = process_attachment(attachment_id)
+            if status is None:
+                # 他のワーカーが処理した分は OCR していないので待たない
+                continue
+            if status == OCR_DONE:
+                done += 1
+            elif status == OCR_FAILED:
+                failed += 1
+            # 毎分 per_minute 件を超えないようにペースを落とす
+            wait = interval - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+    except Exception:
+        logger.exception("Bulk re-OCR aborted: store_id=%s", store_id)
+    finally:
+        with _bulk_lock:
+            _bulk_running.discard(store_id)
+        logger.info(
+            "Bulk re-OCR finished: store_id=%s total=%d done=%d failed=%d",
+            store_id, len(ids), done, failed,
+        )
+
+
+def start_bulk_reocr(
+    store_id: UUID,
+    *,
+    only_missing: bool = True,
+    per_minute: int = EXPENSE_REOCR_PER_MINUTE,
+) -> int:
+    """
+    店舗の画像添付を一括で再 OCR する（専用スレッドで逐次実行）。
+
+    only_missing=True なら未 OCR / 失敗 / 処理待ちのものだけ。戻り値は対象件数。
+    """
+    with _bulk_lock:
+        if store_id in _bulk_running:
+            raise BulkReocrRunningError("Bulk re-OCR is already running for this store.")
+        _bulk_running.add(store_id)
+
+    try:
+        ids = _mark_pending(store_id, only_missing=only_missing)
+    except Exception:
+        with _bulk_lock:
+            _bulk_running.discard(store_id)
+        raise
+
+    threading.Thread(
+        target=_run_bulk,
+        args=(store_id, ids, per_minute),
+        name=f"expense-reocr-{store_id}",
+        daemon=True,
+    ).start()
+    return len(ids)
+
+
+def start() -> None:
+    try:
+        requeue_stale()
+    except Exception:
+        logger.warning("Expense OCR: requeue of stale attachments failed.", exc_info=True)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
@@ -0,0 +1,437 @@
+# app/services/import_jobs.py
+"""
+CSV インポートのバックグラウンドジョブ。
+
+- 投入時はファイルをストレージに保存して import_jobs に queued で登録し、すぐ job_id を返す
+- ワーカー（スレッドプール）がチャンク単位で登録し、同じトランザクションで進捗（next_row / stats）を保存する
+- 再起動などで止まったジョブ（queued のまま / heartbeat が途絶えた running）はスイーパーが拾い直し、
+  最後に commit したチャンクの次の行から再開する
+- ジョブの取得は UPDATE ... WHERE で行うので、複数プロセスでも同じジョブを二重に実行しない
+- 取得時に claim_token を発行し、チャンクの進捗保存は token が一致するときだけ行う。
+  遅いチャンクなどで heartbeat が途絶えて他のワーカーに取り直されたら、元のワーカーは
+  そのチャンクを rollback してやめる（両方が登録を続けて行が重複しない）
+- アップロードした CSV（顧客の氏名・電話番号を含む）は、参照するジョブがすべて終了してから
+  IMPORT_JOB_FILE_RETENTION_HOURS 経ったらスイーパーが削除する。内容アドレスなので同じファイルを
+  別のジョブが参照していることがあり、未終了・保持期間内のジョブが 1 つでもあれば残す。
+  削除とジョブの投入・再実行はファイルごとのアドバイザリロックで直列化する
+
+環境変数:
+  IMPORT_JOB_WORKERS                同時に実行するジョブ数（既定 1）
+  IMPORT_JOB_STALE_SEC              heartbeat がこの秒数途絶えた running を再開対象にする（既定 120）
+  IMPORT_JOB_SWEEP_SEC              スイーパーの実行間隔（既定 30）
+  IMPORT_JOB_FILE_RETENTION_HOURS   終了したジョブのファイルを残す時間（失敗したジョブを再実行できる期間、既定 72）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set
+from uuid import UUID, uuid4
+
+from sqlalchemy import exists, literal, or_, select, text, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.import_job import ImportJobORM
+from app.services import csv_import, storage
+from app.services.csv_import import ImportStats
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+IMPORT_JOB_WORKERS = _env_int("IMPORT_JOB_WORKERS", 1)
+IMPORT_JOB_STALE_SEC = _env_int("IMPORT_JOB_STALE_SEC", 120)
+IMPORT_JOB_SWEEP_SEC = _env_int("IMPORT_JOB_SWEEP_SEC", 30)
+IMPORT_JOB_FILE_RETENTION_HOURS = _env_int("IMPORT_JOB_FILE_RETENTION_HOURS", 72)
+
+# 保持期間を過ぎたファイルの削除間隔と、1 回に削除するファイル数
+FILE_CLEANUP_INTERVAL_SEC = 60 * 60
+FILE_CLEANUP_BATCH = 100
+
+# ジョブ状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+FINISHED_STATUSES = (DONE, FAILED)
+
+# 想定外の例外時に返すメッセージ（内部の詳細は外に出さない）
+INTERNAL_ERROR = "インポートに失敗しました"
+
+SPECS = {
+    csv_import.CAR_SPEC.name: csv_import.CAR_SPEC,
+    csv_import.CUSTOMER_SPEC.name: csv_import.CUSTOMER_SPEC,
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# このプロセスで実行待ち / 実行中のジョブ（スイーパーが同じジョブを重ねて積まないように）
+_inflight: Set[UUID] = set()
+_inflight_lock = threading.Lock()
+
+_stop = threading.Event()
+_sweeper: Optional[threading.Thread] = None
+
+
+class LeaseLostError(RuntimeError):
+    """実行中のジョブが他のワーカーに取り直された。"""
+
+
+class FileExpiredError(RuntimeError):
+    """ジョブのファイルが保持期間を過ぎて削除された（再実行するには再アップロードが必要）。"""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=IMPORT_JOB_WORKERS,
+                    thread_name_prefix="import-job",
+                )
+    return _executor
+
+
+# ============================================================
+# 投入・参照
+# ============================================================
+def create_job(
+    db: Session,
+    *,
+    kind: str,
+    store_id: UUID,
+    user_id: Optional[UUID],
+    stored: storage.StoredObject,
+    filename: Optional[str],
+    mode: str = csv_import.MODE_INSERT,
+    dry_run: bool = False,
+) -> ImportJobORM:
+    if kind not in SPECS:
+        raise ValueError(f"unknown import kind: {kind}")
+    # 同じ内容のファイルを cleanup_files が削除した直後だと、保存はスキップされて実体が無い
+    _lock_file(db, stored.ref)
+    if not storage.exists(stored.ref):
+        db.rollback()
+        raise FileExpiredError(stored.ref)
+    job = ImportJobORM(
+        store_id=store_id,
+        user_id=user_id,
+        kind=kind,
+        mode=mode,
+        dry_run=dry_run,
+        file_ref=stored.ref,
+        filename=filename,
+        bytes_total=stored.size,
+        status=QUEUED,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    enqueue(job.id)
+    return job
+
+
+def get_job(db: Session, job_id: UUID, *, store_id: UUID) -> Optional[ImportJobORM]:
+    """他店舗のジョブは見えないようにする。"""
+    job = db.get(ImportJobORM, job_id)
+    if job is None or job.store_id != store_id:
+        return None
+    return job
+
+
+def retry_job(db: Session, job: ImportJobORM) -> ImportJobORM:
+    """失敗したジョブを、最後に登録したチャンクの次から再実行する。"""
+    if job.status != FAILED:
+        raise ValueError("only failed jobs can be retried")
+    _lock_file(db, job.file_ref)
+    db.refresh(job)
+    if job.file_deleted_at is not None:
+        db.rollback()
+        raise FileExpiredError(job.file_ref)
+    job.status = QUEUED
+    job.error = None
+    job.finished_at = None
+    db.commit()
+    db.refresh(job)
+    enqueue(job.id)
+    return job
+
+
+def to_dict(job: ImportJobORM) -> Dict[str, Any]:
+    stats = job.stats or {}
+    return {
+        "job_id": str(job.id),
+        "kind": job.kind,
+        "mode": job.mode,
+        "dry_run": job.dry_run,
+        "status": job.status,
+        "filename": job.filename,
+        "progress": {
+            "bytes_total": job.bytes_total,
+            "bytes_read": job.bytes_read,
+            "rows_parsed": int(stats.get("total") or 0),
+            "rows_valid": int(stats.get("valid") or 0),
+            "rows_error": int(stats.get("errors") or 0),
+            "rows_inserted": int(stats.get("imported") or 0),
+            "rows_updated": int(stats.get("updated") or 0),
+        },
+        # 完了時のみ ImportResult と同じ形で返す
+        "result": stats if job.status == DONE else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# ============================================================
+# 実行
+# ============================================================
+def _claim(job_id: UUID) -> Optional[UUID]:
+    """queued か、heartbeat が途絶えた running なら running にして自分が取る。取れたら claim_token を返す。"""
+    now = _utcnow()
+    stale_before = now - timedelta(seconds=IMPORT_JOB_STALE_SEC)
+    with SessionLocal() as db:
+        claimed = db.execute(
+            update(ImportJobORM)
+            .where(
+                ImportJobORM.id == job_id,
+                or_(
+                    ImportJobORM.status == QUEUED,
+                    (ImportJobORM.status == RUNNING)
+                    & or_(ImportJobORM.heartbeat_at.is_(None), ImportJobORM.heartbeat_at < stale_before),
+                ),
+            )
+            .values(status=RUNNING, heartbeat_at=now, claim_token=uuid4())
+            .returning(ImportJobORM.claim_token)
+        ).scalar_one_or_none()
+        db.commit()
+    return claimed
+
+
+def _finish(job_id: UUID, token: UUID, *, status: str, error: Optional[str] = None) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(ImportJobORM)
+            .where(ImportJobORM.id == job_id, ImportJobORM.claim_token == token)
+            .values(status=status, error=error, finished_at=_utcnow(), heartbeat_at=_utcnow())
+        )
+        db.commit()
+
+
+def run_job(job_id: UUID) -> None:
+    token = _claim(job_id)
+    if token is None:
+        return
+
+    try:
+        with SessionLocal() as db:
+            job = db.get(ImportJobORM, job_id)
+            spec = SPECS[job.kind]
+            stats = ImportStats.from_dict(job.stats)
+            start_row = int(job.next_row or 2)
+            if start_row > 2:
+                logger.info("Resuming import job %s from row %d", job_id, start_row)
+
+            def _on_chunk(st: ImportStats, next_row: int, bytes_read: int) -> None:
+                # チャンクの登録と同じトランザクションで進捗を保存する。
+                # 他のワーカーに取り直されていたら 0 件になるので、commit せずにやめる
+                owned = db.execute(
+                    update(ImportJobORM)
+                    .where(ImportJobORM.id == job_id, ImportJobORM.claim_token == token)
+                    .values(
+                        stats=st.to_dict(),
+                        next_row=next_row,
+                        bytes_read=bytes_read,
+                        heartbeat_at=_utcnow(),
+                    )
+                    .returning(ImportJobORM.id)
+                ).first()
+                if owned is None:
+                    raise LeaseLostError(str(job_id))
+
+            with tempfile.TemporaryFile() as f:
+                storage.copy_to(job.file_ref, f)
+                f.seek(0)
+                csv_import.run_import(
+                    db,
+                    spec,
+                    f,
+                    store_id=job.store_id,
+                    user_id=job.user_id,
+                    dry_run=job.dry_run,
+                    mode=job.mode,
+                    stats=stats,
+                    start_row=start_row,
+                    on_chunk=_on_chunk,
+                )
+        _finish(job_id, token, status=DONE)
+    except LeaseLostError:
+        # 未 commit のチャンクは rollback 済み。続きは取り直したワーカーが行う
+        logger.warning("Import job %s was claimed by another worker; stopping.", job_id)
+    except Exception:
+        logger.exception("Import job failed: %s", job_id)
+        _finish(job_id, token, status=FAILED, error=INTERNAL_ERROR)
+
+
+def _safe_run(job_id: UUID) -> None:
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Import worker crashed: %s", job_id)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(job_id)
+
+
+def enqueue(job_id: UUID) -> None:
+    with _inflight_lock:
+        if job_id in _inflight:
+            return
+        _inflight.add(job_id)
+    _get_executor().submit(_safe_run, job_id)
+
+
+# ============================================================
+# アップロードしたファイルの削除
+# ============================================================
+def _lock_file(db: Session, ref: str) -> None:
+    """ファイルの削除とジョブの投入・再実行を直列化する（commit / rollback で外れる）。"""
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"import_file:{ref}"})
+
+
+def _file_in_use(ref_column, cutoff: datetime):
+    """ref_column のファイルを、未終了か終了から保持期間内のジョブが参照している"""
+    other = aliased(ImportJobORM)
+    return exists().where(
+        other.file_ref == ref_column,
+        other.file_deleted_at.is_(None),
+        or_(
+            other.status.notin_(FINISHED_STATUSES),
+            other.finished_at.is_(None),
+            other.finished_at >= cutoff,
+        ),
+    )
+
+
+def cleanup_files(limit: int = FILE_CLEANUP_BATCH) -> int:
+    """保持期間を過ぎ、どのジョブも使わなくなったファイルを削除する。戻り値は削除したファイル数。"""
+    cutoff = _utcnow() - timedelta(hours=IMPORT_JOB_FILE_RETENTION_HOURS)
+    with SessionLocal() as db:
+        refs = db.execute(
+            select(ImportJobORM.file_ref)
+            .where(
+                ImportJobORM.status.in_(FINISHED_STATUSES),
+                ImportJobORM.finished_at < cutoff,
+                ImportJobORM.file_deleted_at.is_(None),
+                ~_file_in_use(ImportJobORM.file_ref, cutoff),
+            )
+            .distinct()
+            .limit(limit)
+        ).scalars().all()
+
+    deleted = 0
+    for ref in refs:
+        with SessionLocal() as db:
+            _lock_file(db, ref)
+            # ロックを取る前に同じファイルでジョブが投入・再実行されていたら残す
+            if db.execute(select(_file_in_use(literal(ref), cutoff))).scalar():
+                db.rollback()
+                continue
+            try:
+                storage.delete(ref)
+            except Exception:
+                logger.warning("Failed to delete import file: %s", ref, exc_info=True)
+                db.rollback()
+                continue
+            db.execute(
+                update(ImportJobORM)
+                .where(ImportJobORM.file_ref == ref, ImportJobORM.file_deleted_at.is_(None))
+                .values(file_deleted_at=_utcnow())
+            )
+            db.commit()
+            deleted += 1
+    if deleted:
+        logger.info("Deleted %d expired import files", deleted)
+    return deleted
+
+
+# ============================================================
+# スイーパー（再起動後の再開・ファイルの削除）
+# ============================================================
+def sweep() -> int:
+    """queued のまま / heartbeat が途絶えた running のジョブを積み直す。戻り値は積んだ件数。"""
+    stale_before = _utcnow() - timedelta(seconds=IMPORT_JOB_STALE_SEC)
+    with SessionLocal() as db:
+        ids = db.execute(
+            select(ImportJobORM.id)
+            .where(
+                or_(
+                    ImportJobORM.status == QUEUED,
+                    (ImportJobORM.status == RUNNING)
+                    & or_(ImportJobORM.heartbeat_at.is_(None), ImportJobORM.heartbeat_at < stale_before),
+                )
+            )
+            .order_by(ImportJobORM.created_at)
+        ).scalars().all()
+    for job_id in ids:
+        enqueue(job_id)
+    return len(ids)
+
+
+def _sweep_loop() -> None:
+    last_cleanup = 0.0
+    while not _stop.is_set():
+        try:
+            sweep()
+        except Exception:
+            logger.warning("Import job sweep failed.", exc_info=True)
+
+        if time.monotonic() - last_cleanup > FILE_CLEANUP_INTERVAL_SEC:
+            last_cleanup = time.monotonic()
+            try:
+                cleanup_files()
+            except Exception:
+                logger.warning("Import file cleanup failed.", exc_info=True)
+
+        _stop.wait(IMPORT_JOB_SWEEP_SEC)
+
+
+def start() -> None:
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _stop.clear()
+    _sweeper = threading.Thread(target=_sweep_loop, name="import-job-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def shutdown() -> None:
+    """実行中のチャンクは commit されずに終わり、次回起動時に続きから再開される。"""
+    global _executor, _sweeper
+    _stop.set()
+    _sweeper = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    with _inflight_lock:
+        _inflight.clear()
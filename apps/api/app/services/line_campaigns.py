@@ -0,0 +1,433 @@
+# app/services/line_campaigns.py
+"""
+LINE キャンペーン配信。
+
+- 宛先はセグメント条件（顧客紐付け済み・車検満了日・最終来店日）から 1 本のクエリで求める
+- 作成時は line_campaigns に queued で登録してすぐ返し、ワーカー（スレッドプール）が配信する
+- LINE_CAMPAIGN_BATCH 人ずつ multicast（500 人ずつ並列）で送り、送信できた宛先の
+  line_messages（campaign_id 付き）をまとめて INSERT し、同じトランザクションで進捗を保存する
+- バッチごとにキャンセルを確認する
+- 止まった配信（queued のまま / heartbeat が途絶えた running）はスイーパーが拾い直し、
+  line_messages に記録の無い宛先だけを送る
+- 取得時に claim_token を発行し、バッチを送る前に token が自分のものか確認する（同時に heartbeat を更新）。
+  他のワーカーに取り直されていたら、送信中のバッチのログを残してやめる（残りを二重に送らない）。
+  LINE_CAMPAIGN_STALE_SEC は 1 バッチの送信（Retry-After での待ちを含む）より長くすること
+
+セグメント（line_campaigns.segment）:
+  linked            true なら既存顧客と紐付いた友だちのみ
+  shaken_due_from   車検満了日がこの日以降の車両を持つ顧客（YYYY-MM-DD）
+  shaken_due_to     車検満了日がこの日以前の車両を持つ顧客
+  last_visit_from   最終来店日（請求書の発行日）がこの日以降の顧客
+  last_visit_to     最終来店日がこの日以前の顧客
+
+環境変数:
+  LINE_CAMPAIGN_WORKERS    同時に配信するキャンペーン数（既定 1）
+  LINE_CAMPAIGN_BATCH      1 回に送る宛先数（既定 2000 = multicast 4 本）
+  LINE_CAMPAIGN_STALE_SEC  heartbeat がこの秒数途絶えた running を再開対象にする（既定 120）
+  LINE_CAMPAIGN_SWEEP_SEC  スイーパーの実行間隔（既定 30）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Optional, Set
+from uuid import UUID, uuid4
+
+from sqlalchemy import Select, exists, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.billing import BillingDocumentORM
+from app.models.car import Car
+from app.models.line_campaign import LineCampaignORM
+from app.models.line_customer import LineCustomerORM
+from app.models.line_message import LineMessageORM
+from app.models.line_setting import LineSettingORM
+from app.services import line_client, line_service
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+LINE_CAMPAIGN_WORKERS = _env_int("LINE_CAMPAIGN_WORKERS", 1)
+LINE_CAMPAIGN_BATCH = _env_int("LINE_CAMPAIGN_BATCH", 2000)
+LINE_CAMPAIGN_STALE_SEC = _env_int("LINE_CAMPAIGN_STALE_SEC", 120)
+LINE_CAMPAIGN_SWEEP_SEC = _env_int("LINE_CAMPAIGN_SWEEP_SEC", 30)
+
+# 配信状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# 想定外の例外時に返すメッセージ（内部の詳細は外に出さない）
+INTERNAL_ERROR = "配信に失敗しました"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_inflight: Set[UUID] = set()
+_inflight_lock = threading.Lock()
+
+_stop = threading.Event()
+_sweeper: Optional[threading.Thread] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=LINE_CAMPAIGN_WORKERS,
+                    thread_name_prefix="line-campaign",
+                )
+    return _executor
+
+
+# ============================================================
+# 宛先
+# ============================================================
+def _as_date(value: Any) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def _day_start(d: date) -> datetime:
+    return datetime.combine(d, time.min, tzinfo=timezone.utc)
+
+
+def recipients_query(
+    store_id: UUID,
+    segment: Dict[str, Any],
+    *,
+    campaign_id: Optional[UUID] = None,
+) -> Select:
+    """セグメントに該当する友だち（id, line_user_id）。campaign_id を渡すと送信済みを除く。"""
+    lc = LineCustomerORM
+    stmt = select(lc.id, lc.line_user_id).where(
+        lc.store_id == store_id,
+        lc.follow_status == "following",
+    )
+
+    if segment.get("linked"):
+        stmt = stmt.where(lc.customer_id.isnot(None))
+
+    shaken_from = _as_date(segment.get("shaken_due_from"))
+    shaken_to = _as_date(segment.get("shaken_due_to"))
+    if shaken_from or shaken_to:
+        conds = [Car.store_id == store_id, Car.customer_id == lc.customer_id]
+        if shaken_from:
+            conds.append(Car.inspection_expiry >= shaken_from)
+        if shaken_to:
+            conds.append(Car.inspection_expiry <= shaken_to)
+        stmt = stmt.where(exists().where(*conds))
+
+    visit_from = _as_date(segment.get("last_visit_from"))
+    visit_to = _as_date(segment.get("last_visit_to"))
+    if visit_from or visit_to:
+        last_visit = (
+            select(
+                BillingDocumentORM.customer_id.label("customer_id"),
+                func.max(BillingDocumentORM.issued_at).label("last_visit"),
+            )
+            .where(
+                BillingDocumentORM.store_id == store_id,
+                BillingDocumentORM.kind == "invoice",
+                BillingDocumentORM.status != "void",
+                BillingDocumentORM.customer_id.isnot(None),
+            )
+            .group_by(BillingDocumentORM.customer_id)
+            .subquery()
+        )
+        stmt = stmt.join(last_visit, last_visit.c.customer_id == lc.customer_id)
+        if visit_from:
+            stmt = stmt.where(last_visit.c.last_visit >= _day_start(visit_from))
+        if visit_to:
+            stmt = stmt.where(last_visit.c.last_visit < _day_start(visit_to + timedelta(days=1)))
+
+    if campaign_id is not None:
+        stmt = stmt.where(
+            ~exists().where(
+                LineMessageORM.campaign_id == campaign_id,
+                LineMessageORM.line_customer_id == lc.id,
+            )
+        )
+    return stmt.order_by(lc.id)
+
+
+def count_recipients(db: Session, store_id: UUID, segment: Dict[str, Any]) -> int:
+    sub = recipients_query(store_id, segment).order_by(None).subquery()
+    return int(db.execute(select(func.count()).select_from(sub)).scalar_one())
+
+
+# ============================================================
+# 作成・参照
+# ============================================================
+def create_campaign(
+    db: Session,
+    *,
+    store_id: UUID,
+    user_id: Optional[UUID],
+    name: Optional[str],
+    message: str,
+    segment: Dict[str, Any],
+) -> LineCampaignORM:
+    campaign = LineCampaignORM(
+        store_id=store_id,
+        user_id=user_id,
+        name=name,
+        message=message,
+        segment=segment,
+        status=QUEUED,
+        total=count_recipients(db, store_id, segment),
+    )
+    db.add(campaign)
+    db.commit()
+    db.refresh(campaign)
+    enqueue(campaign.id)
+    return campaign
+
+
+def get_campaign(db: Session, campaign_id: UUID, *, store_id: UUID) -> Optional[LineCampaignORM]:
+    """他店舗のキャンペーンは見えないようにする。"""
+    campaign = db.get(LineCampaignORM, campaign_id)
+    if campaign is None or campaign.store_id != store_id:
+        return None
+    return campaign
+
+
+def cancel_campaign(db: Session, campaign: LineCampaignORM) -> LineCampaignORM:
+    """未完了の配信を止める。送信中のバッチは送り終えてから止まる。"""
+    if campaign.status not in ACTIVE_STATUSES:
+        raise ValueError("only queued or running campaigns can be cancelled")
+    db.execute(
+        update(LineCampaignORM)
+        .where(LineCampaignORM.id == campaign.id, LineCampaignORM.status.in_(ACTIVE_STATUSES))
+        .values(status=CANCELLED, finished_at=_utcnow())
+    )
+    db.commit()
+    db.refresh(campaign)
+    return campaign
+
+
+# ============================================================
+# 実行
+# ============================================================
+def _stale_condition(stale_before: datetime):
+    return or_(
+        LineCampaignORM.status == QUEUED,
+        (LineCampaignORM.status == RUNNING)
+        & or_(LineCampaignORM.heartbeat_at.is_(None), LineCampaignORM.heartbeat_at < stale_before),
+    )
+
+
+def _claim(campaign_id: UUID) -> Optional[UUID]:
+    """配信を取る。取れたら claim_token を返す。"""
+    now = _utcnow()
+    stale_before = now - timedelta(seconds=LINE_CAMPAIGN_STALE_SEC)
+    with SessionLocal() as db:
+        claimed = db.execute(
+            update(LineCampaignORM)
+            .where(LineCampaignORM.id == campaign_id, _stale_condition(stale_before))
+            .values(
+                status=RUNNING,
+                heartbeat_at=now,
+                started_at=func.coalesce(LineCampaignORM.started_at, now),
+                claim_token=uuid4(),
+            )
+            .returning(LineCampaignORM.claim_token)
+        ).scalar_one_or_none()
+        db.commit()
+    return claimed
+
+
+def _owned(campaign_id: UUID, claim_token: UUID):
+    """自分が取った実行中の配信（キャンセル・取り直しされていない）"""
+    return (
+        (LineCampaignORM.id == campaign_id)
+        & (LineCampaignORM.status == RUNNING)
+        & (LineCampaignORM.claim_token == claim_token)
+    )
+
+
+def _finish(campaign_id: UUID, claim_token: UUID, *, status: str, error: Optional[str] = None) -> None:
+    # キャンセル済み・他のワーカーが取り直したものは上書きしない
+    with SessionLocal() as db:
+        db.execute(
+            update(LineCampaignORM)
+            .where(_owned(campaign_id, claim_token))
+            .values(status=status, error=error, finished_at=_utcnow(), heartbeat_at=_utcnow())
+        )
+        db.commit()
+
+
+def run_campaign(campaign_id: UUID) -> None:
+    claim_token = _claim(campaign_id)
+    if claim_token is None:
+        return
+
+    try:
+        with SessionLocal() as db:
+            campaign = db.get(LineCampaignORM, campaign_id)
+            token = db.execute(
+                select(LineSettingORM.channel_access_token).where(LineSettingORM.store_id == campaign.store_id)
+            ).scalar_one_or_none()
+            if not token:
+                _finish(campaign_id, claim_token, status=FAILED, error="LINE 設定が未完了です")
+                return
+
+            pending = db.execute(
+                recipients_query(campaign.store_id, campaign.segment or {}, campaign_id=campaign.id)
+            ).all()
+            # 再開時は送信済み + 未送信を総数とし、失敗数は今回の実行分だけ数え直す
+            db.execute(
+                update(LineCampaignORM)
+                .where(_owned(campaign_id, claim_token))
+                .values(total=LineCampaignORM.sent + len(pending), failed=0)
+            )
+            db.commit()
+
+            for chunk in line_client.chunked(pending, LINE_CAMPAIGN_BATCH):
+                # 送る前に、キャンセル・取り直しされていないことを確認して heartbeat を更新する
+                still_owned = db.execute(
+                    update(LineCampaignORM)
+                    .where(_owned(campaign_id, claim_token))
+                    .values(heartbeat_at=_utcnow())
+                    .returning(LineCampaignORM.id)
+                ).first()
+                db.commit()
+                if still_owned is None:
+                    logger.info("LINE campaign %s stopped (cancelled or claimed by another worker)", campaign_id)
+                    return
+
+                by_user = {r.line_user_id: r.id for r in chunk}
+                sent, failed = line_service.multicast_message(list(by_user), campaign.message, token)
+
+                # 送信ログの一括 INSERT と進捗を同じトランザクションで保存する
+                now = _utcnow()
+                if sent:
+                    db.execute(
+                        insert(LineMessageORM),
+                        [
+                            {
+                                "store_id": campaign.store_id,
+                                "line_customer_id": by_user[u],
+                                "campaign_id": campaign.id,
+                                "direction": "outbound",
+                                "message_type": "text",
+                                "content": campaign.message,
+                                "sent_at": now,
+                            }
+                            for u in sent
+                        ],
+                    )
+                values: Dict[str, Any] = {
+                    "sent": LineCampaignORM.sent + len(sent),
+                    "failed": LineCampaignORM.failed + len(failed),
+                    "heartbeat_at": now,
+                }
+                if failed:
+                    values["error"] = next(iter(failed.values()))[:500]
+                progressed = db.execute(
+                    update(LineCampaignORM)
+                    .where(LineCampaignORM.id == campaign_id, LineCampaignORM.claim_token == claim_token)
+                    .values(**values)
+                    .returning(LineCampaignORM.id)
+                ).first()
+                # 送信ログは送った事実なので、取り直されていても残す（新しいワーカーの再送を減らす）
+                db.commit()
+                if progressed is None:
+                    logger.warning("LINE campaign %s was claimed by another worker; stopping.", campaign_id)
+                    return
+        _finish(campaign_id, claim_token, status=DONE)
+    except Exception:
+        logger.exception("LINE campaign failed: %s", campaign_id)
+        _finish(campaign_id, claim_token, status=FAILED, error=INTERNAL_ERROR)
+
+
+def _safe_run(campaign_id: UUID) -> None:
+    try:
+        run_campaign(campaign_id)
+    except Exception:
+        logger.exception("LINE campaign worker crashed: %s", campaign_id)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(campaign_id)
+
+
+def enqueue(campaign_id: UUID) -> None:
+    with _inflight_lock:
+        if campaign_id in _inflight:
+            return
+        _inflight.add(campaign_id)
+    _get_executor().submit(_safe_run, campaign_id)
+
+
+# ============================================================
+# スイーパー（再起動後の再開）
+# ============================================================
+def sweep() -> int:
+    """queued のまま / heartbeat が途絶えた running の配信を積み直す。戻り値は積んだ件数。"""
+    stale_before = _utcnow() - timedelta(seconds=LINE_CAMPAIGN_STALE_SEC)
+    with SessionLocal() as db:
+        ids = db.execute(
+            select(LineCampaignORM.id)
+            .where(_stale_condition(stale_before))
+            .order_by(LineCampaignORM.created_at)
+        ).scalars().all()
+    for campaign_id in ids:
+        enqueue(campaign_id)
+    return len(ids)
+
+
+def _sweep_loop() -> None:
+    while not _stop.is_set():
+        try:
+            sweep()
+        except Exception:
+            logger.warning("LINE campaign sweep failed.", exc_info=True)
+        _stop.wait(LINE_CAMPAIGN_SWEEP_SEC)
+
+
+def start() -> None:
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _stop.clear()
+    _sweeper = threading.Thread(target=_sweep_loop, name="line-campaign-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def shutdown() -> None:
+    """
+    次回起動時に、line_messages に記録の無い宛先から再開される。
+    送信直後・記録前に止まったバッチの宛先には、再開時にもう一度送られる。
+    """
+    global _executor, _sweeper
+    _stop.set()
+    _sweeper = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    with _inflight_lock:
+        _inflight.clear()
@@ -0,0 +1,330 @@
+# app/services/line_client.py
+"""
+LINE Messaging API の非同期クライアント。
+
+- チャネルアクセストークンごとに httpx.AsyncClient を 1 つ持ち、コネクションを使い回す
+- クライアントはすべて専用スレッドのイベントループ上で動かす（AsyncClient はループをまたげないため）
+  同期コードからは run()、他のイベントループからは call() で呼ぶ
+- エンドポイントごとにトークンバケットで秒間リクエスト数を抑える
+- 429 / 5xx / 通信エラーは指数バックオフで再送する。push / multicast には
+  X-Line-Retry-Key を付けるので、再送しても二重に届かない
+  reply は Retry-Key が使えないので、届いていないことが確かなとき（接続できなかった・429）だけ再送する
+- LINE_MAX_CLIENTS を超えて LRU から外したクライアントは、送信中のリクエストが終わってから閉じる
+- multicast は 1 リクエスト 500 人まで。send_many() は宛先を 500 人ずつに分けて並列に送る
+
+環境変数:
+  LINE_MAX_RETRIES       1 リクエストあたりの再送回数（既定 3）
+  LINE_RETRY_MAX_SEC     1 回の待ち時間の上限秒（既定 30）
+  LINE_TIMEOUT_SEC       1 リクエストのタイムアウト秒（既定 10）
+  LINE_MAX_CONNECTIONS   トークンごとの最大同時接続数（既定 20）
+  LINE_MAX_CLIENTS       保持するクライアント（トークン）数の上限（既定 100）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _env_int(name: str, default: int, minimum: int = 1) -> int:
+    try:
+        return max(minimum, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+LINE_MAX_RETRIES = _env_int("LINE_MAX_RETRIES", 3, minimum=0)
+LINE_RETRY_MAX_SEC = _env_int("LINE_RETRY_MAX_SEC", 30)
+LINE_TIMEOUT_SEC = _env_int("LINE_TIMEOUT_SEC", 10)
+LINE_MAX_CONNECTIONS = _env_int("LINE_MAX_CONNECTIONS", 20)
+LINE_MAX_CLIENTS = _env_int("LINE_MAX_CLIENTS", 100)
+
+LINE_API_BASE = "https://api.line.me/v2/bot"
+
+# multicast 1 回あたりの最大宛先数
+MULTICAST_MAX_RECIPIENTS = 500
+
+# エンドポイントごとの (秒間リクエスト数, まとめて送れる数)。LINE のレート制限に合わせる
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "/message/multicast": (200, 200),
+    # broadcast は 1 時間 60 回
+    "/message/broadcast": (60 / 3600, 60),
+    "/message/push": (2000, 2000),
+    "/message/reply": (2000, 2000),
+    "/profile": (2000, 2000),
+}
+DEFAULT_RATE_LIMIT = (2000, 2000)
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# X-Line-Retry-Key で再送の重複を防げるエンドポイント
+_RETRY_KEY_PATHS = {"/message/push", "/message/multicast", "/message/broadcast"}
+
+# リクエストを送る前に失敗した（LINE に届いていない）通信エラー
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class LineApiError(RuntimeError):
+    def __init__(self, status_code: Optional[int], detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class TokenBucket:
+    """秒間 rate 回まで（最大 capacity 回までまとめて取れる）。1 つのイベントループ内で使う。"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _rate_key(path: str) -> str:
+    for prefix in RATE_LIMITS:
+        if path.startswith(prefix):
+            return prefix
+    return path
+
+
+def _retry_delay(resp: Optional[httpx.Response], attempt: int) -> float:
+    header = resp.headers.get("Retry-After") if resp is not None else None
+    try:
+        delay = float(header) if header else None
+    except ValueError:
+        delay = None
+    if delay is None:
+        delay = (2 ** attempt) + random.uniform(0, 1)
+    return min(max(delay, 0.0), float(LINE_RETRY_MAX_SEC))
+
+
+def chunked(items: Sequence[T], size: int) -> List[List[T]]:
+    return [list(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+class LineClient:
+    """1 つのチャネルアクセストークン用のクライアント。get_client() で取得する。"""
+
+    def __init__(self, token: str):
+        self.token = token
+        self._http = httpx.AsyncClient(
+            base_url=LINE_API_BASE,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=LINE_TIMEOUT_SEC,
+            limits=httpx.Limits(
+                max_connections=LINE_MAX_CONNECTIONS,
+                max_keepalive_connections=LINE_MAX_CONNECTIONS,
+            ),
+        )
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 送信中のリクエスト数と、LRU から外された（空いたら閉じる）か
+        self._in_flight = 0
+        self._close_requested = False
+
+    def _bucket(self, path: str) -> TokenBucket:
+        key = _rate_key(path)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*RATE_LIMITS.get(key, DEFAULT_RATE_LIMIT))
+            self._buckets[key] = bucket
+        return bucket
+
+    async def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """レート制限と再送付きで 1 リクエスト送る。2xx 以外は LineApiError。"""
+        self._in_flight += 1
+        try:
+            return await self._request(method, path, json)
+        finally:
+            self._in_flight -= 1
+            if self._close_requested and self._in_flight == 0:
+                await self._http.aclose()
+
+    async def _request(self, method: str, path: str, json: Optional[Dict[str, Any]]) -> httpx.Response:
+        headers: Dict[str, str] = {}
+        if method == "POST" and _rate_key(path) in _RETRY_KEY_PATHS:
+            headers["X-Line-Retry-Key"] = str(uuid.uuid4())
+        # GET と Retry-Key 付きは何度送っても同じ。それ以外（reply）は届いたかもしれないなら再送しない
+        idempotent = method == "GET" or "X-Line-Retry-Key" in headers
+
+        error = ""
+        resp: Optional[httpx.Response] = None
+        for attempt in range(LINE_MAX_RETRIES + 1):
+            await self._bucket(path).acquire()
+            resp = None
+            try:
+                resp = await self._http.request(method, path, json=json, headers=headers)
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+                if not idempotent and not isinstance(e, _NOT_SENT_ERRORS):
+                    raise LineApiError(None, error) from e
+            else:
+                if resp.status_code < 300:
+                    return resp
+                # 409: 同じ X-Line-Retry-Key のリクエストは受付済み（前回の再送が届いていた）
+                if resp.status_code == 409 and "X-Line-Retry-Key" in headers:
+                    return resp
+                error = f"LINE API {resp.status_code}: {resp.text[:200]}"
+                # 429 はレート制限で受け付けていない。5xx は処理されたかもしれない
+                if resp.status_code not in _RETRY_STATUSES or (not idempotent and resp.status_code != 429):
+                    raise LineApiError(resp.status_code, error)
+            if attempt < LINE_MAX_RETRIES:
+                await asyncio.sleep(_retry_delay(resp, attempt))
+        raise LineApiError(resp.status_code if resp is not None else None, error)
+
+    async def push(self, to: str, messages: List[Dict[str, Any]]) -> None:
+        await self.request("POST", "/message/push", {"to": to, "messages": messages})
+
+    async def reply(self, reply_token: str, messages: List[Dict[str, Any]]) -> None:
+        await self.request("POST", "/message/reply", {"replyToken": reply_token, "messages": messages})
+
+    async def multicast(self, to: Sequence[str], messages: List[Dict[str, Any]]) -> None:
+        """500 人以下の宛先に送る（分割は send_many）。"""
+        await self.request("POST", "/message/multicast", {"to": list(to), "messages": messages})
+
+    async def broadcast(self, messages: List[Dict[str, Any]]) -> None:
+        await self.request("POST", "/message/broadcast", {"messages": messages})
+
+    async def get_profile(self, line_user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            resp = await self.request("GET", f"/profile/{line_user_id}")
+        except LineApiError:
+            return None
+        return resp.json()
+
+    async def send_many(self, to: Sequence[str], messages: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, str]]:
+        """
+        複数人に同じメッセージを送る。宛先は重複を除き、500 人ずつ multicast で並列に送る。
+
+        戻り値は (送信できた userId, 失敗した userId → エラー)。
+        """
+        recipients = list(dict.fromkeys(u for u in to if u))
+        if not recipients:
+            return [], {}
+        if len(recipients) == 1:
+            chunks = [recipients]
+            sends = [self.push(recipients[0], messages)]
+        else:
+            chunks = chunked(recipients, MULTICAST_MAX_RECIPIENTS)
+            sends = [self.multicast(chunk, messages) for chunk in chunks]
+
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        sent: List[str] = []
+        failed: Dict[str, str] = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                detail = result.detail if isinstance(result, LineApiError) else str(result)
+                failed.update({u: detail for u in chunk})
+            else:
+                sent.extend(chunk)
+        return sent, failed
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def close_when_idle(self) -> None:
+        """送信中のリクエストがあれば、最後の 1 件が終わったときに閉じる。"""
+        self._close_requested = True
+        if self._in_flight == 0:
+            await self._http.aclose()
+
+
+# ============================================================
+# 専用イベントループ
+# ============================================================
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+# トークン → クライアント（ループのスレッドからのみ触る）
+_clients: "OrderedDict[str, LineClient]" = OrderedDict()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _thread = threading.Thread(target=loop.run_forever, name="line-client", daemon=True)
+                _thread.start()
+                _loop = loop
+    return _loop
+
+
+def get_client(token: str) -> LineClient:
+    """トークンごとのクライアント。ループのスレッド（run / call に渡すコルーチンの中）で呼ぶ。"""
+    client = _clients.get(token)
+    if client is not None:
+        _clients.move_to_end(token)
+        return client
+    client = LineClient(token)
+    _clients[token] = client
+    while len(_clients) > LINE_MAX_CLIENTS:
+        _, old = _clients.popitem(last=False)
+        asyncio.ensure_future(old.close_when_idle())
+    return client
+
+
+def submit(coro: Awaitable[T]) -> "Future[T]":
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())  # type: ignore[arg-type]
+
+
+def run(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """同期コード（ルート・ワーカースレッド）から呼ぶ。"""
+    return submit(coro).result(timeout)
+
+
+async def call(coro: Awaitable[T]) -> T:
+    """別のイベントループから呼ぶ。"""
+    return await asyncio.wrap_future(submit(coro))
+
+
+async def _close_all() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+def shutdown() -> None:
+    global _loop, _thread
+    loop = _loop
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_all(), loop).result(5)
+    except Exception:
+        logger.warning("[LINE] client close failed.", exc_info=True)
+    loop.call_soon_threadsafe(loop.stop)
+    _loop = None
+    _thread = None
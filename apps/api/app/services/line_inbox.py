@@ -0,0 +1,548 @@
+# app/services/line_inbox.py
+"""
+LINE Webhook の受信キュー。
+
+- Webhook は署名検証後にイベントを line_webhook_events に保存して、すぐ 200 を返す
+  （プロフィール取得・返信・プッシュ通知はリクエスト内で行わない）
+- webhookEventId の一意制約で、LINE からの再送（isRedelivery）を重複登録しない
+- ワーカースレッドが自前のイベントループでイベントをまとめて取り出し、
+  プロフィール取得と返信を並列に行う（送信は line_client のトークンごとのクライアント経由）
+- DB への反映（友だち状態・受信メッセージ）はバッチごとに 1 トランザクション。
+  バッチが失敗したら半分ずつに分けてやり直し、失敗したイベントだけを 1 件ずつ _release する
+  （1 件の不正なイベントで同じバッチの他のイベントの試行回数を使い切らない）
+- 取り出しは UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) なので、
+  複数プロセスでも同じイベントを二重に処理しない
+- 取り出すときにバッチごとの claim_token を発行し、done にする UPDATE は token が一致する行だけ行う。
+  プロフィール取得などで LINE_INBOX_STALE_SEC を超えて他のワーカーに取り直されたら、
+  元のワーカーは反映を rollback する（受信メッセージの重複登録・ウェルカムメッセージの二重送信をしない）
+
+環境変数:
+  LINE_INBOX_BATCH          1 回に取り出すイベント数（既定 100）
+  LINE_INBOX_CONCURRENCY    LINE API への同時リクエスト数（既定 10）
+  LINE_INBOX_MAX_ATTEMPTS   この回数失敗したイベントは failed にする（既定 5）
+  LINE_INBOX_STALE_SEC      processing のままこの秒数経ったイベントを取り直す（既定 120）
+  LINE_INBOX_POLL_SEC       新着通知が無いときの確認間隔（既定 10）
+  LINE_INBOX_RETENTION_DAYS 処理済みイベントを残す日数（重複判定の期間、既定 7）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, delete, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.line_customer import LineCustomerORM
+from app.models.line_message import LineMessageORM
+from app.models.line_setting import LineSettingORM
+from app.models.line_webhook_event import LineWebhookEventORM
+from app.services import line_service, push_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+LINE_INBOX_BATCH = _env_int("LINE_INBOX_BATCH", 100)
+LINE_INBOX_CONCURRENCY = _env_int("LINE_INBOX_CONCURRENCY", 10)
+LINE_INBOX_MAX_ATTEMPTS = _env_int("LINE_INBOX_MAX_ATTEMPTS", 5)
+LINE_INBOX_STALE_SEC = _env_int("LINE_INBOX_STALE_SEC", 120)
+LINE_INBOX_POLL_SEC = _env_int("LINE_INBOX_POLL_SEC", 10)
+LINE_INBOX_RETENTION_DAYS = _env_int("LINE_INBOX_RETENTION_DAYS", 7)
+
+# 処理済みイベントの削除間隔
+CLEANUP_INTERVAL_SEC = 60 * 60
+
+# イベント状態
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+# (イベント id, 店舗 id, イベント JSON, 試行回数) のリスト
+Batch = List[Tuple[UUID, UUID, Dict[str, Any], int]]
+
+_stop = threading.Event()
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+class LeaseLostError(RuntimeError):
+    """処理中のバッチが他のワーカーに取り直された。"""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ============================================================
+# 受信（Webhook から呼ぶ）
+# ============================================================
+def persist(db: Session, store_id: UUID, events: Iterable[Dict[str, Any]]) -> int:
+    """イベントを保存してワーカーを起こす。戻り値は新規に積んだ件数（再送分は数えない）。"""
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "store_id": store_id,
+            "webhook_event_id": ev.get("webhookEventId"),
+            "event_type": (ev.get("type") or "")[:32] or None,
+            "payload": ev,
+            "status": QUEUED,
+            "attempts": 0,
+            "created_at": _utcnow(),
+        }
+        for ev in events
+        if isinstance(ev, dict)
+    ]
+    if not rows:
+        return 0
+
+    stmt = (
+        pg_insert(LineWebhookEventORM)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["webhook_event_id"])
+        .returning(LineWebhookEventORM.id)
+    )
+    inserted = len(db.execute(stmt).all())
+    db.commit()
+    if inserted:
+        _wake.set()
+    return inserted
+
+
+# ============================================================
+# 取り出し
+# ============================================================
+def _claim_batch() -> Tuple[UUID, Batch]:
+    """queued（と止まった processing）を古い順に取り、processing にする。戻り値は (claim_token, バッチ)。"""
+    now = _utcnow()
+    token = uuid.uuid4()
+    stale_before = now - timedelta(seconds=LINE_INBOX_STALE_SEC)
+    pending = (
+        select(LineWebhookEventORM.id)
+        .where(
+            or_(
+                LineWebhookEventORM.status == QUEUED,
+                and_(
+                    LineWebhookEventORM.status == PROCESSING,
+                    LineWebhookEventORM.locked_at < stale_before,
+                ),
+            )
+        )
+        .order_by(LineWebhookEventORM.created_at)
+        .limit(LINE_INBOX_BATCH)
+        .with_for_update(skip_locked=True)
+    )
+    with SessionLocal() as db:
+        rows = db.execute(
+            update(LineWebhookEventORM)
+            .where(LineWebhookEventORM.id.in_(pending.scalar_subquery()))
+            .values(
+                status=PROCESSING,
+                locked_at=now,
+                claim_token=token,
+                attempts=LineWebhookEventORM.attempts + 1,
+            )
+            .returning(
+                LineWebhookEventORM.id,
+                LineWebhookEventORM.store_id,
+                LineWebhookEventORM.payload,
+                LineWebhookEventORM.attempts,
+                LineWebhookEventORM.created_at,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    # RETURNING の順序は保証されないので受信順に並べ直す
+    rows = sorted(rows, key=lambda r: (r.created_at, (r.payload or {}).get("timestamp") or 0))
+    return token, [(r.id, r.store_id, r.payload or {}, r.attempts) for r in rows]
+
+
+def _owned(ids: List[UUID], token: UUID):
+    """自分が取ったまま処理中のイベント"""
+    return (
+        LineWebhookEventORM.id.in_(ids)
+        & (LineWebhookEventORM.status == PROCESSING)
+        & (LineWebhookEventORM.claim_token == token)
+    )
+
+
+def _release(batch: Batch, token: UUID, error: str) -> None:
+    """
+    処理に失敗したバッチを queued に戻す（上限回数を超えたものは failed）。
+    done にした後のイベント・他のワーカーが取り直したイベントは戻さない
+    （戻すと受信メッセージの重複登録・ウェルカムメッセージの再送になる）。
+    """
+    retry_ids = [ev_id for ev_id, _, _, attempts in batch if attempts < LINE_INBOX_MAX_ATTEMPTS]
+    failed_ids = [ev_id for ev_id, _, _, attempts in batch if attempts >= LINE_INBOX_MAX_ATTEMPTS]
+    with SessionLocal() as db:
+        if retry_ids:
+            db.execute(
+                update(LineWebhookEventORM)
+                .where(_owned(retry_ids, token))
+                .values(status=QUEUED, locked_at=None, error=error)
+            )
+        if failed_ids:
+            db.execute(
+                update(LineWebhookEventORM)
+                .where(_owned(failed_ids, token))
+                .values(status=FAILED, error=error, processed_at=_utcnow())
+            )
+        db.commit()
+
+
+# ============================================================
+# 処理
+# ============================================================
+async def _limited(sem: asyncio.Semaphore, coro: Awaitable[Any]) -> Any:
+    async with sem:
+        return await coro
+
+
+def _user_id(event: Dict[str, Any]) -> str:
+    return (event.get("source") or {}).get("userId") or ""
+
+
+def _load_customers(db: Session, keys: Iterable[Tuple[UUID, str]]) -> Dict[Tuple[UUID, str], LineCustomerORM]:
+    keys = list(set(keys))
+    if not keys:
+        return {}
+    rows = db.execute(
+        select(LineCustomerORM).where(
+            tuple_(LineCustomerORM.store_id, LineCustomerORM.line_user_id).in_(keys)
+        )
+    ).scalars().all()
+    return {(lc.store_id, lc.line_user_id): lc for lc in rows}
+
+
+def _apply(
+    db: Session,
+    batch: Batch,
+    settings: Dict[UUID, LineSettingORM],
+    profiles: Dict[Tuple[UUID, str], Optional[dict]],
+) -> Tuple[List[Dict[str, Any]], List[Tuple[UUID, Dict[str, Any]]]]:
+    """
+    友だち状態と受信メッセージを反映する（commit は呼び出し側）。
+
+    戻り値は (LINE への送信予定, 店舗スタッフへのプッシュ通知)。
+    """
+    customers = _load_customers(
+        db,
+        ((store_id, _user_id(ev)) for _, store_id, ev, _ in batch if _user_id(ev)),
+    )
+    outgoing: List[Dict[str, Any]] = []
+    notifications: List[Tuple[UUID, Dict[str, Any]]] = []
+
+    def _customer(store_id: UUID, line_user_id: str) -> LineCustomerORM:
+        lc = customers.get((store_id, line_user_id))
+        if lc is None:
+            lc = LineCustomerORM(
+                id=uuid.uuid4(),
+                store_id=store_id,
+                line_user_id=line_user_id,
+                follow_status="following",
+                followed_at=_utcnow(),
+            )
+            db.add(lc)
+            customers[(store_id, line_user_id)] = lc
+        return lc
+
+    for _, store_id, event, _ in batch:
+        line_user_id = _user_id(event)
+        if not line_user_id:
+            continue
+        setting = settings.get(store_id)
+        token = setting.channel_access_token if setting else ""
+        event_type = event.get("type")
+
+        if event_type == "follow":
+            profile = profiles.get((store_id, line_user_id)) or {}
+            lc = _customer(store_id, line_user_id)
+            if profile.get("displayName"):
+                lc.display_name = profile["displayName"]
+            if profile.get("pictureUrl"):
+                lc.picture_url = profile["pictureUrl"]
+            lc.follow_status = "following"
+            lc.followed_at = _utcnow()
+
+            # ウェルカムメッセージ送信
+            if setting and setting.welcome_message and token:
+                outgoing.append({
+                    "kind": "push",
+                    "to": line_user_id,
+                    "text": setting.welcome_message,
+                    "token": token,
+                })
+
+            notifications.append((store_id, {
+                "title": "新しいLINE友だち",
+                "body": f"{lc.display_name or 'ユーザー'} が友だち追加しました。",
+                "url": "/line",
+                "tag": "line-follow",
+            }))
+
+        elif event_type == "unfollow":
+            lc = customers.get((store_id, line_user_id))
+            if lc:
+                lc.follow_status = "blocked"
+                lc.blocked_at = _utcnow()
+
+        elif event_type == "message":
+            msg = event.get("message", {})
+            msg_type = msg.get("type", "other")
+            content = msg.get("text") if msg_type == "text" else None
+            reply_token = event.get("replyToken")
+
+            lc = _customer(store_id, line_user_id)
+            db.add(LineMessageORM(
+                store_id=store_id,
+                line_customer_id=lc.id,
+                direction="inbound",
+                message_type=msg_type if msg_type in ("text", "image", "sticker") else "other",
+                content=content,
+                line_message_id=msg.get("id"),
+                sent_at=_utcnow(),
+            ))
+
+            # 自動返信（送信できたものだけ後で outbound として保存する）
+            if setting and setting.auto_reply_enabled and setting.auto_reply_message and reply_token and token:
+                outgoing.append({
+                    "kind": "reply",
+                    "to": reply_token,
+                    "text": setting.auto_reply_message,
+                    "token": token,
+                    "store_id": store_id,
+                    "line_customer_id": lc.id,
+                })
+
+            if content:
+                notifications.append((store_id, {
+                    "title": f"LINEメッセージ: {lc.display_name or 'ユーザー'}",
+                    "body": content[:80],
+                    "url": "/line",
+                    "tag": "line-message",
+                }))
+
+    return outgoing, notifications
+
+
+async def _send(item: Dict[str, Any]) -> Tuple[bool, str]:
+    if item["kind"] == "reply":
+        return await line_service.reply_message_async(item["to"], item["text"], item["token"])
+    return await line_service.send_message_async(item["to"], item["text"], item["token"])
+
+
+async def process_batch(batch: Batch, token: UUID) -> None:
+    """
+    例外を投げるのは 2. の commit より前だけ（呼び出し側はそのときだけ _release する）。
+    commit 後の送信・ログ・通知の失敗はログに残して続ける。
+    バッチの一部でも他のワーカーに取り直されていたら、反映を rollback して LeaseLostError を投げる。
+    """
+    sem = asyncio.Semaphore(LINE_INBOX_CONCURRENCY)
+    store_ids = {store_id for _, store_id, _, _ in batch}
+
+    with SessionLocal() as db:
+        settings = {
+            s.store_id: s
+            for s in db.execute(
+                select(LineSettingORM).where(LineSettingORM.store_id.in_(store_ids))
+            ).scalars().all()
+        }
+
+    # 1. 友だち追加のプロフィールを並列で取得
+    profile_keys = sorted({
+        (store_id, _user_id(ev))
+        for _, store_id, ev, _ in batch
+        if ev.get("type") == "follow" and _user_id(ev) and settings.get(store_id)
+    }, key=str)
+    fetched = await asyncio.gather(*(
+        _limited(sem, line_service.get_profile_async(
+            line_user_id, settings[store_id].channel_access_token or ""
+        ))
+        for store_id, line_user_id in profile_keys
+    ))
+    profiles = dict(zip(profile_keys, fetched))
+
+    # 2. DB への反映とイベントの完了を 1 トランザクションで（ここまでで落ちたらやり直し）
+    with SessionLocal() as db:
+        outgoing, notifications = _apply(db, batch, settings, profiles)
+        done = db.execute(
+            update(LineWebhookEventORM)
+            .where(_owned([ev_id for ev_id, _, _, _ in batch], token))
+            .values(status=DONE, error=None, processed_at=_utcnow())
+            .returning(LineWebhookEventORM.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if len(done) != len(batch):
+            db.rollback()
+            raise LeaseLostError(f"{len(batch) - len(done)} of {len(batch)} events were reclaimed")
+        db.commit()
+
+    try:
+        await _after_done(sem, outgoing, notifications)
+    except Exception:
+        # イベントは done 済み。やり直すと二重送信になるので戻さない
+        logger.exception("[LINE Inbox] post-processing failed (%d events)", len(batch))
+
+
+async def _after_done(
+    sem: asyncio.Semaphore,
+    outgoing: List[Dict[str, Any]],
+    notifications: List[Tuple[UUID, Dict[str, Any]]],
+) -> None:
+    # 3. ウェルカムメッセージ・自動返信を並列で送信（replyToken は短時間で失効するので再送しない）
+    results = await asyncio.gather(
+        *(_limited(sem, _send(item)) for item in outgoing), return_exceptions=True
+    )
+    replies = []
+    for item, result in zip(outgoing, results):
+        if isinstance(result, BaseException):
+            logger.warning("[LINE Inbox] %s failed: %r", item["kind"], result)
+            continue
+        ok, err = result
+        if not ok:
+            logger.warning("[LINE Inbox] %s failed: %s", item["kind"], err)
+        elif item["kind"] == "reply":
+            replies.append(LineMessageORM(
+                store_id=item["store_id"],
+                line_customer_id=item["line_customer_id"],
+                direction="outbound",
+                message_type="text",
+                content=item["text"],
+                sent_at=_utcnow(),
+            ))
+    if replies:
+        try:
+            with SessionLocal() as db:
+                db.add_all(replies)
+                db.commit()
+        except Exception:
+            logger.warning("[LINE Inbox] failed to log %d replies", len(replies), exc_info=True)
+
+    # 4. 店舗スタッフにプッシュ通知
+    for store_id, payload in notifications:
+        try:
+            push_queue.enqueue_store(store_id, payload)
+        except Exception:
+            logger.warning("[LINE Inbox] push enqueue failed", exc_info=True)
+
+
+def _error_text(ex: BaseException) -> str:
+    return f"{type(ex).__name__}: {ex}"[:500]
+
+
+async def _process_isolating(batch: Batch, token: UUID) -> None:
+    """
+    バッチを処理し、失敗したら半分に分けてやり直す。
+    1 件だけで失敗したイベントを _release する（試行回数が進むのは、そのイベントだけ）。
+    LeaseLostError は分けても直らないので呼び出し側に返す。
+    """
+    try:
+        await process_batch(batch, token)
+    except LeaseLostError:
+        raise
+    except Exception as ex:
+        if len(batch) == 1:
+            logger.exception("[LINE Inbox] event %s failed", batch[0][0])
+            _release(batch, token, _error_text(ex))
+            return
+        logger.warning("[LINE Inbox] batch failed (%d events); retrying in halves: %r", len(batch), ex)
+        mid = len(batch) // 2
+        await _process_isolating(batch[:mid], token)
+        await _process_isolating(batch[mid:], token)
+
+
+async def drain() -> int:
+    """積まれているイベントを無くなるまで処理する。戻り値は処理したイベント数。"""
+    total = 0
+    while not _stop.is_set():
+        token, batch = _claim_batch()
+        if not batch:
+            break
+        try:
+            await _process_isolating(batch, token)
+        except Exception as ex:
+            # 取り直されたときか _release 自体の失敗。done にした分・取り直された分は _release でも触らない
+            if isinstance(ex, LeaseLostError):
+                logger.warning("[LINE Inbox] batch was reclaimed by another worker: %s", ex)
+            else:
+                logger.exception("[LINE Inbox] batch failed (%d events)", len(batch))
+            _release(batch, token, _error_text(ex))
+        total += len(batch)
+    return total
+
+
+def cleanup() -> int:
+    """保持期間を過ぎた処理済みイベントを削除する。"""
+    before = _utcnow() - timedelta(days=LINE_INBOX_RETENTION_DAYS)
+    with SessionLocal() as db:
+        deleted = db.execute(
+            delete(LineWebhookEventORM).where(
+                LineWebhookEventORM.status == DONE,
+                LineWebhookEventORM.processed_at < before,
+            )
+        ).rowcount
+        db.commit()
+    return deleted or 0
+
+
+# ============================================================
+# ワーカー
+# ============================================================
+async def _main() -> None:
+    last_cleanup = 0.0
+    while not _stop.is_set():
+        _wake.clear()
+        try:
+            await drain()
+        except Exception:
+            logger.warning("[LINE Inbox] drain failed.", exc_info=True)
+
+        if time.monotonic() - last_cleanup > CLEANUP_INTERVAL_SEC:
+            last_cleanup = time.monotonic()
+            try:
+                cleanup()
+            except Exception:
+                logger.warning("[LINE Inbox] cleanup failed.", exc_info=True)
+
+        # 新着（persist）か停止で起きる。他プロセスが受けた分は POLL_SEC ごとに拾う
+        await asyncio.to_thread(_wake.wait, LINE_INBOX_POLL_SEC)
+
+
+def _run() -> None:
+    try:
+        asyncio.run(_main())
+    except Exception:
+        logger.exception("[LINE Inbox] worker crashed.")
+
+
+def start() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _wake.set()
+    _worker = threading.Thread(target=_run, name="line-inbox", daemon=True)
+    _worker.start()
+
+
+def shutdown() -> None:
+    """処理中のバッチは processing のまま残り、LINE_INBOX_STALE_SEC 後に取り直される。"""
+    global _worker
+    _stop.set()
+    _wake.set()
+    _worker = None
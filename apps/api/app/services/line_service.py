@@ -7,12 +7,10 @@ import json
 import logging
 from typing import Any
 
-import httpx
+from app.services import line_client
 
 logger = logging.getLogger(__name__)
 
-LINE_API_BASE = "https://api.line.me/v2/bot"
-
 
 # ============================================================
 # 署名検証
@@ -32,92 +30,91 @@ def verify_signature(body: bytes, signature: str, channel_secret: str) -> bool:
 # メッセージ送信
 # ============================================================
 
-def _auth_header(token: str) -> dict[str, str]:
-    return {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
+def _text(message: str) -> list[dict[str, Any]]:
+    return [{"type": "text", "text": message}]
+
+
+# 送信はすべて line_client の専用ループ上のクライアント（トークンごとにコネクションを使い回す）で行う。
+# get_client() はループのスレッドで呼ぶ必要があるので、コルーチンの中で取得する
+
+async def _push(token: str, to: str, messages: list[dict[str, Any]]) -> tuple[bool, str]:
+    try:
+        await line_client.get_client(token).push(to, messages)
+        return True, ""
+    except Exception as e:
+        return False, _error_detail(e)
+
+
+async def _reply(token: str, reply_token: str, messages: list[dict[str, Any]]) -> tuple[bool, str]:
+    try:
+        await line_client.get_client(token).reply(reply_token, messages)
+        return True, ""
+    except Exception as e:
+        return False, _error_detail(e)
+
+
+async def _broadcast(token: str, messages: list[dict[str, Any]]) -> tuple[bool, str]:
+    try:
+        await line_client.get_client(token).broadcast(messages)
+        return True, ""
+    except Exception as e:
+        return False, _error_detail(e)
+
+
+async def _send_many(
+    token: str, to: list[str], messages: list[dict[str, Any]]
+) -> tuple[list[str], dict[str, str]]:
+    return await line_client.get_client(token).send_many(to, messages)
+
+
+async def _get_profile(token: str, line_user_id: str) -> dict | None:
+    return await line_client.get_client(token).get_profile(line_user_id)
+
+
+def _error_detail(e: Exception) -> str:
+    return e.detail if isinstance(e, line_client.LineApiError) else str(e)
 
 
 def send_message(line_user_id: str, message: str, token: str) -> tuple[bool, str]:
     """LINE ユーザーにテキストメッセージを送信（Push Message）"""
     if not token:
         return False, "channel_access_token が未設定です"
-    try:
-        resp = httpx.post(
-            f"{LINE_API_BASE}/message/push",
-            headers=_auth_header(token),
-            json={
-                "to": line_user_id,
-                "messages": [{"type": "text", "text": message}],
-            },
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            return True, ""
-        return False, f"LINE API {resp.status_code}: {resp.text[:200]}"
-    except Exception as e:
-        return False, str(e)
+    return line_client.run(_push(token, line_user_id, _text(message)))
 
 
 def send_flex_message(line_user_id: str, alt_text: str, flex_content: dict, token: str) -> tuple[bool, str]:
     """LINE ユーザーに Flex Message を送信"""
     if not token:
         return False, "channel_access_token が未設定です"
-    try:
-        resp = httpx.post(
-            f"{LINE_API_BASE}/message/push",
-            headers=_auth_header(token),
-            json={
-                "to": line_user_id,
-                "messages": [{"type": "flex", "altText": alt_text, "contents": flex_content}],
-            },
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            return True, ""
-        return False, f"LINE API {resp.status_code}: {resp.text[:200]}"
-    except Exception as e:
-        return False, str(e)
+    messages = [{"type": "flex", "altText": alt_text, "contents": flex_content}]
+    return line_client.run(_push(token, line_user_id, messages))
 
 
 def reply_message(reply_token: str, message: str, token: str) -> tuple[bool, str]:
     """Reply Token を使って返信（Webhook受信時のみ有効）"""
     if not token:
         return False, "channel_access_token が未設定です"
-    try:
-        resp = httpx.post(
-            f"{LINE_API_BASE}/message/reply",
-            headers=_auth_header(token),
-            json={
-                "replyToken": reply_token,
-                "messages": [{"type": "text", "text": message}],
-            },
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            return True, ""
-        return False, f"LINE API {resp.status_code}: {resp.text[:200]}"
-    except Exception as e:
-        return False, str(e)
+    return line_client.run(_reply(token, reply_token, _text(message)))
 
 
 def broadcast_message(message: str, token: str) -> tuple[bool, str]:
     """全友だちに一斉送信（Broadcast Message）"""
     if not token:
         return False, "channel_access_token が未設定です"
-    try:
-        resp = httpx.post(
-            f"{LINE_API_BASE}/message/broadcast",
-            headers=_auth_header(token),
-            json={"messages": [{"type": "text", "text": message}]},
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            return True, ""
-        return False, f"LINE API {resp.status_code}: {resp.text[:200]}"
-    except Exception as e:
-        return False, str(e)
+    return line_client.run(_broadcast(token, _text(message)))
+
+
+def multicast_message(
+    line_user_ids: list[str], message: str, token: str
+) -> tuple[list[str], dict[str, str]]:
+    """
+    複数の LINE ユーザーに同じテキストを送信（500 人ずつ Multicast Message を並列に送る）
+
+    戻り値は (送信できた userId, 失敗した userId → エラー)。
+    """
+    if not token:
+        return [], {u: "channel_access_token が未設定です" for u in line_user_ids}
+    return line_client.run(_send_many(token, list(line_user_ids), _text(message)))
 
 
 def get_profile(line_user_id: str, token: str) -> dict | None:
@@ -125,18 +122,46 @@ def get_profile(line_user_id: str, token: str) -> dict | None:
     if not token:
         return None
     try:
-        resp = httpx.get(
-            f"{LINE_API_BASE}/profile/{line_user_id}",
-            headers=_auth_header(token),
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            return resp.json()
+        return line_client.run(_get_profile(token, line_user_id))
+    except Exception:
+        return None
+
+
+# ============================================================
+# 非同期版（他のイベントループから呼ぶ。処理は line_client のループで行う）
+# ============================================================
+
+async def get_profile_async(line_user_id: str, token: str) -> dict | None:
+    """get_profile の非同期版"""
+    if not token:
         return None
+    try:
+        return await line_client.call(_get_profile(token, line_user_id))
     except Exception:
         return None
 
 
+async def send_message_async(line_user_id: str, message: str, token: str) -> tuple[bool, str]:
+    """send_message の非同期版"""
+    if not token:
+        return False, "channel_access_token が未設定です"
+    return await line_client.call(_push(token, line_user_id, _text(message)))
+
+
+async def broadcast_messages_async(messages: list[dict[str, Any]], token: str) -> tuple[bool, str]:
+    """任意のメッセージ（テキスト + 画像など）を全友だちに一斉送信する非同期版"""
+    if not token:
+        return False, "channel_access_token が未設定です"
+    return await line_client.call(_broadcast(token, messages))
+
+
+async def reply_message_async(reply_token: str, message: str, token: str) -> tuple[bool, str]:
+    """reply_message の非同期版"""
+    if not token:
+        return False, "channel_access_token が未設定です"
+    return await line_client.call(_reply(token, reply_token, _text(message)))
+
+
 # ============================================================
 # Flex Message テンプレート
 # ============================================================
@@ -0,0 +1,276 @@
+# app/services/ocr_cache.py
+"""
+OCR 結果キャッシュ（ocr_result_cache）。
+
+キーはファイル内容の SHA-256 + provider + lang + preprocess + dpi + max_pages。
+同じファイルを同じ設定で再アップロードしたときは、OCR を実行せずに保存済みのテキスト / パース結果を返す。
+get は commit しない（ヒット情報の更新を残すかどうかは呼び出し側が決める）。
+
+上限は put のたびには確かめない。ワーカースレッドが OCR_CACHE_EVICT_TICK_SEC ごとに件数と SUM(size_bytes) を数え、
+上限を超えた分を最終利用の古い順に EVICT_BATCH 件ずつ削除する（その間は一時的に上限を超えうる）。
+size_bytes が無い行は 0 バイトとして数える。
+
+環境変数:
+  OCR_CACHE_MAX_ENTRIES     保持する最大件数（既定 10000）
+  OCR_CACHE_MAX_BYTES       保持する size_bytes の合計上限（既定 1GB）
+  OCR_CACHE_EVICT_TICK_SEC  上限を超えた分を削除する間隔（既定 600）
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.ocr_result_cache import OcrResultCacheORM
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+OCR_CACHE_MAX_ENTRIES = _env_int("OCR_CACHE_MAX_ENTRIES", 10000)
+OCR_CACHE_MAX_BYTES = _env_int("OCR_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+OCR_CACHE_EVICT_TICK_SEC = _env_int("OCR_CACHE_EVICT_TICK_SEC", 600)
+
+# 1 回の DELETE で削除する件数
+EVICT_BATCH = 500
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+@dataclass(frozen=True)
+class OcrCacheKey:
+    content_sha256: str
+    provider: str
+    lang: str
+    preprocess: bool
+    # PDF のラスタライズ解像度・ページ数（0 = ラスタライズしない / 全ページ）
+    dpi: int = 0
+    max_pages: int = 0
+
+
+@dataclass(frozen=True)
+class OcrCacheEntry:
+    raw_text: str
+    parsed: Optional[Dict[str, Any]]
+
+
+def make_key(
+    content: bytes,
+    *,
+    provider: str,
+    lang: str,
+    preprocess: bool,
+    dpi: int = 0,
+    max_pages: Optional[int] = None,
+) -> OcrCacheKey:
+    return OcrCacheKey(
+        content_sha256=hashlib.sha256(content).hexdigest(),
+        provider=(provider or "").strip().lower(),
+        lang=(lang or "").strip(),
+        preprocess=bool(preprocess),
+        dpi=int(dpi or 0),
+        max_pages=int(max_pages or 0),
+    )
+
+
+def _key_filter(key: OcrCacheKey):
+    return (
+        OcrResultCacheORM.content_sha256 == key.content_sha256,
+        OcrResultCacheORM.provider == key.provider,
+        OcrResultCacheORM.lang == key.lang,
+        OcrResultCacheORM.preprocess == key.preprocess,
+        OcrResultCacheORM.dpi == key.dpi,
+        OcrResultCacheORM.max_pages == key.max_pages,
+    )
+
+
+def get(db: Session, key: OcrCacheKey) -> Optional[OcrCacheEntry]:
+    """
+    ヒットしたら last_used_at / hit_count を更新して返す（1 文の UPDATE ... RETURNING）。
+    commit はしないので、更新を残すなら呼び出し側で commit する。
+    """
+    row = db.execute(
+        update(OcrResultCacheORM)
+        .where(*_key_filter(key))
+        .values(
+            last_used_at=datetime.now(timezone.utc),
+            hit_count=OcrResultCacheORM.hit_count + 1,
+        )
+        .returning(OcrResultCacheORM.raw_text, OcrResultCacheORM.parsed)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+    return OcrCacheEntry(raw_text=row.raw_text, parsed=row.parsed)
+
+
+def put(
+    db: Session,
+    key: OcrCacheKey,
+    *,
+    raw_text: str,
+    parsed: Optional[Dict[str, Any]] = None,
+    size_bytes: Optional[int] = None,
+) -> None:
+    """upsert する（件数上限を超えた分はワーカーが後で削除する）。"""
+    now = datetime.now(timezone.utc)
+    stmt = pg_insert(OcrResultCacheORM).values(
+        content_sha256=key.content_sha256,
+        provider=key.provider,
+        lang=key.lang,
+        preprocess=key.preprocess,
+        dpi=key.dpi,
+        max_pages=key.max_pages,
+        raw_text=raw_text or "",
+        parsed=parsed,
+        size_bytes=size_bytes,
+        hit_count=0,
+        created_at=now,
+        last_used_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_ocr_result_cache_key",
+        set_={
+            "raw_text": stmt.excluded.raw_text,
+            "parsed": stmt.excluded.parsed,
+            "last_used_at": now,
+        },
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def _delete_ids(db: Session, ids) -> int:
+    n = db.execute(
+        delete(OcrResultCacheORM)
+        .where(OcrResultCacheORM.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount or 0
+    db.commit()
+    return n
+
+
+def _evict_entries(db: Session, max_entries: int, batch: int) -> int:
+    excess = db.execute(select(func.count()).select_from(OcrResultCacheORM)).scalar_one() - max_entries
+    deleted = 0
+    while excess > 0:
+        oldest = (
+            select(OcrResultCacheORM.id)
+            .order_by(OcrResultCacheORM.last_used_at)
+            .limit(min(batch, excess))
+            .scalar_subquery()
+        )
+        n = _delete_ids(db, oldest)
+        if n == 0:
+            break
+        deleted += n
+        excess -= n
+    return deleted
+
+
+def _evict_bytes(db: Session, max_bytes: int, batch: int) -> int:
+    size = func.coalesce(OcrResultCacheORM.size_bytes, 0)
+    excess = db.execute(select(func.coalesce(func.sum(size), 0))).scalar_one() - max_bytes
+    deleted = 0
+    while excess > 0:
+        # 古い順に batch 件読み、上限を下回るところまでだけ消す
+        rows = db.execute(
+            select(OcrResultCacheORM.id, size)
+            .order_by(OcrResultCacheORM.last_used_at)
+            .limit(batch)
+        ).all()
+        ids = []
+        for row_id, row_size in rows:
+            ids.append(row_id)
+            excess -= int(row_size)
+            if excess <= 0:
+                break
+        if not ids or _delete_ids(db, ids) == 0:
+            break
+        deleted += len(ids)
+    return deleted
+
+
+def evict(
+    db: Session,
+    max_entries: int = OCR_CACHE_MAX_ENTRIES,
+    batch: int = EVICT_BATCH,
+    max_bytes: int = OCR_CACHE_MAX_BYTES,
+) -> int:
+    """
+    件数・SUM(size_bytes) の上限を超えた分を最終利用の古い順に削除する。戻り値は削除した件数。
+
+    古い順の batch 件は last_used_at のインデックスの先頭から読むだけなので、上限件数分を読み飛ばさない。
+    batch 件ごとに commit する（長いロックを取らない）。
+    """
+    deleted = _evict_entries(db, max_entries, batch)
+    return deleted + _evict_bytes(db, max_bytes, batch)
+
+
+def safe_get(db: Session, key: OcrCacheKey) -> Optional[OcrCacheEntry]:
+    """キャッシュ障害で OCR 自体を止めないためのラッパー。"""
+    try:
+        return get(db, key)
+    except Exception:
+        db.rollback()
+        logger.warning("OCR cache lookup failed; running OCR.", exc_info=True)
+        return None
+
+
+def safe_put(db: Session, key: OcrCacheKey, **kwargs: Any) -> None:
+    try:
+        put(db, key, **kwargs)
+    except Exception:
+        db.rollback()
+        logger.warning("OCR cache store failed.", exc_info=True)
+
+
+# ============================================================
+# Worker
+# ============================================================
+def run_once() -> int:
+    with SessionLocal() as db:
+        deleted = evict(db)
+    if deleted:
+        logger.info("OCR cache: evicted %d entries", deleted)
+    return deleted
+
+
+def _loop() -> None:
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception:
+            logger.warning("OCR cache: eviction failed.", exc_info=True)
+        _stop.wait(OCR_CACHE_EVICT_TICK_SEC)
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="ocr-cache-evict", daemon=True)
+    _thread.start()
+
+
+def shutdown() -> None:
+    global _thread
+    _stop.set()
+    _thread = None
@@ -0,0 +1,311 @@
+# app/services/ocr_jobs.py
+"""
+車検証 OCR のジョブキュー。
+
+- 投入するとすぐ job_id を返し、OCR（pdf2image + tesseract / Vision）はプロセスプールで実行する
+- 同時実行数・待ち行列の上限・ジョブごとのタイムアウト・結果の保持期限（TTL）を持つ
+- タイムアウトしたジョブは呼び出し側にはすぐ timeout を返すが、プロセスは途中で止められないので
+  ワーカーが実際に終わるまで実行枠を返さない（同時実行数が OCR_JOB_WORKERS を超えない）
+- 結果はこのプロセスのメモリに保持する（uvicorn 1 プロセス構成前提）
+
+環境変数:
+  OCR_JOB_WORKERS          プロセスプールのワーカー数（= 同時実行数、既定 2）
+  OCR_JOB_MAX_PENDING      実行待ち + 実行中ジョブの上限（既定 20）
+  OCR_JOB_TIMEOUT_SEC      1 ジョブのタイムアウト秒（既定 120）
+  OCR_JOB_RESULT_TTL_SEC   完了ジョブの結果を保持する秒数（既定 600）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Set
+
+from app.db.session import SessionLocal
+from app.services import ocr_cache
+from app.services.ocr_cache import OcrCacheKey
+from app.services.shaken_ocr import OcrConfig, ShakenOcrError, get_dpi, get_provider, ocr_and_parse_shaken
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+OCR_JOB_WORKERS = _env_int("OCR_JOB_WORKERS", 2)
+OCR_JOB_MAX_PENDING = _env_int("OCR_JOB_MAX_PENDING", 20)
+OCR_JOB_TIMEOUT_SEC = _env_int("OCR_JOB_TIMEOUT_SEC", 120)
+OCR_JOB_RESULT_TTL_SEC = _env_int("OCR_JOB_RESULT_TTL_SEC", 600)
+
+# 車検証 PDF は通常 1 ページ。余分なページ（裏面の注意書き等）はラスタライズしない
+SHAKEN_MAX_PAGES = 2
+
+# ジョブ状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+FINISHED_STATUSES = (DONE, FAILED, TIMEOUT)
+
+# 想定外の例外時に返すメッセージ（内部の詳細は外に出さない）
+INTERNAL_ERROR = "OCR failed"
+
+
+class OcrQueueFullError(RuntimeError):
+    """待ち行列が上限に達している。"""
+
+
+@dataclass
+class OcrJob:
+    id: str
+    store_id: Optional[str]
+    kind: str
+    status: str = QUEUED
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # OCR キャッシュから返した場合 True
+    cached: bool = False
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cached": self.cached,
+        }
+
+
+_jobs: Dict[str, OcrJob] = {}
+# create_task の戻り値は弱参照しか残らないので、完了まで保持する
+_tasks: Set[asyncio.Task] = set()
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # uvicorn はスレッドを持つので fork ではなく spawn でワーカーを起動する
+        _pool = ProcessPoolExecutor(
+            max_workers=OCR_JOB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(OCR_JOB_WORKERS)
+    return _slots
+
+
+def _purge_expired(now: Optional[float] = None) -> None:
+    now = now or time.time()
+    expired = [
+        jid for jid, job in _jobs.items()
+        if job.finished and job.finished_at and now - job.finished_at > OCR_JOB_RESULT_TTL_SEC
+    ]
+    for jid in expired:
+        _jobs.pop(jid, None)
+
+
+def _active_count() -> int:
+    return sum(1 for job in _jobs.values() if not job.finished)
+
+
+def _cache_lookup(key: OcrCacheKey) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        hit = ocr_cache.safe_get(db, key)
+        if hit is not None:
+            # last_used_at / hit_count の更新を残す
+            db.commit()
+    if hit is None:
+        return None
+    return {**(hit.parsed or {}), "raw_text": hit.raw_text}
+
+
+def _cache_store(key: OcrCacheKey, result: Dict[str, Any], size_bytes: int) -> None:
+    parsed = {k: v for k, v in result.items() if k != "raw_text"}
+    with SessionLocal() as db:
+        ocr_cache.safe_put(
+            db,
+            key,
+            raw_text=result.get("raw_text") or "",
+            parsed=parsed,
+            size_bytes=size_bytes,
+        )
+
+
+async def _wait_abandoned(job: OcrJob, fut: "asyncio.Future[Dict[str, Any]]") -> Optional[Dict[str, Any]]:
+    """タイムアウトしたジョブのワーカーが終わるまで待つ。成功していればその結果を返す。"""
+    started = time.monotonic()
+    try:
+        return await fut
+    except BrokenProcessPool:
+        _reset_pool()
+    except ShakenOcrError:
+        pass
+    except Exception:
+        logger.exception("Abandoned OCR job failed: %s", job.id)
+    finally:
+        logger.warning(
+            "OCR worker for timed-out job %s finished %.0fs after the timeout",
+            job.id, time.monotonic() - started,
+        )
+    return None
+
+
+async def _run(
+    job: OcrJob,
+    fn: Callable[..., Dict[str, Any]],
+    *args: Any,
+    cache_key: Optional[OcrCacheKey] = None,
+    size_bytes: int = 0,
+) -> None:
+    loop = asyncio.get_running_loop()
+    late: Optional[Dict[str, Any]] = None
+    try:
+        # 同じファイルの再アップロードはプールに回さず即完了させる
+        if cache_key is not None:
+            hit = await loop.run_in_executor(None, _cache_lookup, cache_key)
+            if hit is not None:
+                job.result = hit
+                job.cached = True
+                job.status = DONE
+                return
+
+        # 同時実行数はセマフォで制限し、タイムアウトは実行開始から数える
+        async with _get_slots():
+            job.status = RUNNING
+            job.started_at = time.time()
+            fut = loop.run_in_executor(_get_pool(), fn, *args)
+            try:
+                # shield: タイムアウトで fut をキャンセルしない（ワーカーの処理は止まらないため）
+                job.result = await asyncio.wait_for(asyncio.shield(fut), timeout=OCR_JOB_TIMEOUT_SEC)
+                job.status = DONE
+            except asyncio.TimeoutError:
+                job.status = TIMEOUT
+                job.error = f"OCR timed out after {OCR_JOB_TIMEOUT_SEC}s"
+                job.finished_at = time.time()
+                job.done.set()
+                # 呼び出し側にはタイムアウトを返すが、ワーカーは OCR を続けているので
+                # 実際に終わるまで枠を返さない（返すと同時実行数が OCR_JOB_WORKERS を超える）
+                late = await _wait_abandoned(job, fut)
+            except ShakenOcrError as e:
+                job.status = FAILED
+                job.error = str(e)
+            except BrokenProcessPool:
+                # ワーカーが落ちたプールは再利用できないので作り直す
+                _reset_pool()
+                raise
+
+        if job.status == DONE and cache_key is not None and job.result is not None:
+            await loop.run_in_executor(None, _cache_store, cache_key, job.result, size_bytes)
+        elif late is not None and cache_key is not None:
+            # 遅れて出た結果もキャッシュしておけば、再アップロードは即完了する
+            await loop.run_in_executor(None, _cache_store, cache_key, late, size_bytes)
+    except Exception:
+        logger.exception("OCR job failed: %s", job.id)
+        job.status = FAILED
+        job.error = INTERNAL_ERROR
+    finally:
+        job.finished_at = job.finished_at or time.time()
+        job.done.set()
+
+
+def _submit(
+    kind: str,
+    store_id: Any,
+    fn: Callable[..., Dict[str, Any]],
+    *args: Any,
+    cache_key: Optional[OcrCacheKey] = None,
+    size_bytes: int = 0,
+) -> OcrJob:
+    _purge_expired()
+    if _active_count() >= OCR_JOB_MAX_PENDING:
+        raise OcrQueueFullError("OCR queue is full. Please retry later.")
+
+    job = OcrJob(id=uuid.uuid4().hex, store_id=str(store_id) if store_id else None, kind=kind)
+    _jobs[job.id] = job
+    task = asyncio.create_task(_run(job, fn, *args, cache_key=cache_key, size_bytes=size_bytes))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def submit_shaken_job(
+    *,
+    filename: str,
+    content: bytes,
+    store_id: Any,
+    cfg: OcrConfig = OcrConfig(lang="jpn", preprocess=True, max_pages=SHAKEN_MAX_PAGES),
+) -> OcrJob:
+    """車検証 OCR ジョブを投入する（イベントループ上から呼ぶこと）。"""
+    key = ocr_cache.make_key(
+        content,
+        provider=get_provider(cfg),
+        lang=cfg.lang,
+        preprocess=cfg.preprocess,
+        dpi=get_dpi(cfg),
+        max_pages=cfg.max_pages,
+    )
+    return _submit(
+        "shaken",
+        store_id,
+        ocr_and_parse_shaken,
+        filename,
+        content,
+        cfg,
+        cache_key=key,
+        size_bytes=len(content),
+    )
+
+
+def get_job(job_id: str, *, store_id: Any) -> Optional[OcrJob]:
+    """他店舗のジョブは見えないようにする。"""
+    _purge_expired()
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    if job.store_id != (str(store_id) if store_id else None):
+        return None
+    return job
+
+
+def shutdown() -> None:
+    global _slots
+    _reset_pool()
+    _slots = None
@@ -0,0 +1,351 @@
+# app/services/push_queue.py
+"""
+Web Push の送信キュー。
+
+- 業務ルート・Webhook は enqueue_store / enqueue_user で積むだけ（リクエスト内で送信しない）
+- 積まれた通知は配信スレッドが購読一覧を読み、送信スレッドプールで並列に送る
+  HTTP は requests.Session を共有してコネクションを使い回す
+- VAPID 秘密鍵は最初の送信時に 1 回だけ読み込み、署名ヘッダーは送信先オリジン（aud）ごとに
+  有効期限が近づくまで使い回す
+- 429 / 5xx / 通信エラーは指数バックオフ（Retry-After があればそれに従う）で再送する
+- 404 / 410（購読が無効）はまとめて 1 回の DELETE で削除する
+- 送信件数などは metrics() で参照できる（GET /push/metrics）
+
+環境変数:
+  PUSH_WORKERS           送信の並列数（= コネクションプール数、既定 8）
+  PUSH_MAX_RETRIES       1 購読あたりの再送回数（既定 3）
+  PUSH_RETRY_MAX_SEC     1 回の待ち時間の上限秒（既定 30）
+  PUSH_TIMEOUT_SEC       1 リクエストのタイムアウト秒（既定 10）
+  PUSH_TTL_SEC           プッシュサービスでの保持秒数（既定 0 = 端末がオフラインなら破棄）
+  VAPID_PRIVATE_KEY      VAPID 秘密鍵（PEM / base64url 文字列、またはファイルパス）
+  VAPID_EMAIL            VAPID の sub クレーム（既定 mailto:admin@example.com）
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from uuid import UUID
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete, select
+
+from app.db.session import SessionLocal
+from app.models.push_subscription import PushSubscriptionORM
+
+# Optional dep (Web Push)
+try:
+    from py_vapid import Vapid
+    from pywebpush import WebPusher
+except Exception:  # pragma: no cover
+    Vapid = None  # type: ignore
+    WebPusher = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int, minimum: int = 1) -> int:
+    try:
+        return max(minimum, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+PUSH_WORKERS = _env_int("PUSH_WORKERS", 8)
+PUSH_MAX_RETRIES = _env_int("PUSH_MAX_RETRIES", 3, minimum=0)
+PUSH_RETRY_MAX_SEC = _env_int("PUSH_RETRY_MAX_SEC", 30)
+PUSH_TIMEOUT_SEC = _env_int("PUSH_TIMEOUT_SEC", 10)
+PUSH_TTL_SEC = _env_int("PUSH_TTL_SEC", 0, minimum=0)
+
+# VAPID の JWT は最大 24 時間。12 時間で発行し、残り 1 時間を切ったら作り直す
+VAPID_EXP_SEC = 12 * 60 * 60
+VAPID_RENEW_MARGIN_SEC = 60 * 60
+
+# 送信結果
+SENT = "sent"
+GONE = "gone"        # 404 / 410: 購読が無効
+FAILED = "failed"
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_GONE_STATUSES = {404, 410}
+
+_dispatcher: Optional[ThreadPoolExecutor] = None
+_sender: Optional[ThreadPoolExecutor] = None
+_session: Optional[requests.Session] = None
+_executor_lock = threading.Lock()
+
+_vapid: Any = None
+_vapid_loaded = False
+_vapid_headers: Dict[str, Tuple[int, Dict[str, str]]] = {}
+_vapid_lock = threading.Lock()
+
+_metrics: Dict[str, int] = {
+    "enqueued": 0,
+    "in_flight": 0,
+    "sent": 0,
+    "failed": 0,
+    "retried": 0,
+    "pruned": 0,
+}
+_metrics_lock = threading.Lock()
+_last_error: Optional[str] = None
+_last_error_at: Optional[datetime] = None
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _metrics_lock:
+        _metrics[key] += n
+
+
+def metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        out: Dict[str, Any] = dict(_metrics)
+    out["workers"] = PUSH_WORKERS
+    out["last_error"] = _last_error
+    out["last_error_at"] = _last_error_at.isoformat() if _last_error_at else None
+    return out
+
+
+def _record_error(message: str) -> None:
+    global _last_error, _last_error_at
+    _last_error = message[:500]
+    _last_error_at = datetime.now(timezone.utc)
+
+
+# ============================================================
+# VAPID
+# ============================================================
+def _load_vapid() -> Any:
+    """VAPID 秘密鍵をプロセスで 1 回だけ読み込む（未設定なら None）。"""
+    global _vapid, _vapid_loaded
+    if _vapid_loaded:
+        return _vapid
+    with _vapid_lock:
+        if not _vapid_loaded:
+            key = (os.getenv("VAPID_PRIVATE_KEY") or "").strip()
+            vapid = None
+            if Vapid is None:
+                logger.warning("[Push] pywebpush not installed. Notifications are disabled.")
+            elif not key:
+                logger.warning("[Push] VAPID_PRIVATE_KEY not set. Notifications are disabled.")
+            else:
+                try:
+                    vapid = Vapid.from_file(key) if os.path.isfile(key) else Vapid.from_string(key)
+                except Exception:
+                    logger.exception("[Push] Invalid VAPID_PRIVATE_KEY.")
+            _vapid = vapid
+            _vapid_loaded = True
+    return _vapid
+
+
+def _audience(endpoint: str) -> str:
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+
+def _auth_headers(vapid: Any, endpoint: str) -> Dict[str, str]:
+    """送信先オリジンごとの VAPID 署名ヘッダー（期限が近づくまで使い回す）。"""
+    aud = _audience(endpoint)
+    now = int(time.time())
+    cached = _vapid_headers.get(aud)
+    if cached and cached[0] - VAPID_RENEW_MARGIN_SEC > now:
+        return cached[1]
+    with _vapid_lock:
+        cached = _vapid_headers.get(aud)
+        if cached and cached[0] - VAPID_RENEW_MARGIN_SEC > now:
+            return cached[1]
+        exp = now + VAPID_EXP_SEC
+        claims = {
+            "sub": os.getenv("VAPID_EMAIL", "mailto:admin@example.com"),
+            "aud": aud,
+            "exp": exp,
+        }
+        headers = dict(vapid.sign(claims))
+        _vapid_headers[aud] = (exp, headers)
+        return headers
+
+
+# ============================================================
+# 送信
+# ============================================================
+def _get_executors() -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor, requests.Session]:
+    global _dispatcher, _sender, _session
+    if _dispatcher is None:
+        with _executor_lock:
+            if _dispatcher is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=PUSH_WORKERS, pool_maxsize=PUSH_WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                _sender = ThreadPoolExecutor(max_workers=PUSH_WORKERS, thread_name_prefix="push-send")
+                # 購読一覧の取得・送信完了待ち・後始末のみ。再送待ちの通知が他を塞がないよう 2 本
+                _dispatcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="push-dispatch")
+    return _dispatcher, _sender, _session  # type: ignore[return-value]
+
+
+def _retry_after(resp: Optional[requests.Response], attempt: int) -> float:
+    """Retry-After（秒 / HTTP 日付）があればそれ、無ければ 1, 2, 4... 秒 + ゆらぎ。"""
+    header = resp.headers.get("Retry-After") if resp is not None else None
+    delay: Optional[float] = None
+    if header:
+        try:
+            delay = float(header)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+    if delay is None:
+        delay = (2 ** attempt) + random.uniform(0, 1)
+    return min(max(delay, 0.0), float(PUSH_RETRY_MAX_SEC))
+
+
+def _send_one(sub: Dict[str, str], data: str, vapid: Any, session: requests.Session) -> str:
+    """1 購読に送る。429 / 5xx / 通信エラーは再送する。"""
+    subscription_info = {"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}
+    for attempt in range(PUSH_MAX_RETRIES + 1):
+        resp: Optional[requests.Response] = None
+        try:
+            resp = WebPusher(subscription_info, requests_session=session).send(
+                data,
+                headers=_auth_headers(vapid, sub["endpoint"]),
+                ttl=PUSH_TTL_SEC,
+                timeout=PUSH_TIMEOUT_SEC,
+            )
+        except requests.RequestException as ex:
+            error = f"{type(ex).__name__}: {ex}"
+        except Exception as ex:
+            # 鍵の不正など、再送しても変わらないもの
+            _record_error(f"{type(ex).__name__}: {ex}")
+            logger.warning("[Push] Send failed: %s", ex)
+            return FAILED
+        else:
+            if resp.status_code <= 202:
+                return SENT
+            if resp.status_code in _GONE_STATUSES:
+                return GONE
+            error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+            if resp.status_code not in _RETRY_STATUSES:
+                _record_error(error)
+                logger.warning("[Push] Send failed: %s", error)
+                return FAILED
+
+        if attempt < PUSH_MAX_RETRIES:
+            _count("retried")
+            time.sleep(_retry_after(resp, attempt))
+
+    _record_error(error)
+    logger.warning("[Push] Send failed after %d retries: %s", PUSH_MAX_RETRIES, error)
+    return FAILED
+
+
+def _load_subscriptions(*, store_id: Optional[UUID], user_id: Optional[UUID]) -> List[Dict[str, str]]:
+    stmt = select(
+        PushSubscriptionORM.id,
+        PushSubscriptionORM.endpoint,
+        PushSubscriptionORM.p256dh,
+        PushSubscriptionORM.auth,
+    )
+    if store_id is not None:
+        stmt = stmt.where(PushSubscriptionORM.store_id == store_id)
+    if user_id is not None:
+        stmt = stmt.where(PushSubscriptionORM.user_id == user_id)
+    with SessionLocal() as db:
+        rows = db.execute(stmt).all()
+    return [{"id": r.id, "endpoint": r.endpoint, "p256dh": r.p256dh, "auth": r.auth} for r in rows]
+
+
+def _prune(ids: List[UUID]) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(PushSubscriptionORM).where(PushSubscriptionORM.id.in_(ids)))
+        db.commit()
+    _count("pruned", len(ids))
+
+
+def deliver(payload: Dict[str, Any], *, store_id: Optional[UUID] = None, user_id: Optional[UUID] = None) -> Dict[str, int]:
+    """購読先すべてに並列で送り、無効な購読を削除する。戻り値は結果ごとの件数。"""
+    result = {SENT: 0, GONE: 0, FAILED: 0}
+    vapid = _load_vapid()
+    if vapid is None:
+        return result
+
+    subs = _load_subscriptions(store_id=store_id, user_id=user_id)
+    if not subs:
+        return result
+
+    _, sender, session = _get_executors()
+    data = json.dumps(payload, ensure_ascii=False)
+    futures = {sender.submit(_send_one, sub, data, vapid, session): sub["id"] for sub in subs}
+    wait(futures)
+
+    gone: List[UUID] = []
+    for fut, sub_id in futures.items():
+        status = fut.result() if not fut.cancelled() and fut.exception() is None else FAILED
+        result[status] += 1
+        if status == GONE:
+            gone.append(sub_id)
+
+    _count("sent", result[SENT])
+    _count("failed", result[FAILED])
+    if gone:
+        _prune(gone)
+    return result
+
+
+def _safe_deliver(payload: Dict[str, Any], store_id: Optional[UUID], user_id: Optional[UUID]) -> None:
+    try:
+        deliver(payload, store_id=store_id, user_id=user_id)
+    except Exception as ex:
+        _record_error(f"{type(ex).__name__}: {ex}")
+        logger.exception("[Push] Delivery crashed: store_id=%s user_id=%s", store_id, user_id)
+
+
+def _enqueue(payload: Dict[str, Any], *, store_id: Optional[UUID], user_id: Optional[UUID]) -> None:
+    dispatcher, _, _ = _get_executors()
+    _count("enqueued")
+    _count("in_flight")
+    try:
+        fut = dispatcher.submit(_safe_deliver, dict(payload), store_id, user_id)
+    except RuntimeError:
+        # shutdown 後
+        _count("in_flight", -1)
+        raise
+    # 完了時に加え、shutdown で実行前にキャンセルされたときも呼ばれる
+    fut.add_done_callback(lambda _fut: _count("in_flight", -1))
+
+
+def _as_uuid(value: Any) -> UUID:
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
+def enqueue_store(store_id: Any, payload: Dict[str, Any]) -> None:
+    """店舗の全購読者への通知を積む（送信はバックグラウンド）。"""
+    _enqueue(payload, store_id=_as_uuid(store_id), user_id=None)
+
+
+def enqueue_user(user_id: Any, payload: Dict[str, Any]) -> None:
+    """ユーザーの全端末への通知を積む（送信はバックグラウンド）。"""
+    _enqueue(payload, store_id=None, user_id=_as_uuid(user_id))
+
+
+def shutdown() -> None:
+    global _dispatcher, _sender, _session
+    if _dispatcher is not None:
+        _dispatcher.shutdown(wait=False, cancel_futures=True)
+    if _sender is not None:
+        _sender.shutdown(wait=False, cancel_futures=True)
+    if _session is not None:
+        _session.close()
+    _dispatcher = None
+    _sender = None
+    _session = None
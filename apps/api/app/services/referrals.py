@@ -0,0 +1,122 @@
+# app/services/referrals.py
+"""
+紹介（referral）の集計と、有効化に伴う割引・パートナーランクの更新。
+
+- パートナー一覧の件数は「partner_id ごとに GROUP BY したサブクエリ」を JOIN する（1 行ずつ COUNT しない）。
+  インデックスは (partner_id, status)。紹介元店舗の件数は (referrer_store_id, status) で 1 店舗分だけ数える
+- 有効化したときの割引額・ランクの再計算は呼び出し側と同じトランザクションで行い、commit しない
+- 再計算の前に紹介元のライセンス行・パートナー行を FOR UPDATE でロックし、ロックを取った後の別の文で数える。
+  READ COMMITTED では UPDATE 内のサブクエリは文の開始時点のスナップショットで 1 回しか評価されず、
+  ロック待ちの後も再評価されないので、同時に有効化された分を数え漏らす
+"""
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.license import LicenseORM
+from app.models.partner import PartnerORM
+from app.models.referral import ReferralORM
+from app.schemas.referral import RANK_THRESHOLDS, REFERRAL_DISCOUNT_PER_ACTIVE
+
+ACTIVE = "active"
+PENDING = "pending"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def partner_counts_subquery():
+    """partner_id ごとの active / pending 件数（一覧に outer join して使う）"""
+    return (
+        select(
+            ReferralORM.partner_id.label("partner_id"),
+            func.count().filter(ReferralORM.status == ACTIVE).label("active_count"),
+            func.count().filter(ReferralORM.status == PENDING).label("pending_count"),
+        )
+        .where(ReferralORM.partner_id.isnot(None))
+        .group_by(ReferralORM.partner_id)
+        .subquery("partner_referral_counts")
+    )
+
+
+def active_count_for_partner(db: Session, partner_id: uuid.UUID) -> int:
+    return db.execute(
+        select(func.count()).select_from(ReferralORM).where(
+            ReferralORM.partner_id == partner_id,
+            ReferralORM.status == ACTIVE,
+        )
+    ).scalar_one()
+
+
+def rank_for(active_count: int) -> str:
+    if active_count >= RANK_THRESHOLDS["platinum"]:
+        return "platinum"
+    if active_count >= RANK_THRESHOLDS["gold"]:
+        return "gold"
+    return "silver"
+
+
+def apply_rank(partner: PartnerORM, active_count: int) -> bool:
+    """active referral 数に基づいてランクを更新する。変更あれば True。"""
+    new_rank = rank_for(active_count)
+    if partner.rank != new_rank:
+        partner.rank = new_rank
+        partner.rank_updated_at = _utcnow()
+        partner.updated_at = partner.rank_updated_at
+        return True
+    return False
+
+
+def active_count_for_referrer(db: Session, store_id: uuid.UUID) -> int:
+    return db.execute(
+        select(func.count()).select_from(ReferralORM).where(
+            ReferralORM.referrer_store_id == store_id,
+            ReferralORM.status == ACTIVE,
+        )
+    ).scalar_one()
+
+
+def refresh_referrer_discount(db: Session, store_id: uuid.UUID) -> None:
+    """
+    紹介元店舗のライセンス割引額を active 件数から設定し直す（commit しない）。
+
+    ライセンス行をロックしてから数えるので、同時に有効化したトランザクションは先の commit を待ってから
+    それを含めて数え直す。
+    """
+    locked = db.execute(
+        select(LicenseORM.id).where(LicenseORM.store_id == store_id).with_for_update()
+    ).scalars().all()
+    if not locked:
+        return
+    db.execute(
+        update(LicenseORM)
+        .where(LicenseORM.id.in_(locked))
+        .values(referral_discount=active_count_for_referrer(db, store_id) * REFERRAL_DISCOUNT_PER_ACTIVE)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_partner_rank(db: Session, partner_id: Optional[uuid.UUID]) -> None:
+    """パートナーのランクを active 件数から更新する（commit しない）。"""
+    if partner_id is None:
+        return
+    # 割引額と同じく、ロックしてから数える
+    partner = db.get(PartnerORM, partner_id, with_for_update=True)
+    if partner is None:
+        return
+    apply_rank(partner, active_count_for_partner(db, partner_id))
+
+
+def activate(db: Session, ref: ReferralORM, *, now: Optional[datetime] = None) -> None:
+    """紹介を有効化し、紹介元の割引とパートナーランクを同じトランザクションで更新する（commit しない）。"""
+    ref.status = ACTIVE
+    ref.activated_at = now or _utcnow()
+    db.flush()
+    refresh_referrer_discount(db, ref.referrer_store_id)
+    refresh_partner_rank(db, ref.partner_id)
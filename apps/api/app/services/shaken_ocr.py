@@ -4,9 +4,10 @@ from __future__ import annotations
 import io
 import os
 import re
-import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from PIL import Image
 
@@ -17,9 +18,16 @@ except Exception:  # pragma: no cover
     pytesseract = None  # type: ignore
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 except Exception:  # pragma: no cover
-    convert_from_path = None  # type: ignore
+    convert_from_bytes = None  # type: ignore
+    pdfinfo_from_bytes = None  # type: ignore
+
+# PyMuPDF があれば一時ファイルを介さずメモリ上で 1 ページずつラスタライズする
+try:
+    import fitz  # type: ignore
+except Exception:  # pragma: no cover
+    fitz = None  # type: ignore
 
 # Optional deps (Google Vision)
 try:
@@ -44,6 +52,12 @@ class OcrConfig:
     # - "local": pytesseract
     # - "aws": 予約（Textract）/ まだ未実装
     provider: Optional[str] = None
+    # PDF ラスタライズ解像度（None なら環境変数 OCR_PDF_DPI、未設定なら 200）
+    dpi: Optional[int] = None
+    # PDF の先頭から何ページまで OCR するか（None = 全ページ）
+    max_pages: Optional[int] = None
+    # ページ単位の並列数（None なら環境変数 OCR_PAGE_WORKERS、未設定なら 2）
+    page_workers: Optional[int] = None
 
 
 def _get_provider(cfg: OcrConfig) -> str:
@@ -55,13 +69,43 @@ def _get_provider(cfg: OcrConfig) -> str:
     return "local"
 
 
+def get_provider(cfg: OcrConfig) -> str:
+    """実際に使われる provider 名（OCR キャッシュのキーにも使う）。"""
+    return _get_provider(cfg)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _get_dpi(cfg: OcrConfig) -> int:
+    # cfg の指定が優先。環境変数は既定値として使う
+    if cfg.dpi is not None:
+        return max(1, cfg.dpi)
+    return _env_int("OCR_PDF_DPI", 200)
+
+
+def get_dpi(cfg: OcrConfig) -> int:
+    """実際に使われるラスタライズ解像度（OCR キャッシュのキーにも使う）。"""
+    return _get_dpi(cfg)
+
+
+def _get_page_workers(cfg: OcrConfig) -> int:
+    if cfg.page_workers is not None:
+        return max(1, cfg.page_workers)
+    return _env_int("OCR_PAGE_WORKERS", 2)
+
+
 def _safe_ext(filename: str) -> str:
     _, ext = os.path.splitext(filename.lower())
     return ext
 
 
 def _require_pdf_dep_if_needed(file_ext: str) -> None:
-    if file_ext == ".pdf" and convert_from_path is None:
+    if file_ext == ".pdf" and fitz is None and convert_from_bytes is None:
         raise ShakenOcrError("pdf2image not installed. Run: pip install pdf2image")
 
 
@@ -75,39 +119,97 @@ def _require_google_ocr() -> None:
         raise ShakenOcrError("google-cloud-vision not installed. Add to requirements.txt: google-cloud-vision")
 
 
-def _load_images_from_bytes(filename: str, content: bytes) -> List[Image.Image]:
+def _iter_pdf_pages_fitz(content: bytes, dpi: int, max_pages: Optional[int]) -> Iterator[Image.Image]:
+    doc = fitz.open(stream=content, filetype="pdf")  # type: ignore
+    try:
+        count = doc.page_count if not max_pages else min(doc.page_count, max_pages)
+        for i in range(count):
+            pix = doc.load_page(i).get_pixmap(dpi=dpi, alpha=False)
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            del pix
+            yield img
+    finally:
+        doc.close()
+
+
+def _iter_pdf_pages_pdf2image(content: bytes, dpi: int, max_pages: Optional[int]) -> Iterator[Image.Image]:
+    # 全ページを一度にラスタライズしないよう、first_page / last_page で 1 ページずつ変換する
+    count = int(pdfinfo_from_bytes(content)["Pages"])  # type: ignore
+    if max_pages:
+        count = min(count, max_pages)
+    for page in range(1, count + 1):
+        images = convert_from_bytes(content, dpi=dpi, first_page=page, last_page=page)  # type: ignore
+        for img in images:
+            yield img.convert("RGB")
+
+
+def _iter_images_from_bytes(filename: str, content: bytes, cfg: OcrConfig) -> Iterator[Image.Image]:
+    """
+    ページ画像を 1 枚ずつ返す。
+
+    PDF はバイト列から直接ラスタライズする（PyMuPDF 優先、無ければ pdf2image）。どちらも 1 ページずつ変換する。
+    cfg.max_pages で先頭ページだけに絞れる（車検証はほぼ 1 ページ）。
+    """
     ext = _safe_ext(filename)
     _require_pdf_dep_if_needed(ext)
 
     if ext in (".png", ".jpg", ".jpeg", ".webp"):
         try:
-            return [Image.open(io.BytesIO(content)).convert("RGB")]
+            img = Image.open(io.BytesIO(content)).convert("RGB")
         except Exception as e:
             raise ShakenOcrError(f"Invalid image file: {e}") from e
+        yield img
+        return
 
     if ext == ".pdf":
-        if convert_from_path is None:
-            raise ShakenOcrError("pdf2image is required for pdf.")
-
-        pdf_path: Optional[str] = None
+        dpi = _get_dpi(cfg)
+        pages = (
+            _iter_pdf_pages_fitz(content, dpi, cfg.max_pages)
+            if fitz is not None
+            else _iter_pdf_pages_pdf2image(content, dpi, cfg.max_pages)
+        )
         try:
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
-                f.write(content)
-                pdf_path = f.name
-            images = convert_from_path(pdf_path)  # type: ignore
-            return [img.convert("RGB") for img in images]
+            yield from pages
+        except ShakenOcrError:
+            raise
         except Exception as e:
             raise ShakenOcrError(f"Failed to convert pdf: {e}") from e
-        finally:
-            if pdf_path:
-                try:
-                    os.remove(pdf_path)
-                except Exception:
-                    pass
+        return
 
     raise ShakenOcrError("Unsupported file type. Use png/jpg/webp/pdf.")
 
 
+def _load_images_from_bytes(filename: str, content: bytes, cfg: OcrConfig = OcrConfig()) -> List[Image.Image]:
+    return list(_iter_images_from_bytes(filename, content, cfg))
+
+
+def _map_pages(
+    pages: Iterator[Image.Image],
+    fn: Callable[[Image.Image], str],
+    workers: int,
+) -> List[str]:
+    """
+    ページを並列に OCR し、ページ順に結果を返す。
+
+    同時に保持するページ画像は最大 workers 枚。ラスタライズはまだ処理していない
+    ページの分しか先読みしないので、ページ数が多くてもピークメモリは増えない。
+    """
+    if workers <= 1:
+        return [fn(img) for img in pages]
+
+    results: List[str] = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-page") as ex:
+        inflight: List[Future] = []
+        for img in pages:
+            inflight.append(ex.submit(fn, img))
+            del img
+            if len(inflight) >= workers:
+                results.append(inflight.pop(0).result())
+        for fut in inflight:
+            results.append(fut.result())
+    return results
+
+
 def _preprocess(img: Image.Image) -> Image.Image:
     # 最小限：グレースケール + ちょい拡大
     gray = img.convert("L")
@@ -123,7 +225,7 @@ def _pil_to_png_bytes(img: Image.Image) -> bytes:
     return buf.getvalue()
 
 
-def _ocr_local(images: List[Image.Image], cfg: OcrConfig) -> str:
+def _ocr_local(pages: Iterator[Image.Image], cfg: OcrConfig) -> str:
     _require_local_ocr()
 
     if cfg.tesseract_cmd:
@@ -131,33 +233,45 @@ def _ocr_local(images: List[Image.Image], cfg: OcrConfig) -> str:
     elif os.getenv("TESSERACT_CMD"):
         pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD")  # type: ignore
 
-    texts: List[str] = []
-    for img in images:
+    def _one(img: Image.Image) -> str:
         if cfg.preprocess:
             img = _preprocess(img)
         try:
-            txt = pytesseract.image_to_string(img, lang=cfg.lang)  # type: ignore
+            return pytesseract.image_to_string(img, lang=cfg.lang)  # type: ignore
         except Exception as e:
             raise ShakenOcrError(f"OCR failed (local): {e}") from e
-        texts.append(txt)
 
-    return "\n\n".join(texts)
+    # pytesseract は tesseract を子プロセスで起動するので、スレッドで十分並列になる
+    return "\n\n".join(_map_pages(pages, _one, _get_page_workers(cfg)))
 
 
-def _ocr_google(images: List[Image.Image], cfg: OcrConfig) -> str:
-    _require_google_ocr()
+_vision_client: Any = None
+_vision_client_lock = threading.Lock()
 
-    try:
-        client = vision.ImageAnnotatorClient()  # type: ignore
-    except Exception as e:
-        raise ShakenOcrError(f"Failed to init Google Vision client: {e}") from e
 
-    texts: List[str] = []
-    for img in images:
+def _get_vision_client() -> Any:
+    """ImageAnnotatorClient はスレッドセーフなのでプロセス内で使い回す。"""
+    global _vision_client
+    if _vision_client is None:
+        with _vision_client_lock:
+            if _vision_client is None:
+                try:
+                    _vision_client = vision.ImageAnnotatorClient()  # type: ignore
+                except Exception as e:
+                    raise ShakenOcrError(f"Failed to init Google Vision client: {e}") from e
+    return _vision_client
+
+
+def _ocr_google(pages: Iterator[Image.Image], cfg: OcrConfig) -> str:
+    _require_google_ocr()
+    client = _get_vision_client()
+
+    def _one(img: Image.Image) -> str:
         if cfg.preprocess:
             img = _preprocess(img)
 
         b = _pil_to_png_bytes(img)
+        del img
         image = vision.Image(content=b)  # type: ignore
         try:
             resp = client.text_detection(image=image)  # type: ignore
@@ -169,26 +283,35 @@ def _ocr_google(images: List[Image.Image], cfg: OcrConfig) -> str:
 
         ann = getattr(resp, "full_text_annotation", None)
         if ann and getattr(ann, "text", None):
-            texts.append(str(ann.text))
-        else:
-            tas = getattr(resp, "text_annotations", None) or []
-            texts.append(str(tas[0].description) if tas else "")
+            return str(ann.text)
+        tas = getattr(resp, "text_annotations", None) or []
+        return str(tas[0].description) if tas else ""
 
-    return "\n\n".join(texts)
+    return "\n\n".join(_map_pages(pages, _one, _get_page_workers(cfg)))
 
 
 def ocr_text_from_file_bytes(filename: str, content: bytes, cfg: OcrConfig = OcrConfig()) -> str:
     provider = _get_provider(cfg)
 
-    images = _load_images_from_bytes(filename=filename, content=content)
+    if provider == "aws":
+        raise ShakenOcrError("OCR_PROVIDER=aws is not enabled yet. Set OCR_PROVIDER=google for now.")
+
+    pages = _iter_images_from_bytes(filename=filename, content=content, cfg=cfg)
 
     if provider == "google":
-        return _ocr_google(images, cfg)
+        return _ocr_google(pages, cfg)
+
+    return _ocr_local(pages, cfg)
 
-    if provider == "aws":
-        raise ShakenOcrError("OCR_PROVIDER=aws is not enabled yet. Set OCR_PROVIDER=google for now.")
 
-    return _ocr_local(images, cfg)
+def ocr_and_parse_shaken(filename: str, content: bytes, cfg: OcrConfig = OcrConfig()) -> Dict[str, Any]:
+    """
+    OCR + パースを 1 回で行う。
+
+    ProcessPoolExecutor から呼ぶため、引数・戻り値とも pickle 可能なものだけにしている。
+    """
+    text = ocr_text_from_file_bytes(filename=filename, content=content, cfg=cfg)
+    return parse_shaken_text_to_json(text)
 
 
 # -------------------------
@@ -0,0 +1,351 @@
+# app/services/shaken_reminders.py
+"""
+車検満了のお知らせ（毎日のバッチ）。
+
+- 車検満了日は cars.inspection_expiry。店舗ごとの範囲検索は部分インデックス
+  ix_cars_store_inspection_expiry (store_id, inspection_expiry) を使う
+- 通知タイミングは満了の SHAKEN_REMINDER_DAYS 日前（既定 30 日前と 7 日前）。
+  残り日数が入る最も短いタイミングを 1 つ選ぶので、登録が遅れた車両に 30 日前と 7 日前を
+  同じ日にまとめて送ることはない
+- 送信記録 shaken_reminders を (car_id, inspection_expiry, window_days) の一意制約付きで
+  INSERT ... SELECT ... ON CONFLICT DO NOTHING で作り、新しく作れた行だけ送る。
+  何度実行しても（複数プロセスでも）同じお知らせは 1 回しか送らない
+- お客様への通知は顧客に紐付いた LINE 友だちへ、満了日ごとにまとめて multicast で送る
+- 店舗スタッフには Web Push で店舗ごとに 1 件、対象台数をまとめて知らせる
+- 送信前に pending で記録し、送信後に sent / failed / no_line にする。pending のまま
+  SHAKEN_REMINDER_STALE_SEC 経ったもの（送信中に落ちた）は届いたか分からないので再送せず failed にする
+
+環境変数:
+  SHAKEN_REMINDER_DAYS        通知タイミング（満了の何日前か、カンマ区切り。既定 "30,7"）
+  SHAKEN_REMINDER_HOUR        この時刻（JST）以降にその日のバッチを実行する（既定 10）
+  SHAKEN_REMINDER_CHECK_SEC   実行時刻になったかを確認する間隔（既定 600）
+  SHAKEN_REMINDER_STALE_SEC   pending を中断とみなす秒数（既定 3600）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Select, case, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.car import Car
+from app.models.line_customer import LineCustomerORM
+from app.models.line_message import LineMessageORM
+from app.models.line_setting import LineSettingORM
+from app.models.shaken_reminder import ShakenReminderORM
+from app.models.store import StoreORM
+from app.services import line_service, push_queue
+
+logger = logging.getLogger(__name__)
+
+JST = timezone(timedelta(hours=9))
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_days(name: str, default: str) -> Tuple[int, ...]:
+    days = set()
+    for part in (os.getenv(name) or default).split(","):
+        try:
+            n = int(part.strip())
+        except ValueError:
+            continue
+        if n > 0:
+            days.add(n)
+    return tuple(sorted(days)) or tuple(sorted(int(d) for d in default.split(",")))
+
+
+# 昇順（最後が最も早い通知タイミング）
+SHAKEN_REMINDER_DAYS = _env_days("SHAKEN_REMINDER_DAYS", "30,7")
+SHAKEN_REMINDER_HOUR = min(23, _env_int("SHAKEN_REMINDER_HOUR", 10))
+SHAKEN_REMINDER_CHECK_SEC = max(1, _env_int("SHAKEN_REMINDER_CHECK_SEC", 600))
+SHAKEN_REMINDER_STALE_SEC = max(1, _env_int("SHAKEN_REMINDER_STALE_SEC", 3600))
+
+# 送信状態
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+NO_LINE = "no_line"
+
+INTERRUPTED_ERROR = "送信中に処理が中断されました。二重送信を避けるため再送しません"
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_last_run: Optional[date] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def today_jst() -> date:
+    return datetime.now(JST).date()
+
+
+# ============================================================
+# 検索
+# ============================================================
+def due_cars_query(store_id: UUID, date_from: date, date_to: date) -> Select:
+    """車検満了日が date_from〜date_to の車両（満了日の近い順）"""
+    return (
+        select(Car)
+        .where(
+            Car.store_id == store_id,
+            Car.inspection_expiry.isnot(None),
+            Car.inspection_expiry >= date_from,
+            Car.inspection_expiry <= date_to,
+        )
+        .order_by(Car.inspection_expiry, Car.id)
+    )
+
+
+def _window_days(today: date):
+    """残り日数が入る最も短い通知タイミング（SQL の CASE）"""
+    windows = SHAKEN_REMINDER_DAYS
+    return case(
+        *((Car.inspection_expiry <= today + timedelta(days=n), n) for n in windows[:-1]),
+        else_=windows[-1],
+    )
+
+
+# ============================================================
+# 予約（送信記録を pending で作る）
+# ============================================================
+def schedule_store(db: Session, store_id: UUID, today: date) -> List[Any]:
+    """
+    今日が通知タイミングの車両（顧客付き）の送信記録を作る。
+    戻り値は新しく作れた行（= これから送るお知らせ）。
+    """
+    window = _window_days(today)
+    source = select(
+        func.gen_random_uuid(),
+        Car.store_id,
+        Car.id,
+        Car.customer_id,
+        Car.inspection_expiry,
+        window,
+        literal(PENDING),
+        literal(0),
+        literal(_utcnow()),
+    ).where(
+        Car.store_id == store_id,
+        Car.customer_id.isnot(None),
+        Car.inspection_expiry.isnot(None),
+        Car.inspection_expiry >= today,
+        Car.inspection_expiry <= today + timedelta(days=SHAKEN_REMINDER_DAYS[-1]),
+    )
+    rows = db.execute(
+        pg_insert(ShakenReminderORM)
+        .from_select(
+            ["id", "store_id", "car_id", "customer_id", "inspection_expiry", "window_days",
+             "status", "recipients", "created_at"],
+            source,
+        )
+        .on_conflict_do_nothing(constraint="uq_shaken_reminders_car_window")
+        .returning(
+            ShakenReminderORM.id,
+            ShakenReminderORM.car_id,
+            ShakenReminderORM.customer_id,
+            ShakenReminderORM.inspection_expiry,
+        )
+    ).all()
+    db.commit()
+    return rows
+
+
+# ============================================================
+# 送信
+# ============================================================
+def reminder_message(store_name: str, expiry: date) -> str:
+    return (
+        f"{store_name + 'です。' if store_name else ''}"
+        f"お車の車検満了日（{expiry.year}年{expiry.month}月{expiry.day}日）が近づいてまいりました。\n"
+        "車検のご予約・お見積りはお気軽にお問い合わせください。"
+    )
+
+
+def dispatch_store(db: Session, store_id: UUID, reminders: List[Any]) -> Dict[str, int]:
+    """
+    作成した送信記録を送る。LINE は満了日ごとに multicast、スタッフへは Web Push を 1 件。
+    戻り値は件数（reminders / line_sent / line_failed / no_line）。
+    """
+    token = db.execute(
+        select(LineSettingORM.channel_access_token).where(LineSettingORM.store_id == store_id)
+    ).scalar_one_or_none()
+    store_name = db.execute(select(StoreORM.name).where(StoreORM.id == store_id)).scalar_one_or_none() or ""
+
+    # 顧客 → 紐付いた LINE 友だち（ブロック済みは除く）
+    friends: Dict[UUID, List[Tuple[UUID, str]]] = {}
+    customer_ids = list({r.customer_id for r in reminders if r.customer_id})
+    if token and customer_ids:
+        for lc_id, customer_id, line_user_id in db.execute(
+            select(LineCustomerORM.id, LineCustomerORM.customer_id, LineCustomerORM.line_user_id).where(
+                LineCustomerORM.store_id == store_id,
+                LineCustomerORM.customer_id.in_(customer_ids),
+                LineCustomerORM.follow_status == "following",
+            )
+        ):
+            friends.setdefault(customer_id, []).append((lc_id, line_user_id))
+
+    # 満了日ごとに同じ文面なので、まとめて multicast
+    by_expiry: Dict[date, List[Any]] = {}
+    for r in reminders:
+        by_expiry.setdefault(r.inspection_expiry, []).append(r)
+
+    now = _utcnow()
+    updates: List[Dict[str, Any]] = []
+    logs: List[Dict[str, Any]] = []
+    counts = {"reminders": len(reminders), "line_sent": 0, "line_failed": 0, "no_line": 0}
+
+    for expiry, group in by_expiry.items():
+        message = reminder_message(store_name, expiry)
+        user_ids = list(dict.fromkeys(u for r in group for _, u in friends.get(r.customer_id, [])))
+        sent: List[str] = []
+        failed: Dict[str, str] = {}
+        if user_ids:
+            try:
+                sent, failed = line_service.multicast_message(user_ids, message, token)
+            except Exception as ex:
+                logger.warning("[Shaken] LINE multicast failed: store=%s", store_id, exc_info=True)
+                failed = {u: f"{type(ex).__name__}: {ex}"[:500] for u in user_ids}
+        sent_set = set(sent)
+        logged: set = set()
+
+        for r in group:
+            linked = friends.get(r.customer_id, [])
+            delivered = [(lc_id, u) for lc_id, u in linked if u in sent_set]
+            if not linked:
+                status, error = NO_LINE, None
+                counts["no_line"] += 1
+            elif delivered:
+                status, error = SENT, None
+                counts["line_sent"] += 1
+            else:
+                status, error = FAILED, next((failed[u] for _, u in linked if u in failed), "送信に失敗しました")
+                counts["line_failed"] += 1
+            updates.append({
+                "id": r.id,
+                "status": status,
+                "recipients": len(delivered),
+                "error": error,
+                "sent_at": now if status == SENT else None,
+            })
+            # 同じ満了日の車両を複数持つ友だちには 1 通しか届かないので、ログも 1 件
+            for lc_id, _ in delivered:
+                if lc_id in logged:
+                    continue
+                logged.add(lc_id)
+                logs.append({
+                    "store_id": store_id,
+                    "line_customer_id": lc_id,
+                    "direction": "outbound",
+                    "message_type": "text",
+                    "content": message,
+                    "sent_at": now,
+                })
+
+    # 送信結果と LINE の送信ログを 1 トランザクションで保存する
+    if updates:
+        db.execute(update(ShakenReminderORM), updates)
+    if logs:
+        db.execute(insert(LineMessageORM), logs)
+    db.commit()
+
+    # 店舗スタッフへ（対象が 1 台以上あれば 1 件だけ）
+    try:
+        push_queue.enqueue_store(store_id, {
+            "title": "車検満了が近い車両",
+            "body": f"{len(reminders)}台の車検満了が近づいています（LINE でお知らせ {counts['line_sent']}件）。",
+            "url": "/cars",
+            "tag": "shaken-reminder",
+        })
+    except Exception:
+        logger.warning("[Shaken] push enqueue failed: store=%s", store_id, exc_info=True)
+
+    return counts
+
+
+def run_store(store_id: UUID, today: Optional[date] = None) -> Dict[str, int]:
+    today = today or today_jst()
+    with SessionLocal() as db:
+        reminders = schedule_store(db, store_id, today)
+        if not reminders:
+            return {"reminders": 0, "line_sent": 0, "line_failed": 0, "no_line": 0}
+        return dispatch_store(db, store_id, reminders)
+
+
+def recover_stale() -> int:
+    """pending のまま止まった送信記録を failed にする。戻り値は件数。"""
+    stale_before = _utcnow() - timedelta(seconds=SHAKEN_REMINDER_STALE_SEC)
+    with SessionLocal() as db:
+        rows = db.execute(
+            update(ShakenReminderORM)
+            .where(ShakenReminderORM.status == PENDING, ShakenReminderORM.created_at < stale_before)
+            .values(status=FAILED, error=INTERRUPTED_ERROR)
+            .returning(ShakenReminderORM.id)
+        ).all()
+        db.commit()
+    return len(rows)
+
+
+def run_once(today: Optional[date] = None) -> int:
+    """全店舗分を実行する。戻り値は作成したお知らせの数。"""
+    today = today or today_jst()
+    recover_stale()
+    with SessionLocal() as db:
+        store_ids = db.execute(select(StoreORM.id)).scalars().all()
+
+    total = 0
+    for store_id in store_ids:
+        if _stop.is_set():
+            break
+        try:
+            total += run_store(store_id, today)["reminders"]
+        except Exception:
+            logger.exception("[Shaken] reminder failed: store=%s", store_id)
+    return total
+
+
+# ============================================================
+# スケジューラ
+# ============================================================
+def _loop() -> None:
+    global _last_run
+    while not _stop.is_set():
+        now = datetime.now(JST)
+        if now.hour >= SHAKEN_REMINDER_HOUR and _last_run != now.date():
+            try:
+                count = run_once(now.date())
+                logger.info("[Shaken] %d reminders created for %s", count, now.date())
+                _last_run = now.date()
+            except Exception:
+                logger.warning("[Shaken] daily run failed.", exc_info=True)
+        _stop.wait(SHAKEN_REMINDER_CHECK_SEC)
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="shaken-reminder", daemon=True)
+    _thread.start()
+
+
+def shutdown() -> None:
+    """送信中のお知らせは次回 recover_stale() で failed になる（再送しない）"""
+    global _thread
+    _stop.set()
+    _thread = None
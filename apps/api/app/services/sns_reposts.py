@@ -0,0 +1,269 @@
+# app/services/sns_reposts.py
+"""
+SNS 定期再投稿ランナー。
+
+- SNS_REPOST_TICK_SEC ごとに repost_enabled の店舗を回り、再投稿期限を過ぎた販売中の車両を
+  get_repost_due_cars（売約ステータスの除外は SQL 側）で求める
+- 車両ごとに冪等キー repost:{car_id}:{予定日} 付きの sns_posts（trigger=repost, status=pending）を
+  ON CONFLICT DO NOTHING で作る。同じ予定日の再投稿は何度実行しても 1 件しかできない
+- pending を posting に更新して取得（FOR UPDATE SKIP LOCKED）した投稿だけを投稿する。
+  複数プロセスで動かしても同じ投稿を二重に送らない
+- 投稿は店舗ごとに並列（SNS_REPOST_CONCURRENCY 件まで）、プラットフォームごとの
+  トークンバケット（REPOST_RATE_LIMITS）で投稿ペースを抑える
+- posting のまま SNS_REPOST_STALE_SEC 経った投稿（投稿中にプロセスが落ちた）は、届いたか
+  分からないので自動では再送せず failed にする。画面からリトライできる
+
+環境変数:
+  SNS_REPOST_TICK_SEC        実行間隔（既定 900）
+  SNS_REPOST_BATCH           1 店舗・1 回あたりの最大再投稿数（既定 20）
+  SNS_REPOST_CONCURRENCY     1 店舗で同時に投稿する数（既定 4）
+  SNS_REPOST_STALE_SEC       posting をこの秒数で中断とみなす（既定 600）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.sns_post import SnsPostORM, SnsSettingORM
+from app.models.store import StoreORM
+from app.services import sns_service
+from app.services.line_client import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+SNS_REPOST_TICK_SEC = _env_int("SNS_REPOST_TICK_SEC", 900)
+SNS_REPOST_BATCH = _env_int("SNS_REPOST_BATCH", 20)
+SNS_REPOST_CONCURRENCY = _env_int("SNS_REPOST_CONCURRENCY", 4)
+SNS_REPOST_STALE_SEC = _env_int("SNS_REPOST_STALE_SEC", 600)
+
+# プラットフォームごとの (秒間投稿数, まとめて投稿できる数)
+REPOST_RATE_LIMITS: Dict[str, tuple] = {
+    "twitter": (1 / 10, 3),
+    "instagram": (1 / 30, 2),
+    # LINE broadcast の上限（1 時間 60 回）は line_client 側で守る
+    "line": (1 / 5, 3),
+}
+
+PENDING = "pending"
+POSTING = "posting"
+
+INTERRUPTED_ERROR = "投稿中に処理が中断されました。二重投稿を避けるため自動では再送しません"
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ============================================================
+# 予約（冪等キー付きで pending を作る）
+# ============================================================
+def _last_image_urls(db: Session, store_id: UUID, car_ids: List[UUID]) -> Dict[UUID, Any]:
+    """車両ごとに直近の投稿の image_urls（再投稿でも同じ画像を使う）"""
+    rows = db.execute(
+        select(SnsPostORM.car_id, SnsPostORM.image_urls)
+        .where(
+            SnsPostORM.store_id == store_id,
+            SnsPostORM.car_id.in_(car_ids),
+            SnsPostORM.status == "posted",
+            SnsPostORM.image_urls.isnot(None),
+        )
+        .order_by(SnsPostORM.car_id, SnsPostORM.posted_at.desc())
+    ).all()
+    urls: Dict[UUID, Any] = {}
+    for car_id, image_urls in rows:
+        urls.setdefault(car_id, image_urls)
+    return urls
+
+
+def schedule_store(db: Session, store_id: UUID, setting: SnsSettingORM) -> int:
+    """再投稿期限の来た車両の投稿を pending で作る。戻り値は新しく作った件数。"""
+    due = sns_service.get_repost_due_cars(
+        db, store_id, setting.repost_interval_weeks, limit=SNS_REPOST_BATCH, exclude_attempted=True
+    )
+    if not due:
+        return 0
+
+    store_name = db.execute(select(StoreORM.name).where(StoreORM.id == store_id)).scalar_one_or_none() or ""
+    images = _last_image_urls(db, store_id, [d["car_id"] for d in due])
+    rows = [
+        {
+            "store_id": store_id,
+            "car_id": d["car_id"],
+            "trigger": "repost",
+            "platform": "all",
+            "status": PENDING,
+            "caption": sns_service.generate_caption(
+                d["car"], "repost", setting.new_arrival_template, store_name
+            ),
+            "image_urls": images.get(d["car_id"]),
+            "idempotency_key": sns_service.repost_key(d["car_id"], d["next_repost_at"]),
+        }
+        for d in due
+    ]
+    created = db.execute(
+        pg_insert(SnsPostORM)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[SnsPostORM.idempotency_key])
+        .returning(SnsPostORM.id)
+    ).all()
+    db.commit()
+    return len(created)
+
+
+# ============================================================
+# 投稿
+# ============================================================
+def _claim(db: Session, store_id: UUID) -> List[Any]:
+    """pending の再投稿を posting にして取得する（他プロセスが取った行は飛ばす）"""
+    ids = (
+        select(SnsPostORM.id)
+        .where(
+            SnsPostORM.store_id == store_id,
+            SnsPostORM.trigger == "repost",
+            SnsPostORM.status == PENDING,
+            SnsPostORM.idempotency_key.isnot(None),
+        )
+        .order_by(SnsPostORM.created_at)
+        .limit(SNS_REPOST_BATCH)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        update(SnsPostORM)
+        .where(SnsPostORM.id.in_(ids))
+        .values(status=POSTING, claimed_at=_utcnow())
+        .returning(SnsPostORM.id, SnsPostORM.caption, SnsPostORM.image_urls)
+    ).all()
+    db.commit()
+    return rows
+
+
+def _save(post_id: UUID, results: Dict[str, Dict]) -> None:
+    status, error = sns_service.result_status(results)
+    with SessionLocal() as db:
+        db.execute(
+            update(SnsPostORM)
+            .where(SnsPostORM.id == post_id, SnsPostORM.status == POSTING)
+            .values(
+                status=status,
+                results=results,
+                error_message=error,
+                posted_at=_utcnow() if status == "posted" else None,
+            )
+        )
+        db.commit()
+
+
+async def _post_all(posts: List[Any], setting: SnsSettingORM) -> None:
+    limiters = {p: TokenBucket(*REPOST_RATE_LIMITS[p]) for p in sns_service.PLATFORMS}
+    sem = asyncio.Semaphore(SNS_REPOST_CONCURRENCY)
+    only = list(setting.repost_platforms or []) or None
+
+    async def post_one(post) -> None:
+        async with sem:
+            _, _, results = await sns_service.execute_sns_post(
+                post.caption, post.image_urls, "all", setting, only=only, limiters=limiters
+            )
+        # 投稿ごとにすぐ記録する（途中で落ちても記録済みの投稿は確定している）
+        _save(post.id, results)
+
+    try:
+        await asyncio.gather(*(post_one(p) for p in posts))
+    finally:
+        await sns_service.aclose_clients()
+
+
+def run_store(store_id: UUID) -> int:
+    """1 店舗分の予約と投稿。戻り値は投稿を試みた件数。"""
+    with SessionLocal() as db:
+        setting = db.execute(
+            select(SnsSettingORM).where(SnsSettingORM.store_id == store_id)
+        ).scalar_one_or_none()
+        if setting is None or not setting.repost_enabled:
+            return 0
+        schedule_store(db, store_id, setting)
+        posts = _claim(db, store_id)
+    if posts:
+        asyncio.run(_post_all(posts, setting))
+    return len(posts)
+
+
+def recover_stale() -> int:
+    """posting のまま止まった投稿を failed にする。戻り値は件数。"""
+    stale_before = _utcnow() - timedelta(seconds=SNS_REPOST_STALE_SEC)
+    with SessionLocal() as db:
+        rows = db.execute(
+            update(SnsPostORM)
+            .where(SnsPostORM.status == POSTING, SnsPostORM.claimed_at < stale_before)
+            .values(status="failed", error_message=INTERRUPTED_ERROR)
+            .returning(SnsPostORM.id)
+        ).all()
+        db.commit()
+    return len(rows)
+
+
+def run_once() -> int:
+    recover_stale()
+    with SessionLocal() as db:
+        store_ids = db.execute(
+            select(SnsSettingORM.store_id).where(SnsSettingORM.repost_enabled.is_(True))
+        ).scalars().all()
+
+    total = 0
+    for store_id in store_ids:
+        if _stop.is_set():
+            break
+        try:
+            total += run_store(store_id)
+        except Exception:
+            logger.exception("SNS repost failed: store=%s", store_id)
+    return total
+
+
+# ============================================================
+# スケジューラ
+# ============================================================
+def _loop() -> None:
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception:
+            logger.warning("SNS repost run failed.", exc_info=True)
+        _stop.wait(SNS_REPOST_TICK_SEC)
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="sns-repost", daemon=True)
+    _thread.start()
+
+
+def shutdown() -> None:
+    """投稿中の再投稿は次回起動時に recover_stale() で failed になる（自動では再送しない）"""
+    global _thread
+    _stop.set()
+    _thread = None
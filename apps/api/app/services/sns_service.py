@@ -3,24 +3,35 @@
 各SNSへの投稿はHTTPSリクエストで実装（SDK不要）。
 Twitter: OAuth 1.0a 手動署名 + v2 API
 Instagram: Graph API (メディアコンテナ作成→公開)
-LINE: Messaging API broadcast
+LINE: Messaging API broadcast（line_client 経由）
+
+有効なプラットフォームへは asyncio.gather で並列に投稿する。
+HTTP クライアントはプラットフォームごとに使い回し、タイムアウト・再送はプラットフォーム別（POLICIES）。
 """
 
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import hmac
 import json
 import logging
+import os
+import random
 import time
 import urllib.parse
 import uuid
+import weakref
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 
 import httpx
 
+from app.services import line_service
+from app.services.line_client import TokenBucket
+
 logger = logging.getLogger(__name__)
 
 # ─── テンプレート変数展開 ────────────────────────────────────
@@ -118,6 +129,124 @@ def _oauth1_header(
     return header_value
 
 
+# ─── 共有 HTTP クライアント・再送ポリシー ───────────────────
+
+PLATFORMS: Tuple[str, ...] = ("twitter", "instagram", "line")
+
+# 投稿結果（SnsPostORM.results の各プラットフォームの status）
+POSTED = "posted"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+SNS_RETRY_MAX_SEC = _env_int("SNS_RETRY_MAX_SEC", 30)
+
+
+@dataclass(frozen=True)
+class PlatformPolicy:
+    """プラットフォームごとのタイムアウトと再送方針"""
+    # 1 リクエストのタイムアウト秒
+    timeout: float
+    # 投稿全体（Instagram はコンテナ作成 + 公開）のタイムアウト秒
+    deadline: float
+    max_retries: int
+    # 再送してよいステータス（投稿が作られていないと分かるもの）
+    retry_statuses: FrozenSet[int]
+
+
+POLICIES: Dict[str, PlatformPolicy] = {
+    # ツイート作成は冪等でないので、429（作成されていない）以外は再送しない
+    "twitter": PlatformPolicy(timeout=15.0, deadline=60.0, max_retries=2, retry_statuses=frozenset({429})),
+    # コンテナ作成は再送しても未公開のコンテナが残るだけ。公開（media_publish）は 429 のみ再送
+    "instagram": PlatformPolicy(
+        timeout=20.0, deadline=90.0, max_retries=2, retry_statuses=frozenset({429, 500, 502, 503, 504})
+    ),
+    # LINE は line_client が X-Line-Retry-Key 付きで再送する
+    "line": PlatformPolicy(timeout=15.0, deadline=60.0, max_retries=0, retry_statuses=frozenset()),
+}
+
+# イベントループ → プラットフォーム → AsyncClient（AsyncClient はループをまたげない）
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _client(platform: str) -> httpx.AsyncClient:
+    """プラットフォームごとに使い回す AsyncClient（コネクションプール）"""
+    per_loop = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = per_loop.get(platform)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=POLICIES[platform].timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        per_loop[platform] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """現在のイベントループの共有クライアントを閉じる（アプリ終了時）"""
+    per_loop = _clients.pop(asyncio.get_running_loop(), {})
+    for client in per_loop.values():
+        await client.aclose()
+
+
+def _retry_delay(resp: Optional[httpx.Response], attempt: int) -> float:
+    delay: Optional[float] = None
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        reset = resp.headers.get("x-rate-limit-reset")  # Twitter: 解除時刻（epoch 秒）
+        try:
+            if retry_after:
+                delay = float(retry_after)
+            elif reset:
+                delay = float(reset) - time.time()
+        except ValueError:
+            delay = None
+    if delay is None:
+        delay = (2 ** attempt) + random.uniform(0, 1)
+    return min(max(delay, 0.0), float(SNS_RETRY_MAX_SEC))
+
+
+async def _send(
+    platform: str,
+    method: str,
+    url: str,
+    *,
+    retry_statuses: Optional[FrozenSet[int]] = None,
+    headers_fn: Optional[Callable[[], Dict[str, str]]] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    共有クライアントで送信する。接続前の失敗（送信されていない）と retry_statuses は再送する。
+    読み取りタイムアウトなど、相手に届いた可能性のある失敗は再送しない。
+    headers_fn: 送信のたびにヘッダーを作り直す場合に指定（OAuth の nonce / timestamp）
+    """
+    policy = POLICIES[platform]
+    statuses = policy.retry_statuses if retry_statuses is None else retry_statuses
+    for attempt in range(policy.max_retries + 1):
+        resp: Optional[httpx.Response] = None
+        if headers_fn is not None:
+            kwargs["headers"] = headers_fn()
+        try:
+            resp = await _client(platform).request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            if attempt >= policy.max_retries:
+                raise
+        else:
+            if resp.status_code not in statuses or attempt >= policy.max_retries:
+                return resp
+        await asyncio.sleep(_retry_delay(resp, attempt))
+    raise RuntimeError("unreachable")
+
+
 # ─── Twitter 投稿 ────────────────────────────────────────────
 
 async def post_to_twitter(
@@ -141,25 +270,22 @@ async def post_to_twitter(
 
     body = {"text": text[:280]}
 
-    auth_header = _oauth1_header(
-        method="POST",
-        url=tweet_url,
-        api_key=api_key,
-        api_secret=api_secret,
-        access_token=access_token,
-        access_secret=access_secret,
-    )
-
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
-                tweet_url,
-                json=body,
-                headers={
-                    "Authorization": auth_header,
-                    "Content-Type": "application/json",
-                },
-            )
+        # nonce は再利用できないので、再送のたびに署名し直す
+        def headers() -> Dict[str, str]:
+            return {
+                "Authorization": _oauth1_header(
+                    method="POST",
+                    url=tweet_url,
+                    api_key=api_key,
+                    api_secret=api_secret,
+                    access_token=access_token,
+                    access_secret=access_secret,
+                ),
+                "Content-Type": "application/json",
+            }
+
+        resp = await _send("twitter", "POST", tweet_url, json=body, headers_fn=headers)
         if resp.status_code in (200, 201):
             return True, None
         return False, f"Twitter API error {resp.status_code}: {resp.text[:200]}"
@@ -187,33 +313,37 @@ async def post_to_instagram(
     base = f"https://graph.facebook.com/v18.0/{account_id}"
 
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            # Step 1: メディアコンテナ作成
-            r1 = await client.post(
-                f"{base}/media",
-                params={
-                    "image_url": image_url,
-                    "caption": caption[:2200],
-                    "access_token": access_token,
-                },
-            )
-            if r1.status_code != 200:
-                return False, f"IG media create error {r1.status_code}: {r1.text[:200]}"
-
-            creation_id = r1.json().get("id")
-            if not creation_id:
-                return False, "IG media create: no id returned"
-
-            # Step 2: 公開
-            r2 = await client.post(
-                f"{base}/media_publish",
-                params={
-                    "creation_id": creation_id,
-                    "access_token": access_token,
-                },
-            )
-            if r2.status_code != 200:
-                return False, f"IG publish error {r2.status_code}: {r2.text[:200]}"
+        # Step 1: メディアコンテナ作成
+        r1 = await _send(
+            "instagram",
+            "POST",
+            f"{base}/media",
+            params={
+                "image_url": image_url,
+                "caption": caption[:2200],
+                "access_token": access_token,
+            },
+        )
+        if r1.status_code != 200:
+            return False, f"IG media create error {r1.status_code}: {r1.text[:200]}"
+
+        creation_id = r1.json().get("id")
+        if not creation_id:
+            return False, "IG media create: no id returned"
+
+        # Step 2: 公開
+        r2 = await _send(
+            "instagram",
+            "POST",
+            f"{base}/media_publish",
+            retry_statuses=frozenset({429}),
+            params={
+                "creation_id": creation_id,
+                "access_token": access_token,
+            },
+        )
+        if r2.status_code != 200:
+            return False, f"IG publish error {r2.status_code}: {r2.text[:200]}"
 
         return True, None
     except Exception as e:
@@ -241,100 +371,150 @@ async def post_to_line(
         })
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
-                "https://api.line.me/v2/bot/message/broadcast",
-                headers={
-                    "Authorization": f"Bearer {channel_token}",
-                    "Content-Type": "application/json",
-                },
-                json={"messages": messages},
-            )
-        if resp.status_code == 200:
+        ok, err = await line_service.broadcast_messages_async(messages, channel_token)
+        if ok:
             return True, None
-        return False, f"LINE API error {resp.status_code}: {resp.text[:200]}"
+        return False, err
     except Exception as e:
         return False, f"LINE request failed: {e}"
 
 
 # ─── 統合実行 ────────────────────────────────────────────────
 
+def _targets(platform: str) -> List[str]:
+    return list(PLATFORMS) if platform == "all" else [platform]
+
+
+def summarize_results(results: Dict[str, Dict]) -> Tuple[bool, Optional[str]]:
+    """
+    プラットフォーム別の結果から (success, combined_error) を作る。
+    1 つでも成功していれば success（失敗分はエラーとして併記）。
+    """
+    labels = {"twitter": "Twitter", "instagram": "Instagram", "line": "LINE"}
+    errors = [
+        f"{labels.get(p, p)}: {r.get('error')}"
+        for p, r in results.items()
+        if r.get("status") == FAILED
+    ]
+    success_count = sum(1 for r in results.values() if r.get("status") == POSTED)
+    if errors and success_count == 0:
+        return False, "; ".join(errors)
+    return True, "; ".join(errors) if errors else None
+
+
+def result_status(results: Dict[str, Dict]) -> Tuple[str, Optional[str]]:
+    """プラットフォーム別の結果から SnsPostORM の (status, error_message) を決める"""
+    ok, err = summarize_results(results)
+    if results and all(r.get("status") == SKIPPED for r in results.values()):
+        return "skipped", err
+    return ("posted" if ok else "failed"), err
+
+
+def failed_platforms(results: Optional[Dict[str, Dict]]) -> List[str]:
+    return [p for p, r in (results or {}).items() if r.get("status") == FAILED]
+
+
+async def _post_one(
+    platform: str,
+    caption: str,
+    image_urls: Optional[List[str]],
+    setting,
+    limiter: Optional[TokenBucket] = None,
+) -> Tuple[bool, Optional[str]]:
+    if limiter is not None:
+        await limiter.acquire()
+    if platform == "twitter":
+        coro = post_to_twitter(
+            caption, image_urls,
+            setting.twitter_api_key or "",
+            setting.twitter_api_secret or "",
+            setting.twitter_access_token or "",
+            setting.twitter_access_secret or "",
+        )
+    elif platform == "instagram":
+        coro = post_to_instagram(
+            caption, image_urls,
+            setting.instagram_account_id or "",
+            setting.instagram_access_token or "",
+        )
+    else:
+        coro = post_to_line(caption, image_urls, setting.line_channel_token or "")
+
+    try:
+        return await asyncio.wait_for(coro, timeout=POLICIES[platform].deadline)
+    except asyncio.TimeoutError:
+        return False, f"timeout ({POLICIES[platform].deadline:.0f}s)"
+
+
+def _enabled(platform: str, setting) -> bool:
+    return bool(getattr(setting, f"{platform}_enabled", False))
+
+
 async def execute_sns_post(
     caption: str,
     image_urls: Optional[List[str]],
     platform: str,
     setting,  # SnsSettingORM
-) -> Tuple[bool, Optional[str]]:
+    only: Optional[List[str]] = None,
+    limiters: Optional[Dict[str, TokenBucket]] = None,
+) -> Tuple[bool, Optional[str], Dict[str, Dict]]:
     """
-    指定プラットフォームへ投稿する。
+    指定プラットフォームへ並列に投稿する。
     platform: "twitter" | "instagram" | "line" | "all"
-    Returns (success, combined_error)
+    only: 指定時はこのプラットフォームだけ投稿する（リトライで失敗分のみ送る場合）
+    limiters: プラットフォーム → TokenBucket。まとめて投稿するときの投稿ペースを抑える
+    Returns (success, combined_error, results)
+      results: {platform: {"status": posted/failed/skipped, "error": ..., "at": ISO8601}}
     """
-    errors: List[str] = []
-    success_count = 0
+    targets = [t for t in _targets(platform) if t in PLATFORMS and (only is None or t in only)]
+    enabled = [t for t in targets if _enabled(t, setting)]
 
-    targets = (
-        ["twitter", "instagram", "line"]
-        if platform == "all"
-        else [platform]
+    outcomes = await asyncio.gather(
+        *(_post_one(t, caption, image_urls, setting, (limiters or {}).get(t)) for t in enabled)
     )
 
-    for t in targets:
-        if t == "twitter" and setting.twitter_enabled:
-            ok, err = await post_to_twitter(
-                caption, image_urls,
-                setting.twitter_api_key or "",
-                setting.twitter_api_secret or "",
-                setting.twitter_access_token or "",
-                setting.twitter_access_secret or "",
-            )
-            if ok:
-                success_count += 1
-            else:
-                errors.append(f"Twitter: {err}")
-
-        elif t == "instagram" and setting.instagram_enabled:
-            ok, err = await post_to_instagram(
-                caption, image_urls,
-                setting.instagram_account_id or "",
-                setting.instagram_access_token or "",
-            )
-            if ok:
-                success_count += 1
-            else:
-                errors.append(f"Instagram: {err}")
-
-        elif t == "line" and setting.line_enabled:
-            ok, err = await post_to_line(
-                caption, image_urls,
-                setting.line_channel_token or "",
-            )
-            if ok:
-                success_count += 1
-            else:
-                errors.append(f"LINE: {err}")
+    now = datetime.now(timezone.utc).isoformat()
+    results: Dict[str, Dict] = {
+        t: {"status": SKIPPED, "error": "無効のためスキップ", "at": now}
+        for t in targets
+        if t not in enabled
+    }
+    for t, (ok, err) in zip(enabled, outcomes):
+        results[t] = {"status": POSTED if ok else FAILED, "error": err, "at": now}
 
-    if errors and success_count == 0:
-        return False, "; ".join(errors)
-    return True, "; ".join(errors) if errors else None
+    ok, err = summarize_results(results)
+    return ok, err, results
 
 
 # ─── 再投稿スケジュール計算 ──────────────────────────────────
 
+# キャプション生成に使う車両の列
+CAPTION_COLUMNS = ("make", "model", "grade", "year", "mileage", "expected_sell_price", "color", "export_description")
+
+
+def repost_key(car_id, next_repost_at: datetime) -> str:
+    """再投稿の冪等キー。同じ車両・同じ予定日の再投稿は 1 回しか作られない。"""
+    return f"repost:{car_id}:{next_repost_at.date().isoformat()}"
+
+
 def get_repost_due_cars(
     db,
     store_id,
     interval_weeks: int,
+    limit: Optional[int] = None,
+    exclude_attempted: bool = False,
 ) -> List[Dict]:
     """
-    new_arrival で posted かつ ステータスが販売中の車両で
-    最終投稿から interval_weeks 週以上経過しているものを返す。
+    new_arrival / repost で posted かつ ステータスが販売中の車両で
+    最終投稿から interval_weeks 週以上経過しているものを、最終投稿が古い順に返す。
+    売約ステータスの除外は SQL 側で行い、車両はキャプションに使う列だけ読む。
+    exclude_attempted: 最終投稿の後に再投稿（pending / posting / failed など）を作成済みの車両を除く
     """
-    from sqlalchemy import select, func, and_
+    from sqlalchemy import select, func, and_, exists
+    from sqlalchemy.orm import aliased
     from app.models.sns_post import SnsPostORM
-    from app.models.car import Car
+    from app.models.car import SOLD_STATUSES, Car
 
-    SOLD_STATUSES = {"売約", "売約済み", "SOLD", "sold_out", "納車済"}
     now = datetime.now(timezone.utc)
     threshold = now - timedelta(weeks=interval_weeks)
 
@@ -356,26 +536,39 @@ def get_repost_due_cars(
         .subquery()
     )
 
-    rows = db.execute(
-        select(Car, subq.c.last_posted_at)
+    stmt = (
+        select(Car.id, *(getattr(Car, c) for c in CAPTION_COLUMNS), subq.c.last_posted_at)
         .join(subq, Car.id == subq.c.car_id)
         .where(
             and_(
                 Car.store_id == store_id,
                 subq.c.last_posted_at <= threshold,
+                Car.status.notin_(SOLD_STATUSES),
+            )
+        )
+        .order_by(subq.c.last_posted_at, Car.id)
+    )
+    if exclude_attempted:
+        attempt = aliased(SnsPostORM)
+        stmt = stmt.where(
+            ~exists().where(
+                attempt.store_id == store_id,
+                attempt.car_id == Car.id,
+                attempt.trigger == "repost",
+                attempt.created_at > subq.c.last_posted_at,
             )
         )
-    ).all()
+    if limit is not None:
+        stmt = stmt.limit(limit)
 
     result = []
-    for car, last_posted_at in rows:
-        if car.status in SOLD_STATUSES:
-            continue
+    for row in db.execute(stmt).mappings():
+        last_posted_at = row["last_posted_at"]
         next_repost_at = last_posted_at + timedelta(weeks=interval_weeks)
         result.append({
-            "car_id": car.id,
-            "car": car,
-            "car_name": " ".join(filter(None, [car.make, car.model, car.grade])) or "車両",
+            "car_id": row["id"],
+            "car": {c: row[c] for c in CAPTION_COLUMNS},
+            "car_name": " ".join(filter(None, [row["make"], row["model"], row["grade"]])) or "車両",
             "last_posted_at": last_posted_at,
             "next_repost_at": next_repost_at,
             "overdue": now >= next_repost_at,
@@ -0,0 +1,542 @@
+# app/services/storage.py
+"""
+添付ファイル・ロゴ等のストレージ層。
+
+- アップロードはチャンクごとに読みながら SHA-256 を計算し、一時ファイルへ書き出す（全体をメモリに載せない）
+- 保存キーは内容アドレス（cas/ab/cd/<sha256>）なので、同じファイルは 1 つだけ保存される
+- バックエンドはローカル FS / S3 互換（MinIO 等）を環境変数で切り替え
+- ダウンロードは HTTP Range / ETag / If-None-Match / If-Modified-Since に対応
+
+DB には「参照文字列（ref）」を保存する。
+  - "cas/..." … このストレージ層のキー
+  - "drv/..." … 元ファイルの SHA-256 から決まる派生物（サムネイル等）のキー
+  - それ以外 … 旧実装で保存したローカルの絶対パス（そのまま読めるよう互換を残す）
+
+環境変数:
+  STORAGE_BACKEND        local（既定）/ s3
+  STORAGE_LOCAL_ROOT     local の保存先（既定 apps/api/uploads）
+  S3_BUCKET              s3 のバケット名
+  S3_ENDPOINT_URL        S3 互換エンドポイント（例 http://localhost:9000 で MinIO）
+  S3_REGION              リージョン（既定 ap-northeast-1）
+  S3_ACCESS_KEY_ID / S3_SECRET_ACCESS_KEY
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Protocol, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+# Optional dep (S3 backend)
+try:
+    import boto3  # type: ignore
+    from botocore.exceptions import ClientError  # type: ignore
+except Exception:  # pragma: no cover
+    boto3 = None  # type: ignore
+    ClientError = Exception  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+CAS_PREFIX = "cas/"
+DERIVED_PREFIX = "drv/"
+
+_CAS_KEY_RE = re.compile(r"^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}$")
+_DERIVED_KEY_RE = re.compile(r"^drv/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})/([a-z0-9]+\.[a-z0-9]+)$")
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+class FileTooLargeError(StorageError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    ref: str
+    sha256: str
+    size: int
+
+
+@dataclass(frozen=True)
+class ObjectStat:
+    size: int
+    modified_at: datetime
+
+
+# ============================================================
+# Backends
+# ============================================================
+class StorageBackend(Protocol):
+    def exists(self, key: str) -> bool: ...
+
+    def put_file(self, key: str, src_path: str, content_type: Optional[str] = None) -> None: ...
+
+    def stat(self, key: str) -> ObjectStat: ...
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class LocalStorage:
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def staging_dir(self) -> Path:
+        # os.replace で移動できるよう保存先と同じファイルシステムに置く
+        d = self.root / ".staging"
+        d.mkdir(parents=True, exist_ok=True)
+        return d
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def put_file(self, key: str, src_path: str, content_type: Optional[str] = None) -> None:
+        dest = self._path(key)
+        if dest.exists():
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src_path, dest)
+
+    def stat(self, key: str) -> ObjectStat:
+        try:
+            st = self._path(key).stat()
+        except FileNotFoundError:
+            raise StorageError("object not found") from None
+        return ObjectStat(size=st.st_size, modified_at=datetime.fromtimestamp(st.st_mtime, tz=timezone.utc))
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        remaining = end - start + 1
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage:
+    def __init__(self, bucket: str, client):
+        self.bucket = bucket
+        self.client = client
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:  # type: ignore[misc]
+            code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, key: str, src_path: str, content_type: Optional[str] = None) -> None:
+        if self.exists(key):
+            return
+        extra = {"ContentType": content_type} if content_type else None
+        # upload_file は大きいファイルを自動でマルチパートに分ける
+        self.client.upload_file(src_path, self.bucket, key, ExtraArgs=extra)
+
+    def stat(self, key: str) -> ObjectStat:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:  # type: ignore[misc]
+            raise StorageError(f"object not found: {e}") from e
+        return ObjectStat(size=int(head["ContentLength"]), modified_at=head["LastModified"])
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        obj = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")
+        body = obj["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def _default_local_root() -> Path:
+    # apps/api/uploads（既存の expenses / stores と同じ場所）
+    return Path(__file__).resolve().parents[2] / "uploads"
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+# 旧実装で storage_path / file_path に入っている絶対パスを読むためのバックエンド
+_legacy = LocalStorage(Path("/"))
+
+
+def _build_backend() -> StorageBackend:
+    kind = (os.getenv("STORAGE_BACKEND") or "local").strip().lower()
+    if kind == "s3":
+        if boto3 is None:
+            raise StorageError("boto3 not installed. Run: pip install boto3")
+        bucket = os.getenv("S3_BUCKET") or ""
+        if not bucket:
+            raise StorageError("S3_BUCKET is not set")
+        client = boto3.client(
+            "s3",
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region_name=os.getenv("S3_REGION") or "ap-northeast-1",
+            aws_access_key_id=os.getenv("S3_ACCESS_KEY_ID") or None,
+            aws_secret_access_key=os.getenv("S3_SECRET_ACCESS_KEY") or None,
+        )
+        return S3Storage(bucket, client)
+
+    root = Path(os.getenv("STORAGE_LOCAL_ROOT") or _default_local_root())
+    return LocalStorage(root)
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend()
+    return _backend
+
+
+def _staging_dir() -> Path:
+    backend = get_backend()
+    if isinstance(backend, LocalStorage):
+        return backend.staging_dir()
+    return Path(tempfile.gettempdir())
+
+
+# ============================================================
+# Refs
+# ============================================================
+def cas_key(sha256: str) -> str:
+    return f"{CAS_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def is_cas_ref(ref: str) -> bool:
+    return bool(_CAS_KEY_RE.match(ref or ""))
+
+
+def sha256_of_ref(ref: str) -> Optional[str]:
+    return ref.rsplit("/", 1)[-1] if is_cas_ref(ref) else None
+
+
+def derived_key(sha256: str, name: str) -> str:
+    """元ファイルの SHA-256 と派生物の名前（例 w320.webp）から保存キーを決める。"""
+    return f"{DERIVED_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}/{name}"
+
+
+def is_derived_ref(ref: str) -> bool:
+    return bool(_DERIVED_KEY_RE.match(ref or ""))
+
+
+def _resolve(ref: str) -> Tuple[StorageBackend, str]:
+    if is_cas_ref(ref) or is_derived_ref(ref):
+        return get_backend(), ref
+    if (ref or "").startswith((CAS_PREFIX, DERIVED_PREFIX)):
+        raise StorageError("invalid storage ref")
+    return _legacy, ref
+
+
+def exists(ref: str) -> bool:
+    try:
+        backend, key = _resolve(ref)
+        return backend.exists(key)
+    except StorageError:
+        return False
+
+
+def read_bytes(ref: str) -> bytes:
+    backend, key = _resolve(ref)
+    st = backend.stat(key)
+    if st.size == 0:
+        return b""
+    return b"".join(backend.iter_range(key, 0, st.size - 1))
+
+
+def copy_to(ref: str, out: BinaryIO) -> int:
+    """ファイルオブジェクトへチャンク単位でコピーする（大きいファイルを一括で読まない）。"""
+    backend, key = _resolve(ref)
+    st = backend.stat(key)
+    if st.size > 0:
+        for chunk in backend.iter_range(key, 0, st.size - 1):
+            out.write(chunk)
+    return st.size
+
+
+def read_head(ref: str, n: int = 32) -> bytes:
+    """先頭 n バイトだけ読む（形式判定用）。"""
+    backend, key = _resolve(ref)
+    st = backend.stat(key)
+    if st.size == 0:
+        return b""
+    return b"".join(backend.iter_range(key, 0, min(n, st.size) - 1))
+
+
+def release(ref: str) -> None:
+    """
+    参照をやめたファイルを片付ける。
+
+    内容アドレスの実体は他の行と共有されうるので消さない（旧形式のパスのみ削除）。
+    """
+    if not ref or is_cas_ref(ref):
+        return
+    try:
+        _legacy.delete(ref)
+    except Exception:
+        logger.warning("Failed to delete legacy file: %s", ref, exc_info=True)
+
+
+def delete(ref: str) -> None:
+    """
+    ファイルを削除する。
+
+    内容アドレスの実体も消すので、他に参照が無いことは呼び出し側で確かめること
+    （参照をやめただけなら release を使う）。
+    """
+    backend, key = _resolve(ref)
+    backend.delete(key)
+
+
+# ============================================================
+# Upload
+# ============================================================
+def _commit_staged(tmp_path: str, sha256: str, content_type: Optional[str]) -> str:
+    key = cas_key(sha256)
+    get_backend().put_file(key, tmp_path, content_type)
+    return key
+
+
+async def save_upload(
+    file: UploadFile,
+    *,
+    max_bytes: int,
+    content_type: Optional[str] = None,
+) -> StoredObject:
+    """
+    UploadFile をチャンク単位で読みながらハッシュを計算し、内容アドレスで保存する。
+
+    max_bytes を超えた時点で読み込みを打ち切って FileTooLargeError を送出する。
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=_staging_dir(), suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"File too large (max {max_bytes} bytes)")
+                h.update(chunk)
+                out.write(chunk)
+
+        digest = h.hexdigest()
+        ref = await run_in_threadpool(_commit_staged, tmp_path, digest, content_type or file.content_type)
+        return StoredObject(ref=ref, sha256=digest, size=size)
+    finally:
+        # put_file で移動済みなら存在しない（重複時は残っているので消す）
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def put_bytes(key: str, content: bytes, *, content_type: Optional[str] = None) -> None:
+    """バイト列をキー指定で保存する（既にあれば何もしない）。"""
+    fd, tmp_path = tempfile.mkstemp(dir=_staging_dir(), suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(content)
+        get_backend().put_file(key, tmp_path, content_type)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def save_bytes(content: bytes, *, content_type: Optional[str] = None) -> StoredObject:
+    """生成したバイト列を内容アドレスで保存する。"""
+    digest = hashlib.sha256(content).hexdigest()
+    put_bytes(cas_key(digest), content, content_type=content_type)
+    return StoredObject(ref=cas_key(digest), sha256=digest, size=len(content))
+
+
+# ============================================================
+# Download（Range / 条件付きリクエスト）
+# ============================================================
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(ref: str, st: ObjectStat) -> str:
+    digest = sha256_of_ref(ref)
+    if digest:
+        return f'"{digest}"'
+    m = _DERIVED_KEY_RE.match(ref or "")
+    if m:
+        return f'"{m.group(1)}-{m.group(2)}"'
+    return f'W/"{st.size:x}-{int(st.modified_at.timestamp()):x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 用の弱い比較（W/ の有無を無視する）。"""
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == bare for t in header.split(","))
+
+
+def _if_range_matches(header: str, etag: str, modified_at: datetime) -> bool:
+    """
+    If-Range の判定（RFC 9110 13.1.5）。
+
+    ETag は強い比較なので、弱い ETag（W/）はどちら側にあっても一致しない。
+    日付は Last-Modified と完全に一致したときだけ一致とみなす。
+    """
+    header = header.strip()
+    if header.startswith(("W/", '"')):
+        return not etag.startswith("W/") and header == etag
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified_at.replace(microsecond=0) == since
+
+
+def _not_modified_since(header: str, modified_at: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified_at.replace(microsecond=0) <= since
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    単一レンジのみ対応。複数レンジや解釈できない指定は None（= 全体を返す）。
+    満たせないレンジは ValueError。
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first and not last:
+        return None
+    if not first:
+        n = int(last)
+        if n == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def _content_disposition(filename: str, inline: bool) -> str:
+    kind = "inline" if inline else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{kind}; filename*=utf-8''{quoted}"
+    return f'{kind}; filename="{filename}"'
+
+
+def file_response(
+    request: Request,
+    ref: str,
+    *,
+    media_type: Optional[str],
+    filename: Optional[str] = None,
+    inline: bool = False,
+    cache_control: str = "private, max-age=0, must-revalidate",
+) -> Response:
+    """
+    保存済みファイルを返す。
+
+    - If-None-Match / If-Modified-Since が一致すれば 304
+    - Range: bytes=a-b（単一レンジ）なら 206、満たせなければ 416
+    - If-Range（強い ETag か Last-Modified と同じ日付）が一致しない場合は Range を無視して全体を返す
+    """
+    backend, key = _resolve(ref)
+    st = backend.stat(key)
+    etag = _etag(ref, st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(st.modified_at.astimezone(timezone.utc), usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        if _etag_matches(inm, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        ims = request.headers.get("if-modified-since")
+        if ims and _not_modified_since(ims, st.modified_at):
+            return Response(status_code=304, headers=headers)
+
+    if filename:
+        headers["Content-Disposition"] = _content_disposition(filename, inline)
+
+    start, end, status = 0, st.size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and st.size > 0:
+        if_range = request.headers.get("if-range")
+        if not if_range or _if_range_matches(if_range, etag, st.modified_at):
+            try:
+                rng = _parse_range(range_header, st.size)
+            except ValueError:
+                return Response(
+                    status_code=416,
+                    headers={**headers, "Content-Range": f"bytes */{st.size}"},
+                )
+            if rng is not None:
+                start, end = rng
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{st.size}"
+
+    headers["Content-Length"] = str(max(0, end - start + 1))
+    if request.method == "HEAD" or st.size == 0:
+        return Response(status_code=status, headers=headers, media_type=media_type)
+
+    return StreamingResponse(
+        backend.iter_range(key, start, end),
+        status_code=status,
+        headers=headers,
+        media_type=media_type or "application/octet-stream",
+    )
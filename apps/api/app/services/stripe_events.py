@@ -0,0 +1,419 @@
+# app/services/stripe_events.py
+"""
+Stripe Webhook の受信キュー。
+
+- Webhook は署名検証後にイベントを stripe_events に 1 文の INSERT で保存して、すぐ 200 を返す
+- stripe_event_id の一意制約（ON CONFLICT DO NOTHING）で、Stripe の再送を二重に積まない
+- ワーカーは顧客（stripe_customer_id）ごとに発生順で処理する。同じ顧客の前のイベントが
+  未処理（queued / processing）の間は次のイベントを取らない。顧客が違えば並列に処理する
+- ハンドラーの更新とイベントの done は同じトランザクション。落ちてもやり直すだけで二重適用しない
+- 取り出すたびに claim_token を発行し、done / 再試行は token が一致する行だけ更新する。
+  止まったと判断されて他のワーカーに取り直されたイベントは、ハンドラーの更新ごとロールバックする
+- 失敗したイベントは指数バックオフで再試行し、STRIPE_INBOX_MAX_ATTEMPTS 回で failed にする
+
+環境変数:
+  STRIPE_INBOX_BATCH          1 回に取り出すイベント数（既定 50）
+  STRIPE_INBOX_WORKERS        同時に処理するイベント数（既定 4）
+  STRIPE_INBOX_MAX_ATTEMPTS   この回数失敗したイベントは failed にする（既定 8）
+  STRIPE_INBOX_STALE_SEC      processing のままこの秒数経ったイベントを取り直す（既定 120）
+  STRIPE_INBOX_POLL_SEC       新着通知が無いときの確認間隔（既定 10）
+  STRIPE_INBOX_RETENTION_DAYS 処理済みイベントを残す日数（重複判定の期間、既定 30）
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, exists, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
+
+from app.db.session import SessionLocal
+from app.models.license import LicenseORM
+from app.models.referral import ReferralORM
+from app.models.stripe_event import StripeEventORM
+from app.services import referrals
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+STRIPE_INBOX_BATCH = _env_int("STRIPE_INBOX_BATCH", 50)
+STRIPE_INBOX_WORKERS = _env_int("STRIPE_INBOX_WORKERS", 4)
+STRIPE_INBOX_MAX_ATTEMPTS = _env_int("STRIPE_INBOX_MAX_ATTEMPTS", 8)
+STRIPE_INBOX_STALE_SEC = _env_int("STRIPE_INBOX_STALE_SEC", 120)
+STRIPE_INBOX_POLL_SEC = _env_int("STRIPE_INBOX_POLL_SEC", 10)
+STRIPE_INBOX_RETENTION_DAYS = _env_int("STRIPE_INBOX_RETENTION_DAYS", 30)
+
+# 再試行の待ち時間の上限
+RETRY_MAX_SEC = 60 * 60
+
+# 処理済みイベントの削除間隔
+CLEANUP_INTERVAL_SEC = 60 * 60
+
+# イベント状態
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+_stop = threading.Event()
+_wake = threading.Event()
+_worker: Optional[threading.Thread] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ============================================================
+# 受信（Webhook から呼ぶ）
+# ============================================================
+def _customer_id(event: Dict[str, Any]) -> Optional[str]:
+    obj = (event.get("data") or {}).get("object") or {}
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    if not customer and obj.get("object") == "customer":
+        customer = obj.get("id")
+    return str(customer)[:255] if customer else None
+
+
+def persist(db: Session, event: Dict[str, Any]) -> bool:
+    """イベントを保存してワーカーを起こす。戻り値は新規に積んだか（再送なら False）。"""
+    event_id = event.get("id")
+    if not event_id:
+        raise ValueError("Stripe event id is missing")
+
+    created = event.get("created")
+    stripe_created_at = (
+        datetime.fromtimestamp(int(created), tz=timezone.utc) if created else _utcnow()
+    )
+    inserted = db.execute(
+        pg_insert(StripeEventORM)
+        .values(
+            id=uuid.uuid4(),
+            stripe_event_id=str(event_id)[:255],
+            event_type=(event.get("type") or "")[:64],
+            stripe_customer_id=_customer_id(event),
+            stripe_created_at=stripe_created_at,
+            payload=event,
+            status=QUEUED,
+            attempts=0,
+            created_at=_utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["stripe_event_id"])
+        .returning(StripeEventORM.id)
+    ).first()
+    db.commit()
+    if inserted is not None:
+        _wake.set()
+    return inserted is not None
+
+
+# ============================================================
+# イベントハンドラー（commit は呼び出し側）
+# ============================================================
+def _handle_subscription_created(db: Session, obj: dict) -> None:
+    """customer.subscription.created → license.status = active"""
+    customer_id = obj.get("customer", "")
+    subscription_id = obj.get("id", "")
+    lic = db.execute(
+        select(LicenseORM).where(LicenseORM.stripe_customer_id == customer_id)
+    ).scalar_one_or_none()
+    if not lic:
+        logger.warning(f"No license found for Stripe customer: {customer_id}")
+        return
+
+    lic.status = "active"
+    lic.stripe_subscription_id = subscription_id
+    now = datetime.now(timezone.utc)
+    lic.current_period_start = now
+    lic.current_period_end = now + timedelta(days=30)
+    lic.updated_at = now
+    logger.info(f"License activated for customer {customer_id}")
+
+
+def _handle_subscription_deleted(db: Session, obj: dict) -> None:
+    """customer.subscription.deleted → license.status = expired"""
+    subscription_id = obj.get("id", "")
+    lic = db.execute(
+        select(LicenseORM).where(LicenseORM.stripe_subscription_id == subscription_id)
+    ).scalar_one_or_none()
+    if not lic:
+        return
+
+    lic.status = "expired"
+    lic.updated_at = datetime.now(timezone.utc)
+    logger.info(f"License expired for subscription {subscription_id}")
+
+
+def _handle_payment_succeeded(db: Session, obj: dict) -> None:
+    """invoice.payment_succeeded → 3ヶ月チェック → referral を pending → active に"""
+    customer_id = obj.get("customer", "")
+    if not customer_id:
+        return
+
+    lic = db.execute(
+        select(LicenseORM).where(LicenseORM.stripe_customer_id == customer_id)
+    ).scalar_one_or_none()
+    if not lic:
+        return
+
+    # current_period を更新
+    now = datetime.now(timezone.utc)
+    lic.current_period_start = now
+    lic.current_period_end = now + timedelta(days=30)
+    lic.updated_at = now
+
+    # 3ヶ月継続チェック（登録から90日以上経過した pending referral を active に）
+    pending_referrals = db.execute(
+        select(ReferralORM).where(
+            ReferralORM.referred_store_id == lic.store_id,
+            ReferralORM.status == "pending",
+        )
+    ).scalars().all()
+
+    for ref in pending_referrals:
+        days_since_created = (now - ref.created_at.replace(tzinfo=timezone.utc)).days
+        if days_since_created >= 90:
+            # 紹介元のライセンス割引・パートナーランクも同じトランザクションで更新
+            referrals.activate(db, ref, now=now)
+            logger.info(f"Referral {ref.id} auto-activated after 90 days")
+
+
+def _handle_payment_failed(db: Session, obj: dict) -> None:
+    """invoice.payment_failed → ログ記録のみ（通知はSentryで対応）。"""
+    customer_id = obj.get("customer", "")
+    invoice_id = obj.get("id", "")
+    logger.warning(f"Payment failed: customer={customer_id}, invoice={invoice_id}")
+
+
+HANDLERS: Dict[str, Callable[[Session, dict], None]] = {
+    "customer.subscription.created": _handle_subscription_created,
+    "customer.subscription.deleted": _handle_subscription_deleted,
+    "invoice.payment_succeeded": _handle_payment_succeeded,
+    "invoice.payment_failed": _handle_payment_failed,
+}
+
+
+# ============================================================
+# 取り出し
+# ============================================================
+def _requeue_stale() -> None:
+    """processing のまま止まったイベントを queued に戻す（同じ顧客の後続が待っているため）。"""
+    stale_before = _utcnow() - timedelta(seconds=STRIPE_INBOX_STALE_SEC)
+    with SessionLocal() as db:
+        db.execute(
+            update(StripeEventORM)
+            .where(StripeEventORM.status == PROCESSING, StripeEventORM.locked_at < stale_before)
+            .values(status=QUEUED, locked_at=None, claim_token=None)
+        )
+        db.commit()
+
+
+def _claim_batch() -> List[Any]:
+    """
+    処理できる queued を発生順に取り、processing にする。
+    同じ顧客に前の未処理イベントがあるものは取らないので、1 バッチに同じ顧客は 1 件まで。
+    """
+    now = _utcnow()
+    earlier = aliased(StripeEventORM)
+    ev = StripeEventORM
+    pending = (
+        select(ev.id)
+        .where(
+            ev.status == QUEUED,
+            or_(ev.next_attempt_at.is_(None), ev.next_attempt_at <= now),
+            ~exists().where(
+                earlier.stripe_customer_id == ev.stripe_customer_id,
+                earlier.status.in_((QUEUED, PROCESSING)),
+                tuple_(earlier.stripe_created_at, earlier.created_at)
+                < tuple_(ev.stripe_created_at, ev.created_at),
+            ),
+        )
+        .order_by(ev.stripe_created_at, ev.created_at)
+        .limit(STRIPE_INBOX_BATCH)
+        .with_for_update(skip_locked=True)
+    )
+    with SessionLocal() as db:
+        rows = db.execute(
+            update(StripeEventORM)
+            .where(StripeEventORM.id.in_(pending.scalar_subquery()))
+            .values(
+                status=PROCESSING,
+                locked_at=now,
+                claim_token=uuid.uuid4(),
+                attempts=StripeEventORM.attempts + 1,
+            )
+            .returning(
+                StripeEventORM.id,
+                StripeEventORM.claim_token,
+                StripeEventORM.event_type,
+                StripeEventORM.payload,
+                StripeEventORM.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    return list(rows)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_MAX_SEC, 10 * (2 ** (attempts - 1))))
+
+
+def _owned(event_id: uuid.UUID, token: uuid.UUID):
+    """このワーカーが取り出したまま（取り直されていない）の行"""
+    return and_(
+        StripeEventORM.id == event_id,
+        StripeEventORM.status == PROCESSING,
+        StripeEventORM.claim_token == token,
+    )
+
+
+# ============================================================
+# 処理
+# ============================================================
+def process_event(
+    event_id: uuid.UUID, token: uuid.UUID, event_type: str, payload: Dict[str, Any], attempts: int
+) -> bool:
+    """1 イベントを処理する。ハンドラーの更新と done を同じトランザクションで確定する。"""
+    handler = HANDLERS.get(event_type)
+    with SessionLocal() as db:
+        try:
+            if handler is None:
+                logger.info(f"Unhandled Stripe event: {event_type}")
+            else:
+                handler(db, (payload.get("data") or {}).get("object") or {})
+            done = db.execute(
+                update(StripeEventORM)
+                .where(_owned(event_id, token))
+                .values(status=DONE, error=None, processed_at=_utcnow())
+                .returning(StripeEventORM.id)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if done is None:
+                # 処理中に取り直された。ハンドラーの更新は取り直したワーカーに任せる
+                db.rollback()
+                logger.warning("[Stripe Inbox] %s was reclaimed by another worker", event_type)
+                return False
+            db.commit()
+            return True
+        except Exception as ex:
+            db.rollback()
+            logger.exception("[Stripe Inbox] %s failed (attempt %d)", event_type, attempts)
+            error = f"{type(ex).__name__}: {ex}"[:500]
+
+    # 前のイベントが終わるまで同じ顧客の後続は取られない（queued のまま待つ）
+    with SessionLocal() as db:
+        if attempts >= STRIPE_INBOX_MAX_ATTEMPTS:
+            values = {"status": FAILED, "error": error, "processed_at": _utcnow()}
+        else:
+            values = {
+                "status": QUEUED,
+                "error": error,
+                "locked_at": None,
+                "next_attempt_at": _utcnow() + _retry_delay(attempts),
+            }
+        db.execute(
+            update(StripeEventORM)
+            .where(_owned(event_id, token))
+            .values(claim_token=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return False
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=STRIPE_INBOX_WORKERS, thread_name_prefix="stripe-inbox")
+    return _executor
+
+
+def drain() -> int:
+    """処理できるイベントが無くなるまで処理する。戻り値は処理したイベント数。"""
+    _requeue_stale()
+    total = 0
+    while not _stop.is_set():
+        batch = _claim_batch()
+        if not batch:
+            break
+        # バッチ内は顧客が重ならないので並列に処理してよい
+        list(_get_executor().map(
+            lambda r: process_event(r.id, r.claim_token, r.event_type, r.payload or {}, r.attempts), batch
+        ))
+        total += len(batch)
+    return total
+
+
+def cleanup() -> int:
+    """保持期間を過ぎた処理済みイベントを削除する。"""
+    before = _utcnow() - timedelta(days=STRIPE_INBOX_RETENTION_DAYS)
+    with SessionLocal() as db:
+        deleted = db.execute(
+            delete(StripeEventORM).where(
+                and_(StripeEventORM.status == DONE, StripeEventORM.processed_at < before)
+            )
+        ).rowcount
+        db.commit()
+    return deleted or 0
+
+
+# ============================================================
+# ワーカー
+# ============================================================
+def _run() -> None:
+    last_cleanup = 0.0
+    while not _stop.is_set():
+        _wake.clear()
+        try:
+            drain()
+        except Exception:
+            logger.warning("[Stripe Inbox] drain failed.", exc_info=True)
+
+        if time.monotonic() - last_cleanup > CLEANUP_INTERVAL_SEC:
+            last_cleanup = time.monotonic()
+            try:
+                cleanup()
+            except Exception:
+                logger.warning("[Stripe Inbox] cleanup failed.", exc_info=True)
+
+        # 新着（persist）か停止で起きる。再試行待ち・他プロセスが受けた分は POLL_SEC ごとに拾う
+        _wake.wait(STRIPE_INBOX_POLL_SEC)
+
+
+def start() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _wake.set()
+    _worker = threading.Thread(target=_run, name="stripe-inbox", daemon=True)
+    _worker.start()
+
+
+def shutdown() -> None:
+    """処理中のイベントは processing のまま残り、STRIPE_INBOX_STALE_SEC 後に取り直される。"""
+    global _worker, _executor
+    _stop.set()
+    _wake.set()
+    _worker = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
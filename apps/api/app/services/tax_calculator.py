@@ -1,9 +1,19 @@
-"""自賠責保険料・重量税 簡易計算サービス（2024年度法定料金）"""
+"""自賠責保険料・重量税 簡易計算サービス
+
+料金表は年度（4月始まり）ごとに FeeTable として登録する（FEE_TABLES）。
+計算日の年度以前で最も新しい料金表を使うので、過去の見積も当時の料金で計算し直せる。
+重量区分は閾値の配列を bisect で引く。calculate_many() は料金表の解決を 1 回にまとめて
+複数台をまとめて計算する（車検シーズンの一括見積用）。
+"""
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
 from datetime import date
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
 
+# ─── 2024年度 法定料金 ───────────────────────────────────────────
 
 # ─── 自賠責保険料テーブル ─────────────────────────────────────────
 # key: (vehicle_type, months)
@@ -95,16 +105,89 @@ ECO_MULTIPLIERS: dict[str, float] = {
 }
 
 
+AGE_CATEGORIES: Tuple[str, ...] = ("under13", "13to18", "over18")
+# 経過年数の区分の境目（13年未満 / 13年以上18年未満 / 18年以上）
+AGE_THRESHOLDS: Tuple[int, ...] = (13, 18)
+
+
+# ─── 年度別料金表 ─────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class FeeTable:
+    """1 年度分の法定料金（bisect で引けるよう重量区分は昇順の配列で持つ）"""
+    fiscal_year: int
+    jibaiseki: Mapping[Tuple[str, int], int]
+    # 重量区分の上限（kg、昇順）
+    weight_limits_kg: Tuple[float, ...]
+    # 経過年数区分 → weight_limits_kg と同じ並びの重量税（非エコカー / 車検2年）
+    jyuryozei: Mapping[str, Tuple[int, ...]]
+    # 軽自動車の重量税（車検2年）
+    kei_jyuryozei: Mapping[str, int]
+
+
+def _compile_fee_table(
+    fiscal_year: int,
+    jibaiseki: Mapping[Tuple[str, int], int],
+    jyuryozei: Mapping[Tuple[str, float], int],
+    kei_jyuryozei: Mapping[str, int],
+    weight_thresholds_t: Iterable[float],
+) -> FeeTable:
+    thresholds = sorted(weight_thresholds_t)
+    return FeeTable(
+        fiscal_year=fiscal_year,
+        jibaiseki=dict(jibaiseki),
+        weight_limits_kg=tuple(t * 1000.0 for t in thresholds),
+        jyuryozei={
+            age_cat: tuple(jyuryozei.get((age_cat, t), 0) for t in thresholds)
+            for age_cat in AGE_CATEGORIES
+        },
+        kei_jyuryozei=dict(kei_jyuryozei),
+    )
+
+
+# 年度 → 料金表。料金改定時は新しい年度の料金表を追加する（古い年度は残す）
+FEE_TABLES: Dict[int, FeeTable] = {
+    2024: _compile_fee_table(2024, JIBAISEKI_TABLE, JYURYOZEI_TABLE, KEI_JYURYOZEI, WEIGHT_THRESHOLDS),
+}
+_FEE_YEARS: List[int] = sorted(FEE_TABLES)
+
+
+def fiscal_year_of(d: date) -> int:
+    """年度（4月始まり）"""
+    return d.year if d.month >= 4 else d.year - 1
+
+
+def get_fee_table(fiscal_year: int) -> Tuple[FeeTable, List[str]]:
+    """
+    指定年度に有効な料金表（その年度以前で最も新しいもの）と注記を返す。
+    登録より前の年度は最も古い料金表で計算し、その旨を注記する。
+    """
+    idx = bisect_right(_FEE_YEARS, fiscal_year) - 1
+    if idx < 0:
+        oldest = _FEE_YEARS[0]
+        return FEE_TABLES[oldest], [
+            f"{fiscal_year}年度の料金表が未登録のため、{oldest}年度の料金で計算しています。"
+        ]
+    return FEE_TABLES[_FEE_YEARS[idx]], []
+
+
+def fee_table_years() -> List[int]:
+    return list(_FEE_YEARS)
+
+
+# ─── 計算 ────────────────────────────────────────────────────────
+
 def _age_category(vehicle_age: int) -> str:
-    if vehicle_age < 13:
-        return "under13"
-    if vehicle_age < 18:
-        return "13to18"
-    return "over18"
+    return AGE_CATEGORIES[bisect_right(AGE_THRESHOLDS, vehicle_age)]
 
 
-def calc_jibaiseki(vehicle_type: str, months: int) -> Optional[int]:
-    return JIBAISEKI_TABLE.get((vehicle_type, months))
+def _vehicle_age(first_reg_year: int, first_reg_month: int, as_of: date) -> int:
+    return (as_of.year - first_reg_year) + (0 if as_of.month >= first_reg_month else -1)
+
+
+def calc_jibaiseki(vehicle_type: str, months: int, table: Optional[FeeTable] = None) -> Optional[int]:
+    table = table or FEE_TABLES[_FEE_YEARS[-1]]
+    return table.jibaiseki.get((vehicle_type, months))
 
 
 def calc_jyuryozei(
@@ -113,8 +196,10 @@ def calc_jyuryozei(
     vehicle_age: int,
     eco_type: str,
     inspection_years: int,
+    table: Optional[FeeTable] = None,
 ) -> tuple[int, List[str]]:
     """重量税を計算して (fee, notes) を返す。"""
+    table = table or FEE_TABLES[_FEE_YEARS[-1]]
     notes: List[str] = []
     age_cat = _age_category(vehicle_age)
     multiplier = ECO_MULTIPLIERS.get(eco_type, 1.0)
@@ -125,15 +210,16 @@ def calc_jyuryozei(
     is_kei = vehicle_type in ("kei", "kei_business")
 
     if is_kei:
-        base = KEI_JYURYOZEI.get(age_cat, 0)
+        base = table.kei_jyuryozei.get(age_cat, 0)
         fee = int(base * multiplier * year_factor)
     else:
-        weight_tons = weight_kg / 1000.0
-        upper = next((t for t in WEIGHT_THRESHOLDS if weight_tons <= t), None)
-        if upper is None:
-            notes.append("車両重量が3t超のため計算対象外です。個別にご確認ください。")
+        # weight_kg 以上で最小の区分上限
+        idx = bisect_left(table.weight_limits_kg, weight_kg)
+        if idx == len(table.weight_limits_kg):
+            limit_t = table.weight_limits_kg[-1] / 1000.0
+            notes.append(f"車両重量が{limit_t:g}t超のため計算対象外です。個別にご確認ください。")
             return 0, notes
-        base = JYURYOZEI_TABLE.get((age_cat, upper), 0)
+        base = table.jyuryozei[age_cat][idx]
         fee = int(base * multiplier * year_factor)
 
     if eco_type == "exempt":
@@ -149,7 +235,9 @@ def calc_jyuryozei(
     return fee, notes
 
 
-def calculate(
+def _calculate_one(
+    table: FeeTable,
+    as_of: date,
     vehicle_type: str,
     weight_kg: float,
     first_reg_year: int,
@@ -158,16 +246,12 @@ def calculate(
     jibaiseki_months: int,
     inspection_years: int,
 ) -> dict:
-    today = date.today()
-    reg_date = date(first_reg_year, first_reg_month, 1)
-    vehicle_age = (today.year - reg_date.year) + (
-        0 if (today.month, today.day) >= (reg_date.month, 1) else -1
-    )
+    vehicle_age = _vehicle_age(first_reg_year, first_reg_month, as_of)
     age_cat = _age_category(vehicle_age)
 
-    jibaiseki = calc_jibaiseki(vehicle_type, jibaiseki_months)
+    jibaiseki = calc_jibaiseki(vehicle_type, jibaiseki_months, table)
     jyuryozei, notes = calc_jyuryozei(
-        vehicle_type, weight_kg, vehicle_age, eco_type, inspection_years
+        vehicle_type, weight_kg, vehicle_age, eco_type, inspection_years, table
     )
 
     if jibaiseki is None:
@@ -183,5 +267,65 @@ def calculate(
         "total": jibaiseki + jyuryozei,
         "vehicle_age": vehicle_age,
         "age_category": age_cat,
+        "fiscal_year": table.fiscal_year,
         "notes": notes,
     }
+
+
+def calculate_many(
+    vehicles: Iterable[Mapping[str, Any]],
+    *,
+    as_of: Optional[date] = None,
+    fiscal_year: Optional[int] = None,
+) -> Tuple[int, List[dict]]:
+    """
+    複数台をまとめて計算する。料金表は 1 回だけ解決する。
+
+    as_of: 経過年数の基準日（既定は今日）。fiscal_year 未指定ならこの日の年度の料金表を使う
+    Returns (適用した料金表の年度, 車両ごとの結果)
+    """
+    as_of = as_of or date.today()
+    table, table_notes = get_fee_table(fiscal_year if fiscal_year is not None else fiscal_year_of(as_of))
+    results = []
+    for v in vehicles:
+        result = _calculate_one(
+            table,
+            as_of,
+            vehicle_type=v["vehicle_type"],
+            weight_kg=v["weight_kg"],
+            first_reg_year=v["first_reg_year"],
+            first_reg_month=v["first_reg_month"],
+            eco_type=v.get("eco_type", "non_eco"),
+            jibaiseki_months=v.get("jibaiseki_months", 25),
+            inspection_years=v.get("inspection_years", 2),
+        )
+        result["notes"] = table_notes + result["notes"]
+        results.append(result)
+    return table.fiscal_year, results
+
+
+def calculate(
+    vehicle_type: str,
+    weight_kg: float,
+    first_reg_year: int,
+    first_reg_month: int,
+    eco_type: str,
+    jibaiseki_months: int,
+    inspection_years: int,
+    as_of: Optional[date] = None,
+    fiscal_year: Optional[int] = None,
+) -> dict:
+    _, results = calculate_many(
+        [{
+            "vehicle_type": vehicle_type,
+            "weight_kg": weight_kg,
+            "first_reg_year": first_reg_year,
+            "first_reg_month": first_reg_month,
+            "eco_type": eco_type,
+            "jibaiseki_months": jibaiseki_months,
+            "inspection_years": inspection_years,
+        }],
+        as_of=as_of,
+        fiscal_year=fiscal_year,
+    )
+    return results[0]
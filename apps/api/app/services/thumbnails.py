@@ -0,0 +1,263 @@
+# app/services/thumbnails.py
+"""
+画像の派生物（サムネイル）生成。
+
+- 保存キーは「元画像の SHA-256 + 幅 + 形式」で決まるので、同じ画像は一度だけ変換される
+- アップロード時に固定幅（THUMBNAIL_WIDTHS）の WebP をスレッドプールで事前生成する
+- 配信時に未生成のサイズ・形式があれば、その 1 つだけその場で生成して保存する
+- 旧形式（絶対パス）のファイルは派生物を作らず元画像をそのまま返す
+
+環境変数:
+  THUMBNAIL_WORKERS   事前生成の並列数（既定 2）
+  THUMBNAIL_AVIF      1 なら AVIF も事前生成し、Accept に image/avif があれば優先する（既定 0）
+"""
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps, features
+
+from app.services import storage
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+THUMBNAIL_WORKERS = _env_int("THUMBNAIL_WORKERS", 2)
+THUMBNAIL_AVIF = (os.getenv("THUMBNAIL_AVIF") or "0").strip().lower() in ("1", "true", "yes")
+
+# 一覧（160/320）・詳細（640）・拡大表示（1280）
+THUMBNAIL_WIDTHS: Tuple[int, ...] = (160, 320, 640, 1280)
+
+WEBP = "webp"
+AVIF = "avif"
+
+MEDIA_TYPES: Dict[str, str] = {WEBP: "image/webp", AVIF: "image/avif"}
+_QUALITY: Dict[str, int] = {WEBP: 80, AVIF: 60}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _avif_supported() -> bool:
+    try:
+        return bool(features.check("avif"))
+    except Exception:
+        return False
+
+
+def _pregenerate_formats() -> Tuple[str, ...]:
+    if THUMBNAIL_AVIF and _avif_supported():
+        return (WEBP, AVIF)
+    return (WEBP,)
+
+
+def is_thumbnail_target(content_type: Optional[str]) -> bool:
+    ct = (content_type or "").lower()
+    # SVG はベクターなので縮小不要、GIF アニメはフレームが落ちるので対象外
+    return ct.startswith("image/") and ct not in ("image/svg+xml", "image/gif")
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """先頭バイトから画像形式を判定する（content_type を保存していないファイル用）。"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1"):
+        return "image/heic"
+    return None
+
+
+def snap_width(width: int) -> int:
+    """要求幅以上で最小の固定幅に丸める（キャッシュが幅ごとに散らばらないように）。"""
+    for w in THUMBNAIL_WIDTHS:
+        if width <= w:
+            return w
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def choose_format(requested: Optional[str], accept: Optional[str]) -> Optional[str]:
+    """
+    配信形式を決める。None なら元画像を返す。
+
+    requested: webp / avif / auto（None は auto）
+    """
+    fmt = (requested or "auto").lower()
+    if fmt == AVIF:
+        return AVIF if _avif_supported() else WEBP
+    if fmt == WEBP:
+        return WEBP
+
+    accept = (accept or "").lower()
+    if THUMBNAIL_AVIF and "image/avif" in accept and _avif_supported():
+        return AVIF
+    if not accept or "image/webp" in accept or "*/*" in accept or "image/*" in accept:
+        return WEBP
+    return None
+
+
+def _derived_name(width: int, fmt: str) -> str:
+    return f"w{width}.{fmt}"
+
+
+def _prepare(img: Image.Image) -> Image.Image:
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGB", "RGBA"):
+        return img
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def _encode(img: Image.Image, fmt: str) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format=fmt.upper(), quality=_QUALITY[fmt])
+    return out.getvalue()
+
+
+def render(content: bytes, widths: Sequence[int], formats: Iterable[str]) -> Dict[Tuple[int, str], bytes]:
+    """
+    1 回のデコードで複数サイズ・形式を作る。
+
+    大きい幅から順に縮小し、次の幅は直前の縮小結果から作る（毎回元画像から縮小しない）。
+    元画像より大きい幅は拡大せず、元の大きさのまま出力する。
+    """
+    formats = tuple(formats)
+    results: Dict[Tuple[int, str], bytes] = {}
+    with Image.open(io.BytesIO(content)) as src:
+        largest = max(widths)
+        # JPEG は縮小デコードできるので、必要な大きさ以上で最小のスケールで読み込む
+        src.draft("RGB", (largest, largest))
+        img = _prepare(src)
+        for width in sorted(set(widths), reverse=True):
+            if img.width > width:
+                img = img.copy()
+                img.thumbnail((width, img.height), Image.LANCZOS)
+            for fmt in formats:
+                results[(width, fmt)] = _encode(img, fmt)
+    return results
+
+
+def ensure(ref: str, width: int, fmt: str) -> Optional[str]:
+    """派生物のキーを返す（無ければ生成）。内容アドレスでない ref は None。"""
+    sha = storage.sha256_of_ref(ref)
+    if sha is None:
+        return None
+    width = snap_width(width)
+    key = storage.derived_key(sha, _derived_name(width, fmt))
+    if storage.exists(key):
+        return key
+
+    data = render(storage.read_bytes(ref), [width], [fmt])[(width, fmt)]
+    storage.put_bytes(key, data, content_type=MEDIA_TYPES[fmt])
+    return key
+
+
+def generate_all(ref: str) -> int:
+    """固定幅すべての派生物を作る（作成済みは飛ばす）。戻り値は新規作成数。"""
+    sha = storage.sha256_of_ref(ref)
+    if sha is None:
+        return 0
+
+    missing = [
+        (w, fmt)
+        for w in THUMBNAIL_WIDTHS
+        for fmt in _pregenerate_formats()
+        if not storage.exists(storage.derived_key(sha, _derived_name(w, fmt)))
+    ]
+    if not missing:
+        return 0
+
+    rendered = render(
+        storage.read_bytes(ref),
+        sorted({w for w, _ in missing}),
+        sorted({fmt for _, fmt in missing}),
+    )
+    for (w, fmt) in missing:
+        storage.put_bytes(
+            storage.derived_key(sha, _derived_name(w, fmt)),
+            rendered[(w, fmt)],
+            content_type=MEDIA_TYPES[fmt],
+        )
+    return len(missing)
+
+
+def variant(
+    ref: str,
+    *,
+    content_type: Optional[str],
+    width: Optional[int],
+    fmt: Optional[str],
+    accept: Optional[str],
+) -> Tuple[str, Optional[str]]:
+    """
+    配信する ref とメディアタイプを返す。
+
+    width 未指定・画像以外・旧形式パス・Accept 非対応・生成失敗のときは元画像。
+    """
+    if not width or not is_thumbnail_target(content_type) or not storage.is_cas_ref(ref):
+        return ref, content_type
+
+    chosen = choose_format(fmt, accept)
+    if chosen is None:
+        return ref, content_type
+
+    try:
+        key = ensure(ref, width, chosen)
+    except Exception:
+        logger.warning("Thumbnail generation failed: %s", ref, exc_info=True)
+        return ref, content_type
+    if key is None:
+        return ref, content_type
+    return key, MEDIA_TYPES[chosen]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Pillow は縮小・エンコード中に GIL を解放するのでスレッドで並列になる
+                _executor = ThreadPoolExecutor(
+                    max_workers=THUMBNAIL_WORKERS,
+                    thread_name_prefix="thumbnails",
+                )
+    return _executor
+
+
+def _safe_generate(ref: str) -> None:
+    try:
+        generate_all(ref)
+    except Exception:
+        logger.warning("Thumbnail pre-generation failed: %s", ref, exc_info=True)
+
+
+def enqueue(ref: str, content_type: Optional[str]) -> None:
+    """アップロード直後に固定幅のサムネイルをバックグラウンドで作る。"""
+    if not is_thumbnail_target(content_type) or not storage.is_cas_ref(ref):
+        return
+    _get_executor().submit(_safe_generate, ref)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
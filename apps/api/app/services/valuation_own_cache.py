@@ -0,0 +1,503 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Mapping, Optional
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.car import SOLD_STATUSES, Car
+from app.models.valuation_own_cache import ValuationOwnCache
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+# 差分集計の実行間隔（秒）
+VALUATION_OWN_CACHE_TICK_SEC = _env_int("VALUATION_OWN_CACHE_TICK_SEC", 600)
+
+# 年式は ±1 年（3 年幅）、走行距離は 2 万 km 刻みでバケット化する
+YEAR_BUCKET_SPAN = 3
+MILEAGE_BUCKET_KM = 20_000
+MILEAGE_BUCKET_MAX_KM = 200_000
+
+# 1 回のトランザクションで集計する車両数
+AGGREGATE_BATCH_SIZE = 500
+
+# 集計の同時実行を 1 つにするアドバイザリロックのキー
+_LOCK_KEY = "valuation_own_cache"
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+# ============================================================
+# Bucketing
+# ============================================================
+def _normalize_key_part(s: Optional[str]) -> str:
+    """valuation_service のキャッシュキー正規化と揃える（trim / lowercase / 空白圧縮）。"""
+    s = (s or "").strip().lower()
+    return " ".join(s.split())
+
+
+def year_center(year: int) -> int:
+    """年式を YEAR_BUCKET_SPAN 年幅のバケット中心に丸める（例: 2016/2017/2018 -> 2017、2019/2020/2021 -> 2020）。"""
+    return (int(year) // YEAR_BUCKET_SPAN) * YEAR_BUCKET_SPAN + YEAR_BUCKET_SPAN // 2
+
+
+def mileage_bucket(mileage: int) -> str:
+    """走行距離を "0-20000" 形式のバケット文字列にする。上限超えは "200000+"。"""
+    m = max(0, int(mileage))
+    if m >= MILEAGE_BUCKET_MAX_KM:
+        return f"{MILEAGE_BUCKET_MAX_KM}+"
+    lo = (m // MILEAGE_BUCKET_KM) * MILEAGE_BUCKET_KM
+    return f"{lo}-{lo + MILEAGE_BUCKET_KM}"
+
+
+def bucket_key(*, make: str, model: str, grade: Optional[str], year: int, mileage: int) -> tuple:
+    return (
+        _normalize_key_part(make),
+        _normalize_key_part(model),
+        _normalize_key_part(grade),
+        year_center(year),
+        mileage_bucket(mileage),
+    )
+
+
+# ============================================================
+# Streaming median (P² algorithm, Jain & Chlamtac 1985)
+# ============================================================
+_P = 0.5
+_DN = (0.0, _P / 2, _P, (1 + _P) / 2, 1.0)
+
+
+@dataclass
+class P2Median:
+    """
+    P² アルゴリズムによる中央値の逐次推定。
+
+    5 個のマーカー（最小 / 第1四分位 / 中央値 / 第3四分位 / 最大）だけを保持し、
+    観測値を 1 件ずつ O(1) で取り込む。5 件未満の間は生の値をそのまま持つ。
+    状態は JSON にそのまま保存できる。
+    """
+
+    n: int = 0
+    q: list[float] = field(default_factory=list)
+    pos: list[float] = field(default_factory=list)
+    desired: list[float] = field(default_factory=list)
+
+    @classmethod
+    def from_state(cls, state: Optional[Mapping[str, Any]]) -> "P2Median":
+        if not state:
+            return cls()
+        try:
+            return cls(
+                n=int(state.get("n", 0)),
+                q=[float(x) for x in state.get("q", [])],
+                pos=[float(x) for x in state.get("pos", [])],
+                desired=[float(x) for x in state.get("desired", [])],
+            )
+        except (TypeError, ValueError):
+            logger.warning("Invalid P2 sketch state; starting over.", exc_info=True)
+            return cls()
+
+    def to_state(self) -> dict:
+        return {"n": self.n, "q": self.q, "pos": self.pos, "desired": self.desired}
+
+    def add(self, x: float) -> None:
+        x = float(x)
+        self.n += 1
+
+        if self.n <= 5:
+            self.q.append(x)
+            if self.n == 5:
+                self.q.sort()
+                self.pos = [1.0, 2.0, 3.0, 4.0, 5.0]
+                self.desired = [1.0, 1 + 2 * _P, 1 + 4 * _P, 3 + 2 * _P, 5.0]
+            return
+
+        q, pos = self.q, self.pos
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.desired[i] += _DN[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not (q[i - 1] < candidate < q[i + 1]):
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (pos[i + step] - pos[i])
+                q[i] = candidate
+                pos[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _small_sorted(self) -> list[float]:
+        return sorted(self.q)
+
+    def median(self) -> Optional[int]:
+        if self.n == 0:
+            return None
+        if self.n < 5:
+            s = self._small_sorted()
+            mid = len(s) // 2
+            v = s[mid] if len(s) % 2 else (s[mid - 1] + s[mid]) / 2
+            return int(round(v))
+        return int(round(self.q[2]))
+
+    def quartiles(self) -> Optional[tuple[int, int]]:
+        """(第1四分位, 第3四分位) の推定値。5 件未満は最小 / 最大で代用する。"""
+        if self.n == 0:
+            return None
+        if self.n < 5:
+            s = self._small_sorted()
+            return int(round(s[0])), int(round(s[-1]))
+        return int(round(self.q[1])), int(round(self.q[3]))
+
+
+# ============================================================
+# Aggregation job
+# ============================================================
+def _lock(db: Session) -> None:
+    # 並行実行（定期実行と管理画面の手動実行など）で同じ車両を二重集計しない。commit で外れる
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": _LOCK_KEY})
+
+
+def _pending_sold_cars_stmt(store_id=None, limit: int = AGGREGATE_BATCH_SIZE):
+    stmt = (
+        select(Car)
+        .where(
+            Car.valuation_aggregated_at.is_(None),
+            Car.status.in_(SOLD_STATUSES),
+            Car.expected_sell_price.isnot(None),
+            Car.expected_sell_price > 0,
+            Car.year.isnot(None),
+            Car.mileage.isnot(None),
+        )
+        .order_by(Car.updated_at)
+        .limit(limit)
+    )
+    if store_id is not None:
+        stmt = stmt.where(Car.store_id == store_id)
+    return stmt
+
+
+def _contribution(car: Car) -> Optional[tuple]:
+    """車両が今集計に入るなら (バケットキー, 売価)、入らないなら None"""
+    if (
+        car.status not in SOLD_STATUSES
+        or not car.expected_sell_price
+        or car.expected_sell_price <= 0
+        or car.year is None
+        or car.mileage is None
+    ):
+        return None
+    key = bucket_key(make=car.make, model=car.model, grade=car.grade, year=car.year, mileage=car.mileage)
+    return key, int(car.expected_sell_price)
+
+
+def _recorded_contribution(db: Session, car: Car) -> Optional[tuple]:
+    """集計したときの (バケットキー, 売価)。どのバケットに入れたか分からなければ None"""
+    if car.valuation_bucket_id is None or car.valuation_aggregated_price is None:
+        return None
+    row = db.get(ValuationOwnCache, car.valuation_bucket_id)
+    if row is None:
+        return None
+    key = (row.make, row.model, row.grade, row.year_center, row.mileage_bucket)
+    return key, int(car.valuation_aggregated_price)
+
+
+def _reset_changed(db: Session, store_id=None) -> int:
+    """
+    集計した後に更新された車両を見直す。戻り値は作り直すバケット数。
+
+    - 集計に効く値（ステータス・売価・メーカー / 車種 / グレード / 年式 / 走行距離）が変わっていなければ、
+      集計済みの日時だけ進める
+    - 変わっていれば、その車両を入れたバケットだけを作り直す
+      （P² スケッチからは取り込んだ値を取り除けないので、バケットの車両を未集計に戻して取り込み直す）
+    - どのバケットに入れたか分からない車両（記録前に集計したもの）は店舗ごと作り直す
+    """
+    stmt = select(Car).where(
+        Car.valuation_aggregated_at.isnot(None),
+        Car.updated_at > Car.valuation_aggregated_at,
+    )
+    if store_id is not None:
+        stmt = stmt.where(Car.store_id == store_id)
+    cars = db.execute(stmt).scalars().all()
+
+    unchanged: list = []
+    buckets: set = set()
+    stores: set = set()
+    for car in cars:
+        recorded = _recorded_contribution(db, car)
+        if recorded is None:
+            stores.add(car.store_id)
+        elif recorded == _contribution(car):
+            unchanged.append(car.id)
+        else:
+            buckets.add(car.valuation_bucket_id)
+
+    if unchanged:
+        db.execute(
+            update(Car)
+            .where(Car.id.in_(unchanged))
+            # 車両の更新日時は変えない（onupdate を抑える）
+            .values(valuation_aggregated_at=func.now(), updated_at=Car.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+    for sid in stores:
+        _reset_store(db, sid)
+    buckets = {
+        b for b in buckets
+        if b is not None and db.get(ValuationOwnCache, b) is not None
+    }
+    if buckets:
+        _reset_buckets(db, buckets)
+    return len(buckets)
+
+
+def _reset_buckets(db: Session, bucket_ids: set) -> None:
+    """バケットの集計を捨てて、そこに入れた車両を未集計に戻す。"""
+    db.execute(
+        update(Car)
+        .where(Car.valuation_bucket_id.in_(bucket_ids))
+        # 車両の更新日時は変えない（onupdate を抑える）
+        .values(
+            valuation_aggregated_at=None,
+            valuation_bucket_id=None,
+            valuation_aggregated_price=None,
+            updated_at=Car.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(ValuationOwnCache)
+        .where(ValuationOwnCache.id.in_(bucket_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _reset_store(db: Session, store_id) -> None:
+    """店舗の集計を捨てて、全車両を未集計に戻す。"""
+    db.execute(
+        update(Car)
+        .where(Car.store_id == store_id, Car.valuation_aggregated_at.isnot(None))
+        # 車両の更新日時は変えない（onupdate を抑える）
+        .values(
+            valuation_aggregated_at=None,
+            valuation_bucket_id=None,
+            valuation_aggregated_price=None,
+            updated_at=Car.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(delete(ValuationOwnCache).where(ValuationOwnCache.store_id == store_id))
+
+
+def _load_bucket_row(db: Session, store_id, key: tuple) -> ValuationOwnCache:
+    make, model, grade, yc, mb = key
+    # 行が無ければ作る（並行実行でも一意制約で 1 行に収束させる）
+    db.execute(
+        pg_insert(ValuationOwnCache)
+        .values(
+            store_id=store_id,
+            make=make,
+            model=model,
+            grade=grade,
+            year_center=yc,
+            mileage_bucket=mb,
+            own_count=0,
+        )
+        .on_conflict_do_nothing(
+            index_elements=["store_id", "make", "model", "grade", "year_center", "mileage_bucket"]
+        )
+    )
+    return db.execute(
+        select(ValuationOwnCache)
+        .where(
+            ValuationOwnCache.store_id == store_id,
+            ValuationOwnCache.make == make,
+            ValuationOwnCache.model == model,
+            ValuationOwnCache.grade == grade,
+            ValuationOwnCache.year_center == yc,
+            ValuationOwnCache.mileage_bucket == mb,
+        )
+        .with_for_update()
+    ).scalar_one()
+
+
+def refresh_own_cache(db: Session, *, store_id=None, batch_size: int = AGGREGATE_BATCH_SIZE) -> int:
+    """
+    未集計の販売済み車両を valuation_own_cache に取り込む（差分集計）。
+
+    - 車両ごとに cars.valuation_aggregated_at を立てるので、何度実行しても二重計上しない
+    - 中央値は P² スケッチで逐次更新する（過去の販売価格を読み直して並べ替えない）
+    - 集計後に売価・ステータス・車種などが変わった車両（売価の訂正・売約の取り消しなど）は、
+      その車両を入れたバケットだけを作り直す
+    - batch_size 件ごとに commit する
+
+    store_id を省略すると全店舗が対象。戻り値は取り込んだ車両数。
+    """
+    _lock(db)
+    rebuilt = _reset_changed(db, store_id)
+    db.commit()
+    if rebuilt:
+        logger.info("valuation_own_cache: rebuilding %d buckets with updated cars", rebuilt)
+
+    total = 0
+    while True:
+        _lock(db)
+        cars = db.execute(_pending_sold_cars_stmt(store_id, batch_size)).scalars().all()
+        if not cars:
+            db.commit()
+            break
+
+        now = datetime.now(timezone.utc)
+        rows: dict[tuple, ValuationOwnCache] = {}
+        sketches: dict[tuple, P2Median] = {}
+
+        for car in cars:
+            key = bucket_key(
+                make=car.make,
+                model=car.model,
+                grade=car.grade,
+                year=car.year,
+                mileage=car.mileage,
+            )
+            rk = (car.store_id, *key)
+            if rk not in rows:
+                rows[rk] = _load_bucket_row(db, car.store_id, key)
+                sketches[rk] = P2Median.from_state(rows[rk].sketch)
+            sketches[rk].add(car.expected_sell_price)
+            car.valuation_bucket_id = rows[rk].id
+            car.valuation_aggregated_price = int(car.expected_sell_price)
+            # onupdate の updated_at と同じ DB の now() にする（集計した更新を「集計後の変更」と見なさない）
+            car.valuation_aggregated_at = func.now()
+
+        for rk, row in rows.items():
+            sk = sketches[rk]
+            row.sketch = sk.to_state()
+            row.own_count = sk.n
+            row.own_median_price = sk.median()
+            row.updated_at = now
+
+        db.commit()
+        total += len(cars)
+        if len(cars) < batch_size:
+            break
+
+    if total:
+        logger.info("valuation_own_cache: aggregated %d sold cars (store_id=%s)", total, store_id)
+    return total
+
+
+# ============================================================
+# Worker
+# ============================================================
+def run_once() -> int:
+    with SessionLocal() as db:
+        return refresh_own_cache(db)
+
+
+def _loop() -> None:
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception:
+            logger.warning("valuation_own_cache: aggregation failed.", exc_info=True)
+        _stop.wait(VALUATION_OWN_CACHE_TICK_SEC)
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="valuation-own-cache", daemon=True)
+    _thread.start()
+
+
+def shutdown() -> None:
+    """集計中のバッチは commit されずに終わり、次回の実行で取り込み直す"""
+    global _thread
+    _stop.set()
+    _thread = None
+
+
+# ============================================================
+# Lookup
+# ============================================================
+@dataclass(frozen=True)
+class OwnMarket:
+    count: int
+    low: int
+    median: int
+    high: int
+
+
+def get_own_market(
+    db: Session,
+    *,
+    store_id,
+    make: str,
+    model: str,
+    grade: str,
+    year: int,
+    mileage: int,
+) -> Optional[OwnMarket]:
+    """自社販売実績の中央値（と四分位）を返す。実績が無ければ None。"""
+    make_n, model_n, grade_n, yc, mb = bucket_key(
+        make=make, model=model, grade=grade, year=year, mileage=mileage
+    )
+    row = db.execute(
+        select(ValuationOwnCache).where(
+            ValuationOwnCache.store_id == store_id,
+            ValuationOwnCache.make == make_n,
+            ValuationOwnCache.model == model_n,
+            ValuationOwnCache.grade == grade_n,
+            ValuationOwnCache.year_center == yc,
+            ValuationOwnCache.mileage_bucket == mb,
+        )
+    ).scalar_one_or_none()
+    if row is None or not row.own_count or not row.own_median_price:
+        return None
+
+    quartiles = P2Median.from_state(row.sketch).quartiles()
+    median = int(row.own_median_price)
+    low, high = quartiles if quartiles else (median, median)
+    return OwnMarket(
+        count=int(row.own_count),
+        low=min(low, median),
+        median=median,
+        high=max(high, median),
+    )
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 
 from app.models.valuation_settings import ValuationSettings
 from app.models.valuation_cache_external import ValuationCacheExternal
+from app.services.valuation_own_cache import OwnMarket, get_own_market
 
 logger = logging.getLogger(__name__)
 
@@ -331,6 +332,12 @@ def _get_market_price_external_with_cache(
     grade: str,
     year: int,
     mileage: int,
+    market_zip: str,
+    market_radius_miles: int,
+    market_miles_band: int,
+    market_car_type: str,
+    market_currency: str,
+    market_fx_rate: float,
 ) -> MarketPrice:
     now = _now_utc()
 
@@ -408,6 +415,34 @@ def _get_market_price_external_with_cache(
         raise UpstreamUnavailableError("External market provider failed and no valid cache found.") from None
 
 
+# ============================================================
+# Own sales history (valuation_own_cache)
+# ============================================================
+# 自社実績がこの件数以上あれば外部相場を呼ばずに自社中央値のみで査定する
+OWN_ONLY_MIN_COUNT = 10
+# この件数以上あれば外部相場とブレンドする（未満は外部相場のみ）
+OWN_BLEND_MIN_COUNT = 3
+# ブレンド重み w = n / (n + prior)。件数が増えるほど自社実績を重視する
+OWN_BLEND_PRIOR = 5
+
+
+def _market_from_own(own: OwnMarket) -> MarketPrice:
+    return MarketPrice(low=own.low, median=own.median, high=own.high)
+
+
+def _blend_market(own: OwnMarket, external: MarketPrice) -> MarketPrice:
+    w = Decimal(own.count) / Decimal(own.count + OWN_BLEND_PRIOR)
+
+    def mix(a: int, b: int) -> int:
+        return int((Decimal(a) * w + Decimal(b) * (Decimal("1") - w)).to_integral_value(rounding="ROUND_HALF_UP"))
+
+    return MarketPrice(
+        low=mix(own.low, external.low),
+        median=mix(own.median, external.median),
+        high=mix(own.high, external.high),
+    )
+
+
 # ============================================================
 # Product-ready valuation logic
 # ============================================================
@@ -425,22 +460,52 @@ def calculate_valuation(
 
     provider = getattr(settings, "provider", None) or "MAT"
 
-    market = _get_market_price_external_with_cache(
+    own = get_own_market(
         db,
         store_id=store_id,
-        provider=provider,
         make=make,
         model=model,
         grade=grade,
         year=year,
         mileage=mileage,
-        market_zip=getattr(settings, "market_zip", "90210"),
-        market_radius_miles=int(getattr(settings, "market_radius_miles", 200)),
-        market_miles_band=int(getattr(settings, "market_miles_band", 10000)),
-        market_car_type=getattr(settings, "market_car_type", "used"),
-        market_currency=getattr(settings, "market_currency", "USD"),
-        market_fx_rate=float(getattr(settings, "market_fx_rate", 150)),
     )
+    own_count = own.count if own else 0
+
+    if own and own.count >= OWN_ONLY_MIN_COUNT:
+        # 自社実績が十分 → 外部 API を呼ばない（オフラインでも査定可能）
+        market = _market_from_own(own)
+        source = "own"
+    else:
+        try:
+            external = _get_market_price_external_with_cache(
+                db,
+                store_id=store_id,
+                provider=provider,
+                make=make,
+                model=model,
+                grade=grade,
+                year=year,
+                mileage=mileage,
+                market_zip=getattr(settings, "market_zip", "90210"),
+                market_radius_miles=int(getattr(settings, "market_radius_miles", 200)),
+                market_miles_band=int(getattr(settings, "market_miles_band", 10000)),
+                market_car_type=getattr(settings, "market_car_type", "used"),
+                market_currency=getattr(settings, "market_currency", "USD"),
+                market_fx_rate=float(getattr(settings, "market_fx_rate", 150)),
+            )
+        except UpstreamUnavailableError:
+            if not own or own.count < OWN_BLEND_MIN_COUNT:
+                raise
+            logger.warning("External market unavailable; using own sales history only.")
+            market = _market_from_own(own)
+            source = "own"
+        else:
+            if own and own.count >= OWN_BLEND_MIN_COUNT:
+                market = _blend_market(own, external)
+                source = "blend"
+            else:
+                market = external
+                source = "market"
 
     unit = max(1, _to_int_safe(getattr(settings, "round_unit_yen", 1000), default=1000))
 
@@ -495,4 +560,6 @@ def calculate_valuation(
         "recommended_price": recommended_price,
         "expected_profit": expected_profit,
         "expected_profit_rate": float(expected_profit_rate),
+        "source": source,
+        "own_count": own_count,
     }
@@ -0,0 +1,249 @@
+# app/services/work_catalog.py
+"""
+作業マスタ・整備プリセットのカタログキャッシュ。
+
+- 見積画面で毎回読まれるが、ほとんど変わらないので店舗ごとにプロセス内へキャッシュする
+  （システムデフォルト store_id=NULL + 店舗固有の行）
+- 作業マスタは vehicle_category → [工賃付きの作業] の索引を作成時に作っておき、
+  /work-masters/by-vehicle-category はリクエストごとに rates を走査しない
+- 作業マスタ・工賃・プリセットの追加 / 更新 / 削除（ORM 経由）で該当店舗のキャッシュを捨てる。
+  flush 時と commit 時の両方で捨てるので、commit 前の内容が残ることはない。
+  システムデフォルトの変更は全店舗分を捨てる
+- 他プロセスでの変更・生 SQL での変更は WORK_CATALOG_TTL_SEC 秒で反映する
+- カタログごとに内容のハッシュから ETag を作る（プロセスをまたいでも同じ内容なら同じ ETag）。
+  If-None-Match が一致すれば 304 を返せる
+
+環境変数:
+  WORK_CATALOG_TTL_SEC   キャッシュの有効秒数（既定 300）
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import Request, Response
+from sqlalchemy import event, or_, select
+from sqlalchemy.orm import Session, object_session, selectinload
+from sqlalchemy.orm.util import identity_key
+
+from app.models.maintenance_preset import MaintenancePresetORM
+from app.models.work_master import WorkMasterORM, WorkMasterRateORM
+from app.schemas.maintenance_preset import MaintenancePresetOut
+from app.schemas.work_master import WorkMasterForVehicle, WorkMasterOut
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+WORK_CATALOG_TTL_SEC = _env_int("WORK_CATALOG_TTL_SEC", 300)
+
+# カタログの種類
+WORK_MASTERS = "work_masters"
+PRESETS = "presets"
+
+# すべての店舗を表すキー（システムデフォルトの変更）
+ALL_STORES = "*"
+
+# Session.info に変更のあった (種類, 店舗) を貯めるキー
+_PENDING_KEY = "work_catalog_pending"
+
+
+@dataclass
+class WorkCatalog:
+    """作業マスタのカタログ（1 店舗分）"""
+    items: List[WorkMasterOut]
+    # vehicle_category → 有効な作業（工賃付き、並び順は items と同じ）
+    by_vehicle_category: Dict[str, List[WorkMasterForVehicle]]
+    etag: str
+    built_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class PresetCatalog:
+    """整備プリセットのカタログ（1 店舗分）"""
+    items: List[MaintenancePresetOut]
+    by_vehicle_category: Dict[str, List[MaintenancePresetOut]]
+    etag: str
+    built_at: float = field(default_factory=time.monotonic)
+
+
+_cache: Dict[Tuple[str, Optional[UUID]], Any] = {}
+# invalidate のたびに進める（作成中に変更があったカタログはキャッシュしない）
+_generation: Dict[str, int] = {WORK_MASTERS: 0, PRESETS: 0}
+_cache_lock = threading.Lock()
+
+
+# ============================================================
+# 無効化
+# ============================================================
+def invalidate(kind: str, store_id: Any = ALL_STORES) -> None:
+    """指定店舗（ALL_STORES なら全店舗）のカタログを捨てる。"""
+    with _cache_lock:
+        _generation[kind] += 1
+        if store_id == ALL_STORES or store_id is None:
+            for key in [k for k in _cache if k[0] == kind]:
+                del _cache[key]
+        else:
+            _cache.pop((kind, store_id), None)
+
+
+def _rate_store_id(session: Optional[Session], rate: WorkMasterRateORM) -> Any:
+    """工賃の変更 → 作業マスタの店舗。flush 中は SQL を出せないので identity map から引く。"""
+    if session is None or rate.work_master_id is None:
+        return ALL_STORES
+    wm = session.identity_map.get(identity_key(WorkMasterORM, rate.work_master_id))
+    return wm.store_id if wm is not None else ALL_STORES
+
+
+def _on_change(kind: str):
+    def listener(_mapper, _connection, target) -> None:
+        session = object_session(target)
+        if isinstance(target, WorkMasterRateORM):
+            store_id = _rate_store_id(session, target)
+        else:
+            store_id = target.store_id
+        invalidate(kind, store_id)
+        if session is not None:
+            session.info.setdefault(_PENDING_KEY, set()).add((kind, store_id))
+    return listener
+
+
+for _model, _kind in (
+    (WorkMasterORM, WORK_MASTERS),
+    (WorkMasterRateORM, WORK_MASTERS),
+    (MaintenancePresetORM, PRESETS),
+):
+    for _ev in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _ev, _on_change(_kind))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    # flush 後・commit 前に他のリクエストが作ったカタログ（古い内容）も捨てる
+    pending: Set[Tuple[str, Any]] = session.info.pop(_PENDING_KEY, set())
+    for kind, store_id in pending:
+        invalidate(kind, store_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ============================================================
+# 作成
+# ============================================================
+def _etag(items: List[Any]) -> str:
+    body = json.dumps([i.model_dump(mode="json") for i in items], sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _build_work(db: Session, store_id: Optional[UUID]) -> WorkCatalog:
+    rows = db.execute(
+        select(WorkMasterORM)
+        .where(or_(WorkMasterORM.store_id == store_id, WorkMasterORM.store_id.is_(None)))
+        .options(selectinload(WorkMasterORM.rates))
+        .order_by(WorkMasterORM.sort_order, WorkMasterORM.work_name)
+    ).scalars().all()
+
+    items = [WorkMasterOut.model_validate(wm) for wm in rows]
+    index: Dict[str, List[WorkMasterForVehicle]] = {}
+    for wm in items:
+        if not wm.is_active:
+            continue
+        seen: Set[str] = set()
+        for rate in wm.rates:
+            # 同じ車種の工賃が複数ある場合は最初の 1 件（従来の next(...) と同じ）
+            if rate.vehicle_category in seen:
+                continue
+            seen.add(rate.vehicle_category)
+            index.setdefault(rate.vehicle_category, []).append(WorkMasterForVehicle(
+                id=wm.id, work_name=wm.work_name, work_category=wm.work_category,
+                store_id=wm.store_id, is_active=wm.is_active, sort_order=wm.sort_order,
+                duration_minutes=rate.duration_minutes, price=rate.price,
+            ))
+    return WorkCatalog(items=items, by_vehicle_category=index, etag=_etag(items))
+
+
+def _build_presets(db: Session, store_id: Optional[UUID]) -> PresetCatalog:
+    rows = db.execute(
+        select(MaintenancePresetORM)
+        .where(
+            or_(
+                MaintenancePresetORM.store_id == store_id,
+                MaintenancePresetORM.store_id.is_(None),
+            )
+        )
+        .order_by(MaintenancePresetORM.sort_order, MaintenancePresetORM.name)
+    ).scalars().all()
+
+    items = [MaintenancePresetOut.model_validate(r) for r in rows]
+    index: Dict[str, List[MaintenancePresetOut]] = {}
+    for p in items:
+        index.setdefault(p.vehicle_category, []).append(p)
+    return PresetCatalog(items=items, by_vehicle_category=index, etag=_etag(items))
+
+
+_BUILDERS = {WORK_MASTERS: _build_work, PRESETS: _build_presets}
+
+
+def _get(kind: str, db: Session, store_id: Optional[UUID]):
+    key = (kind, store_id)
+    cached = _cache.get(key)
+    if cached is not None and time.monotonic() - cached.built_at < WORK_CATALOG_TTL_SEC:
+        return cached
+
+    generation = _generation[kind]
+    catalog = _BUILDERS[kind](db, store_id)
+    with _cache_lock:
+        if generation == _generation[kind]:
+            _cache[key] = catalog
+    return catalog
+
+
+def get_work_catalog(db: Session, store_id: Optional[UUID]) -> WorkCatalog:
+    return _get(WORK_MASTERS, db, store_id)
+
+
+def get_preset_catalog(db: Session, store_id: Optional[UUID]) -> PresetCatalog:
+    return _get(PRESETS, db, store_id)
+
+
+# ============================================================
+# ETag
+# ============================================================
+def variant_etag(etag: str, variant: str) -> str:
+    """同じカタログから絞り込んだレスポンス用の ETag（カタログが変われば必ず変わる）"""
+    if not variant:
+        return etag
+    digest = hashlib.sha256(f"{etag}:{variant}".encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == bare for t in header.split(","))
+
+
+def conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    ETag を付ける。If-None-Match が一致すれば 304 のレスポンスを返す（呼び出し側はそれを返す）。
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match")
+    if inm and _etag_matches(inm, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
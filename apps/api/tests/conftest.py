@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401  全モデルを登録する（relationship の解決に必要）
+from app.models.base import Base
+
+
+def _with_dependencies(names):
+    """外部キーの参照先も含めたテーブル（作成順）"""
+    tables = {Base.metadata.tables[n] for n in names}
+    pending = list(tables)
+    while pending:
+        for fk in pending.pop().foreign_keys:
+            if fk.column.table not in tables:
+                tables.add(fk.column.table)
+                pending.append(fk.column.table)
+    return [t for t in Base.metadata.sorted_tables if t in tables]
+
+
+@pytest.fixture()
+def db_tables(request):
+    """テストモジュールの TABLES と、その外部キーの参照先"""
+    return _with_dependencies(request.module.TABLES)
+
+
+@pytest.fixture()
+def session_factory(request, db_tables, tmp_path, monkeypatch):
+    """
+    テストモジュールの TABLES を作った SQLite の sessionmaker。
+
+    - SESSION_MODULES に並べたモジュールの SessionLocal をこの sessionmaker に差し替える
+    - FILE_DB = True のモジュールは接続を共有しないファイル DB を使う
+      （commit 前の内容が別セッションから見えてはいけないテスト用）
+    """
+    if getattr(request.module, "FILE_DB", False):
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    else:
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=db_tables)
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    for module in getattr(request.module, "SESSION_MODULES", ()):
+        monkeypatch.setattr(module, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
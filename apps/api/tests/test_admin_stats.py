@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.models.license import LicenseORM
+from app.services import admin_stats
+
+TABLES = ("licenses", "users")
+
+
+@pytest.fixture()
+def db(session_factory):
+    with session_factory() as session:
+        yield session
+
+
+def _fill_cache():
+    # 他のリクエストが commit 前の状態で集計してキャッシュした状態
+    admin_stats._cache = {"stale": True}
+
+
+def test_bulk_update_invalidates_after_commit(db):
+    _fill_cache()
+    db.execute(
+        update(LicenseORM)
+        .where(LicenseORM.store_id == uuid.uuid4())
+        .values(referral_discount=1000)
+        .execution_options(synchronize_session=False)
+    )
+    assert admin_stats._cache is None
+
+    _fill_cache()
+    db.commit()
+    assert admin_stats._cache is None
+
+
+def test_orm_flush_invalidates_after_commit(db):
+    db.add(LicenseORM(store_id=uuid.uuid4(), plan="starter", status="active", billing_cycle="monthly"))
+    db.flush()
+    _fill_cache()
+    db.commit()
+    assert admin_stats._cache is None
+
+
+def test_rollback_forgets_pending_change(db):
+    db.execute(update(LicenseORM).values(referral_discount=0).execution_options(synchronize_session=False))
+    db.rollback()
+
+    _fill_cache()
+    db.commit()
+    assert admin_stats._cache == {"stale": True}
+
+
+def _license(db, *, plan="starter", status="active", cycle="monthly", discount=0, changed_days_ago=None):
+    lic = LicenseORM(
+        store_id=uuid.uuid4(),
+        plan=plan,
+        status=status,
+        billing_cycle=cycle,
+        referral_discount=discount,
+    )
+    db.add(lic)
+    db.flush()
+    if changed_days_ago is not None:
+        lic.status_changed_at = datetime.now(timezone.utc) - timedelta(days=changed_days_ago)
+    return lic
+
+
+def test_summary_sums_mrr_from_plan_prices(db):
+    _license(db, plan="starter", discount=1000)
+    _license(db, plan="starter", cycle="yearly")
+    _license(db, plan="pro")
+    # active 以外は MRR に入れない
+    _license(db, plan="pro", status="trial")
+    # 料金表に無いプランは 0 円
+    _license(db, plan="legacy")
+    db.commit()
+
+    summary = admin_stats.compute_summary(db)
+    plans = {p["plan"]: p for p in summary["plans"]}
+
+    assert plans["starter"]["mrr"] == 9_800 + round(105_840 / 12)
+    assert plans["starter"]["referral_discount"] == 1000
+    assert plans["pro"]["mrr"] == 29_800
+    assert plans["legacy"]["mrr"] == 0
+    assert summary["mrr"] == 9_800 + round(105_840 / 12) + 29_800
+    assert summary["referral_discount"] == 1000
+
+
+def test_summary_counts_active_and_churn_by_status_change(db):
+    for _ in range(3):
+        _license(db, plan="standard")
+    _license(db, plan="standard", status="trial")
+    _license(db, plan="standard", status="expired", changed_days_ago=5)
+    _license(db, plan="standard", status="suspended", changed_days_ago=29)
+    # 窓の外で解約したものは数えない
+    old = _license(db, plan="standard", status="expired", changed_days_ago=45)
+    db.commit()
+
+    # 解約後に他の列を更新しても（updated_at が進んでも）解約日は変わらない
+    old.notes = "memo"
+    db.commit()
+
+    summary = admin_stats.compute_summary(db)
+    (plan,) = summary["plans"]
+    assert plan["total"] == 7
+    assert plan["active"] == 3
+    assert plan["trial"] == 1
+    assert plan["expired"] == 2
+    assert plan["suspended"] == 1
+    assert plan["churned_30d"] == 2
+    assert plan["churn_rate_30d"] == round(2 / 5, 4)
+    assert summary["licenses_active"] == 3
+    assert summary["churned_30d"] == 2
+
+
+def test_status_change_records_status_changed_at(db):
+    lic = _license(db, status="active", changed_days_ago=100)
+    db.commit()
+    before = lic.status_changed_at
+
+    lic.status = "active"
+    db.commit()
+    assert lic.status_changed_at == before
+
+    lic.status = "expired"
+    db.commit()
+    assert lic.status_changed_at > before
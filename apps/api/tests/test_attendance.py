@@ -0,0 +1,150 @@
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from app.models.attendance import AttendanceORM
+from app.models.base import Base
+from app.models.store import StoreORM
+from app.models.user import User
+from app.routes import attendance
+
+TABLES = ("attendance",)
+
+START, END = date(2026, 3, 1), date(2026, 3, 31)
+
+
+def _timesheet(db, user, **kwargs):
+    params = {"month": None, "start_date": None, "end_date": None, "user_id": None}
+    params.update(kwargs)
+    return attendance.get_timesheet(**params, db=db, user=user)
+
+
+class _CaptureDb:
+    """実行された文を記録して空の結果を返す"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        return SimpleNamespace(all=lambda: [])
+
+
+def _staff(role="staff"):
+    return SimpleNamespace(id=uuid.uuid4(), store_id=uuid.uuid4(), role=role)
+
+
+def test_timesheet_aggregates_in_one_query():
+    db = _CaptureDb()
+    staff = _staff()
+
+    out = _timesheet(db, staff, month="2026-02")
+
+    assert (out.start_date, out.end_date) == (date(2026, 2, 1), date(2026, 2, 28))
+    assert (out.items, out.total_minutes) == ([], 0)
+    (stmt,) = db.statements
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.count("count(*) FILTER (WHERE") == 2
+    assert "sum(greatest(EXTRACT(epoch FROM attendance.clock_out - attendance.clock_in)" in sql
+    assert "GROUP BY attendance.user_id" in sql
+    # スタッフは自分の分だけ
+    assert staff.id in compiled.params.values()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"month": "2026/03"},
+        {"start_date": START},
+        {"start_date": END, "end_date": START},
+    ],
+    ids=["bad-month", "half-range", "reversed"],
+)
+def test_timesheet_rejects_invalid_periods(kwargs):
+    with pytest.raises(HTTPException) as exc:
+        _timesheet(_CaptureDb(), _staff(), **kwargs)
+    assert exc.value.status_code == 400
+
+
+# ============================================================
+# PostgreSQL（FILTER / EXTRACT(epoch) の集計結果）
+# ============================================================
+PG_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+@pytest.fixture()
+def pg_factory(db_tables):
+    if not PG_URL.startswith("postgresql"):
+        pytest.skip("TEST_DATABASE_URL (PostgreSQL) is not set")
+    # 使い捨てのスキーマに作る（既存のテーブルには触れない）
+    schema = f"test_attendance_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(PG_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    engine = create_engine(PG_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        Base.metadata.create_all(engine, tables=db_tables)
+        yield sessionmaker(bind=engine, expire_on_commit=False)
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+def _shift(user, day, clock_in=None, minutes=None):
+    """day 日の clock_in 時（JST）から minutes 分の勤務。minutes=None は退勤打刻なし"""
+    start = None
+    if clock_in is not None:
+        start = datetime(2026, 3, 1, clock_in, tzinfo=attendance.JST) + timedelta(days=day - 1)
+    return AttendanceORM(
+        store_id=user.store_id,
+        user_id=user.id,
+        work_date=date(2026, 3, 1) + timedelta(days=day - 1),
+        clock_in=start,
+        clock_out=start + timedelta(minutes=minutes) if start is not None and minutes is not None else None,
+    )
+
+
+def test_timesheet_counts_days_and_sums_worked_minutes(pg_factory):
+    store_id = uuid.uuid4()
+    with pg_factory() as db:
+        db.add(StoreORM(id=store_id, name="テスト店"))
+        admin = User(email="admin@example.com", name="管理者", store_id=store_id, role="admin")
+        staff = User(email="staff@example.com", name="スタッフ", store_id=store_id, role="staff")
+        db.add_all([admin, staff])
+        db.flush()
+        db.add_all([
+            _shift(staff, 2, 9, 8 * 60 + 30),
+            _shift(staff, 3, 9, 7 * 60 + 59),
+            _shift(staff, 4, 9),       # 退勤打刻なし
+            _shift(staff, 5),          # 打刻なし（日数には入る）
+            _shift(staff, 6, 22, -30), # 退勤が出勤より前は 0 分
+            _shift(admin, 31, 23, 90), # 日付をまたぐ勤務
+        ])
+        # 期間外
+        db.add(AttendanceORM(store_id=store_id, user_id=staff.id, work_date=date(2026, 4, 1),
+                             clock_in=datetime(2026, 4, 1, tzinfo=timezone.utc),
+                             clock_out=datetime(2026, 4, 1, 8, tzinfo=timezone.utc)))
+        db.commit()
+
+    with pg_factory() as db:
+        out = _timesheet(db, admin, start_date=START, end_date=END)
+        own = _timesheet(db, staff, month="2026-03", user_id=admin.id)
+
+    rows = {i.user_email: (i.days, i.completed_days, i.incomplete_days, i.total_minutes) for i in out.items}
+    assert rows == {
+        "staff@example.com": (5, 3, 1, 8 * 60 + 30 + 7 * 60 + 59),
+        "admin@example.com": (1, 1, 0, 90),
+    }
+    assert out.total_minutes == 8 * 60 + 30 + 7 * 60 + 59 + 90
+    # スタッフは user_id を指定しても自分の分だけ
+    assert [i.user_email for i in own.items] == ["staff@example.com"]
@@ -0,0 +1,106 @@
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.db.session import get_db
+from app.deps.auth import get_current_user
+from app.models.instruction_order import InstructionOrderORM
+from app.routes.calendar import router as calendar_router
+
+TABLES = ("instruction_orders",)
+
+STORE_ID = uuid.uuid4()
+
+
+@pytest.fixture()
+def client(session_factory):
+    def _db():
+        with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(calendar_router)
+    app.dependency_overrides[get_db] = _db
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(store_id=STORE_ID)
+    return TestClient(app)
+
+
+def _order(factory, received_at, due_at, *, store_id=STORE_ID, memo=None) -> str:
+    with factory() as db:
+        row = InstructionOrderORM(
+            store_id=store_id,
+            received_at=received_at,
+            due_at=due_at,
+            status="in_progress",
+            memo=memo,
+        )
+        db.add(row)
+        db.commit()
+        return str(row.id)
+
+
+def _at(day, hour=0, minute=0):
+    return datetime(2026, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+def test_events_include_orders_touching_the_range_boundaries(client, session_factory):
+    received_last_day = _order(session_factory, _at(10, 23, 59), _at(20))
+    due_first_day = _order(session_factory, datetime(2026, 2, 20, tzinfo=timezone.utc), _at(1))
+    spanning = _order(session_factory, datetime(2026, 2, 1, tzinfo=timezone.utc), _at(31))
+    # 範囲外: to の翌日 0:00 受付、from の前日に期限
+    _order(session_factory, _at(11), _at(20))
+    _order(session_factory, datetime(2026, 2, 1, tzinfo=timezone.utc),
+           datetime(2026, 2, 28, 23, 59, tzinfo=timezone.utc))
+    _order(session_factory, _at(5), _at(6), store_id=uuid.uuid4())
+
+    res = client.get("/calendar/events", params={"from": "2026-03-01", "to": "2026-03-10"})
+
+    assert res.status_code == 200
+    assert [e["id"] for e in res.json()] == [due_first_day, received_last_day, spanning]
+    event = res.json()[1]
+    assert (event["start"], event["end"], event["title"]) == ("2026-03-10", "2026-03-20", "指示書")
+
+
+def test_day_includes_orders_received_or_due_that_day(client, session_factory):
+    received = _order(session_factory, _at(10, 23, 59), _at(12))
+    due = _order(session_factory, _at(8), _at(10))
+    _order(session_factory, _at(11), _at(12))
+    _order(session_factory, _at(8), _at(9, 23, 59))
+
+    res = client.get("/calendar/day", params={"date": "2026-03-10"})
+
+    assert res.status_code == 200
+    assert res.json()["date"] == "2026-03-10"
+    assert [i["id"] for i in res.json()["items"]] == [due, received]
+
+
+def test_matching_if_none_match_returns_304(client, session_factory):
+    _order(session_factory, _at(1), _at(5))
+    params = {"from": "2026-03-01", "to": "2026-03-31"}
+
+    first = client.get("/calendar/events", params=params)
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["cache-control"].startswith("private, max-age=")
+
+    for inm in (etag, etag.removeprefix("W/"), f'"other", {etag}'):
+        res = client.get("/calendar/events", params=params, headers={"If-None-Match": inm})
+        assert res.status_code == 304, inm
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+
+    # 内容が変われば ETag も変わり、古い ETag では 304 にならない
+    _order(session_factory, _at(2), _at(6), memo="追加")
+    res = client.get("/calendar/events", params=params, headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+    assert len(res.json()) == 2
+
+
+def test_invalid_range_is_rejected(client):
+    res = client.get("/calendar/events", params={"from": "2026-03-10", "to": "2026-03-01"})
+    assert res.status_code == 400
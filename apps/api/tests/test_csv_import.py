@@ -0,0 +1,174 @@
+import io
+import uuid
+
+from app.services import csv_import
+
+
+HEADER = "顧客名,フリガナ,電話番号\r\n"
+
+
+class _FakeDB:
+    """
+    existing_keys の SELECT には existing（(キー, id) のリスト）を返し、
+    INSERT / UPDATE は executed に、アドバイザリロックは locks に記録するだけ。
+    """
+
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.executed = []
+        self.locks = []
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        if stmt.is_insert or stmt.is_update:
+            self.executed.append(("insert" if stmt.is_insert else "update", params))
+        elif params is not None:
+            self.locks.append(params["k"])
+        return self
+
+    def all(self):
+        return self.existing
+
+    def commit(self):
+        self.commits += 1
+
+
+def _rows(data: bytes):
+    text_io = csv_import.open_text(io.BytesIO(data))
+    try:
+        return text_io.encoding, [row for _, row in csv_import.iter_rows(text_io)]
+    finally:
+        text_io.detach()
+
+
+def test_cp932_extension_chars_after_sniff_window():
+    # 判定範囲（先頭 SNIFF_BYTES）は Shift-JIS でも読める文字だけ、その後に NEC 拡張文字
+    filler = "山田太郎,ヤマダタロウ,000\r\n" * (csv_import.SNIFF_BYTES // 20 + 1)
+    data = (HEADER + filler + "①テスト,㈱テスト,0120\r\n").encode("cp932")
+    assert len(data) > csv_import.SNIFF_BYTES
+
+    encoding, rows = _rows(data)
+
+    assert encoding == "cp932"
+    assert rows[-1]["顧客名"] == "①テスト"
+    assert rows[-1]["フリガナ"] == "㈱テスト"
+
+
+def test_sniff_skips_ascii_only_prefix():
+    filler = "abc,def,000\r\n" * (csv_import.SNIFF_BYTES // 10 + 1)
+    data = (HEADER + filler + "山田,ヤマダ,0120\r\n").encode("cp932")
+
+    encoding, rows = _rows(data)
+
+    assert encoding == "cp932"
+    assert rows[-1]["顧客名"] == "山田"
+
+
+def test_utf8_with_bom():
+    encoding, rows = _rows(("\ufeff" + HEADER + "①山田,ヤマダ,0120\r\n").encode("utf-8"))
+
+    assert encoding == "utf-8-sig"
+    assert rows[0]["顧客名"] == "①山田"
+
+
+def test_undecodable_row_is_reported_not_replaced():
+    data = (HEADER + "山田,ヤマダ,0120\r\n").encode("cp932") + b"\x82\xff\x80,x,0999\r\n"
+
+    stats = csv_import.run_import(
+        _FakeDB(),
+        csv_import.CUSTOMER_SPEC,
+        io.BytesIO(data),
+        store_id=uuid.uuid4(),
+        dry_run=True,
+    )
+
+    assert stats.total == 2
+    assert stats.valid == 1
+    assert stats.errors == 1
+    assert stats.error_summary == {"文字コード不正": 1}
+    bad = next(r for r in stats.rows if r.status == "error")
+    assert bad.row == 3
+    assert "顧客名" in bad.reason
+    # 表示用のデータは JSON に入れられる形（サロゲートを残さない）
+    bad.data["顧客名"].encode("utf-8")
+
+
+def test_upsert_updates_single_match_and_rejects_ambiguous_key():
+    only_id, family_a, family_b = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    db = _FakeDB(existing=[("0120", only_id), ("0999", family_a), ("0999", family_b)])
+    data = (HEADER + "山田,ヤマダ,0120\r\n佐藤,サトウ,0999\r\n鈴木,スズキ,0555\r\n").encode("cp932")
+
+    stats = csv_import.run_import(
+        db,
+        csv_import.CUSTOMER_SPEC,
+        io.BytesIO(data),
+        store_id=uuid.uuid4(),
+        mode=csv_import.MODE_UPSERT,
+    )
+
+    assert (stats.imported, stats.updated, stats.errors) == (2, 1, 1)
+    assert list(stats.error_summary) == ["電話番号登録済み（複数）"]
+
+    executed = dict(db.executed)
+    assert [r["name"] for r in executed["insert"]] == ["鈴木"]
+    [updated] = executed["update"]
+    assert updated["id"] == only_id
+    assert updated["name"] == "山田"
+    # 上書きしない列は UPDATE に含めない
+    assert "store_id" not in updated and "created_at" not in updated
+
+
+def test_insert_mode_skips_registered_key():
+    db = _FakeDB(existing=[("0120", uuid.uuid4())])
+    data = (HEADER + "山田,ヤマダ,0120\r\n").encode("cp932")
+
+    stats = csv_import.run_import(db, csv_import.CUSTOMER_SPEC, io.BytesIO(data), store_id=uuid.uuid4())
+
+    assert (stats.imported, stats.errors) == (0, 1)
+    assert db.executed == []
+
+
+def test_upsert_keeps_existing_values_for_blank_cells():
+    only_id = uuid.uuid4()
+    db = _FakeDB(existing=[("0120", only_id)])
+    data = ("顧客名,フリガナ,敬称,電話番号\r\n" "山田,,,0120\r\n" "鈴木,,,0555\r\n").encode("cp932")
+
+    stats = csv_import.run_import(
+        db,
+        csv_import.CUSTOMER_SPEC,
+        io.BytesIO(data),
+        store_id=uuid.uuid4(),
+        mode=csv_import.MODE_UPSERT,
+    )
+
+    assert (stats.imported, stats.updated) == (2, 1)
+    executed = dict(db.executed)
+    [updated] = executed["update"]
+    assert updated["id"] == only_id
+    assert updated["name"] == "山田"
+    # 空欄の列は SET に含めない（登録済みのフリガナ・敬称を消さない）
+    assert "name_kana" not in updated and "honorific" not in updated
+    # 新規登録は空欄の敬称に既定値を入れる
+    [inserted] = executed["insert"]
+    assert inserted["honorific"] == "御中"
+
+
+def test_chunks_are_serialized_per_store_and_kind():
+    store_id = uuid.uuid4()
+    db = _FakeDB()
+    data = (HEADER + "山田,ヤマダ,0120\r\n佐藤,サトウ,0999\r\n鈴木,スズキ,0555\r\n").encode("cp932")
+
+    csv_import.run_import(db, csv_import.CUSTOMER_SPEC, io.BytesIO(data), store_id=store_id, chunk_rows=2)
+
+    # チャンクごとに突き合わせの前でロックし、commit で外す
+    assert db.locks == [f"csv_import:customers:{store_id}"] * 2
+    assert db.commits == 2
+
+
+def test_dry_run_does_not_lock():
+    db = _FakeDB()
+    data = (HEADER + "山田,ヤマダ,0120\r\n").encode("cp932")
+
+    csv_import.run_import(db, csv_import.CUSTOMER_SPEC, io.BytesIO(data), store_id=uuid.uuid4(), dry_run=True)
+
+    assert db.locks == [] and db.executed == []
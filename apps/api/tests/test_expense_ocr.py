@@ -0,0 +1,114 @@
+import uuid
+
+from sqlalchemy import select
+
+from app.models.expense_attachment import ExpenseAttachmentORM
+from app.services import expense_ocr
+
+TABLES = ("expense_attachments",)
+SESSION_MODULES = (expense_ocr,)
+
+
+def _add(factory, store_id, *, status, text=None, content_type="image/jpeg") -> uuid.UUID:
+    with factory() as db:
+        row = ExpenseAttachmentORM(
+            store_id=store_id,
+            expense_id=uuid.uuid4(),
+            filename="receipt.jpg",
+            content_type=content_type,
+            storage_path=f"local:{uuid.uuid4().hex}",
+            ocr_text=text,
+            ocr_status=status,
+        )
+        db.add(row)
+        db.commit()
+        return row.id
+
+
+def _statuses(factory) -> dict:
+    with factory() as db:
+        return dict(db.execute(select(ExpenseAttachmentORM.id, ExpenseAttachmentORM.ocr_status)).all())
+
+
+def test_mark_pending_skips_running_attachments(session_factory):
+    store_id = uuid.uuid4()
+    none = _add(session_factory, store_id, status=expense_ocr.OCR_NONE)
+    pending = _add(session_factory, store_id, status=expense_ocr.OCR_PENDING)
+    running = _add(session_factory, store_id, status=expense_ocr.OCR_RUNNING)
+    failed = _add(session_factory, store_id, status=expense_ocr.OCR_FAILED, text="partial")
+    done = _add(session_factory, store_id, status=expense_ocr.OCR_DONE, text="ok")
+    pdf = _add(session_factory, store_id, status=expense_ocr.OCR_NONE, content_type="application/pdf")
+    other_store = _add(session_factory, uuid.uuid4(), status=expense_ocr.OCR_NONE)
+
+    ids = expense_ocr._mark_pending(store_id, only_missing=True)
+    assert set(ids) == {none, pending, failed}
+
+    ids = expense_ocr._mark_pending(store_id, only_missing=False)
+    assert set(ids) == {none, pending, failed, done}
+
+    statuses = _statuses(session_factory)
+    assert statuses[running] == expense_ocr.OCR_RUNNING
+    assert statuses[pdf] == expense_ocr.OCR_NONE
+    assert statuses[other_store] == expense_ocr.OCR_NONE
+
+
+def test_process_attachment_only_runs_claimed_rows(session_factory, monkeypatch):
+    store_id = uuid.uuid4()
+    pending = _add(session_factory, store_id, status=expense_ocr.OCR_PENDING)
+    running = _add(session_factory, store_id, status=expense_ocr.OCR_RUNNING)
+    ocr_calls = []
+
+    def fake_ocr(content, lang):
+        ocr_calls.append(lang)
+        return "領収書"
+
+    monkeypatch.setattr(expense_ocr.storage, "read_bytes", lambda path: b"jpeg")
+    monkeypatch.setattr(expense_ocr, "_ocr_image_bytes", fake_ocr)
+
+    # 他のワーカーが running にしたものは OCR しない
+    assert expense_ocr.process_attachment(running) is None
+    assert expense_ocr.process_attachment(uuid.uuid4()) is None
+    assert ocr_calls == []
+
+    assert expense_ocr.process_attachment(pending) == expense_ocr.OCR_DONE
+    # 2 回目は pending ではないので取れない
+    assert expense_ocr.process_attachment(pending) is None
+    assert ocr_calls == [expense_ocr.DEFAULT_LANG]
+
+    with session_factory() as db:
+        row = db.get(ExpenseAttachmentORM, pending)
+    assert row.ocr_status == expense_ocr.OCR_DONE
+    assert row.ocr_text == "領収書"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.sleeps.append(sec)
+        self.now += sec
+
+
+def test_run_bulk_paces_to_per_minute_and_skips_unclaimed(monkeypatch):
+    clock = _Clock()
+    results = iter([expense_ocr.OCR_DONE, None, expense_ocr.OCR_FAILED, expense_ocr.OCR_DONE])
+
+    def fake_process(attachment_id):
+        clock.now += 0.5  # OCR に 0.5 秒かかる
+        return next(results)
+
+    monkeypatch.setattr(expense_ocr, "time", clock)
+    monkeypatch.setattr(expense_ocr, "process_attachment", fake_process)
+    store_id = uuid.uuid4()
+    expense_ocr._bulk_running.add(store_id)
+
+    expense_ocr._run_bulk(store_id, [uuid.uuid4() for _ in range(4)], per_minute=30)
+
+    # 毎分 30 件 = 2 秒に 1 件。取れなかった（None）分は待たない
+    assert clock.sleeps == [1.5, 1.5, 1.5]
+    assert store_id not in expense_ocr._bulk_running
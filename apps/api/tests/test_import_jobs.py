@@ -0,0 +1,147 @@
+import uuid
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.models.import_job import ImportJobORM
+from app.services import import_jobs
+
+TABLES = ("import_jobs",)
+SESSION_MODULES = (import_jobs,)
+
+
+@pytest.fixture(autouse=True)
+def _stub_storage(monkeypatch):
+    monkeypatch.setattr(import_jobs.storage, "copy_to", lambda ref, f: f.write(b"x"))
+    # SQLite にはアドバイザリロックが無い
+    monkeypatch.setattr(import_jobs, "_lock_file", lambda db, ref: None)
+
+
+@pytest.fixture()
+def deleted_files(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(import_jobs.storage, "delete", deleted.append)
+    return deleted
+
+
+def _create_job(factory, *, file_ref="ref", status=import_jobs.QUEUED, finished_hours_ago=None) -> uuid.UUID:
+    finished_at = None
+    if finished_hours_ago is not None:
+        finished_at = import_jobs._utcnow() - timedelta(hours=finished_hours_ago)
+    with factory() as db:
+        job = ImportJobORM(
+            store_id=uuid.uuid4(),
+            kind="customers",
+            mode="insert",
+            dry_run=False,
+            file_ref=file_ref,
+            bytes_total=1,
+            status=status,
+            finished_at=finished_at,
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+
+
+def _expire_heartbeat(factory, job_id) -> None:
+    with factory() as db:
+        db.execute(
+            update(ImportJobORM)
+            .where(ImportJobORM.id == job_id)
+            .values(heartbeat_at=import_jobs._utcnow() - timedelta(seconds=import_jobs.IMPORT_JOB_STALE_SEC + 1))
+        )
+        db.commit()
+
+
+def _get(factory, job_id) -> ImportJobORM:
+    with factory() as db:
+        return db.get(ImportJobORM, job_id)
+
+
+def test_claim_is_exclusive_until_heartbeat_is_stale(session_factory):
+    job_id = _create_job(session_factory)
+
+    first = import_jobs._claim(job_id)
+    assert first is not None
+    assert import_jobs._claim(job_id) is None
+
+    _expire_heartbeat(session_factory, job_id)
+    second = import_jobs._claim(job_id)
+    assert second is not None and second != first
+    assert _get(session_factory, job_id).claim_token == second
+
+
+def test_worker_stops_after_losing_the_lease(session_factory, monkeypatch):
+    job_id = _create_job(session_factory)
+    chunks = []
+
+    def fake_run_import(db, spec, f, *, on_chunk, stats, **kwargs):
+        # 1 チャンク目の途中で止まったと判定され、他のワーカーに取り直される
+        _expire_heartbeat(session_factory, job_id)
+        assert import_jobs._claim(job_id) is not None
+        stats.imported = 100
+        on_chunk(stats, 102, 10)
+        chunks.append("committed")
+        db.commit()
+        return stats
+
+    monkeypatch.setattr(import_jobs.csv_import, "run_import", fake_run_import)
+    import_jobs.run_job(job_id)
+
+    job = _get(session_factory, job_id)
+    assert chunks == []
+    # 進捗も状態も、取り直したワーカーのまま
+    assert job.status == import_jobs.RUNNING
+    assert job.next_row == 2
+    assert job.stats is None
+
+
+def test_owner_saves_progress_and_finishes(session_factory, monkeypatch):
+    job_id = _create_job(session_factory)
+
+    def fake_run_import(db, spec, f, *, on_chunk, stats, **kwargs):
+        stats.imported = 1
+        on_chunk(stats, 3, 1)
+        db.commit()
+        return stats
+
+    monkeypatch.setattr(import_jobs.csv_import, "run_import", fake_run_import)
+    import_jobs.run_job(job_id)
+
+    job = _get(session_factory, job_id)
+    assert job.status == import_jobs.DONE
+    assert job.next_row == 3
+    assert job.stats["imported"] == 1
+
+
+def test_cleanup_deletes_file_once_no_job_needs_it(session_factory, deleted_files):
+    old = import_jobs.IMPORT_JOB_FILE_RETENTION_HOURS + 1
+    expired = _create_job(session_factory, file_ref="cas/expired", status=import_jobs.DONE, finished_hours_ago=old)
+    recent = _create_job(session_factory, file_ref="cas/recent", status=import_jobs.FAILED, finished_hours_ago=1)
+    # 同じ内容のファイルを、まだ終わっていないジョブも参照している
+    _create_job(session_factory, file_ref="cas/shared", status=import_jobs.FAILED, finished_hours_ago=old)
+    _create_job(session_factory, file_ref="cas/shared", status=import_jobs.RUNNING)
+
+    assert import_jobs.cleanup_files() == 1
+
+    assert deleted_files == ["cas/expired"]
+    assert _get(session_factory, expired).file_deleted_at is not None
+    assert _get(session_factory, recent).file_deleted_at is None
+    # 2 回目は何もしない
+    assert import_jobs.cleanup_files() == 0
+
+
+def test_retry_is_rejected_after_file_is_deleted(session_factory, deleted_files):
+    job_id = _create_job(
+        session_factory,
+        status=import_jobs.FAILED,
+        finished_hours_ago=import_jobs.IMPORT_JOB_FILE_RETENTION_HOURS + 1,
+    )
+    import_jobs.cleanup_files()
+
+    with session_factory() as db:
+        with pytest.raises(import_jobs.FileExpiredError):
+            import_jobs.retry_job(db, db.get(ImportJobORM, job_id))
+    assert _get(session_factory, job_id).status == import_jobs.FAILED
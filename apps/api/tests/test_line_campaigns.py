@@ -0,0 +1,129 @@
+import uuid
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app.models.line_campaign import LineCampaignORM
+from app.models.line_customer import LineCustomerORM
+from app.models.line_message import LineMessageORM
+from app.models.line_setting import LineSettingORM
+from app.services import line_campaigns
+
+TABLES = ("line_campaigns", "line_customers", "line_messages", "line_settings")
+SESSION_MODULES = (line_campaigns,)
+
+
+@pytest.fixture(autouse=True)
+def _small_batches(monkeypatch):
+    monkeypatch.setattr(line_campaigns, "LINE_CAMPAIGN_BATCH", 2)
+
+
+def _create_campaign(factory, friends: int) -> uuid.UUID:
+    store_id = uuid.uuid4()
+    with factory() as db:
+        db.add(LineSettingORM(store_id=store_id, channel_access_token="token"))
+        for i in range(friends):
+            db.add(LineCustomerORM(store_id=store_id, line_user_id=f"U{i:03d}", follow_status="following"))
+        campaign = LineCampaignORM(
+            store_id=store_id,
+            message="hello",
+            segment={},
+            status=line_campaigns.QUEUED,
+        )
+        db.add(campaign)
+        db.commit()
+        return campaign.id
+
+
+def _expire_heartbeat(factory, campaign_id) -> None:
+    with factory() as db:
+        db.execute(
+            update(LineCampaignORM)
+            .where(LineCampaignORM.id == campaign_id)
+            .values(heartbeat_at=line_campaigns._utcnow() - timedelta(seconds=line_campaigns.LINE_CAMPAIGN_STALE_SEC + 1))
+        )
+        db.commit()
+
+
+def _logged(factory, campaign_id) -> int:
+    with factory() as db:
+        return db.execute(
+            select(func.count()).select_from(LineMessageORM).where(LineMessageORM.campaign_id == campaign_id)
+        ).scalar_one()
+
+
+def test_claim_is_exclusive_until_heartbeat_is_stale(session_factory):
+    campaign_id = _create_campaign(session_factory, friends=0)
+
+    first = line_campaigns._claim(campaign_id)
+    assert first is not None
+    assert line_campaigns._claim(campaign_id) is None
+
+    _expire_heartbeat(session_factory, campaign_id)
+    second = line_campaigns._claim(campaign_id)
+    assert second is not None and second != first
+
+
+def test_sends_every_chunk_once(session_factory, monkeypatch):
+    campaign_id = _create_campaign(session_factory, friends=5)
+    sent_to = []
+
+    def fake_multicast(user_ids, message, token):
+        sent_to.extend(user_ids)
+        return list(user_ids), {}
+
+    monkeypatch.setattr(line_campaigns.line_service, "multicast_message", fake_multicast)
+    line_campaigns.run_campaign(campaign_id)
+
+    with session_factory() as db:
+        campaign = db.get(LineCampaignORM, campaign_id)
+    assert campaign.status == line_campaigns.DONE
+    assert (campaign.total, campaign.sent) == (5, 5)
+    assert sorted(sent_to) == [f"U{i:03d}" for i in range(5)]
+    assert _logged(session_factory, campaign_id) == 5
+
+
+def test_worker_stops_when_another_worker_reclaims(session_factory, monkeypatch):
+    campaign_id = _create_campaign(session_factory, friends=5)
+    calls = []
+
+    def slow_multicast(user_ids, message, token):
+        # 1 バッチ目の送信中（Retry-After 待ちなど）に heartbeat が途絶え、他のワーカーが取り直す
+        calls.append(list(user_ids))
+        if len(calls) == 1:
+            _expire_heartbeat(session_factory, campaign_id)
+            assert line_campaigns._claim(campaign_id) is not None
+        return list(user_ids), {}
+
+    monkeypatch.setattr(line_campaigns.line_service, "multicast_message", slow_multicast)
+    line_campaigns.run_campaign(campaign_id)
+
+    # 残りのバッチは送らない。送ったバッチのログは残す
+    assert len(calls) == 1
+    assert _logged(session_factory, campaign_id) == 2
+    with session_factory() as db:
+        campaign = db.get(LineCampaignORM, campaign_id)
+    # 状態は取り直したワーカーのまま（元のワーカーが done にしない）
+    assert campaign.status == line_campaigns.RUNNING
+    assert campaign.sent == 0
+
+
+def test_cancel_stops_before_next_chunk(session_factory, monkeypatch):
+    campaign_id = _create_campaign(session_factory, friends=5)
+    calls = []
+
+    def multicast_then_cancel(user_ids, message, token):
+        calls.append(list(user_ids))
+        with session_factory() as db:
+            line_campaigns.cancel_campaign(db, db.get(LineCampaignORM, campaign_id))
+        return list(user_ids), {}
+
+    monkeypatch.setattr(line_campaigns.line_service, "multicast_message", multicast_then_cancel)
+    line_campaigns.run_campaign(campaign_id)
+
+    assert len(calls) == 1
+    with session_factory() as db:
+        campaign = db.get(LineCampaignORM, campaign_id)
+    assert campaign.status == line_campaigns.CANCELLED
+    assert campaign.sent == 2
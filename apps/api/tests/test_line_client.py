@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services import line_client
+from app.services.line_client import LineApiError, LineClient, TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(line_client, "_retry_delay", lambda resp, attempt: 0.0)
+
+
+def _client(handler) -> LineClient:
+    client = LineClient("token")
+    client._http = httpx.AsyncClient(base_url=line_client.LINE_API_BASE, transport=httpx.MockTransport(handler))
+    return client
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_waits_for_refill(monkeypatch):
+    clock = _Clock()
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(sec):
+        clock.sleeps.append(sec)
+        clock.now += sec
+        await real_sleep(0)
+
+    monkeypatch.setattr(line_client, "time", clock)
+    monkeypatch.setattr(line_client.asyncio, "sleep", fake_sleep)
+
+    async def scenario():
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(5):
+            await bucket.acquire()
+
+    asyncio.run(scenario())
+    # 3 回はまとめて取れ、その後は秒間 2 回（0.5 秒に 1 回）
+    assert clock.sleeps == [0.5, 0.5]
+    assert clock.now == 1.0
+
+
+def test_send_many_dedupes_and_multicasts_in_chunks_of_500(monkeypatch):
+    monkeypatch.setattr(line_client, "MULTICAST_MAX_RECIPIENTS", 3)
+    calls = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        calls.append((request.url.path, body["to"], request.headers.get("X-Line-Retry-Key")))
+        if "U5" in body["to"]:
+            return httpx.Response(400, text="invalid")
+        return httpx.Response(200, json={})
+
+    client = _client(handler)
+    users = ["U1", "U2", "U1", "U3", "U4", "", "U5", "U6", "U7"]
+    sent, failed = asyncio.run(client.send_many(users, [{"type": "text", "text": "hi"}]))
+
+    assert sorted(to for _, to, _ in calls) == [["U1", "U2", "U3"], ["U4", "U5", "U6"], ["U7"]]
+    assert all(path.endswith("/message/multicast") and key for path, _, key in calls)
+    assert sent == ["U1", "U2", "U3", "U7"]
+    assert set(failed) == {"U4", "U5", "U6"}
+    assert "400" in failed["U5"]
+
+
+def test_send_many_uses_push_for_a_single_recipient():
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        return httpx.Response(200, json={})
+
+    sent, failed = asyncio.run(_client(handler).send_many(["U1", "U1"], [{"type": "text", "text": "hi"}]))
+    assert paths == ["/v2/bot/message/push"]
+    assert sent == ["U1"] and failed == {}
+
+
+@pytest.mark.parametrize(
+    "outcome",
+    [httpx.Response(500, text="oops"), httpx.ReadTimeout("read timed out")],
+    ids=["5xx", "read-timeout"],
+)
+def test_reply_is_not_retried_once_sent(outcome):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with pytest.raises(LineApiError):
+        asyncio.run(_client(handler).reply("rt", [{"type": "text", "text": "hi"}]))
+    assert len(calls) == 1
+
+
+def test_reply_is_retried_when_not_sent():
+    outcomes = [httpx.ConnectError("refused"), httpx.Response(429), httpx.Response(200, json={})]
+
+    def handler(request):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    asyncio.run(_client(handler).reply("rt", [{"type": "text", "text": "hi"}]))
+    assert outcomes == []
+
+
+def test_push_is_retried_on_5xx_with_the_same_retry_key():
+    keys = []
+
+    def handler(request):
+        keys.append(request.headers["X-Line-Retry-Key"])
+        return httpx.Response(503 if len(keys) == 1 else 200, json={})
+
+    asyncio.run(_client(handler).push("U1", [{"type": "text", "text": "hi"}]))
+    assert len(keys) == 2 and keys[0] == keys[1]
+
+
+def test_evicted_client_closes_after_in_flight_request():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(200, json={})
+
+        client = _client(handler)
+        task = asyncio.ensure_future(client.push("U1", [{"type": "text", "text": "hi"}]))
+        await asyncio.sleep(0)
+
+        await client.close_when_idle()
+        assert not client._http.is_closed
+
+        release.set()
+        await task
+        assert client._http.is_closed
+
+    asyncio.run(scenario())
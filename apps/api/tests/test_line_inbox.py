@@ -0,0 +1,66 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models.line_webhook_event import LineWebhookEventORM
+from app.services import line_inbox
+
+TABLES = ("line_webhook_events", "line_settings", "line_customers", "line_messages")
+SESSION_MODULES = (line_inbox,)
+
+
+@pytest.fixture(autouse=True)
+def _limits(monkeypatch):
+    monkeypatch.setattr(line_inbox, "LINE_INBOX_MAX_ATTEMPTS", 3)
+
+
+def _queue(factory, payloads) -> list:
+    store_id = uuid.uuid4()
+    base = datetime.now(timezone.utc)
+    with factory() as db:
+        rows = [
+            LineWebhookEventORM(
+                store_id=store_id,
+                payload=payload,
+                status=line_inbox.QUEUED,
+                attempts=0,
+                created_at=base + timedelta(milliseconds=i),
+            )
+            for i, payload in enumerate(payloads)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [r.id for r in rows]
+
+
+def test_one_bad_event_does_not_fail_the_rest_of_the_batch(session_factory, monkeypatch):
+    apply = line_inbox._apply
+
+    def failing_apply(db, batch, settings, profiles):
+        if any(ev.get("bad") for _, _, ev, _ in batch):
+            raise ValueError("bad event")
+        return apply(db, batch, settings, profiles)
+
+    monkeypatch.setattr(line_inbox, "_apply", failing_apply)
+    payloads = [{"type": "unfollow", "source": {"userId": f"U{i}"}} for i in range(5)]
+    payloads[3]["bad"] = True
+    ids = _queue(session_factory, payloads)
+
+    asyncio.run(line_inbox.drain())
+
+    with session_factory() as db:
+        events = {
+            ev.id: ev
+            for ev in db.execute(select(LineWebhookEventORM)).scalars().all()
+        }
+    bad = events[ids[3]]
+    assert bad.status == line_inbox.FAILED
+    assert bad.attempts == line_inbox.LINE_INBOX_MAX_ATTEMPTS
+    assert "bad event" in bad.error
+    # 同じバッチの他のイベントは 1 回目で done になり、試行回数も進まない
+    for ev_id in ids[:3] + ids[4:]:
+        assert events[ev_id].status == line_inbox.DONE
+        assert events[ev_id].attempts == 1
@@ -0,0 +1,93 @@
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from app.routes import loaner_cars
+
+
+def _res(start, end):
+    return SimpleNamespace(start_date=date(2026, 3, start), end_date=date(2026, 3, end))
+
+
+def _slots(reservations, start=1, end=31):
+    return [
+        (s.start_date.day, s.end_date.day)
+        for s in loaner_cars._free_slots(reservations, date(2026, 3, start), date(2026, 3, end))
+    ]
+
+
+@pytest.mark.parametrize(
+    "reservations, expected",
+    [
+        ([], [(1, 31)]),
+        ([_res(10, 12)], [(1, 9), (13, 31)]),
+        # 両端に接する予約
+        ([_res(1, 3), _res(29, 31)], [(4, 28)]),
+        # 期間の外まではみ出す予約
+        ([SimpleNamespace(start_date=date(2026, 2, 20), end_date=date(2026, 3, 5)), _res(25, 31)], [(6, 24)]),
+        # 重なる・内側に含まれる・隣接する予約は 1 つの埋まり区間として扱う
+        ([_res(5, 10), _res(8, 9), _res(9, 14), _res(15, 16), _res(20, 22)], [(1, 4), (17, 19), (23, 31)]),
+        ([_res(1, 31)], []),
+    ],
+    ids=["empty", "middle", "edges", "outside", "overlapping", "full"],
+)
+def test_free_slots(reservations, expected):
+    assert _slots(reservations) == expected
+
+
+def test_free_slots_single_day_range():
+    assert _slots([], 10, 10) == [(10, 10)]
+    assert _slots([_res(10, 10)], 10, 10) == []
+    assert _slots([_res(9, 9)], 10, 10) == [(10, 10)]
+
+
+class _Db:
+    def __init__(self, error):
+        self.error = error
+        self.rolled_back = False
+
+    def commit(self):
+        raise self.error
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_exclusion_violation_on_commit_is_reported_as_overlap():
+    db = _Db(IntegrityError("INSERT", {}, SimpleNamespace(pgcode="23P01")))
+
+    with pytest.raises(HTTPException) as exc:
+        loaner_cars._commit_reservation(db)
+
+    assert exc.value.status_code == 400
+    assert "重複" in exc.value.detail
+    assert db.rolled_back
+
+
+def test_other_integrity_errors_are_raised_as_is():
+    error = IntegrityError("INSERT", {}, SimpleNamespace(pgcode="23503"))
+    db = _Db(error)
+
+    with pytest.raises(IntegrityError) as exc:
+        loaner_cars._commit_reservation(db)
+
+    assert exc.value is error
+    assert db.rolled_back
+
+
+@pytest.mark.parametrize(
+    "date_from, date_to",
+    [(date(2026, 3, 10), date(2026, 3, 9)), (date(2026, 1, 1), date(2027, 1, 2))],
+    ids=["reversed", "too-long"],
+)
+def test_availability_rejects_invalid_ranges(date_from, date_to):
+    request = SimpleNamespace(state=SimpleNamespace(user=SimpleNamespace(store_id=uuid.uuid4())))
+
+    with pytest.raises(HTTPException) as exc:
+        loaner_cars.get_availability(request, date_from, date_to, only_free=False, db=None)
+
+    assert exc.value.status_code == 400
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.ocr_result_cache import OcrResultCacheORM
+from app.services import ocr_cache
+
+TABLES = ("ocr_result_cache",)
+
+
+def test_evict_deletes_least_recently_used_in_batches(session_factory):
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    with session_factory() as db:
+        for i in range(7):
+            db.add(OcrResultCacheORM(
+                content_sha256=f"{i:064d}",
+                provider="local",
+                lang="jpn",
+                preprocess=False,
+                raw_text="",
+                last_used_at=base + timedelta(minutes=i),
+            ))
+        db.commit()
+
+        assert ocr_cache.evict(db, max_entries=3, batch=2) == 4
+        kept = db.execute(
+            select(OcrResultCacheORM.content_sha256).order_by(OcrResultCacheORM.last_used_at)
+        ).scalars().all()
+        assert kept == [f"{i:064d}" for i in (4, 5, 6)]
+
+        # 上限内なら何もしない
+        assert ocr_cache.evict(db, max_entries=3) == 0
+
+
+def test_evict_deletes_oldest_until_total_bytes_under_limit(session_factory):
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    sizes = [400, None, 300, 200, 100]
+    with session_factory() as db:
+        for i, size in enumerate(sizes):
+            db.add(OcrResultCacheORM(
+                content_sha256=f"{i:064d}",
+                provider="local",
+                lang="jpn",
+                preprocess=False,
+                raw_text="",
+                size_bytes=size,
+                last_used_at=base + timedelta(minutes=i),
+            ))
+        db.commit()
+
+        # 合計 1000 バイト → 450 以下まで古い順に消す（size_bytes 無しは 0 として数える）
+        assert ocr_cache.evict(db, max_entries=100, batch=2, max_bytes=450) == 3
+        kept = db.execute(
+            select(OcrResultCacheORM.content_sha256).order_by(OcrResultCacheORM.last_used_at)
+        ).scalars().all()
+        assert kept == [f"{i:064d}" for i in (3, 4)]
+
+        assert ocr_cache.evict(db, max_entries=100, max_bytes=300) == 0
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import ocr_jobs
+from app.services.shaken_ocr import ShakenOcrError
+
+
+@pytest.fixture(autouse=True)
+def _fresh_queue(monkeypatch):
+    # プロセスプールの代わりに既定のスレッドプールで実行する（関数を pickle しなくてよい）
+    monkeypatch.setattr(ocr_jobs, "_get_pool", lambda: None)
+    monkeypatch.setattr(ocr_jobs, "_jobs", {})
+    monkeypatch.setattr(ocr_jobs, "_slots", None)
+
+
+async def _wait_status(job, status):
+    for _ in range(200):
+        if job.status == status:
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError(f"job stayed {job.status}, expected {status}")
+
+
+def test_job_goes_from_queued_to_running_to_done():
+    release = threading.Event()
+
+    def work(value):
+        release.wait(5)
+        return {"raw_text": "車検証", "vin": value}
+
+    async def scenario():
+        job = ocr_jobs._submit("shaken", "s1", work, "ABC-123")
+        assert job.status == ocr_jobs.QUEUED
+        await _wait_status(job, ocr_jobs.RUNNING)
+        assert job.started_at is not None and not job.done.is_set()
+
+        release.set()
+        await asyncio.wait_for(job.done.wait(), 5)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == ocr_jobs.DONE
+    assert job.result == {"raw_text": "車検証", "vin": "ABC-123"}
+    assert job.error is None and job.finished_at is not None
+
+
+@pytest.mark.parametrize(
+    "exc, error",
+    [
+        (ShakenOcrError("Invalid image file"), "Invalid image file"),
+        # 想定外の例外は内部の詳細を出さない
+        (ValueError("secret detail"), ocr_jobs.INTERNAL_ERROR),
+    ],
+)
+def test_failed_job_reports_error(exc, error):
+    def work():
+        raise exc
+
+    async def scenario():
+        job = ocr_jobs._submit("shaken", None, work)
+        await asyncio.wait_for(job.done.wait(), 5)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == ocr_jobs.FAILED
+    assert job.error == error
+    assert job.result is None
+
+
+def test_timeout_returns_early_but_keeps_slot_until_worker_finishes(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "OCR_JOB_TIMEOUT_SEC", 0.05)
+    monkeypatch.setattr(ocr_jobs, "OCR_JOB_WORKERS", 1)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return {"raw_text": "late"}
+
+    def fast():
+        return {"raw_text": "fast"}
+
+    async def scenario():
+        first = ocr_jobs._submit("shaken", None, slow)
+        await asyncio.wait_for(first.done.wait(), 5)
+        assert first.status == ocr_jobs.TIMEOUT
+        assert "timed out" in first.error
+
+        # ワーカーが終わるまで実行枠は返らない
+        second = ocr_jobs._submit("shaken", None, fast)
+        await asyncio.sleep(0.05)
+        assert second.status == ocr_jobs.QUEUED
+
+        release.set()
+        await asyncio.wait_for(second.done.wait(), 5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.status == ocr_jobs.TIMEOUT and first.result is None
+    assert second.status == ocr_jobs.DONE
+
+
+def test_finished_jobs_expire_after_ttl(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "OCR_JOB_RESULT_TTL_SEC", 60)
+    now = time.time()
+    old = ocr_jobs.OcrJob(id="old", store_id="s1", kind="shaken", status=ocr_jobs.DONE, finished_at=now - 61)
+    fresh = ocr_jobs.OcrJob(id="fresh", store_id="s1", kind="shaken", status=ocr_jobs.DONE, finished_at=now - 10)
+    # 実行中のジョブは期限に関係なく残す
+    running = ocr_jobs.OcrJob(id="running", store_id="s1", kind="shaken", status=ocr_jobs.RUNNING, created_at=now - 600)
+    for job in (old, fresh, running):
+        ocr_jobs._jobs[job.id] = job
+
+    assert ocr_jobs.get_job("old", store_id="s1") is None
+    assert ocr_jobs.get_job("fresh", store_id="s1") is fresh
+    assert ocr_jobs.get_job("running", store_id="s1") is running
+    assert set(ocr_jobs._jobs) == {"fresh", "running"}
+
+    # 他店舗のジョブは見えない
+    assert ocr_jobs.get_job("fresh", store_id="s2") is None
+
+
+def test_submit_rejects_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(ocr_jobs, "OCR_JOB_MAX_PENDING", 1)
+    release = threading.Event()
+
+    async def scenario():
+        job = ocr_jobs._submit("shaken", None, release.wait, 5)
+        with pytest.raises(ocr_jobs.OcrQueueFullError):
+            ocr_jobs._submit("shaken", None, release.wait, 5)
+        release.set()
+        await asyncio.wait_for(job.done.wait(), 5)
+
+    asyncio.run(scenario())
@@ -0,0 +1,173 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+import requests
+from sqlalchemy import select
+
+from app.models.push_subscription import PushSubscriptionORM
+from app.services import push_queue
+
+TABLES = ("push_subscriptions",)
+SESSION_MODULES = (push_queue,)
+
+
+class _Vapid:
+    def sign(self, claims):
+        return {"Authorization": f"vapid t=test,k={claims['aud']}"}
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ""
+
+
+class _Pusher:
+    """endpoint ごとに、送るたびに responses の先頭を返す WebPusher の代わり"""
+
+    responses = {}
+    sent = []
+
+    def __init__(self, subscription_info, requests_session=None):
+        self.endpoint = subscription_info["endpoint"]
+
+    def send(self, data, headers, ttl, timeout):
+        _Pusher.sent.append(self.endpoint)
+        outcome = _Pusher.responses[self.endpoint].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def _push(monkeypatch):
+    _Pusher.responses = {}
+    _Pusher.sent = []
+    sleeps = []
+    monkeypatch.setattr(push_queue, "WebPusher", _Pusher)
+    monkeypatch.setattr(push_queue, "_load_vapid", lambda: _Vapid())
+    monkeypatch.setattr(push_queue, "_vapid_headers", {})
+    monkeypatch.setattr(push_queue, "time", SimpleNamespace(time=time.time, sleep=sleeps.append))
+    monkeypatch.setattr(push_queue, "_metrics", dict.fromkeys(push_queue._metrics, 0))
+    yield sleeps
+    push_queue.shutdown()
+
+
+def _subscribe(factory, user_id, endpoints):
+    with factory() as db:
+        for endpoint in endpoints:
+            db.add(PushSubscriptionORM(user_id=user_id, endpoint=endpoint, p256dh="p", auth="a"))
+        db.commit()
+
+
+def _sub(endpoint):
+    return {"id": uuid.uuid4(), "endpoint": endpoint, "p256dh": "p", "auth": "a"}
+
+
+def test_send_one_retries_and_honours_retry_after(_push, monkeypatch):
+    monkeypatch.setattr(push_queue, "PUSH_MAX_RETRIES", 3)
+    endpoint = "https://push.example.com/a"
+    _Pusher.responses[endpoint] = [
+        _Response(429, {"Retry-After": "7"}),
+        requests.ConnectionError("reset"),
+        _Response(201),
+    ]
+
+    status = push_queue._send_one(_sub(endpoint), "{}", _Vapid(), requests.Session())
+
+    assert status == push_queue.SENT
+    assert len(_Pusher.sent) == 3
+    # 1 回目は Retry-After の 7 秒、2 回目は 2 秒 + ゆらぎ
+    assert _push[0] == 7
+    assert 2 <= _push[1] < 3
+    assert push_queue.metrics()["retried"] == 2
+
+
+def test_send_one_gives_up_after_max_retries_and_skips_non_retryable(_push, monkeypatch):
+    monkeypatch.setattr(push_queue, "PUSH_MAX_RETRIES", 2)
+    retry = "https://push.example.com/retry"
+    bad = "https://push.example.com/bad"
+    _Pusher.responses[retry] = [_Response(503)] * 3
+    _Pusher.responses[bad] = [_Response(400)]
+
+    assert push_queue._send_one(_sub(retry), "{}", _Vapid(), requests.Session()) == push_queue.FAILED
+    assert push_queue._send_one(_sub(bad), "{}", _Vapid(), requests.Session()) == push_queue.FAILED
+    assert _Pusher.sent.count(retry) == 3
+    assert _Pusher.sent.count(bad) == 1
+
+
+def test_retry_after_accepts_http_date_and_is_capped(monkeypatch):
+    monkeypatch.setattr(push_queue, "PUSH_RETRY_MAX_SEC", 30)
+    soon = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=12), usegmt=True)
+    assert 10 <= push_queue._retry_after(_Response(503, {"Retry-After": soon}), 0) <= 12
+    assert push_queue._retry_after(_Response(429, {"Retry-After": "3600"}), 0) == 30
+
+
+def test_deliver_prunes_gone_subscriptions(session_factory, monkeypatch):
+    monkeypatch.setattr(push_queue, "PUSH_MAX_RETRIES", 0)
+    user_id = uuid.uuid4()
+    endpoints = {
+        "https://push.example.com/ok": [_Response(201)],
+        "https://push.example.com/gone": [_Response(410)],
+        "https://push.example.com/missing": [_Response(404)],
+        "https://push.example.com/error": [_Response(500)],
+    }
+    _Pusher.responses.update(endpoints)
+    _subscribe(session_factory, user_id, endpoints)
+    # 他のユーザーには送らない
+    _subscribe(session_factory, uuid.uuid4(), ["https://push.example.com/other"])
+
+    result = push_queue.deliver({"title": "t"}, user_id=user_id)
+
+    assert result == {push_queue.SENT: 1, push_queue.GONE: 2, push_queue.FAILED: 1}
+    with session_factory() as db:
+        left = set(db.execute(select(PushSubscriptionORM.endpoint)).scalars())
+    assert left == {
+        "https://push.example.com/ok",
+        "https://push.example.com/error",
+        "https://push.example.com/other",
+    }
+    m = push_queue.metrics()
+    assert (m["sent"], m["failed"], m["pruned"]) == (1, 1, 2)
+
+
+def test_dispatcher_delivers_in_background(session_factory):
+    user_id = uuid.uuid4()
+    _Pusher.responses["https://push.example.com/a"] = [_Response(201)]
+    _subscribe(session_factory, user_id, ["https://push.example.com/a"])
+
+    push_queue.enqueue_user(str(user_id), {"title": "t"})
+    push_queue._get_executors()[0].shutdown(wait=True)
+
+    assert _Pusher.sent == ["https://push.example.com/a"]
+    m = push_queue.metrics()
+    assert (m["enqueued"], m["in_flight"], m["sent"]) == (1, 0, 1)
+
+
+def test_in_flight_is_released_for_jobs_cancelled_at_shutdown(monkeypatch):
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def blocking_deliver(payload, *, store_id=None, user_id=None):
+        started.release()
+        release.wait(5)
+
+    monkeypatch.setattr(push_queue, "deliver", blocking_deliver)
+    for _ in range(5):
+        push_queue.enqueue_store(uuid.uuid4(), {"title": "t"})
+    # 配信スレッド 2 本が埋まり、残り 3 件は待ち行列にある
+    assert started.acquire(timeout=5) and started.acquire(timeout=5)
+    dispatcher = push_queue._get_executors()[0]
+
+    push_queue.shutdown()
+    assert push_queue.metrics()["in_flight"] == 2
+
+    release.set()
+    dispatcher.shutdown(wait=True)
+    assert push_queue.metrics()["in_flight"] == 0
@@ -0,0 +1,23 @@
+from PIL import Image
+
+from app.services import shaken_ocr
+
+
+def test_pdf2image_fallback_converts_one_page_at_a_time(monkeypatch):
+    calls = []
+
+    def fake_convert(content, *, dpi, first_page, last_page):
+        calls.append((first_page, last_page))
+        return [Image.new("L", (4, 4))]
+
+    monkeypatch.setattr(shaken_ocr, "pdfinfo_from_bytes", lambda content: {"Pages": 5})
+    monkeypatch.setattr(shaken_ocr, "convert_from_bytes", fake_convert)
+
+    pages = shaken_ocr._iter_pdf_pages_pdf2image(b"%PDF", 200, max_pages=3)
+    first = next(pages)
+
+    # 先頭ページを返した時点では 1 ページ分しか変換していない
+    assert calls == [(1, 1)]
+    assert first.mode == "RGB"
+    assert len(list(pages)) == 2
+    assert calls == [(1, 1), (2, 2), (3, 3)]
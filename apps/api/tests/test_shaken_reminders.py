@@ -0,0 +1,211 @@
+import os
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.models.base import Base
+from app.models.car import Car
+from app.models.customer import CustomerORM
+from app.models.line_customer import LineCustomerORM
+from app.models.line_message import LineMessageORM
+from app.models.line_setting import LineSettingORM
+from app.models.shaken_reminder import ShakenReminderORM
+from app.models.store import StoreORM
+from app.models.user import User
+from app.services import shaken_reminders
+
+TODAY = date(2026, 3, 1)
+TABLES = ("stores", "users", "customers", "cars", "shaken_reminders", "line_settings", "line_customers", "line_messages")
+SESSION_MODULES = (shaken_reminders,)
+
+
+@pytest.fixture()
+def pushed(monkeypatch):
+    payloads = []
+    monkeypatch.setattr(shaken_reminders.push_queue, "enqueue_store", lambda store_id, p: payloads.append(p))
+    return payloads
+
+
+def _add_car(db, store_id, expiry, customer_id=None, user_id=None) -> Car:
+    car = Car(
+        store_id=store_id,
+        user_id=user_id or uuid.uuid4(),
+        stock_no="S-1",
+        make="トヨタ",
+        model="プリウス",
+        inspection_expiry=expiry,
+        customer_id=customer_id,
+    )
+    db.add(car)
+    db.flush()
+    return car
+
+
+# ============================================================
+# 一意キー
+# ============================================================
+class _RecordingDB:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append(stmt)
+        return self
+
+    def all(self):
+        return []
+
+    def commit(self):
+        pass
+
+
+def test_schedule_inserts_on_conflict_of_unique_key():
+    db = _RecordingDB()
+    shaken_reminders.schedule_store(db, uuid.uuid4(), TODAY)
+
+    [stmt] = db.statements
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT ON CONSTRAINT uq_shaken_reminders_car_window DO NOTHING" in sql
+    assert "RETURNING" in sql
+
+
+def test_unique_key_rejects_same_car_expiry_and_window(session_factory):
+    expiry = TODAY + timedelta(days=20)
+    with session_factory() as db:
+        car = _add_car(db, uuid.uuid4(), expiry)
+
+        def reminder(window_days):
+            return ShakenReminderORM(
+                store_id=car.store_id, car_id=car.id, inspection_expiry=expiry, window_days=window_days
+            )
+
+        db.add_all([reminder(30), reminder(7)])
+        db.commit()
+
+        db.add(reminder(30))
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+        # 車検を通して満了日が変われば、同じ通知タイミングでも別のお知らせ
+        db.add(ShakenReminderORM(
+            store_id=car.store_id, car_id=car.id, inspection_expiry=expiry + timedelta(days=730), window_days=30
+        ))
+        db.commit()
+
+
+def test_window_is_the_shortest_one_that_contains_the_expiry(session_factory):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        cars = {
+            days: _add_car(db, store_id, TODAY + timedelta(days=days)).id
+            for days in (0, 7, 8, 30)
+        }
+        rows = dict(db.execute(select(Car.id, shaken_reminders._window_days(TODAY))).all())
+
+    assert {days: rows[car_id] for days, car_id in cars.items()} == {0: 7, 7: 7, 8: 30, 30: 30}
+
+
+# ============================================================
+# 送信
+# ============================================================
+def test_dispatch_sends_one_multicast_per_expiry(session_factory, pushed, monkeypatch):
+    store_id = uuid.uuid4()
+    customer_a, customer_b = uuid.uuid4(), uuid.uuid4()
+    expiry = TODAY + timedelta(days=7)
+
+    with session_factory() as db:
+        db.add(StoreORM(id=store_id, name="テスト店"))
+        db.add(LineSettingORM(store_id=store_id, channel_access_token="token"))
+        db.add(LineCustomerORM(store_id=store_id, customer_id=customer_a, line_user_id="UA", follow_status="following"))
+        reminders = []
+        # 顧客 A は同じ満了日の車両を 2 台、顧客 B は LINE 未連携
+        for customer_id in (customer_a, customer_a, customer_b):
+            car = _add_car(db, store_id, expiry, customer_id)
+            r = ShakenReminderORM(
+                store_id=store_id, car_id=car.id, customer_id=customer_id,
+                inspection_expiry=expiry, window_days=7, status=shaken_reminders.PENDING,
+            )
+            db.add(r)
+            db.flush()
+            reminders.append(SimpleNamespace(id=r.id, car_id=car.id, customer_id=customer_id, inspection_expiry=expiry))
+        db.commit()
+
+        calls = []
+
+        def fake_multicast(user_ids, message, token):
+            calls.append(user_ids)
+            return list(user_ids), {}
+
+        monkeypatch.setattr(shaken_reminders.line_service, "multicast_message", fake_multicast)
+        counts = shaken_reminders.dispatch_store(db, store_id, reminders)
+
+        statuses = sorted(db.execute(select(ShakenReminderORM.status)).scalars().all())
+        logs = db.execute(select(LineMessageORM)).scalars().all()
+
+    assert calls == [["UA"]]
+    assert counts == {"reminders": 3, "line_sent": 2, "line_failed": 0, "no_line": 1}
+    assert statuses == [shaken_reminders.NO_LINE, shaken_reminders.SENT, shaken_reminders.SENT]
+    # 同じ友だちへは 1 通なのでログも 1 件
+    assert len(logs) == 1 and "テスト店です。" in logs[0].content
+    assert len(pushed) == 1 and "3台" in pushed[0]["body"]
+
+
+# ============================================================
+# PostgreSQL（ON CONFLICT による重複防止）
+# ============================================================
+PG_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+@pytest.fixture()
+def pg_factory(db_tables, monkeypatch):
+    if not PG_URL.startswith("postgresql"):
+        pytest.skip("TEST_DATABASE_URL (PostgreSQL) is not set")
+    # 使い捨てのスキーマに作る（既存のテーブルには触れない）
+    schema = f"test_shaken_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(PG_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    engine = create_engine(PG_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        Base.metadata.create_all(engine, tables=db_tables)
+        factory = sessionmaker(bind=engine, expire_on_commit=False)
+        monkeypatch.setattr(shaken_reminders, "SessionLocal", factory)
+        yield factory
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+def test_run_store_sends_each_reminder_once(pg_factory, pushed, monkeypatch):
+    store_id, customer_id = uuid.uuid4(), uuid.uuid4()
+    with pg_factory() as db:
+        db.add(StoreORM(id=store_id, name="テスト店"))
+        db.add(CustomerORM(id=customer_id, store_id=store_id, name="山田", honorific="様"))
+        user = User(email=f"{store_id}@example.com", store_id=store_id)
+        db.add(user)
+        db.flush()
+        _add_car(db, store_id, TODAY + timedelta(days=20), customer_id, user.id)
+        db.commit()
+
+    monkeypatch.setattr(shaken_reminders.line_service, "multicast_message", lambda u, m, t: (list(u), {}))
+
+    assert shaken_reminders.run_store(store_id, TODAY)["reminders"] == 1
+    # 同じ日にもう一度（別プロセスの実行を含む）動いても作らない
+    assert shaken_reminders.run_store(store_id, TODAY)["reminders"] == 0
+    # 30 日前のお知らせ済みでも 7 日前のタイミングでは 1 回送る
+    assert shaken_reminders.run_store(store_id, TODAY + timedelta(days=13))["reminders"] == 1
+    assert shaken_reminders.run_store(store_id, TODAY + timedelta(days=14))["reminders"] == 0
+
+    with pg_factory() as db:
+        windows = sorted(db.execute(select(ShakenReminderORM.window_days)).scalars().all())
+    assert windows == [7, 30]
+    assert len(pushed) == 2
@@ -0,0 +1,142 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.models.sns_post import SnsPostORM, SnsSettingORM
+from app.services import sns_reposts, sns_service
+
+TABLES = ("sns_posts", "sns_settings")
+SESSION_MODULES = (sns_reposts,)
+
+
+def _post(db, store_id, *, status="pending", key="auto", claimed_at=None, trigger="repost", created_at=None):
+    post = SnsPostORM(
+        store_id=store_id,
+        trigger=trigger,
+        platform="all",
+        status=status,
+        caption="caption",
+        idempotency_key=f"repost:{uuid.uuid4()}:2026-03-01" if key == "auto" else key,
+        claimed_at=claimed_at,
+        created_at=created_at or datetime.now(timezone.utc),
+    )
+    db.add(post)
+    db.commit()
+    return post.id
+
+
+def _statuses(factory) -> dict:
+    with factory() as db:
+        return {p.id: p for p in db.execute(select(SnsPostORM)).scalars().all()}
+
+
+def test_schedule_store_creates_one_repost_per_car_and_due_date(session_factory, monkeypatch):
+    store_id = uuid.uuid4()
+    car_a, car_b = uuid.uuid4(), uuid.uuid4()
+    due_at = datetime(2026, 3, 15, 9, 30, tzinfo=timezone.utc)
+    car = {"make": "トヨタ", "model": "プリウス", "grade": None, "year": 2020, "mileage": 1000,
+           "expected_sell_price": 1_500_000, "color": None, "export_description": None}
+    due = [
+        {"car_id": car_a, "car": car, "next_repost_at": due_at},
+        {"car_id": car_b, "car": car, "next_repost_at": due_at + timedelta(days=1)},
+    ]
+    monkeypatch.setattr(sns_service, "get_repost_due_cars", lambda *a, **k: due)
+    setting = SnsSettingORM(store_id=store_id, repost_enabled=True, repost_interval_weeks=2,
+                            new_arrival_template="{make} {model}")
+
+    with session_factory() as db:
+        assert sns_reposts.schedule_store(db, store_id, setting) == 2
+        # 同じ予定日の再投稿は何度実行しても増えない
+        assert sns_reposts.schedule_store(db, store_id, setting) == 0
+
+    posts = list(_statuses(session_factory).values())
+    assert sorted(p.idempotency_key for p in posts) == sorted([
+        f"repost:{car_a}:2026-03-15",
+        f"repost:{car_b}:2026-03-16",
+    ])
+    assert {(p.trigger, p.status) for p in posts} == {("repost", sns_reposts.PENDING)}
+
+
+def test_repost_key_uses_the_due_date():
+    car_id = uuid.uuid4()
+    late = datetime(2026, 3, 15, 23, 59, tzinfo=timezone.utc)
+    assert sns_service.repost_key(car_id, late) == f"repost:{car_id}:2026-03-15"
+    assert sns_service.repost_key(car_id, late) == sns_service.repost_key(car_id, late.replace(hour=0))
+
+
+def test_claim_marks_pending_reposts_posting_once(session_factory, monkeypatch):
+    monkeypatch.setattr(sns_reposts, "SNS_REPOST_BATCH", 2)
+    store_id = uuid.uuid4()
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    with session_factory() as db:
+        first = _post(db, store_id, created_at=base)
+        second = _post(db, store_id, created_at=base + timedelta(minutes=1))
+        third = _post(db, store_id, created_at=base + timedelta(minutes=2))
+        # 対象外: 手動投稿・冪等キー無し・他店舗・処理済み
+        _post(db, store_id, trigger="manual")
+        _post(db, store_id, key=None)
+        _post(db, uuid.uuid4())
+        _post(db, store_id, status="posted")
+
+    statements = []
+    with session_factory() as db:
+        execute = db.execute
+        monkeypatch.setattr(db, "execute", lambda stmt, *a, **k: statements.append(stmt) or execute(stmt, *a, **k))
+        claimed = sns_reposts._claim(db, store_id)
+        assert [r.id for r in claimed] == [first, second]
+        # 残り 1 件。取った分は posting なので二度は取らない
+        assert [r.id for r in sns_reposts._claim(db, store_id)] == [third]
+        assert sns_reposts._claim(db, store_id) == []
+
+    # 他プロセスがロック中の行は待たずに飛ばす
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql
+
+    posts = _statuses(session_factory)
+    for post_id in (first, second, third):
+        assert posts[post_id].status == sns_reposts.POSTING
+        assert posts[post_id].claimed_at is not None
+
+
+def test_recover_stale_fails_interrupted_posts_without_resending(session_factory, monkeypatch):
+    monkeypatch.setattr(sns_reposts, "SNS_REPOST_STALE_SEC", 600)
+    store_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    with session_factory() as db:
+        stale = _post(db, store_id, status=sns_reposts.POSTING, claimed_at=now - timedelta(seconds=601))
+        recent = _post(db, store_id, status=sns_reposts.POSTING, claimed_at=now - timedelta(seconds=30))
+        pending = _post(db, store_id)
+
+    assert sns_reposts.recover_stale() == 1
+
+    posts = _statuses(session_factory)
+    assert posts[stale].status == "failed"
+    assert posts[stale].error_message == sns_reposts.INTERRUPTED_ERROR
+    assert posts[recent].status == sns_reposts.POSTING
+    assert posts[pending].status == sns_reposts.PENDING
+
+
+def test_post_all_saves_each_result(session_factory, monkeypatch):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        ok = _post(db, store_id)
+        ng = _post(db, store_id)
+        claimed = sns_reposts._claim(db, store_id)
+
+    async def fake_execute(caption, image_urls, platform, setting, only=None, limiters=None):
+        assert only == ["line"] and set(limiters) == set(sns_service.PLATFORMS)
+        status = sns_service.POSTED if fake_execute.calls == 0 else sns_service.FAILED
+        fake_execute.calls += 1
+        return status == sns_service.POSTED, None, {"line": {"status": status, "error": None}}
+
+    fake_execute.calls = 0
+    monkeypatch.setattr(sns_service, "execute_sns_post", fake_execute)
+    setting = SnsSettingORM(store_id=store_id, repost_platforms=["line"])
+    asyncio.run(sns_reposts._post_all(claimed, setting))
+
+    posts = _statuses(session_factory)
+    assert sorted(posts[i].status for i in (ok, ng)) == ["failed", "posted"]
+    assert all(posts[i].results for i in (ok, ng))
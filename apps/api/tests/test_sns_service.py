@@ -0,0 +1,209 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import sns_service
+from app.services.sns_service import PlatformPolicy
+
+TWEET = "/2/tweets"
+IG_MEDIA = "/v18.0/ig-1/media"
+IG_PUBLISH = "/v18.0/ig-1/media_publish"
+
+
+class _Api:
+    """パスごとに、呼ばれるたびに responses の先頭を返す Twitter / Instagram の代わり"""
+
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+        self.before = None
+
+    async def __call__(self, request):
+        self.calls.append(request)
+        if self.before is not None:
+            await self.before(request)
+        outcome = self.responses[request.url.path].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def paths(self):
+        return [r.url.path for r in self.calls]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = _Api()
+    clients = {}
+    monkeypatch.setattr(
+        sns_service,
+        "_client",
+        lambda platform: clients.setdefault(platform, httpx.AsyncClient(transport=httpx.MockTransport(api))),
+    )
+    monkeypatch.setattr(sns_service, "_retry_delay", lambda resp, attempt: 0.0)
+    return api
+
+
+@pytest.fixture
+def line(monkeypatch):
+    state = SimpleNamespace(sent=[], outcome=(True, ""))
+
+    async def broadcast(messages, token):
+        state.sent.append(messages)
+        return state.outcome
+
+    monkeypatch.setattr(sns_service.line_service, "broadcast_messages_async", broadcast)
+    return state
+
+
+def _setting(**enabled):
+    return SimpleNamespace(
+        twitter_enabled=enabled.get("twitter", True),
+        twitter_api_key="k", twitter_api_secret="s", twitter_access_token="t", twitter_access_secret="ts",
+        instagram_enabled=enabled.get("instagram", True),
+        instagram_account_id="ig-1", instagram_access_token="ig-token",
+        line_enabled=enabled.get("line", True),
+        line_channel_token="line-token",
+    )
+
+
+def _post(platform="all", setting=None, **kwargs):
+    return asyncio.run(
+        sns_service.execute_sns_post("新着です", ["https://img.example.com/1.jpg"], platform,
+                                     setting or _setting(), **kwargs)
+    )
+
+
+def test_posts_to_all_platforms_concurrently(api, line):
+    api.responses = {
+        TWEET: [httpx.Response(201, json={})],
+        IG_MEDIA: [httpx.Response(200, json={"id": "c1"})],
+        IG_PUBLISH: [httpx.Response(200, json={})],
+    }
+    line.outcome = (False, "quota exceeded")
+    arrived = set()
+
+    async def wait_for_both(request):
+        # Twitter と Instagram のリクエストが同時に出ていないと揃わない
+        arrived.add(request.url.host)
+        while len(arrived) < 2:
+            await asyncio.sleep(0)
+
+    api.before = lambda request: asyncio.wait_for(wait_for_both(request), timeout=1)
+
+    ok, err, results = _post()
+
+    assert ok is True
+    assert err == "LINE: quota exceeded"
+    assert {p: r["status"] for p, r in results.items()} == {
+        "twitter": sns_service.POSTED,
+        "instagram": sns_service.POSTED,
+        "line": sns_service.FAILED,
+    }
+    assert all(r["at"] for r in results.values())
+    assert sorted(api.paths()) == sorted([TWEET, IG_MEDIA, IG_PUBLISH])
+    assert len(line.sent) == 1
+
+
+def test_only_and_disabled_platforms_are_not_posted(api, line):
+    api.responses = {TWEET: [httpx.Response(201, json={})]}
+
+    ok, err, results = _post(setting=_setting(line=False), only=["twitter", "line"])
+
+    assert (ok, err) == (True, None)
+    # only に無い Instagram は結果にも載らず、無効の LINE はスキップ
+    assert set(results) == {"twitter", "line"}
+    assert results["line"]["status"] == sns_service.SKIPPED
+    assert api.paths() == [TWEET]
+    assert line.sent == []
+
+
+def test_all_failed_returns_combined_error(api, line):
+    api.responses = {TWEET: [httpx.Response(403, text="forbidden")]}
+    line.outcome = (False, "quota exceeded")
+
+    ok, err, results = _post(setting=_setting(instagram=False))
+
+    assert ok is False
+    assert err.startswith("Twitter: Twitter API error 403") and err.endswith("LINE: quota exceeded")
+    assert results["instagram"]["status"] == sns_service.SKIPPED
+
+
+def test_twitter_retries_only_rate_limits_with_a_fresh_signature(api):
+    api.responses = {TWEET: [httpx.Response(429), httpx.Response(201, json={})]}
+    _, _, results = _post("twitter")
+    assert results["twitter"]["status"] == sns_service.POSTED
+    nonces = [r.headers["Authorization"] for r in api.calls]
+    assert len(nonces) == 2 and nonces[0] != nonces[1]
+
+    # 5xx はツイートが作成されたか分からないので再送しない
+    api.calls.clear()
+    api.responses = {TWEET: [httpx.Response(503, text="unavailable")]}
+    _, _, results = _post("twitter")
+    assert results["twitter"]["status"] == sns_service.FAILED
+    assert "503" in results["twitter"]["error"]
+    assert len(api.calls) == 1
+
+
+@pytest.mark.parametrize(
+    "outcome, calls",
+    [(httpx.ConnectError("refused"), 2), (httpx.ReadTimeout("read timed out"), 1)],
+    ids=["not-sent", "maybe-sent"],
+)
+def test_twitter_retries_only_requests_that_were_not_sent(api, outcome, calls):
+    api.responses = {TWEET: [outcome, httpx.Response(201, json={})]}
+    _, _, results = _post("twitter")
+    assert len(api.calls) == calls
+    assert results["twitter"]["status"] == (sns_service.POSTED if calls == 2 else sns_service.FAILED)
+
+
+def test_instagram_retries_container_on_5xx_but_publish_only_on_429(api):
+    api.responses = {
+        IG_MEDIA: [httpx.Response(502), httpx.Response(200, json={"id": "c1"})],
+        IG_PUBLISH: [httpx.Response(429), httpx.Response(500, text="oops"), httpx.Response(200, json={})],
+    }
+
+    _, _, results = _post("instagram")
+
+    assert api.paths() == [IG_MEDIA, IG_MEDIA, IG_PUBLISH, IG_PUBLISH]
+    assert results["instagram"]["status"] == sns_service.FAILED
+    assert "IG publish error 500" in results["instagram"]["error"]
+
+
+def test_retries_stop_at_max_retries(api):
+    api.responses = {IG_MEDIA: [httpx.Response(503)] * 5}
+    _, _, results = _post("instagram")
+    assert len(api.calls) == sns_service.POLICIES["instagram"].max_retries + 1
+    assert "IG media create error 503" in results["instagram"]["error"]
+
+
+def test_platform_deadline_fails_only_the_slow_platform(api, monkeypatch):
+    monkeypatch.setitem(
+        sns_service.POLICIES, "line",
+        PlatformPolicy(timeout=1.0, deadline=0.05, max_retries=0, retry_statuses=frozenset()),
+    )
+
+    async def slow_broadcast(messages, token):
+        await asyncio.sleep(1)
+        return True, ""
+
+    monkeypatch.setattr(sns_service.line_service, "broadcast_messages_async", slow_broadcast)
+    api.responses = {TWEET: [httpx.Response(201, json={})]}
+
+    ok, err, results = _post(setting=_setting(instagram=False))
+
+    assert ok is True
+    assert results["twitter"]["status"] == sns_service.POSTED
+    assert (results["line"]["status"], results["line"]["error"]) == (sns_service.FAILED, "timeout (0s)")
+    assert err == "LINE: timeout (0s)"
+
+
+def test_retry_delay_honours_headers_and_is_capped(monkeypatch):
+    monkeypatch.setattr(sns_service, "SNS_RETRY_MAX_SEC", 30)
+    monkeypatch.setattr(sns_service.time, "time", lambda: 1000.0)
+    assert sns_service._retry_delay(httpx.Response(429, headers={"Retry-After": "7"}), 0) == 7
+    assert sns_service._retry_delay(httpx.Response(429, headers={"x-rate-limit-reset": "1012"}), 0) == 12
+    assert sns_service._retry_delay(httpx.Response(429, headers={"Retry-After": "3600"}), 0) == 30
+    assert 2 <= sns_service._retry_delay(None, 1) < 3
@@ -0,0 +1,286 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.db.session import get_db
+from app.models.asset import AssetORM
+from app.models.store import StoreORM
+from app.routes.stores import router as stores_router
+from app.services import storage
+
+TABLES = ("stores", "assets")
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture()
+def local_backend(tmp_path, monkeypatch):
+    backend = storage.LocalStorage(tmp_path)
+    monkeypatch.setattr(storage, "_backend", backend)
+    return backend
+
+
+def _client(ref: str) -> TestClient:
+    app = FastAPI()
+
+    @app.api_route("/file", methods=["GET", "HEAD"])
+    def download(request: Request):
+        return storage.file_response(request, ref, media_type="application/pdf", filename="見積書.pdf")
+
+    return TestClient(app)
+
+
+def _http_date(dt: datetime) -> str:
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def test_full_download_has_strong_etag(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    res = _client(stored.ref).get("/file")
+
+    assert res.status_code == 200
+    assert res.content == CONTENT
+    assert res.headers["etag"] == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+    assert res.headers["accept-ranges"] == "bytes"
+    assert res.headers["content-disposition"] == "attachment; filename*=utf-8''%E8%A6%8B%E7%A9%8D%E6%9B%B8.pdf"
+
+
+def test_if_none_match_and_if_modified_since_return_304(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    client = _client(stored.ref)
+    first = client.get("/file")
+
+    etag = first.headers["etag"]
+    for inm in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        res = client.get("/file", headers={"If-None-Match": inm})
+        assert res.status_code == 304, inm
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+
+    res = client.get("/file", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert res.status_code == 304
+
+    # If-None-Match が一致しなければ If-Modified-Since は見ない
+    res = client.get("/file", headers={"If-None-Match": '"other"', "If-Modified-Since": first.headers["last-modified"]})
+    assert res.status_code == 200
+
+
+def test_single_range(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    client = _client(stored.ref)
+
+    res = client.get("/file", headers={"Range": "bytes=10-19"})
+    assert res.status_code == 206
+    assert res.content == CONTENT[10:20]
+    assert res.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert res.headers["content-length"] == "10"
+
+    res = client.get("/file", headers={"Range": "bytes=-5"})
+    assert res.status_code == 206
+    assert res.content == CONTENT[-5:]
+
+    res = client.get("/file", headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    # 複数レンジは全体を返す
+    res = client.get("/file", headers={"Range": "bytes=0-1,4-5"})
+    assert res.status_code == 200
+    assert res.content == CONTENT
+
+
+def test_head_returns_headers_only(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    res = _client(stored.ref).head("/file", headers={"Range": "bytes=0-9"})
+
+    assert res.status_code == 206
+    assert res.content == b""
+    assert res.headers["content-length"] == "10"
+
+
+def test_download_route_answers_head(local_backend, session_factory):
+    stored = storage.save_bytes(CONTENT)
+    with session_factory() as db:
+        store = StoreORM(name="テスト店")
+        db.add(store)
+        db.flush()
+        db.add(AssetORM(store_id=store.id, kind="logo", content_type="image/png", file_path=stored.ref))
+        db.commit()
+        store_id = store.id
+
+    def _db():
+        with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(stores_router)
+    app.dependency_overrides[get_db] = _db
+    client = TestClient(app)
+
+    res = client.head(f"/stores/{store_id}/logo")
+
+    assert res.status_code == 200
+    assert res.content == b""
+    assert res.headers["content-length"] == str(len(CONTENT))
+    assert res.headers["etag"] == client.get(f"/stores/{store_id}/logo").headers["etag"]
+
+
+def test_if_range_uses_strong_comparison(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    client = _client(stored.ref)
+    etag = client.get("/file").headers["etag"]
+
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert res.status_code == 206
+
+    # 弱い ETag は If-Range では一致しない
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": f"W/{etag}"})
+    assert res.status_code == 200
+    assert res.content == CONTENT
+
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert res.status_code == 200
+
+
+def test_if_range_never_matches_weak_etag_of_legacy_file(tmp_path):
+    # 旧形式（絶対パス）のファイルは弱い ETag になる
+    legacy = tmp_path / "legacy.pdf"
+    legacy.write_bytes(CONTENT)
+    client = _client(str(legacy))
+    etag = client.get("/file").headers["etag"]
+    assert etag.startswith("W/")
+
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert res.status_code == 200
+    assert res.content == CONTENT
+
+    # If-None-Match は弱い比較なので 304 になる
+    assert client.get("/file", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_if_range_date_must_equal_last_modified(local_backend):
+    stored = storage.save_bytes(CONTENT)
+    client = _client(stored.ref)
+    last_modified = client.get("/file").headers["last-modified"]
+
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": last_modified})
+    assert res.status_code == 206
+
+    later = _http_date(storage.get_backend().stat(stored.ref).modified_at + timedelta(hours=1))
+    res = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": later})
+    assert res.status_code == 200
+
+
+# ============================================================
+# S3 backend
+# ============================================================
+def _client_error(code: str):
+    if storage.boto3 is not None:
+        return storage.ClientError({"Error": {"Code": code}}, "HeadObject")
+    err = storage.ClientError(code)
+    err.response = {"Error": {"Code": code}}
+    return err
+
+
+class _FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.closed = False
+
+    def iter_chunks(self, size: int):
+        for i in range(0, len(self.data), size):
+            yield self.data[i : i + size]
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeS3Client:
+    """S3Storage が使う API だけを持つメモリ上のクライアント。"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+        self.bodies = []
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _client_error("404")
+        data, modified_at, _ = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "LastModified": modified_at}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        self.uploads += 1
+        with open(Filename, "rb") as f:
+            data = f.read()
+        modified_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.objects[(Bucket, Key)] = (data, modified_at, (ExtraArgs or {}).get("ContentType"))
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(v) for v in Range.removeprefix("bytes=").split("-"))
+        body = _FakeBody(self.objects[(Bucket, Key)][0][start : end + 1])
+        self.bodies.append(body)
+        return {"Body": body}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def _exercise_s3_backend(backend) -> None:
+    stored = storage.save_bytes(CONTENT, content_type="application/pdf")
+    storage.save_bytes(CONTENT)
+
+    assert storage.exists(stored.ref)
+    assert storage.read_bytes(stored.ref) == CONTENT
+    assert storage.read_head(stored.ref, 4) == CONTENT[:4]
+
+    client = _client(stored.ref)
+    res = client.get("/file", headers={"Range": "bytes=100-199"})
+    assert res.status_code == 206
+    assert res.content == CONTENT[100:200]
+    assert client.get("/file", headers={"If-None-Match": res.headers["etag"]}).status_code == 304
+
+    backend.delete(stored.ref)
+    assert not storage.exists(stored.ref)
+
+
+def test_s3_backend_with_fake_client(monkeypatch):
+    fake = _FakeS3Client()
+    backend = storage.S3Storage("bucket", fake)
+    monkeypatch.setattr(storage, "_backend", backend)
+
+    _exercise_s3_backend(backend)
+
+    # 同じ内容は 1 回だけアップロードし、本文はすべて閉じる
+    assert fake.uploads == 1
+    assert fake.bodies and all(b.closed for b in fake.bodies)
+
+
+def test_s3_backend_with_moto(monkeypatch):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    mock = getattr(moto, "mock_aws", None) or moto.mock_s3
+
+    with mock():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="bucket")
+        backend = storage.S3Storage("bucket", client)
+        monkeypatch.setattr(storage, "_backend", backend)
+
+        _exercise_s3_backend(backend)
+
+
+def test_logo_download_name_keeps_extension():
+    import app.main  # noqa: F401  全モデルを登録する（relationship の解決に必要）
+    from app.models.asset import AssetORM
+    from app.routes.stores import _logo_filename
+
+    ref = storage.cas_key(hashlib.sha256(CONTENT).hexdigest())
+    assert _logo_filename(AssetORM(file_path=ref, content_type="image/jpeg", filename="shop.JPEG")) == "shop.JPEG"
+    # ファイル名を持たない行は Content-Type から拡張子を決める
+    assert _logo_filename(AssetORM(file_path=ref, content_type="image/png")) == "logo.png"
+    assert _logo_filename(AssetORM(file_path="/srv/uploads/assets/x/logo/abc.webp")) == "abc.webp"
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from app.models.stripe_event import StripeEventORM
+from app.services import stripe_events
+
+TABLES = ("stripe_events",)
+SESSION_MODULES = (stripe_events,)
+
+
+@pytest.fixture(autouse=True)
+def _limits(monkeypatch):
+    monkeypatch.setattr(stripe_events, "STRIPE_INBOX_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(stripe_events, "STRIPE_INBOX_STALE_SEC", 60)
+    # SQLite は接続を共有しているので 1 スレッドで処理する
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(stripe_events, "_get_executor", lambda: executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+def _queue(factory, events) -> list:
+    """(customer, 発生時刻の秒オフセット) を queued で積む"""
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    with factory() as db:
+        rows = [
+            StripeEventORM(
+                stripe_event_id=f"evt_{i}",
+                event_type="test.event",
+                stripe_customer_id=customer,
+                stripe_created_at=base + timedelta(seconds=offset),
+                payload={"data": {"object": {"customer": customer}}},
+                status=stripe_events.QUEUED,
+                attempts=0,
+                created_at=base + timedelta(seconds=offset),
+            )
+            for i, (customer, offset) in enumerate(events)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [r.id for r in rows]
+
+
+def _events(factory) -> dict:
+    with factory() as db:
+        return {ev.id: ev for ev in db.execute(select(StripeEventORM)).scalars().all()}
+
+
+def test_persist_skips_redelivered_event_ids(session_factory):
+    event = {
+        "id": "evt_dup",
+        "type": "invoice.payment_succeeded",
+        "created": 1772323200,
+        "data": {"object": {"object": "invoice", "customer": "cus_A"}},
+    }
+    with session_factory() as db:
+        assert stripe_events.persist(db, event) is True
+        # Stripe の再送（同じ evt_...）は ON CONFLICT DO NOTHING で積まない
+        assert stripe_events.persist(db, dict(event, type="changed")) is False
+
+    rows = list(_events(session_factory).values())
+    assert len(rows) == 1
+    assert rows[0].event_type == "invoice.payment_succeeded"
+    assert rows[0].stripe_customer_id == "cus_A"
+    assert rows[0].status == stripe_events.QUEUED
+
+
+def test_claim_takes_one_event_per_customer_in_order(session_factory):
+    a1, b1, a2 = _queue(session_factory, [("cus_A", 0), ("cus_B", 1), ("cus_A", 2)])
+
+    claimed = {r.id for r in stripe_events._claim_batch()}
+    # 同じ顧客の前のイベント（a1）が未処理の間は a2 を取らない
+    assert claimed == {a1, b1}
+    assert stripe_events._claim_batch() == []
+
+    with session_factory() as db:
+        db.execute(update(StripeEventORM).where(StripeEventORM.id == a1).values(status=stripe_events.DONE))
+        db.commit()
+    assert [r.id for r in stripe_events._claim_batch()] == [a2]
+
+
+def test_failed_event_backs_off_then_fails_after_max_attempts(session_factory, monkeypatch):
+    def failing(db, obj):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(stripe_events, "HANDLERS", {"test.event": failing})
+    first, second = _queue(session_factory, [("cus_A", 0), ("cus_A", 1)])
+
+    before = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert stripe_events.drain() == 1
+    ev = _events(session_factory)[first]
+    assert ev.status == stripe_events.QUEUED
+    assert ev.attempts == 1
+    assert "boom" in ev.error
+    assert ev.claim_token is None
+    # 1 回目の失敗は 10 秒後に再試行
+    wait = ev.next_attempt_at.replace(tzinfo=None) - before
+    assert timedelta(seconds=9) < wait <= timedelta(seconds=11)
+
+    # バックオフ中は取らず、同じ顧客の後続も待たせる
+    assert stripe_events.drain() == 0
+    assert _events(session_factory)[second].status == stripe_events.QUEUED
+
+    with session_factory() as db:
+        db.execute(update(StripeEventORM).where(StripeEventORM.id == first).values(next_attempt_at=None))
+        db.commit()
+    assert stripe_events.drain() == 2
+
+    events = _events(session_factory)
+    assert events[first].status == stripe_events.FAILED
+    assert events[first].attempts == stripe_events.STRIPE_INBOX_MAX_ATTEMPTS
+    # failed になれば後続は取られる（ここでも失敗して再試行待ち）
+    assert events[second].attempts == 1
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    assert stripe_events._retry_delay(1) == timedelta(seconds=10)
+    assert stripe_events._retry_delay(2) == timedelta(seconds=20)
+    assert stripe_events._retry_delay(4) == timedelta(seconds=80)
+    assert stripe_events._retry_delay(30) == timedelta(seconds=stripe_events.RETRY_MAX_SEC)
+
+
+def test_stale_claim_is_recovered_and_old_worker_cannot_finish(session_factory, monkeypatch):
+    (ev_id,) = _queue(session_factory, [("cus_A", 0)])
+    (claim,) = stripe_events._claim_batch()
+    assert claim.attempts == 1
+
+    # processing のまま STALE_SEC を過ぎたので取り直される
+    with session_factory() as db:
+        db.execute(
+            update(StripeEventORM)
+            .where(StripeEventORM.id == ev_id)
+            .values(locked_at=datetime.now(timezone.utc) - timedelta(seconds=61))
+        )
+        db.commit()
+    stripe_events._requeue_stale()
+    ev = _events(session_factory)[ev_id]
+    assert ev.status == stripe_events.QUEUED
+    assert ev.claim_token is None and ev.locked_at is None
+
+    (reclaim,) = stripe_events._claim_batch()
+    assert reclaim.claim_token != claim.claim_token
+    assert reclaim.attempts == 2
+
+    def touch(db, obj):
+        db.execute(update(StripeEventORM).where(StripeEventORM.id == ev_id).values(error="applied"))
+
+    monkeypatch.setattr(stripe_events, "HANDLERS", {"test.event": touch})
+
+    # 古い token のワーカーは done にできず、ハンドラーの更新もロールバックされる
+    assert stripe_events.process_event(ev_id, claim.claim_token, "test.event", {}, claim.attempts) is False
+    ev = _events(session_factory)[ev_id]
+    assert ev.status == stripe_events.PROCESSING
+    assert ev.error is None
+
+    assert stripe_events.process_event(ev_id, reclaim.claim_token, "test.event", {}, reclaim.attempts) is True
+    ev = _events(session_factory)[ev_id]
+    assert ev.status == stripe_events.DONE
+    assert ev.error is None  # done で error はクリアされる
+    assert ev.processed_at is not None
+
+
+def test_recently_locked_event_is_not_recovered(session_factory):
+    (ev_id,) = _queue(session_factory, [("cus_A", 0)])
+    stripe_events._claim_batch()
+
+    stripe_events._requeue_stale()
+    assert _events(session_factory)[ev_id].status == stripe_events.PROCESSING
+    assert stripe_events._claim_batch() == []
@@ -0,0 +1,94 @@
+from datetime import date
+
+from app.routes.tax_calc import TaxBatchRequest, calculate_tax_batch
+from app.services import tax_calculator
+
+AS_OF = date(2024, 6, 1)
+
+VEHICLES = [
+    # 13年未満・1.5t 以下
+    dict(vehicle_type="passenger", weight_kg=1200, first_reg_year=2015, first_reg_month=6),
+    # 区分の上限ちょうど / わずかに超える
+    dict(vehicle_type="passenger", weight_kg=1000, first_reg_year=2020, first_reg_month=1),
+    dict(vehicle_type="passenger", weight_kg=1000.5, first_reg_year=2020, first_reg_month=1),
+    # 初度登録月の前月までは 13 年未満、当月から 13 年以上
+    dict(vehicle_type="passenger", weight_kg=1800, first_reg_year=2011, first_reg_month=7),
+    dict(vehicle_type="passenger", weight_kg=1800, first_reg_year=2011, first_reg_month=6),
+    # 18年以上
+    dict(vehicle_type="passenger", weight_kg=2900, first_reg_year=2000, first_reg_month=1),
+    # 計算対象外の重量
+    dict(vehicle_type="passenger", weight_kg=3500, first_reg_year=2020, first_reg_month=1),
+    # 軽・エコカー減税・車検1年
+    dict(vehicle_type="kei", weight_kg=800, first_reg_year=2010, first_reg_month=1,
+         eco_type="eco_50", inspection_years=1, jibaiseki_months=12),
+    dict(vehicle_type="kei_business", weight_kg=800, first_reg_year=2022, first_reg_month=4,
+         eco_type="exempt", jibaiseki_months=37),
+    # 自賠責の期間が料金表にない
+    dict(vehicle_type="moped", weight_kg=80, first_reg_year=2023, first_reg_month=4, jibaiseki_months=36),
+]
+
+
+def _single(v: dict, **kwargs) -> dict:
+    return tax_calculator.calculate(
+        vehicle_type=v["vehicle_type"],
+        weight_kg=v["weight_kg"],
+        first_reg_year=v["first_reg_year"],
+        first_reg_month=v["first_reg_month"],
+        eco_type=v.get("eco_type", "non_eco"),
+        jibaiseki_months=v.get("jibaiseki_months", 25),
+        inspection_years=v.get("inspection_years", 2),
+        **kwargs,
+    )
+
+
+def test_known_fees():
+    results = [_single(v, as_of=AS_OF) for v in VEHICLES]
+
+    assert [(r["jibaiseki"], r["jyuryozei"]) for r in results] == [
+        (18_530, 24_600),
+        (18_530, 16_400),
+        (18_530, 24_600),
+        (18_530, 32_800),
+        (18_530, 45_600),
+        (18_530, 75_600),
+        (18_530, 0),
+        (9_870, 2_050),
+        (23_660, 0),
+        (0, 8_200),
+    ]
+    assert [r["age_category"] for r in results[3:6]] == ["under13", "13to18", "over18"]
+    assert any("計算対象外" in n for n in results[6]["notes"])
+    assert any("自賠責料金テーブルが見つかりません" in n for n in results[9]["notes"])
+
+
+def test_batch_matches_single_calculation():
+    fiscal_year, results = tax_calculator.calculate_many(VEHICLES, as_of=AS_OF)
+
+    assert fiscal_year == 2024
+    assert results == [_single(v, as_of=AS_OF) for v in VEHICLES]
+
+
+def test_batch_endpoint_totals_match_single_calculation():
+    body = TaxBatchRequest(vehicles=VEHICLES, as_of=AS_OF)
+    res = calculate_tax_batch(body)
+
+    singles = [_single(v, as_of=AS_OF) for v in VEHICLES]
+    assert [r.model_dump() for r in res.results] == singles
+    assert res.total_jibaiseki == sum(r["jibaiseki"] for r in singles)
+    assert res.total_jyuryozei == sum(r["jyuryozei"] for r in singles)
+    assert res.total == sum(r["total"] for r in singles) == res.total_jibaiseki + res.total_jyuryozei
+
+
+def test_fee_table_resolution_by_fiscal_year():
+    # 4月始まり
+    assert tax_calculator.fiscal_year_of(date(2025, 3, 31)) == 2024
+    assert tax_calculator.fiscal_year_of(date(2025, 4, 1)) == 2025
+
+    # 登録済みの年度以降は直近の料金表、以前は最も古い料金表で注記付き
+    table, notes = tax_calculator.get_fee_table(2030)
+    assert table.fiscal_year == max(tax_calculator.fee_table_years()) and notes == []
+
+    oldest = min(tax_calculator.fee_table_years())
+    fiscal_year, results = tax_calculator.calculate_many(VEHICLES[:2], as_of=AS_OF, fiscal_year=oldest - 1)
+    assert fiscal_year == oldest
+    assert all(r["notes"][0].startswith(f"{oldest - 1}年度の料金表が未登録") for r in results)
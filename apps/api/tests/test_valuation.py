@@ -0,0 +1,93 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import valuation_service
+from app.services.valuation_own_cache import OwnMarket
+from app.services.valuation_service import MarketPrice, UpstreamUnavailableError
+
+EXTERNAL = MarketPrice(low=800_000, median=1_000_000, high=1_200_000)
+SETTINGS = SimpleNamespace(
+    provider="MAT",
+    display_adjust_pct=0,
+    buy_cap_pct=0.8,
+    risk_buffer_yen=0,
+    round_unit_yen=1000,
+    recommended_from_cap_yen=0,
+    default_extra_cost_yen=0,
+    min_profit_yen=0,
+    min_profit_rate=0,
+)
+
+
+@pytest.fixture()
+def market(monkeypatch):
+    """own: 自社実績（None なら無し）、external: 外部相場（例外なら取得失敗）、calls: 外部相場の呼び出し回数"""
+    state = SimpleNamespace(own=None, external=EXTERNAL, calls=0)
+
+    def fake_external(db, **kwargs):
+        state.calls += 1
+        if isinstance(state.external, Exception):
+            raise state.external
+        return state.external
+
+    monkeypatch.setattr(valuation_service, "get_or_create_settings", lambda db, store_id: SETTINGS)
+    monkeypatch.setattr(valuation_service, "get_own_market", lambda db, **kwargs: state.own)
+    monkeypatch.setattr(valuation_service, "_get_market_price_external_with_cache", fake_external)
+    return state
+
+
+def _own(count: int) -> OwnMarket:
+    return OwnMarket(count=count, low=1_100_000, median=1_400_000, high=1_600_000)
+
+
+def _calculate():
+    return valuation_service.calculate_valuation(
+        db=None, store_id=uuid.uuid4(), make="トヨタ", model="プリウス", grade="S", year=2017, mileage=30_000
+    )
+
+
+def test_below_blend_threshold_uses_external_only(market):
+    market.own = _own(valuation_service.OWN_BLEND_MIN_COUNT - 1)
+
+    result = _calculate()
+
+    assert result["source"] == "market"
+    assert result["market_median"] == EXTERNAL.median
+    assert result["own_count"] == valuation_service.OWN_BLEND_MIN_COUNT - 1
+
+
+def test_blend_weight_grows_with_sample_size(market):
+    n = valuation_service.OWN_BLEND_MIN_COUNT
+    market.own = _own(n)
+
+    result = _calculate()
+
+    w = n / (n + valuation_service.OWN_BLEND_PRIOR)
+    assert result["source"] == "blend"
+    assert result["market_median"] == round(1_400_000 * w + EXTERNAL.median * (1 - w))
+
+    market.own = _own(valuation_service.OWN_ONLY_MIN_COUNT - 1)
+    assert _calculate()["market_median"] > result["market_median"]
+
+
+def test_own_only_at_threshold_skips_external(market):
+    market.own = _own(valuation_service.OWN_ONLY_MIN_COUNT)
+
+    result = _calculate()
+
+    assert result["source"] == "own"
+    assert (result["market_low"], result["market_median"], result["market_high"]) == (1_100_000, 1_400_000, 1_600_000)
+    assert market.calls == 0
+
+
+def test_external_failure_falls_back_to_own_from_blend_threshold(market):
+    market.external = UpstreamUnavailableError("down")
+    market.own = _own(valuation_service.OWN_BLEND_MIN_COUNT)
+
+    assert _calculate()["source"] == "own"
+
+    market.own = _own(valuation_service.OWN_BLEND_MIN_COUNT - 1)
+    with pytest.raises(UpstreamUnavailableError):
+        _calculate()
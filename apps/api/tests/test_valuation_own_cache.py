@@ -0,0 +1,157 @@
+import random
+import statistics
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.models.car import Car
+from app.models.valuation_own_cache import ValuationOwnCache
+from app.services import valuation_own_cache
+from app.services.valuation_own_cache import P2Median, bucket_key
+
+TABLES = ("cars", "valuation_own_cache")
+
+AGGREGATED_AT = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+# ============================================================
+# P² median
+# ============================================================
+def test_p2_median_is_exact_below_five_samples():
+    sk = P2Median()
+    assert sk.median() is None and sk.quartiles() is None
+
+    for x in (300, 100, 200):
+        sk.add(x)
+    assert sk.median() == 200
+    assert sk.quartiles() == (100, 300)
+
+    sk.add(400)
+    assert sk.median() == 250
+
+
+def test_p2_median_tracks_true_median():
+    rng = random.Random(0)
+    values = [rng.gauss(1_500_000, 300_000) for _ in range(2000)]
+    sk = P2Median()
+    for x in values:
+        sk.add(x)
+
+    true_median = statistics.median(values)
+    assert abs(sk.median() - true_median) / true_median < 0.02
+    q1, q3 = sk.quartiles()
+    assert q1 < sk.median() < q3
+
+
+def test_p2_state_round_trips_between_refreshes():
+    values = [float(v) for v in range(1, 51)]
+    whole = P2Median()
+    for x in values:
+        whole.add(x)
+
+    resumed = P2Median()
+    for x in values[:20]:
+        resumed.add(x)
+    resumed = P2Median.from_state(resumed.to_state())
+    for x in values[20:]:
+        resumed.add(x)
+
+    assert resumed.to_state() == whole.to_state()
+    assert P2Median.from_state({"n": "x"}).n == 0
+
+
+# ============================================================
+# 集計後に変更された車両の見直し
+# ============================================================
+def _aggregated(db, store_id, *, model: str, price: int) -> Car:
+    key = bucket_key(make="トヨタ", model=model, grade=None, year=2017, mileage=30_000)
+    bucket = db.execute(
+        select(ValuationOwnCache).where(ValuationOwnCache.store_id == store_id, ValuationOwnCache.model == key[1])
+    ).scalar_one_or_none()
+    if bucket is None:
+        make, model_n, grade, yc, mb = key
+        bucket = ValuationOwnCache(
+            store_id=store_id, make=make, model=model_n, grade=grade,
+            year_center=yc, mileage_bucket=mb, own_count=0,
+        )
+        db.add(bucket)
+        db.flush()
+    bucket.own_count += 1
+    car = Car(
+        store_id=store_id,
+        user_id=uuid.uuid4(),
+        stock_no="S-1",
+        status="売約済み",
+        make="トヨタ",
+        model=model,
+        year=2017,
+        mileage=30_000,
+        expected_sell_price=price,
+        valuation_aggregated_at=AGGREGATED_AT,
+        valuation_bucket_id=bucket.id,
+        valuation_aggregated_price=price,
+        updated_at=AGGREGATED_AT,
+    )
+    db.add(car)
+    db.flush()
+    return car
+
+
+def _touch(db, car: Car, **values) -> None:
+    for k, v in values.items():
+        setattr(car, k, v)
+    car.updated_at = AGGREGATED_AT + timedelta(hours=1)
+    db.flush()
+
+
+def test_edit_without_price_or_bucket_change_keeps_aggregation(session_factory):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        car = _aggregated(db, store_id, model="プリウス", price=1_000_000)
+        _touch(db, car, color="白")
+
+        assert valuation_own_cache._reset_changed(db, store_id) == 0
+        db.commit()
+
+        db.refresh(car)
+        assert car.valuation_bucket_id is not None
+        assert car.valuation_aggregated_at is not None
+        assert db.execute(select(ValuationOwnCache)).scalars().all()
+
+
+def test_price_change_resets_only_that_bucket(session_factory):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        changed = _aggregated(db, store_id, model="プリウス", price=1_000_000)
+        same_bucket = _aggregated(db, store_id, model="プリウス", price=1_200_000)
+        other = _aggregated(db, store_id, model="アクア", price=800_000)
+        _touch(db, changed, expected_sell_price=900_000)
+
+        assert valuation_own_cache._reset_changed(db, store_id) == 1
+        db.commit()
+
+        for car in (changed, same_bucket, other):
+            db.refresh(car)
+        # 同じバケットの車両は取り込み直す
+        assert changed.valuation_aggregated_at is None
+        assert same_bucket.valuation_aggregated_at is None
+        assert same_bucket.valuation_bucket_id is None
+        # 他のバケットはそのまま
+        assert other.valuation_aggregated_at is not None
+        [remaining] = db.execute(select(ValuationOwnCache)).scalars().all()
+        assert remaining.id == other.valuation_bucket_id
+
+
+def test_unsold_car_resets_its_bucket(session_factory):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        car = _aggregated(db, store_id, model="プリウス", price=1_000_000)
+        _touch(db, car, status="在庫")
+
+        assert valuation_own_cache._reset_changed(db, store_id) == 1
+        db.commit()
+
+        db.refresh(car)
+        assert car.valuation_aggregated_at is None
+        assert db.execute(select(ValuationOwnCache)).scalars().all() == []
@@ -0,0 +1,130 @@
+import uuid
+
+import pytest
+from fastapi import Response
+from starlette.requests import Request
+
+from app.models.maintenance_preset import MaintenancePresetORM
+from app.models.work_master import WorkMasterORM, WorkMasterRateORM
+from app.services import work_catalog
+
+TABLES = ("work_masters", "work_master_rates", "maintenance_presets")
+# commit 前の内容が別セッションから見えないよう、接続を共有しないファイル DB を使う
+FILE_DB = True
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache(monkeypatch):
+    monkeypatch.setattr(work_catalog, "WORK_CATALOG_TTL_SEC", 3600)
+    monkeypatch.setattr(work_catalog, "_cache", {})
+
+
+def _add_work(db, store_id, name, rates=(("普通", 60, 5000),)) -> WorkMasterORM:
+    wm = WorkMasterORM(work_name=name, work_category="点検", store_id=store_id, is_active=True, sort_order=0)
+    wm.rates = [WorkMasterRateORM(vehicle_category=vc, duration_minutes=m, price=p) for vc, m, p in rates]
+    db.add(wm)
+    return wm
+
+
+def _names(catalog) -> list:
+    return [i.work_name for i in catalog.items]
+
+
+def test_catalog_is_cached_and_indexed(session_factory):
+    store_id = uuid.uuid4()
+    with session_factory() as db:
+        _add_work(db, None, "共通点検")
+        _add_work(db, store_id, "店舗点検", rates=(("軽", 30, 3000), ("普通", 45, 4000)))
+        _add_work(db, uuid.uuid4(), "他店点検")
+        db.commit()
+
+    with session_factory() as db:
+        first = work_catalog.get_work_catalog(db, store_id)
+        assert work_catalog.get_work_catalog(db, store_id) is first
+
+    assert sorted(_names(first)) == ["共通点検", "店舗点検"]
+    assert [w.work_name for w in first.by_vehicle_category["軽"]] == ["店舗点検"]
+    assert sorted(w.work_name for w in first.by_vehicle_category["普通"]) == ["共通点検", "店舗点検"]
+
+
+def test_store_change_invalidates_only_that_store(session_factory):
+    store_a, store_b = uuid.uuid4(), uuid.uuid4()
+    with session_factory() as db:
+        wm = _add_work(db, store_a, "A点検")
+        db.commit()
+        before_a = work_catalog.get_work_catalog(db, store_a)
+        before_b = work_catalog.get_work_catalog(db, store_b)
+
+        # 工賃だけの変更でも作業マスタの店舗のキャッシュを捨てる
+        wm.rates[0].price = 6000
+        db.commit()
+
+        after_a = work_catalog.get_work_catalog(db, store_a)
+        assert after_a is not before_a
+        assert after_a.etag != before_a.etag
+        assert after_a.by_vehicle_category["普通"][0].price == 6000
+        assert work_catalog.get_work_catalog(db, store_b) is before_b
+
+
+def test_system_default_change_invalidates_every_store(session_factory):
+    store_a, store_b = uuid.uuid4(), uuid.uuid4()
+    with session_factory() as db:
+        before = [work_catalog.get_preset_catalog(db, s) for s in (store_a, store_b)]
+        db.add(MaintenancePresetORM(name="共通オイル交換", vehicle_category="普通", duration_minutes=30))
+        db.commit()
+
+        for store_id, old in zip((store_a, store_b), before):
+            new = work_catalog.get_preset_catalog(db, store_id)
+            assert new is not old
+            assert [p.name for p in new.by_vehicle_category["普通"]] == ["共通オイル交換"]
+
+
+def test_catalog_built_before_commit_is_dropped_at_commit(session_factory):
+    store_id = uuid.uuid4()
+    writer = session_factory()
+    try:
+        _add_work(writer, store_id, "新規点検")
+        writer.flush()
+
+        # flush 後・commit 前に別のリクエストが古い内容でカタログを作る
+        with session_factory() as reader:
+            stale = work_catalog.get_work_catalog(reader, store_id)
+
+        writer.commit()
+    finally:
+        writer.close()
+
+    with session_factory() as db:
+        fresh = work_catalog.get_work_catalog(db, store_id)
+    assert fresh is not stale
+    assert _names(fresh) == ["新規点検"]
+
+
+def test_rollback_clears_pending_invalidations(session_factory):
+    with session_factory() as db:
+        _add_work(db, uuid.uuid4(), "取消点検")
+        db.flush()
+        assert db.info[work_catalog._PENDING_KEY]
+        db.rollback()
+        assert work_catalog._PENDING_KEY not in db.info
+
+
+def _request(headers: dict) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_conditional_returns_304_for_matching_etag(session_factory):
+    with session_factory() as db:
+        etag = work_catalog.get_work_catalog(db, uuid.uuid4()).etag
+
+    response = Response()
+    assert work_catalog.conditional(_request({}), response, etag) is None
+    assert response.headers["etag"] == etag
+
+    not_modified = work_catalog.conditional(_request({"If-None-Match": etag}), Response(), etag)
+    assert not_modified is not None and not_modified.status_code == 304
+
+    variant = work_catalog.variant_etag(etag, "普通")
+    assert variant != etag
+    assert work_catalog.conditional(_request({"If-None-Match": etag}), Response(), variant) is None
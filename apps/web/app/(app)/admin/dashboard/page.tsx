@@ -4,13 +4,27 @@ import * as React from "react";
 import Link from "next/link";
 import {
   LayoutDashboard, Building2, Users, CheckCircle, Clock, XCircle, AlertTriangle,
-  ArrowRight,
+  ArrowRight, JapaneseYen, TrendingDown,
 } from "lucide-react";
 import { apiFetch } from "@/lib/api";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 
 // ─── 型 ──────────────────────────────────────────────────────
 
+type PlanStats = {
+  plan: string;
+  total: number;
+  active: number;
+  trial: number;
+  suspended: number;
+  expired: number;
+  expiring_soon: number;
+  churned_30d: number;
+  churn_rate_30d: number;
+  mrr: number;
+  referral_discount: number;
+};
+
 type DashboardStats = {
   total_stores: number;
   total_users: number;
@@ -18,8 +32,18 @@ type DashboardStats = {
   licenses_trial: number;
   licenses_suspended: number;
   licenses_expiring_soon: number;
+  mrr: number;
+  referral_discount: number;
+  churned_30d: number;
+  churn_rate_30d: number;
+  plans: PlanStats[];
+  generated_at: string;
 };
 
+function pct(rate: number): string {
+  return `${(rate * 100).toFixed(1)}%`;
+}
+
 // ─── 統計カード ──────────────────────────────────────────────
 
 function StatCard({
@@ -132,9 +156,61 @@ export default function AdminDashboardPage() {
             color={stats.licenses_expiring_soon > 0 ? "#f59e0b" : "#555"}
             sub={stats.licenses_expiring_soon > 0 ? "要対応" : "問題なし"}
           />
+          <StatCard
+            label="MRR（月額換算・税抜）"
+            value={stats.mrr}
+            icon={<JapaneseYen size={28} />}
+            color="#10b981"
+            sub={stats.referral_discount > 0 ? `紹介割引 -${stats.referral_discount.toLocaleString()}円` : undefined}
+          />
+          <StatCard
+            label="直近30日の解約"
+            value={stats.churned_30d}
+            icon={<TrendingDown size={28} />}
+            color={stats.churned_30d > 0 ? "#ef4444" : "#555"}
+            sub={`解約率 ${pct(stats.churn_rate_30d)}`}
+          />
         </div>
       )}
 
+      {/* プラン別 */}
+      {stats && stats.plans.length > 0 && (
+        <Card className="border-border/60 shadow-sm">
+          <CardHeader className="pb-2">
+            <CardTitle className="text-sm">プラン別</CardTitle>
+          </CardHeader>
+          <CardContent>
+            <table className="w-full text-sm" style={{ fontVariantNumeric: "tabular-nums" }}>
+              <thead>
+                <tr className="text-muted-foreground text-xs">
+                  <th className="text-left py-1">プラン</th>
+                  <th className="text-right py-1">有効</th>
+                  <th className="text-right py-1">トライアル</th>
+                  <th className="text-right py-1">停止 / 期限切れ</th>
+                  <th className="text-right py-1">MRR</th>
+                  <th className="text-right py-1">解約率(30日)</th>
+                </tr>
+              </thead>
+              <tbody>
+                {stats.plans.map((p) => (
+                  <tr key={p.plan} className="border-t border-border/40">
+                    <td className="py-1">{p.plan}</td>
+                    <td className="text-right py-1">{p.active.toLocaleString()}</td>
+                    <td className="text-right py-1">{p.trial.toLocaleString()}</td>
+                    <td className="text-right py-1">{(p.suspended + p.expired).toLocaleString()}</td>
+                    <td className="text-right py-1">{p.mrr.toLocaleString()}円</td>
+                    <td className="text-right py-1">{pct(p.churn_rate_30d)}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+            <div className="text-xs text-muted-foreground mt-2">
+              集計: {new Date(stats.generated_at).toLocaleString("ja-JP")}
+            </div>
+          </CardContent>
+        </Card>
+      )}
+
       {/* クイックリンク */}
       <div className="space-y-2">
         <div className="text-sm font-semibold text-muted-foreground">クイックリンク</div>
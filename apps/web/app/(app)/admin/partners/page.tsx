@@ -133,8 +133,12 @@ function PartnerDialog({
 
 // ─── Main Page ─────────────────────────────────────────────────────────────────
 
+const PAGE_SIZE = 100;
+
 export default function AdminPartnersPage() {
   const [partners, setPartners] = React.useState<Partner[]>([]);
+  const [total, setTotal] = React.useState(0);
+  const [page, setPage] = React.useState(0);
   const [licenses, setLicenses] = React.useState<License[]>([]);
   const [loading, setLoading] = React.useState(false);
   const [error, setError] = React.useState<string | null>(null);
@@ -143,17 +147,26 @@ export default function AdminPartnersPage() {
   const load = React.useCallback(async () => {
     setLoading(true); setError(null);
     try {
-      const [pd, ld] = await Promise.all([listPartners(), listLicenses()]);
-      setPartners(pd); setLicenses(ld);
+      const [pd, ld] = await Promise.all([
+        listPartners({ limit: PAGE_SIZE, offset: page * PAGE_SIZE }),
+        listLicenses(),
+      ]);
+      setPartners(pd.items); setTotal(pd.total); setLicenses(ld);
     } catch (e: any) { setError(e?.message ?? "読み込みに失敗しました"); }
     finally { setLoading(false); }
-  }, []);
+  }, [page]);
 
   React.useEffect(() => { void load(); }, [load]);
 
+  const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE));
+
   async function handleDelete(p: Partner) {
     if (!confirm(`「${p.name}」を削除しますか？`)) return;
-    try { await deletePartner(p.id); setPartners((prev) => prev.filter((x) => x.id !== p.id)); }
+    try {
+      await deletePartner(p.id);
+      setPartners((prev) => prev.filter((x) => x.id !== p.id));
+      setTotal((t) => Math.max(0, t - 1));
+    }
     catch (e: any) { alert(e?.message ?? "削除に失敗しました"); }
   }
 
@@ -168,6 +181,7 @@ export default function AdminPartnersPage() {
           onClose={() => setDialog(null)}
           onSaved={(p) => {
             setPartners((prev) => dialog === "create" ? [p, ...prev] : prev.map((x) => x.id === p.id ? p : x));
+            if (dialog === "create") setTotal((t) => t + 1);
             setDialog(null);
           }}
         />
@@ -236,6 +250,15 @@ export default function AdminPartnersPage() {
           </table>
         </div>
       </div>
+
+      {total > PAGE_SIZE && (
+        <div style={{ display: "flex", alignItems: "center", justifyContent: "flex-end", gap: 10, marginTop: 12, fontSize: 13, color: "#aaa" }}>
+          <span>全 {total} 件</span>
+          <button onClick={() => setPage((n) => Math.max(0, n - 1))} disabled={loading || page === 0} style={{ padding: "6px 12px", borderRadius: 8, border: "1px solid #3a3a3a", background: "transparent", color: "#bbb", fontWeight: 700, fontSize: 12, cursor: "pointer", opacity: page === 0 ? 0.4 : 1 }}>前へ</button>
+          <span>{page + 1} / {pageCount}</span>
+          <button onClick={() => setPage((n) => Math.min(pageCount - 1, n + 1))} disabled={loading || page + 1 >= pageCount} style={{ padding: "6px 12px", borderRadius: 8, border: "1px solid #3a3a3a", background: "transparent", color: "#bbb", fontWeight: 700, fontSize: 12, cursor: "pointer", opacity: page + 1 >= pageCount ? 0.4 : 1 }}>次へ</button>
+        </div>
+      )}
     </div>
   );
 }
@@ -5,11 +5,13 @@ import { ClipboardCheck, MapPin, Pencil, Trash2, X, Check } from "lucide-react";
 
 import {
   listAttendance,
+  getTimesheet,
   updateAttendance,
   deleteAttendance,
   calcWorkHours,
   type Attendance,
   type AttendanceUpdate,
+  type TimesheetUser,
 } from "@/lib/api/attendance";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
@@ -146,6 +148,7 @@ function EditRow({
 export default function AttendancePage() {
   const [items, setItems] = React.useState<Attendance[]>([]);
   const [total, setTotal] = React.useState(0);
+  const [timesheet, setTimesheet] = React.useState<TimesheetUser[]>([]);
   const [loading, setLoading] = React.useState(true);
   const [error, setError] = React.useState<string | null>(null);
 
@@ -157,9 +160,13 @@ export default function AttendancePage() {
     setLoading(true);
     setError(null);
     try {
-      const data = await listAttendance({ start_date: startDate, end_date: endDate, limit: 200 });
+      const [data, sheet] = await Promise.all([
+        listAttendance({ start_date: startDate, end_date: endDate, limit: 200 }),
+        getTimesheet({ start_date: startDate, end_date: endDate }),
+      ]);
       setItems(data.items);
       setTotal(data.total);
+      setTimesheet(sheet.items);
     } catch (e) {
       setError(errMsg(e));
     } finally {
@@ -179,21 +186,16 @@ export default function AttendancePage() {
     }
   };
 
-  // ユーザー別サマリー（表示期間内の合計勤務時間）
-  const summary = React.useMemo(() => {
-    const map = new Map<string, { name: string; days: number; totalMs: number }>();
-    for (const r of items) {
-      const key = r.user_id;
-      const name = r.user_name ?? r.user_email ?? r.user_id;
-      const ms =
-        r.clock_in && r.clock_out
-          ? Math.max(0, new Date(r.clock_out).getTime() - new Date(r.clock_in).getTime())
-          : 0;
-      const prev = map.get(key) ?? { name, days: 0, totalMs: 0 };
-      map.set(key, { name, days: prev.days + 1, totalMs: prev.totalMs + ms });
-    }
-    return Array.from(map.values()).sort((a, b) => a.name.localeCompare(b.name));
-  }, [items]);
+  // ユーザー別サマリー（表示期間内の合計勤務時間。一覧の件数上限に関係なくサーバーで集計）
+  const summary = React.useMemo(
+    () =>
+      timesheet.map((t) => ({
+        name: t.user_name ?? t.user_email ?? t.user_id,
+        days: t.days,
+        totalMs: t.total_minutes * 60000,
+      })),
+    [timesheet],
+  );
 
   return (
     <div className="space-y-4">
@@ -13,7 +13,14 @@ import {
 } from "lucide-react";
 
 import { Button } from "@/components/ui/button";
-import { downloadTemplate, uploadImportCsv, type ImportResult, type ImportRowResult } from "@/lib/api";
+import {
+  downloadTemplate,
+  submitImportJob,
+  waitImportJob,
+  type ImportJob,
+  type ImportResult,
+  type ImportRowResult,
+} from "@/lib/api";
 
 // ─── タブ定義 ─────────────────────────────────────────────────────────────────
 
@@ -80,9 +87,35 @@ function Summary({ result, imported }: { result: ImportResult; imported: boolean
   );
 }
 
+// ─── 進捗表示 ──────────────────────────────────────────────────────────────────
+
+function JobProgress({ job, label }: { job: ImportJob | null; label: string }) {
+  const p = job?.progress;
+  const pct = p && p.bytes_total > 0 ? Math.min(100, Math.floor((p.bytes_read / p.bytes_total) * 100)) : 0;
+  return (
+    <div className="space-y-2 rounded-xl border bg-slate-50 px-5 py-4">
+      <div className="flex items-center justify-between text-sm">
+        <span className="font-semibold text-slate-700">
+          {!job || job.status === "queued" ? "順番待ち..." : label}
+        </span>
+        <span className="text-slate-500">{pct}%</span>
+      </div>
+      <div className="h-2 w-full overflow-hidden rounded-full bg-slate-200">
+        <div className="h-full bg-blue-500 transition-all" style={{ width: `${pct}%` }} />
+      </div>
+      {p && (
+        <p className="text-xs text-slate-500">
+          {p.rows_parsed}行読み込み ・ 正常 {p.rows_valid} ・ エラー {p.rows_error}
+          {p.rows_inserted > 0 && ` ・ 登録 ${p.rows_inserted}`}
+        </p>
+      )}
+    </div>
+  );
+}
+
 // ─── プレビューテーブル ────────────────────────────────────────────────────────
 
-function PreviewTable({ rows }: { rows: ImportRowResult[] }) {
+function PreviewTable({ rows, total }: { rows: ImportRowResult[]; total?: number }) {
   const preview = rows.slice(0, 10);
   // データのキー一覧（最初の行から取得）
   const cols = preview.length > 0 ? Object.keys(preview[0].data) : [];
@@ -124,9 +157,9 @@ function PreviewTable({ rows }: { rows: ImportRowResult[] }) {
           ))}
         </tbody>
       </table>
-      {rows.length > 10 && (
+      {(total ?? rows.length) > 10 && (
         <p className="text-xs text-slate-500 px-3 py-2 bg-slate-50">
-          ※ 先頭10件のみ表示（全{rows.length}件）
+          ※ 先頭10件のみ表示（全{total ?? rows.length}件）
         </p>
       )}
     </div>
@@ -169,7 +202,7 @@ function DropZone({
       <p className="text-base font-semibold text-slate-600">
         CSVファイルをドロップ、またはクリックして選択
       </p>
-      <p className="text-sm text-slate-400">UTF-8 / Shift-JIS 対応 ・ 最大 5MB</p>
+      <p className="text-sm text-slate-400">UTF-8 / Shift-JIS 対応 ・ 最大 100MB</p>
       <input
         ref={inputRef}
         type="file"
@@ -196,6 +229,7 @@ export default function ImportPage() {
   const [preview, setPreview] = React.useState<ImportResult | null>(null);
   const [result, setResult] = React.useState<ImportResult | null>(null);
   const [loading, setLoading] = React.useState(false);
+  const [job, setJob] = React.useState<ImportJob | null>(null);
   const [error, setError] = React.useState<string | null>(null);
 
   // タブ切り替え時にリセット
@@ -208,6 +242,17 @@ export default function ImportPage() {
     setError(null);
   };
 
+  // ジョブとして投入し、終了まで進捗を表示する（大きいファイルでもリクエストがタイムアウトしない）
+  const runJob = async (f: File, dryRun: boolean): Promise<ImportResult> => {
+    setJob(null);
+    const { job_id } = await submitImportJob(tab, f, dryRun);
+    const finished = await waitImportJob(job_id, setJob);
+    if (finished.status !== "done" || !finished.result) {
+      throw new Error(finished.error ?? "import job failed");
+    }
+    return finished.result;
+  };
+
   // ファイル選択 → プレビュー
   const handleFile = async (f: File) => {
     setFile(f);
@@ -216,13 +261,14 @@ export default function ImportPage() {
     setPreview(null);
     setLoading(true);
     try {
-      const res = await uploadImportCsv(tab, f, true);
+      const res = await runJob(f, true);
       setPreview(res);
       setPhase("preview");
     } catch {
       setError("CSVの読み込みに失敗しました。ファイルとフォーマットを確認してください。");
     } finally {
       setLoading(false);
+      setJob(null);
     }
   };
 
@@ -232,13 +278,14 @@ export default function ImportPage() {
     setLoading(true);
     setError(null);
     try {
-      const res = await uploadImportCsv(tab, file, false);
+      const res = await runJob(file, false);
       setResult(res);
       setPhase("done");
     } catch {
       setError("インポートに失敗しました。再度お試しください。");
     } finally {
       setLoading(false);
+      setJob(null);
     }
   };
 
@@ -313,6 +360,7 @@ export default function ImportPage() {
       {phase === "idle" && (
         <DropZone onFile={handleFile} disabled={loading} />
       )}
+      {phase === "idle" && loading && <JobProgress job={job} label="読み込み中..." />}
 
       {/* ── Phase: preview ── */}
       {phase === "preview" && preview && (
@@ -333,7 +381,7 @@ export default function ImportPage() {
           <Summary result={preview} imported={false} />
 
           {/* プレビューテーブル */}
-          <PreviewTable rows={preview.rows} />
+          <PreviewTable rows={preview.rows} total={preview.total} />
 
           {/* インポート実行ボタン */}
           <div className="flex gap-3 flex-wrap">
@@ -357,6 +405,8 @@ export default function ImportPage() {
             </Button>
           </div>
 
+          {loading && <JobProgress job={job} label="登録中..." />}
+
           {preview.valid === 0 && (
             <p className="text-sm text-red-600">
               正常行が0件のためインポートできません。CSVを修正してください。
@@ -386,7 +436,10 @@ export default function ImportPage() {
           {result.errors > 0 && (
             <div className="space-y-2">
               <h3 className="text-sm font-semibold text-red-700">スキップされた行の詳細</h3>
-              <PreviewTable rows={result.rows.filter((r) => r.status === "error")} />
+              <PreviewTable
+                rows={result.rows.filter((r) => r.status === "error")}
+                total={result.errors}
+              />
             </div>
           )}
 
@@ -11,6 +11,8 @@ import {
   updateReservation,
   deleteReservation,
   findOverlappingReservations,
+  getLoanerAvailability,
+  type LoanerAvailability,
   type LoanerCar,
   type LoanerReservation,
 } from "@/lib/api/loanerCars";
@@ -61,9 +63,8 @@ type ResForm = {
   note: string;
 };
 
-function emptyResForm(carId = ""): ResForm {
-  const t = today();
-  return { loaner_car_id: carId, customer_name: "", start_date: t, end_date: t, note: "" };
+function emptyResForm(carId = "", start = today(), end = start): ResForm {
+  return { loaner_car_id: carId, customer_name: "", start_date: start, end_date: end, note: "" };
 }
 
 function resFormFromRes(r: LoanerReservation): ResForm {
@@ -99,6 +100,13 @@ export default function LoanerPage() {
   const [resError, setResError] = React.useState<string | null>(null);
   const [overlapWarning, setOverlapWarning] = React.useState<LoanerReservation[]>([]);
 
+  // 空き状況
+  const [availFrom, setAvailFrom] = React.useState(today());
+  const [availTo, setAvailTo] = React.useState(today());
+  const [availability, setAvailability] = React.useState<LoanerAvailability[] | null>(null);
+  const [availLoading, setAvailLoading] = React.useState(false);
+  const [availError, setAvailError] = React.useState<string | null>(null);
+
   const load = React.useCallback(async () => {
     setLoading(true);
     setError(null);
@@ -118,6 +126,19 @@ export default function LoanerPage() {
 
   React.useEffect(() => { void load(); }, [load]);
 
+  async function searchAvailability() {
+    if (!availFrom || !availTo || availTo < availFrom) { setAvailError("期間を正しく入力してください"); return; }
+    setAvailLoading(true);
+    setAvailError(null);
+    try {
+      setAvailability(await getLoanerAvailability(availFrom, availTo));
+    } catch (e: unknown) {
+      setAvailError(e instanceof Error ? e.message : "検索失敗");
+    } finally {
+      setAvailLoading(false);
+    }
+  }
+
   // ─── 代車フォーム ──────────────────────────────────────────────
 
   function openCreateCar() {
@@ -186,8 +207,8 @@ export default function LoanerPage() {
     setOverlapWarning(conflicts);
   }
 
-  function openCreateRes(carId = "") {
-    const f = emptyResForm(carId);
+  function openCreateRes(carId = "", start?: string, end?: string) {
+    const f = emptyResForm(carId, start, end);
     setEditingRes(null);
     setResForm(f);
     setResError(null);
@@ -230,6 +251,7 @@ export default function LoanerPage() {
         await createReservation(payload);
       }
       await load();
+      if (availability) void searchAvailability();
       setResDialog(false);
     } catch (e: unknown) {
       setResError(e instanceof Error ? e.message : "保存失敗");
@@ -286,6 +308,59 @@ export default function LoanerPage() {
         </div>
       )}
 
+      {/* 空き状況 */}
+      <Card>
+        <CardHeader className="pb-2">
+          <CardTitle className="text-base">空き状況</CardTitle>
+        </CardHeader>
+        <CardContent className="space-y-3">
+          <div className="flex items-end gap-2 flex-wrap">
+            <div className="space-y-1">
+              <Label htmlFor="avail-from">貸出開始日</Label>
+              <Input id="avail-from" type="date" value={availFrom} onChange={(e) => setAvailFrom(e.target.value)} />
+            </div>
+            <div className="space-y-1">
+              <Label htmlFor="avail-to">返却日</Label>
+              <Input id="avail-to" type="date" value={availTo} onChange={(e) => setAvailTo(e.target.value)} />
+            </div>
+            <Button variant="outline" onClick={() => void searchAvailability()} disabled={availLoading}>
+              {availLoading ? "検索中..." : "空きを検索"}
+            </Button>
+          </div>
+          {availError && <div className="text-sm text-destructive">{availError}</div>}
+          {availability && availability.length === 0 && (
+            <div className="text-sm text-muted-foreground">有効な代車がありません。</div>
+          )}
+          {availability && availability.length > 0 && (
+            <div className="divide-y rounded-md border">
+              {availability.map((a) => (
+                <div key={a.loaner_car_id} className="flex items-center justify-between gap-3 p-2 text-sm flex-wrap">
+                  <div className="flex items-center gap-2">
+                    <span className="font-medium">{a.name}</span>
+                    {a.plate_no && <span className="text-muted-foreground">{a.plate_no}</span>}
+                    {a.available
+                      ? <Badge>空きあり</Badge>
+                      : <Badge variant="secondary">{a.free_slots.length > 0 ? "一部空き" : "予約あり"}</Badge>}
+                  </div>
+                  <div className="flex items-center gap-2 flex-wrap">
+                    {!a.available && a.free_slots.map((s) => (
+                      <span key={s.start_date} className="text-muted-foreground">
+                        {fmtDate(s.start_date)} 〜 {fmtDate(s.end_date)}
+                      </span>
+                    ))}
+                    {a.available && (
+                      <Button size="sm" variant="outline" onClick={() => openCreateRes(a.loaner_car_id, availFrom, availTo)}>
+                        この期間で予約
+                      </Button>
+                    )}
+                  </div>
+                </div>
+              ))}
+            </div>
+          )}
+        </CardContent>
+      </Card>
+
       {/* 代車カード一覧 */}
       {!loading && cars.length === 0 && (
         <div className="text-center py-12 text-muted-foreground text-sm">
@@ -40,11 +40,15 @@ async function proxy(request: NextRequest): Promise<NextResponse> {
   try {
     const apiRes = await fetch(targetUrl, init);
     const body = await apiRes.text();
+    const resHeaders: Record<string, string> = {
+      "content-type": apiRes.headers.get("content-type") ?? "application/json",
+    };
+    // 一覧 API の総件数（ページング用）
+    const total = apiRes.headers.get("x-total-count");
+    if (total !== null) resHeaders["x-total-count"] = total;
     return new NextResponse(body, {
       status: apiRes.status,
-      headers: {
-        "content-type": apiRes.headers.get("content-type") ?? "application/json",
-      },
+      headers: resHeaders,
     });
   } catch (e) {
     console.error(`[/api/v1/*] proxy error -> ${targetUrl}:`, e);
@@ -12,6 +12,7 @@ type ExportVehicle = {
   mileage?: number | null;
   export_price?: number | null;
   export_image_url?: string | null;
+  export_image_thumb_url?: string | null;
 };
 
 function apiBaseUrl() {
@@ -83,7 +84,7 @@ export default function ExportPage() {
               {v.export_image_url ? (
                 // eslint-disable-next-line @next/next/no-img-element
                 <img
-                  src={v.export_image_url}
+                  src={v.export_image_thumb_url ?? v.export_image_url}
                   alt={`${v.make ?? ""} ${v.model ?? ""}`.trim() || "vehicle"}
                   className="mb-3 h-48 w-full rounded-xl object-cover"
                   loading="lazy"
@@ -32,6 +32,23 @@ export type AttendanceListOut = {
   total: number;
 };
 
+export type TimesheetUser = {
+  user_id: string;
+  user_name: string | null;
+  user_email: string | null;
+  days: number;
+  completed_days: number;
+  incomplete_days: number;
+  total_minutes: number;
+};
+
+export type Timesheet = {
+  start_date: string;
+  end_date: string;
+  items: TimesheetUser[];
+  total_minutes: number;
+};
+
 export type ClockRequest = {
   lat?: number | null;
   lng?: number | null;
@@ -73,6 +90,22 @@ export async function listAttendance(params?: AttendanceFilter): Promise<Attenda
   return apiFetch<AttendanceListOut>(`/api/v1/attendance${q ? "?" + q : ""}`);
 }
 
+/** スタッフ別の期間集計（month=YYYY-MM か start_date/end_date） */
+export async function getTimesheet(params: {
+  month?: string;
+  start_date?: string;
+  end_date?: string;
+  user_id?: string;
+}): Promise<Timesheet> {
+  const qs = new URLSearchParams();
+  if (params.month) qs.set("month", params.month);
+  if (params.start_date) qs.set("start_date", params.start_date);
+  if (params.end_date) qs.set("end_date", params.end_date);
+  if (params.user_id) qs.set("user_id", params.user_id);
+  const q = qs.toString();
+  return apiFetch<Timesheet>(`/api/v1/attendance/timesheet${q ? "?" + q : ""}`);
+}
+
 export async function getTodayAttendance(): Promise<Attendance | null> {
   const res = await apiFetch<Attendance | null>("/api/v1/attendance/today");
   return res ?? null;
@@ -243,20 +243,58 @@ export async function deleteCar(id: string): Promise<void> {
   await apiFetch<void>(`/api/v1/cars/${encodeURIComponent(id)}`, { method: "DELETE", auth: true });
 }
 
+type ShakenOcrJob = {
+  job_id: string;
+  status: "queued" | "running" | "done" | "failed" | "timeout";
+  result: (ShakenOcrFields & { raw_text?: string | null }) | null;
+  error: string | null;
+};
+
+/** 車検証 OCR ジョブのポーリング間隔・待つ上限（サーバー側のタイムアウト既定 120 秒 + 余裕） */
+const SHAKEN_OCR_POLL_MS = 1500;
+const SHAKEN_OCR_WAIT_MS = 180_000;
+
+/**
+ * 車検証 OCR。ジョブとして投入し（POST /shaken/jobs）、完了まで GET /shaken/jobs/{id} をポーリングする。
+ * OCR 中にリクエストを張りっぱなしにしないので、プロキシのタイムアウトにかからない。
+ */
 export async function ocrShaken(file: File): Promise<ShakenOcrResult> {
   const form = new FormData();
   form.append("file", file);
-  const data = await apiFetch<unknown>("/api/v1/ocr/shaken", {
+  const { job_id } = await apiFetch<{ job_id: string }>("/api/v1/shaken/jobs", {
     method: "POST",
     body: form,
     auth: true,
     headers: {},
   });
-  const anyData = data as any;
-  return {
-    text: String(anyData?.text ?? ""),
-    fields: (anyData?.fields ?? {}) as ShakenOcrFields,
-  };
+
+  const url = `/api/v1/shaken/jobs/${encodeURIComponent(job_id)}`;
+  const deadline = Date.now() + SHAKEN_OCR_WAIT_MS;
+  for (;;) {
+    const job = await apiFetch<ShakenOcrJob>(url, { method: "GET", auth: true });
+    if (job.status === "done" && job.result) {
+      const { raw_text, ...fields } = job.result;
+      const text = String(raw_text ?? "");
+      if (text.trim().length < 10) {
+        throw new ApiError({
+          status: 422,
+          url,
+          message: "文字を抽出できませんでした。鮮明な画像かPDFを使用してください。",
+        });
+      }
+      return { text, fields: fields as ShakenOcrFields };
+    }
+    if (job.status === "timeout") {
+      throw new ApiError({ status: 504, url, message: "OCR処理がタイムアウトしました。" });
+    }
+    if (job.status === "failed" || job.status === "done") {
+      throw new ApiError({ status: 500, url, message: "OCR処理に失敗しました。再度お試しください。", detail: job.error });
+    }
+    if (Date.now() > deadline) {
+      throw new ApiError({ status: 504, url, message: "OCR処理がタイムアウトしました。" });
+    }
+    await new Promise((r) => setTimeout(r, SHAKEN_OCR_POLL_MS));
+  }
 }
 
 export async function listCarStatuses(): Promise<CarStatus[]> {
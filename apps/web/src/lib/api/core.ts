@@ -86,6 +86,23 @@ export type ApiFetchOptions = {
 };
 
 export async function apiFetch<T>(path: string, options: ApiFetchOptions = {}): Promise<T> {
+  const res = await apiFetchResponse(path, options);
+  if (res.status === 204) return undefined as unknown as T;
+  return (await safeReadJson(res)) as T;
+}
+
+export type Page<T> = { items: T[]; total: number };
+
+/** 一覧 API 用。総件数は X-Total-Count ヘッダーから取る（無ければ items.length） */
+export async function apiFetchPage<T>(path: string, options: ApiFetchOptions = {}): Promise<Page<T>> {
+  const res = await apiFetchResponse(path, options);
+  const items = ((await safeReadJson(res)) as T[] | null) ?? [];
+  const header = res.headers.get("x-total-count");
+  const total = header !== null && !Number.isNaN(Number(header)) ? Number(header) : items.length;
+  return { items, total };
+}
+
+async function apiFetchResponse(path: string, options: ApiFetchOptions): Promise<Response> {
   const method = options.method ?? "GET";
   const url = buildUrl(path);
 
@@ -117,6 +134,5 @@ export async function apiFetch<T>(path: string, options: ApiFetchOptions = {}):
     });
   }
 
-  if (res.status === 204) return undefined as unknown as T;
-  return (await safeReadJson(res)) as T;
+  return res;
 }
@@ -12,7 +12,13 @@ export interface ImportResult {
   valid: number;
   errors: number;
   imported: number;
+  /** imported のうち既存データを上書きした件数（mode=upsert） */
+  updated: number;
+  /** 先頭数行 + エラー行（上限あり）。全行は返らない */
   rows: ImportRowResult[];
+  truncated: boolean;
+  /** エラー理由ごとの件数 */
+  error_summary: Record<string, number>;
 }
 
 /** テンプレート CSV をダウンロード（ブラウザ経由）*/
@@ -25,16 +31,141 @@ export function downloadTemplate(type: "cars" | "customers") {
   a.click();
 }
 
-/** CSV をアップロードしてプレビュー／インポート */
+/**
+ * CSV をアップロードしてプレビュー／インポート
+ * mode="upsert" なら登録済みの車体番号 / 電話番号は上書き（既定はスキップ）
+ */
 export async function uploadImportCsv(
   type: "cars" | "customers",
   file: File,
-  dryRun: boolean
+  dryRun: boolean,
+  mode: "insert" | "upsert" = "insert"
 ): Promise<ImportResult> {
   const formData = new FormData();
   formData.append("file", file);
   return apiFetch<ImportResult>(
-    `/api/v1/import/${type}?dry_run=${dryRun}`,
+    `/api/v1/import/${type}?dry_run=${dryRun}&mode=${mode}`,
     { method: "POST", body: formData }
   );
 }
+
+// ─── バックグラウンドジョブ（大きいファイル向け）────────────────────────────────
+
+export interface ImportJobProgress {
+  bytes_total: number;
+  bytes_read: number;
+  rows_parsed: number;
+  rows_valid: number;
+  rows_error: number;
+  rows_inserted: number;
+  rows_updated: number;
+}
+
+export interface ImportJob {
+  job_id: string;
+  kind: "cars" | "customers";
+  mode: "insert" | "upsert";
+  dry_run: boolean;
+  status: "queued" | "running" | "done" | "failed";
+  filename: string | null;
+  progress: ImportJobProgress;
+  /** status=done のときのみ */
+  result: ImportResult | null;
+  error: string | null;
+  created_at: string | null;
+  finished_at: string | null;
+}
+
+/** CSV をジョブとして投入（即座に job_id が返る） */
+export async function submitImportJob(
+  type: "cars" | "customers",
+  file: File,
+  dryRun: boolean,
+  mode: "insert" | "upsert" = "insert"
+): Promise<{ job_id: string; status: ImportJob["status"] }> {
+  const formData = new FormData();
+  formData.append("file", file);
+  return apiFetch(`/api/v1/import/jobs?kind=${type}&dry_run=${dryRun}&mode=${mode}`, {
+    method: "POST",
+    body: formData,
+  });
+}
+
+export async function getImportJob(jobId: string): Promise<ImportJob> {
+  return apiFetch<ImportJob>(`/api/v1/import/jobs/${jobId}`);
+}
+
+/** 進捗を Server-Sent Events で受け取る URL（EventSource 用） */
+export function importJobEventsUrl(jobId: string): string {
+  return `/api/v1/import/jobs/${jobId}/events`;
+}
+
+/** SSE が使えないとき（プロキシが切る・非対応ブラウザ）のポーリング間隔 */
+const IMPORT_JOB_POLL_MS = 1500;
+
+function isFinished(job: ImportJob): boolean {
+  return job.status === "done" || job.status === "failed";
+}
+
+/**
+ * ジョブの終了（done / failed）まで待つ。
+ * 進捗は SSE で受け取り、接続できない・途中で切れたときは getImportJob のポーリングに切り替える。
+ */
+export function waitImportJob(
+  jobId: string,
+  onProgress?: (job: ImportJob) => void
+): Promise<ImportJob> {
+  return new Promise<ImportJob>((resolve, reject) => {
+    let settled = false;
+
+    const finish = (job: ImportJob) => {
+      if (settled) return;
+      settled = true;
+      resolve(job);
+    };
+
+    const poll = async () => {
+      while (!settled) {
+        try {
+          const job = await getImportJob(jobId);
+          onProgress?.(job);
+          if (isFinished(job)) {
+            finish(job);
+            return;
+          }
+        } catch (e) {
+          settled = true;
+          reject(e);
+          return;
+        }
+        await new Promise((r) => setTimeout(r, IMPORT_JOB_POLL_MS));
+      }
+    };
+
+    if (typeof EventSource === "undefined") {
+      void poll();
+      return;
+    }
+
+    const es = new EventSource(importJobEventsUrl(jobId));
+    const handle = (ev: MessageEvent) => {
+      try {
+        const job = JSON.parse(ev.data) as ImportJob;
+        onProgress?.(job);
+        if (isFinished(job)) {
+          es.close();
+          finish(job);
+        }
+      } catch {
+        // 壊れたイベントは無視して次を待つ
+      }
+    };
+    es.addEventListener("progress", handle as EventListener);
+    es.addEventListener("result", handle as EventListener);
+    es.onerror = () => {
+      // 自動再接続に任せず、ポーリングで続きを取る
+      es.close();
+      if (!settled) void poll();
+    };
+  });
+}
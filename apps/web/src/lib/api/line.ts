@@ -102,6 +102,82 @@ export async function broadcastLineMessage(message: string): Promise<void> {
   });
 }
 
+export interface LineMulticastResult {
+  status: "ok" | "partial" | "error";
+  requested: number;
+  sent: number;
+  failed: number;
+  errors: Record<string, string>;
+}
+
+export async function multicastLineMessage(
+  lineCustomerIds: string[],
+  message: string,
+): Promise<LineMulticastResult> {
+  return apiFetch<LineMulticastResult>("/api/v1/line/messages/multicast", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ line_customer_ids: lineCustomerIds, message }),
+  });
+}
+
+// ---- キャンペーン ----
+
+export interface LineCampaignSegment {
+  linked?: boolean;
+  shaken_due_from?: string | null;
+  shaken_due_to?: string | null;
+  last_visit_from?: string | null;
+  last_visit_to?: string | null;
+}
+
+export interface LineCampaign {
+  id: string;
+  name: string | null;
+  message: string;
+  segment: LineCampaignSegment;
+  status: "queued" | "running" | "done" | "failed" | "cancelled";
+  total: number;
+  sent: number;
+  failed: number;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+export async function previewLineCampaign(segment: LineCampaignSegment): Promise<{ recipients: number }> {
+  return apiFetch<{ recipients: number }>("/api/v1/line/campaigns/preview", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(segment),
+  });
+}
+
+export async function createLineCampaign(input: {
+  name?: string;
+  message: string;
+  segment: LineCampaignSegment;
+}): Promise<LineCampaign> {
+  return apiFetch<LineCampaign>("/api/v1/line/campaigns", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(input),
+  });
+}
+
+export async function listLineCampaigns(limit = 50, offset = 0): Promise<LineCampaign[]> {
+  return apiFetch<LineCampaign[]>(`/api/v1/line/campaigns?limit=${limit}&offset=${offset}`);
+}
+
+export async function getLineCampaign(id: string): Promise<LineCampaign> {
+  return apiFetch<LineCampaign>(`/api/v1/line/campaigns/${id}`);
+}
+
+export async function cancelLineCampaign(id: string): Promise<LineCampaign> {
+  return apiFetch<LineCampaign>(`/api/v1/line/campaigns/${id}/cancel`, { method: "POST" });
+}
+
 // ---- 通知 ----
 
 export async function notifyWorkOrder(input: {
@@ -98,6 +98,34 @@ export async function deleteReservation(id: string): Promise<void> {
   await apiFetch(`/api/v1/loaner-reservations/${id}`, { method: "DELETE" });
 }
 
+// ─── 空き状況 ────────────────────────────────────────────────────
+
+export type LoanerFreeSlot = {
+  start_date: string;
+  end_date: string;
+};
+
+export type LoanerAvailability = {
+  loaner_car_id: string;
+  name: string;
+  plate_no: string | null;
+  color: string | null;
+  available: boolean;
+  free_slots: LoanerFreeSlot[];
+  reservations: LoanerReservation[];
+};
+
+/** 指定期間の全代車の空き状況（onlyFree なら期間すべてが空いている代車だけ） */
+export async function getLoanerAvailability(
+  from: string,
+  to: string,
+  onlyFree = false,
+): Promise<LoanerAvailability[]> {
+  const q = new URLSearchParams({ from, to });
+  if (onlyFree) q.set("only_free", "true");
+  return apiFetch<LoanerAvailability[]>(`/api/v1/loaner-cars/availability?${q.toString()}`);
+}
+
 // ─── クライアント側重複チェック ────────────────────────────────────
 
 /**
@@ -1,4 +1,4 @@
-import { apiFetch } from "./core";
+import { apiFetch, apiFetchPage, type Page } from "./core";
 
 export type PartnerRank = "silver" | "gold" | "platinum";
 export type ServiceType = "own" | "partner" | null;
@@ -67,8 +67,13 @@ export const RANK_COLORS: Record<PartnerRank, string> = {
   platinum: "#7c3aed",
 };
 
-export async function listPartners(): Promise<Partner[]> {
-  return apiFetch<Partner[]>("/api/v1/admin/partners");
+/** 1 ページ分（サーバー既定 100 件・最大 500 件）と総件数 */
+export async function listPartners(params?: { limit?: number; offset?: number }): Promise<Page<Partner>> {
+  const qs = new URLSearchParams();
+  if (params?.limit != null) qs.set("limit", String(params.limit));
+  if (params?.offset != null) qs.set("offset", String(params.offset));
+  const q = qs.toString();
+  return apiFetchPage<Partner>(`/api/v1/admin/partners${q ? "?" + q : ""}`);
 }
 
 export async function createPartner(input: PartnerCreateInput): Promise<Partner> {
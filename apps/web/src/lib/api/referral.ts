@@ -1,4 +1,4 @@
-import { apiFetch } from "./core";
+import { apiFetch, apiFetchPage, type Page } from "./core";
 
 export interface Referral {
   id: string;
@@ -29,8 +29,13 @@ export interface MyCodeInfo {
 
 export const REFERRAL_DISCOUNT_PER_ACTIVE = 1_000; // 円
 
-export async function listReferrals(): Promise<Referral[]> {
-  return apiFetch<Referral[]>("/api/v1/referrals");
+/** 1 ページ分（サーバー既定 100 件・最大 500 件）と総件数 */
+export async function listReferrals(params?: { limit?: number; offset?: number }): Promise<Page<Referral>> {
+  const qs = new URLSearchParams();
+  if (params?.limit != null) qs.set("limit", String(params.limit));
+  if (params?.offset != null) qs.set("offset", String(params.offset));
+  const q = qs.toString();
+  return apiFetchPage<Referral>(`/api/v1/referrals${q ? "?" + q : ""}`);
 }
 
 export async function activateReferral(id: string): Promise<Referral> {
@@ -41,8 +46,17 @@ export async function getMyCode(): Promise<MyCodeInfo> {
   return apiFetch<MyCodeInfo>("/api/v1/referrals/my-code");
 }
 
+/** 自店舗の紹介は画面でページングしないので、総件数まで最大件数ずつ読み切る */
 export async function getMyReferrals(): Promise<Referral[]> {
-  return apiFetch<Referral[]>("/api/v1/referrals/my-referrals");
+  const limit = 500;
+  const all: Referral[] = [];
+  for (;;) {
+    const { items, total } = await apiFetchPage<Referral>(
+      `/api/v1/referrals/my-referrals?limit=${limit}&offset=${all.length}`
+    );
+    all.push(...items);
+    if (items.length < limit || all.length >= total) return all;
+  }
 }
 
 export async function getMyDiscount(): Promise<MyDiscountInfo> {
@@ -38,17 +38,24 @@ export type SnsSetting = {
 
 export type SnsSettingUpdate = Partial<Omit<SnsSetting, "id" | "store_id" | "created_at" | "updated_at">>;
 
+export type SnsPlatformResult = {
+  status: "posted" | "failed" | "skipped";
+  error: string | null;
+  at: string;
+};
+
 export type SnsPost = {
   id: string;
   store_id: string;
   car_id: string | null;
   trigger: string;
   platform: string;
-  status: "pending" | "posted" | "failed" | "skipped";
+  status: "pending" | "posting" | "posted" | "failed" | "skipped";
   caption: string;
   image_urls: string[] | null;
   posted_at: string | null;
   error_message: string | null;
+  results: Partial<Record<"twitter" | "instagram" | "line", SnsPlatformResult>> | null;
   repost_count: number;
   created_at: string;
 };
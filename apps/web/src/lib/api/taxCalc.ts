@@ -2,7 +2,7 @@ import { apiFetch } from "./core";
 
 // ─── Types ───────────────────────────────────────────────────────────────────
 
-export interface TaxCalcRequest {
+export interface TaxCalcVehicle {
   vehicle_type: string;
   weight_kg: number;
   first_reg_year: number;
@@ -12,15 +12,37 @@ export interface TaxCalcRequest {
   inspection_years: number;
 }
 
+export interface TaxCalcRequest extends TaxCalcVehicle {
+  /** 経過年数の基準日（YYYY-MM-DD、既定は今日） */
+  as_of?: string;
+  /** 料金表の年度（既定は基準日の年度） */
+  fiscal_year?: number;
+}
+
 export interface TaxCalcResult {
   jibaiseki: number;
   jyuryozei: number;
   total: number;
   vehicle_age: number;
   age_category: string;
+  fiscal_year: number;
   notes: string[];
 }
 
+export interface TaxBatchRequest {
+  vehicles: TaxCalcVehicle[];
+  as_of?: string;
+  fiscal_year?: number;
+}
+
+export interface TaxBatchResult {
+  fiscal_year: number;
+  results: TaxCalcResult[];
+  total_jibaiseki: number;
+  total_jyuryozei: number;
+  total: number;
+}
+
 export interface TaxTypeItem {
   value: string;
   label: string;
@@ -61,3 +83,11 @@ export async function calculateTax(req: TaxCalcRequest): Promise<TaxCalcResult>
     body: JSON.stringify(req),
   });
 }
+
+export async function calculateTaxBatch(req: TaxBatchRequest): Promise<TaxBatchResult> {
+  return apiFetch<TaxBatchResult>("/api/v1/tax/calculate/batch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(req),
+  });
+}